@@ -0,0 +1,371 @@
+# presets_bank.py
+# Banco preset compilato: netsound/presets.json -> netsound/presets.sqlite
+#
+# presets.json viene letto e firmato tutto insieme (presets_admin.py): col
+# crescere del banco costa sempre di più. Qui ogni preset diventa una riga
+# SQLite indicizzata per nome, con il suo hash e la sua firma HMAC: richiamare
+# un preset legge solo quella riga e la decodifica solo quando serve, che il
+# banco abbia 10 o 1000 voci.
+#
+# Formati JSON accettati:
+#   {"plugmain": {...}, "bowed-piano": {...}}
+#   {"presets": [{"name": "plugmain", ...}, ...]}   oppure   [{"name": ...}, ...]
+# Una voce è un dizionario receive -> messaggio, nello stesso ordine in cui
+# i subpatch di preset.pd mandano ($0-path, $0-drone, $0-stretch, ...):
+#   {"path": "read data/vline_perc_1.txt", "drone": 2, "stretch": 48,
+#    "act": [1, 1, 1, 1], "sample": "read -resize audio/klick.wav samplebufL samplebufR"}
+#
+# Uso:
+#   python3 presets_bank.py compile            # ricompila solo le voci cambiate
+#   python3 presets_bank.py list
+#   python3 presets_bank.py get plugmain
+#   python3 presets_bank.py serve --port 3010  # risponditore FUDI per [netsend]
+#
+# Protocollo FUDI (Pd: [netsend] -> "get plugmain;"):
+#   get <nome>;   ->  una riga per receive ("path read data/x.txt;"), poi "done <nome>;"
+#   list;         ->  "names <n1> <n2> ...;"
+#   errore        ->  "error <motivo> <nome>;"
+# Lato patch: [netreceive] -> [route path drone stretch act sample done] -> s $0-...
+
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import socketserver
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+
+from presets_admin import PRESETS_JSON, SECRET_PATH
+
+BANK_PATH = "netsound/presets.sqlite"
+BANK_VERSION = 1
+FUDI_PORT = 3010
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS presets (
+    name   TEXT PRIMARY KEY,
+    pos    INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    sig    TEXT,
+    data   BLOB NOT NULL
+);
+"""
+
+class BankError(ValueError):
+    pass
+
+def _secret():
+    # in lettura non si crea la chiave: senza presets.key si verifica solo lo sha256
+    if not os.path.exists(SECRET_PATH):
+        return None
+    with open(SECRET_PATH, "rb") as f:
+        return f.read()
+
+def _sign(secret, name, blob):
+    if secret is None:
+        return None
+    return hmac.new(secret, name.encode("utf-8") + b"\0" + blob, hashlib.sha256).hexdigest()
+
+def key_id(secret):
+    # impronta della chiave (non la chiave): se cambia, le firme vecchie non valgono più
+    if secret is None:
+        return ""
+    return hashlib.sha256(b"envion-presets-key\0" + secret).hexdigest()[:16]
+
+def entry_dump(entry):
+    # come canonical_dump ma senza sort_keys: l'ordine dei receive è l'ordine di invio
+    return json.dumps(entry, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+def entries_from_json(obj):
+    """Banco JSON (dict o lista) -> lista ordinata di (nome, voce)."""
+    if isinstance(obj, dict) and isinstance(obj.get("presets"), list):
+        obj = obj["presets"]
+    if isinstance(obj, dict):
+        return [(str(k), v) for k, v in obj.items()]
+    if isinstance(obj, list):
+        out = []
+        for i, e in enumerate(obj):
+            if not isinstance(e, dict) or "name" not in e:
+                raise BankError(f"voce {i} senza 'name'")
+            e = dict(e)
+            out.append((str(e.pop("name")), e))
+        return out
+    raise BankError("formato di presets.json non riconosciuto")
+
+def compile_bank(json_path=PRESETS_JSON, bank_path=BANK_PATH, secret=None):
+    """
+    presets.json -> SQLite. Riscrive solo le voci cambiate, tutte se la chiave
+    è cambiata (nuove firme); ritorna (totale, aggiornate, rimosse).
+    """
+    with open(json_path, "r", encoding="utf-8") as f:
+        entries = entries_from_json(json.load(f))
+    names = [n for n, _ in entries]
+    if len(set(names)) != len(names):
+        raise BankError("nomi di preset duplicati")
+    con = sqlite3.connect(bank_path)
+    try:
+        con.executescript(SCHEMA)
+        old = dict(con.execute("SELECT name, sha256 FROM presets"))
+        kid = con.execute("SELECT value FROM meta WHERE key='key_id'").fetchone()
+        resign = kid is None or kid[0] != key_id(secret)
+        changed = 0
+        with con:
+            for pos, (name, entry) in enumerate(entries):
+                blob = entry_dump(entry)
+                sha = hashlib.sha256(blob).hexdigest()
+                if old.get(name) == sha and not resign:
+                    con.execute("UPDATE presets SET pos=? WHERE name=?", (pos, name))
+                    continue
+                con.execute("INSERT OR REPLACE INTO presets (name, pos, sha256, sig, data) VALUES (?, ?, ?, ?, ?)",
+                            (name, pos, sha, _sign(secret, name, blob), zlib.compress(blob)))
+                changed += 1
+            gone = [n for n in old if n not in set(names)]
+            con.executemany("DELETE FROM presets WHERE name=?", [(n,) for n in gone])
+            con.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", [
+                ("version", str(BANK_VERSION)),
+                ("source", os.path.abspath(json_path)),
+                ("compiled", time.strftime("%Y-%m-%dT%H:%M:%S")),
+                ("count", str(len(entries))),
+                ("key_id", key_id(secret)),
+            ])
+        return len(entries), changed, len(gone)
+    finally:
+        con.close()
+
+def _stamp(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+class PresetBank:
+    """
+    Lettore del banco compilato: lookup per nome, decodifica e verifica pigre
+    (con cache). Se il file del banco o la chiave cambiano (ricompilazione,
+    rotazione) la cache si svuota e banco e chiave si rileggono.
+    """
+
+    def __init__(self, path=BANK_PATH, verify=True):
+        if not os.path.exists(path):
+            raise BankError(f"banco non trovato: {path} (python3 presets_bank.py compile)")
+        self.path = path
+        self.verify = verify
+        self._lock = threading.Lock()
+        self._con = None
+        self._open()
+
+    def _open(self):
+        """(Ri)apre banco e chiave; da chiamare con il lock preso o prima di condividere l'oggetto."""
+        self._stamps = (_stamp(self.path), _stamp(SECRET_PATH))
+        if self._con is not None:
+            self._con.close()
+        self.secret = _secret() if self.verify else None
+        self._con = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        self._cache = {}
+        v = self._con.execute("SELECT value FROM meta WHERE key='version'").fetchone()
+        if not v or int(v[0]) != BANK_VERSION:
+            raise BankError(f"versione del banco non supportata: {v[0] if v else None}")
+
+    def refresh(self):
+        """Riapre il banco se file o chiave sono cambiati dall'ultima lettura."""
+        if (_stamp(self.path), _stamp(SECRET_PATH)) != self._stamps:
+            with self._lock:
+                if (_stamp(self.path), _stamp(SECRET_PATH)) != self._stamps:
+                    self._open()
+
+    def close(self):
+        self._con.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._con.execute("SELECT COUNT(*) FROM presets").fetchone()[0]
+
+    def __contains__(self, name):
+        with self._lock:
+            return self._con.execute("SELECT 1 FROM presets WHERE name=?", (name,)).fetchone() is not None
+
+    def names(self):
+        self.refresh()
+        with self._lock:
+            return [r[0] for r in self._con.execute("SELECT name FROM presets ORDER BY pos")]
+
+    def get(self, name):
+        """Voce decodificata; KeyError se manca, BankError se hash o firma non tornano."""
+        self.refresh()
+        cache = self._cache
+        if name in cache:
+            return cache[name]
+        with self._lock:
+            cache = self._cache
+            row = self._con.execute("SELECT sha256, sig, data FROM presets WHERE name=?", (name,)).fetchone()
+            secret = self.secret
+        if row is None:
+            raise KeyError(name)
+        sha, sig, data = row
+        try:
+            blob = zlib.decompress(data)
+        except zlib.error:
+            raise BankError(f"voce corrotta: '{name}'")
+        if self.verify:
+            if hashlib.sha256(blob).hexdigest() != sha:
+                raise BankError(f"hash non valido per '{name}'")
+            # con la chiave presente una voce senza firma non passa
+            if secret is not None and (sig is None
+                                       or not hmac.compare_digest(sig, _sign(secret, name, blob))):
+                raise BankError(f"firma non valida per '{name}'")
+        entry = json.loads(blob)
+        cache[name] = entry
+        return entry
+
+# ------------------------------------------------------------
+# FUDI
+# ------------------------------------------------------------
+
+def _fudi_escape(tok):
+    return "".join("\\" + c if c in ";,$\\" else c for c in tok)
+
+def fudi_atoms(value):
+    """Valore JSON -> atomi FUDI (le stringhe sono messaggi: si spezzano sugli spazi)."""
+    if isinstance(value, bool):
+        return ["1" if value else "0"]
+    if isinstance(value, (int, float)):
+        return [repr(value) if isinstance(value, float) else str(value)]
+    if isinstance(value, str):
+        return [_fudi_escape(t) for t in value.split()]
+    if isinstance(value, list):
+        return [a for v in value for a in fudi_atoms(v)]
+    if value is None:
+        return []
+    return [_fudi_escape(json.dumps(value, separators=(",", ":")))]
+
+def fudi_preset(name, entry):
+    """Voce -> messaggi FUDI, uno per receive, chiusi da 'done <nome>;'."""
+    lines = []
+    for key, value in entry.items():
+        if isinstance(value, dict):
+            for sub, v in value.items():
+                lines.append(" ".join([_fudi_escape(key), _fudi_escape(sub)] + fudi_atoms(v)) + ";")
+        else:
+            lines.append(" ".join([_fudi_escape(key)] + fudi_atoms(value)) + ";")
+    lines.append(f"done {_fudi_escape(name)};")
+    return "\n".join(lines) + "\n"
+
+def split_fudi(buf):
+    """Buffer -> (messaggi completi come liste di atomi, resto)."""
+    msgs, cur, tok, i = [], [], [], 0
+    start = 0
+    while i < len(buf):
+        c = buf[i]
+        if c == "\\" and i + 1 < len(buf):
+            tok.append(buf[i + 1])
+            i += 2
+            continue
+        if c in " \t\r\n":
+            if tok:
+                cur.append("".join(tok))
+                tok = []
+        elif c == ";":
+            if tok:
+                cur.append("".join(tok))
+                tok = []
+            if cur:
+                msgs.append(cur)
+            cur = []
+            start = i + 1
+        else:
+            tok.append(c)
+        i += 1
+    return msgs, buf[start:]
+
+def answer(bank, msg):
+    """Un messaggio FUDI -> risposta FUDI."""
+    cmd, args = msg[0], msg[1:]
+    if cmd == "get" and args:
+        name = " ".join(args)
+        try:
+            return fudi_preset(name, bank.get(name))
+        except KeyError:
+            return f"error unknown {_fudi_escape(name)};\n"
+        except BankError:
+            return f"error integrity {_fudi_escape(name)};\n"
+    if cmd == "list":
+        return "names " + " ".join(_fudi_escape(n) for n in bank.names()) + ";\n"
+    return f"error command {_fudi_escape(cmd)};\n"
+
+class FudiHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        buf = ""
+        while True:
+            data = self.request.recv(4096)
+            if not data:
+                break
+            buf += data.decode("utf-8", errors="replace")
+            msgs, buf = split_fudi(buf)
+            for m in msgs:
+                try:
+                    reply = answer(self.server.bank, m)
+                except Exception as e:
+                    # un errore inatteso non deve chiudere la connessione in silenzio
+                    print(f"[ERROR] {' '.join(m)}: {e!r}", file=sys.stderr)
+                    reply = f"error internal {_fudi_escape(m[0])};\n"
+                self.wfile.write(reply.encode("utf-8"))
+
+class FudiServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, addr, bank):
+        self.bank = bank
+        super().__init__(addr, FudiHandler)
+
+def main():
+    ap = argparse.ArgumentParser(description="Compiled Envion preset bank (SQLite) with FUDI responder.")
+    ap.add_argument("--json", default=PRESETS_JSON, help=f"banco JSON (default: {PRESETS_JSON})")
+    ap.add_argument("--bank", default=BANK_PATH, help=f"banco compilato (default: {BANK_PATH})")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("compile", help="compila presets.json (solo le voci cambiate)")
+    sub.add_parser("list", help="elenca i preset")
+    g = sub.add_parser("get", help="stampa un preset in FUDI")
+    g.add_argument("name")
+    s = sub.add_parser("serve", help="risponditore FUDI su TCP")
+    s.add_argument("--host", default="127.0.0.1")
+    s.add_argument("--port", type=int, default=FUDI_PORT)
+    args = ap.parse_args()
+
+    try:
+        if args.cmd == "compile":
+            from presets_admin import _load_secret
+            total, changed, gone = compile_bank(args.json, args.bank, _load_secret())
+            print(f"[admin] {total} preset, {changed} aggiornati, {gone} rimossi -> {args.bank}")
+            return
+        bank = PresetBank(args.bank)
+        if args.cmd == "list":
+            for n in bank.names():
+                print(n)
+        elif args.cmd == "get":
+            try:
+                sys.stdout.write(fudi_preset(args.name, bank.get(args.name)))
+            except KeyError:
+                print(f"[ERROR] preset non trovato: {args.name}", file=sys.stderr)
+                sys.exit(1)
+        elif args.cmd == "serve":
+            srv = FudiServer((args.host, args.port), bank)
+            print(f"[OK] FUDI su {args.host}:{args.port} ({len(bank)} preset)")
+            try:
+                srv.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                srv.server_close()
+    except (BankError, OSError, ValueError) as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+batch_runner.py
+Esegue molte ricette di query (recipes/*.toml|json) in un solo processo.
+
+Il refresh notturno di decine di liste diventa un'unica esecuzione invece di
+decine di avvii a freddo di internet_archive_fine_tuning.py.
+
+Caratteristiche:
+- Ricette eseguite in parallelo (--workers)
+- Una sola session HTTP con pool di connessioni per tutte le ricette
+- Cache /metadata condivisa: richieste identiche fra ricette collassate in una
+- Nessun URL assegnato a due ricette dello stesso batch
+- Scrittura liste e history serializzate (numerazione progressiva coerente)
+
+Uso:
+  python3 batch_runner.py recipes/ --root .. --workers 4
+  python3 batch_runner.py recipes/electric_snap.toml recipes/metal_impact.json --debug
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import envion_catalog
+import envion_http
+import envion_trace as trace
+import internet_archive_fine_tuning as ft
+import query_recipes
+from envion_urls import canonical_url
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+class Batch:
+    """Stato condiviso fra le ricette: history, URL già assegnati, lock di scrittura."""
+
+    def __init__(self, root, debug=False):
+        self.root = root
+        self.debug = debug
+        self.lock = threading.Lock()
+        self.histories = {}
+        self.claimed = set()
+
+    def path(self, p):
+        return p if os.path.isabs(p) else os.path.join(self.root, p)
+
+    def history_set(self, history_path):
+        with self.lock:
+            if history_path not in self.histories:
+                # copia: qui si aggiungono le URL scritte dalle ricette (il set di envion_urls va solo letto)
+                self.histories[history_path] = set(ft.read_history_set(history_path))
+            return self.histories[history_path]
+
+    def claim(self, url):
+        with self.lock:
+            if url in self.claimed:
+                return False
+            self.claimed.add(url)
+            return True
+
+    def write_list(self, recipe, urls, meta=None):
+        out = recipe["output"]
+        out_dir = self.path(out["dir"])
+        history = self.path(out["history"]) if out["history"] else ""
+        with self.lock:
+            ft.ensure_dir(out_dir)
+            if out["basename"]:
+                stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                out_path = os.path.join(out_dir, f"{out['basename']}_{stamp}.txt")
+            else:
+                out_path = ft.next_progressive_filename(out_dir)
+            with open(out_path, "w", encoding="utf-8") as f:
+                for u in urls:
+                    f.write(u + "\n")
+            envion_catalog.write_sidecar(out_path, urls, meta, query=recipe["query"],
+                                         script=f"batch_runner:{recipe['name']}")
+            if out["dedupe"] and history:
+                ft.append_history(history, urls)
+                self.histories.setdefault(history, set()).update(canonical_url(u) for u in urls)
+        return out_path
+
+def run_recipe(batch, recipe):
+    """Ricerca + metadata + filtri per una ricetta. Ritorna (out_path, n_url)."""
+    out = recipe["output"]
+    history = batch.path(out["history"]) if out["history"] else ""
+    history_set = batch.history_set(history) if out["dedupe"] else set()
+
+    with trace.span("search", recipe=recipe["name"]):
+        docs = ft.search_docs(
+            query_text=recipe["query"],
+            rows=recipe["rows"],
+            scope=recipe["scope"],
+            debug=batch.debug,
+            exclude_tokens=recipe["exclude_titles"],
+            exclude_collections=recipe["exclude_collections"],
+            include_subjects=recipe["subjects"],
+        )
+    if not docs:
+        return None, 0
+
+    meta = {}
+    urls = ft.collect_urls(
+        docs, recipe["count"], set(recipe["formats"]),
+        recipe["max_dur"], recipe["max_size_mb"],
+        history_set, out["dedupe"], batch.debug,
+        claim=batch.claim, meta=meta,
+    )
+    if not urls:
+        return None, 0
+    with trace.span("write", recipe=recipe["name"]):
+        return batch.write_list(recipe, urls, meta), len(urls)
+
+def main():
+    ap = argparse.ArgumentParser(description="Run many Envion query recipes in one process.")
+    ap.add_argument("recipes", nargs="*", default=[os.path.join(HERE, "recipes")],
+                    help="file ricetta o cartelle (default: recipes/)")
+    ap.add_argument("--root", type=str, default=os.path.dirname(HERE),
+                    help="root di Envion: i percorsi delle ricette sono relativi a questa")
+    ap.add_argument("--workers", type=int, default=4, help="ricette in parallelo (default 4)")
+    ap.add_argument("--pool-size", type=int, default=envion_http.DEFAULT_POOL_SIZE,
+                    help="connessioni HTTP nel pool condiviso")
+    ap.add_argument("--only", type=str, default="", help="esegue solo le ricette con questi nomi (virgole)")
+    ap.add_argument("--dry-run", action="store_true", help="valida le ricette senza eseguirle")
+    ap.add_argument("--debug", action="store_true")
+    envion_http.add_cli_args(ap)
+    trace.add_cli_args(ap)
+    args = ap.parse_args()
+    trace.setup(args.trace, args.profile)
+    envion_http.setup_cache(args)
+
+    try:
+        recipes = query_recipes.load_recipes(args.recipes)
+    except (query_recipes.RecipeError, OSError, ValueError) as e:
+        print(f"[ERROR] ricetta non valida: {e}", file=sys.stderr)
+        sys.exit(2)
+    if args.only:
+        wanted = {n.strip() for n in args.only.split(",") if n.strip()}
+        recipes = [r for r in recipes if r["name"] in wanted]
+    if not recipes:
+        print("[WARN] Nessuna ricetta da eseguire.", file=sys.stderr)
+        sys.exit(1)
+
+    if args.dry_run:
+        for r in recipes:
+            print(f"[OK] {r['name']}: {r['query']} (scope={r['scope']}, max_dur={r['max_dur']})")
+        return
+
+    envion_http.session(pool_size=max(args.pool_size, args.workers))
+    batch = Batch(os.path.abspath(args.root), debug=args.debug)
+
+    t0 = time.time()
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as ex:
+        futures = {ex.submit(run_recipe, batch, r): r for r in recipes}
+        for fut in as_completed(futures):
+            r = futures[fut]
+            try:
+                out_path, n = fut.result()
+            except Exception as e:
+                failed += 1
+                print(f"[ERROR] {r['name']}: {e}", file=sys.stderr)
+                continue
+            if not out_path:
+                failed += 1
+                print(f"[WARN] {r['name']}: nessun file compatibile trovato.", file=sys.stderr)
+                continue
+            print(f"[OK] {r['name']}: {n} URL → {out_path}")
+
+    cache = envion_http.metadata_cache()
+    print(f"[DONE] {len(recipes) - failed}/{len(recipes)} ricette in {time.time() - t0:.1f}s "
+          f"(metadata: {cache.misses} richieste, {cache.hits} condivise)")
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,582 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+candidate_pool.py
+Pool di candidati pre-calcolati per le query salvate di Envion NET-AUDIO.
+
+Le query "ricetta" in makefile/ (queryes.txt, BEST QUERY di
+internet_archive_fine_tuning.py, lowercase_dust micro-textures_multi, ...)
+ripartono ogni volta da zero: ricerca + metadata + filtri. Questo script le
+esegue in anticipo, in background, e tiene per ogni query un pool locale di
+candidati già filtrati e deduplicati. Generare una nuova lista diventa
+un'estrazione istantanea dal pool.
+
+Caratteristiche:
+- Legge i comandi "python3 <script>.py --opzioni ..." salvati in makefile/
+  (continuazioni con '\\', prompt '>' e cicli for su array bash inclusi)
+  e le ricette dichiarative in recipes/ (vedi query_recipes.py)
+- Store locale SQLite (default netsound/candidate_pool.sqlite)
+- Pool di --pool-size URL per query, ricaricato sotto la watermark --low-water
+- Dedupe contro la history e contro il pool stesso
+- draw: estrae N URL casuali, scrive envion_random_raw_XXX.txt, aggiorna la history
+  e (se il pool scende sotto la watermark) lancia un refill in background
+
+Uso:
+  python3 candidate_pool.py list
+  python3 candidate_pool.py refill [--query ID] [--force]
+  python3 candidate_pool.py serve --interval 600
+  python3 candidate_pool.py draw --query ID --count 8 \\
+    --out-dir "netsound" --history "netsound/netsound_history.txt"
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import shlex
+import sqlite3
+import subprocess
+import sys
+import time
+
+import envion_catalog
+from envion_urls import append_history, canonical_url, read_history_set
+
+# --- Costanti e default -------------------------------------------------------
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_MAKEFILE_DIR = os.path.join(HERE, "makefile")
+DEFAULT_RECIPES_DIR = os.path.join(HERE, "recipes")
+DEFAULT_DB = "netsound/candidate_pool.sqlite"
+DEFAULT_HISTORY = "netsound/netsound_history.txt"
+
+DEFAULT_POOL_SIZE = 300
+DEFAULT_LOW_WATER = 100
+
+# script di cui sappiamo eseguire le query salvate
+SUPPORTED_SCRIPTS = {
+    "internet_archive_fine_tuning",
+    "make_internetarchive_search",
+    "make_bbc_search_ia",
+    "make_raw_list",
+    "wiki_commons_fetch",
+}
+
+# opzioni che riguardano l'output e non la query: non entrano nell'ID
+OUTPUT_OPTIONS = {
+    "count", "out-dir", "out-file", "out-prefix", "basename",
+    "history", "dedupe", "debug", "verbose",
+}
+
+# --- Utilità ------------------------------------------------------------------
+
+def dbg(enabled, *msg):
+    if enabled:
+        print("[DEBUG]", *msg, file=sys.stderr, flush=True)
+
+def ensure_dir(path):
+    if path:
+        os.makedirs(path, exist_ok=True)
+
+def next_progressive_filename(out_dir, prefix="envion_random_raw_", ext=".txt"):
+    ensure_dir(out_dir)
+    pattern = re.compile(rf"^{re.escape(prefix)}(\d+){re.escape(ext)}$")
+    max_n = 0
+    for n in os.listdir(out_dir):
+        m = pattern.match(n)
+        if m:
+            max_n = max(max_n, int(m.group(1)))
+    return os.path.join(out_dir, f"{prefix}{max_n+1:03d}{ext}")
+
+# --- Parsing delle query salvate ----------------------------------------------
+
+def _logical_lines(text):
+    """Unisce le continuazioni '\\' e toglie i prompt '> ' copiati dal terminale."""
+    out, buf = [], ""
+    for raw in text.splitlines():
+        line = raw.strip()
+        if line.startswith("> "):
+            line = line[2:].strip()
+        if line.endswith("\\"):
+            buf += line[:-1] + " "
+            continue
+        out.append(buf + line)
+        buf = ""
+    if buf:
+        out.append(buf)
+    return out
+
+def _parse_options(tokens):
+    """--chiave valore / --flag -> dict (flag = True)."""
+    opts, i = {}, 0
+    while i < len(tokens):
+        tok = tokens[i]
+        if tok.startswith("--"):
+            key = tok[2:]
+            if i + 1 < len(tokens) and not tokens[i + 1].startswith("--"):
+                opts[key] = tokens[i + 1]
+                i += 2
+                continue
+            opts[key] = True
+        i += 1
+    return opts
+
+def _expand_loops(line, arrays):
+    """
+    Espande i cicli bash tipo:
+      for t in "${terms[@]}"; do python3 ... ${t} ... done
+    in un comando per ciascun valore dell'array. Ritorna coppie (comando, valore).
+    """
+    m = re.search(r'for\s+(\w+)\s+in\s+"?\$\{(\w+)\[@\]\}"?\s*;?\s*do\s+(.*?)(?:;?\s*done)?$', line)
+    if not m or m.group(2) not in arrays:
+        return [(line, "")]
+    var, body = m.group(1), m.group(3)
+    return [(re.sub(r"\$\{?" + var + r"\}?", val, body), val) for val in arrays[m.group(2)]]
+
+def query_id(script, opts):
+    """ID stabile: script + hash delle sole opzioni di query ("4" e "4.0" coincidono)."""
+    key = {}
+    for k, v in opts.items():
+        if k in OUTPUT_OPTIONS:
+            continue
+        try:
+            v = repr(float(v)) if v is not True else v
+        except ValueError:
+            pass
+        key[k] = v
+    h = hashlib.sha1(json.dumps([script, key], sort_keys=True).encode("utf-8")).hexdigest()[:10]
+    return f"{script}-{h}"
+
+def parse_saved_queries(text, source=""):
+    """
+    Estrae le query salvate da un file di makefile/.
+    Ritorna una lista di dict: id, label, script, opts, source.
+    """
+    queries = []
+    label = ""
+    arrays = {}
+    # il ciclo for può stare su più righe logiche: lo ricuciamo fino a 'done'
+    lines, pending = [], ""
+    for line in _logical_lines(text):
+        if pending:
+            pending += " " + line
+            if re.search(r"\bdone\b", line):
+                lines.append(pending)
+                pending = ""
+            continue
+        if re.search(r"\bfor\s+\w+\s+in\b", line) and not re.search(r"\bdone\b", line):
+            pending = line
+            continue
+        lines.append(line)
+    if pending:
+        lines.append(pending)
+
+    for line in lines:
+        if line.startswith("#"):
+            label = line.lstrip("#").strip() or label
+            continue
+        for m in re.finditer(r"(\w+)=\(([^)]*)\)", line):
+            arrays[m.group(1)] = m.group(2).split()
+        found = False
+        for cmd, loop_val in _expand_loops(line, arrays):
+            for part in re.split(r"&&|;", cmd):
+                if "python" not in part or ".py" not in part:
+                    continue
+                try:
+                    tokens = shlex.split(part)
+                except ValueError:
+                    continue
+                idx = next((i for i, t in enumerate(tokens) if t.endswith(".py")), None)
+                if idx is None:
+                    continue
+                script = os.path.splitext(os.path.basename(tokens[idx]))[0]
+                script = re.sub(r"_v\d+$", "", script)
+                if script not in SUPPORTED_SCRIPTS:
+                    continue
+                opts = _parse_options(tokens[idx + 1:])
+                if not opts.get("q") and not opts.get("url"):
+                    continue
+                found = True
+                queries.append({
+                    "id": query_id(script, opts),
+                    "label": f"{label} [{loop_val}]" if loop_val else label,
+                    "script": script,
+                    "opts": opts,
+                    "source": source,
+                })
+        if found:
+            label = ""
+    return queries
+
+def recipe_queries(recipes_dir):
+    """Ricette di recipes/ come query salvate di internet_archive_fine_tuning."""
+    import query_recipes
+    if not recipes_dir or not os.path.isdir(recipes_dir):
+        return []
+    out = []
+    for path in query_recipes.find_recipe_files([recipes_dir]):
+        try:
+            r = query_recipes.load_recipe(path)
+        except (query_recipes.RecipeError, ValueError) as e:
+            print(f"[WARN] ricetta ignorata: {e}", file=sys.stderr)
+            continue
+        opts = query_recipes.recipe_to_opts(r)
+        out.append({
+            "id": query_id("internet_archive_fine_tuning", opts),
+            "label": r["name"],
+            "script": "internet_archive_fine_tuning",
+            "opts": opts,
+            "source": os.path.basename(path),
+        })
+    return out
+
+def load_saved_queries(makefile_dir, recipes_dir=""):
+    """Tutte le query salvate (makefile/ + recipes/), senza duplicati (stesso ID)."""
+    out, seen = [], set()
+    found = recipe_queries(recipes_dir)
+    for path in sorted(glob.glob(os.path.join(makefile_dir, "*"))):
+        if not os.path.isfile(path):
+            continue
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            text = f.read()
+        found += parse_saved_queries(text, source=os.path.basename(path))
+    for q in found:
+        if q["id"] in seen:
+            continue
+        seen.add(q["id"])
+        out.append(q)
+    return out
+
+# --- Store SQLite -------------------------------------------------------------
+
+def open_store(db_path):
+    ensure_dir(os.path.dirname(db_path))
+    con = sqlite3.connect(db_path, timeout=30)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS queries (
+            id TEXT PRIMARY KEY,
+            label TEXT,
+            script TEXT,
+            opts TEXT,
+            refilled_at REAL
+        )""")
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS candidates (
+            query_id TEXT,
+            url TEXT,
+            added_at REAL,
+            PRIMARY KEY (query_id, url)
+        )""")
+    return con
+
+def register_queries(con, queries):
+    with con:
+        for q in queries:
+            con.execute(
+                "INSERT INTO queries (id, label, script, opts) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET label=excluded.label",
+                (q["id"], q["label"], q["script"], json.dumps(q["opts"], sort_keys=True)),
+            )
+
+def pool_size(con, qid):
+    return con.execute("SELECT COUNT(*) FROM candidates WHERE query_id=?", (qid,)).fetchone()[0]
+
+def pool_urls(con, qid):
+    return {r[0] for r in con.execute("SELECT url FROM candidates WHERE query_id=?", (qid,))}
+
+def add_candidates(con, qid, urls):
+    now = time.time()
+    with con:
+        con.executemany(
+            "INSERT OR IGNORE INTO candidates (query_id, url, added_at) VALUES (?, ?, ?)",
+            [(qid, u, now) for u in urls],
+        )
+        con.execute("UPDATE queries SET refilled_at=? WHERE id=?", (now, qid))
+
+def take_candidates(con, qid, count, history_set):
+    """Estrae (e rimuove) fino a count URL casuali dal pool, saltando quelli già in history."""
+    out, stale = [], []
+    with con:
+        rows = con.execute(
+            "SELECT url FROM candidates WHERE query_id=? ORDER BY RANDOM()", (qid,)
+        )
+        for (url,) in rows:
+            if canonical_url(url) in history_set:
+                stale.append(url)
+                continue
+            out.append(url)
+            if len(out) >= count:
+                break
+        con.executemany(
+            "DELETE FROM candidates WHERE query_id=? AND url=?",
+            [(qid, u) for u in out + stale],
+        )
+    return out
+
+# --- Esecuzione delle query (riusa gli script esistenti) ----------------------
+
+def _opt(opts, key, default, cast=str):
+    v = opts.get(key, default)
+    if v is True:
+        return default
+    try:
+        return cast(v)
+    except (TypeError, ValueError):
+        return default
+
+def _csv(opts, key):
+    return [t.strip() for t in _opt(opts, key, "").split(",") if t.strip()]
+
+def run_ia_fine_tuning(opts, want, exclude, debug):
+    import internet_archive_fine_tuning as ft
+    docs = ft.search_docs(
+        query_text=_opt(opts, "q", ""),
+        rows=_opt(opts, "rows", 300, int),
+        scope=_opt(opts, "scope", "sitewide"),
+        debug=debug,
+        exclude_tokens=_csv(opts, "exclude"),
+        exclude_collections=_csv(opts, "exclude-collections"),
+        include_subjects=_csv(opts, "include-subjects"),
+    )
+    exts = {x.lower() for x in _csv(opts, "formats")} or set(ft.DEFAULT_EXTS)
+    urls = ft.collect_urls(
+        docs, want, exts,
+        _opt(opts, "max-dur", 0.0, float), _opt(opts, "max-size-mb", 10.0, float),
+        exclude, True, debug,
+    )
+    return [canonical_url(u) for u in urls]
+
+def run_ia_search(opts, want, exclude, debug):
+    import make_internetarchive_search as mis
+    docs = mis.search_docs(
+        query_text=_opt(opts, "q", ""),
+        rows=_opt(opts, "rows", 300, int),
+        scope=_opt(opts, "scope", "bbc"),
+        debug=debug,
+        exclude_tokens=_csv(opts, "exclude"),
+    )
+    exts = {x.lower() for x in _csv(opts, "formats")} or set(mis.DEFAULT_EXTS)
+    urls = mis.collect_urls_from_docs(
+        docs, want, exts, _opt(opts, "max-dur", 0.0, float), exclude, True, debug,
+    )
+    return [canonical_url(u) for u in urls]
+
+def run_bbc(opts, want, exclude, debug):
+    import make_bbc_search_ia as bbc
+    docs = bbc.search_bbc_docs(_opt(opts, "q", ""), _opt(opts, "rows", 300, int), debug)
+    max_dur = _opt(opts, "max-dur", 0, int)
+    out = []
+    for d in docs:
+        ident = d.get("identifier")
+        if not ident:
+            continue
+        try:
+            urls = bbc.files_from_identifier(ident, max_dur, debug)
+        except Exception as e:
+            dbg(debug, f"metadata fetch failed for {ident}: {e}")
+            continue
+        out.extend(u for u in map(canonical_url, urls) if u not in exclude and u not in out)
+        if len(out) >= want:
+            break
+    return out[:want]
+
+def run_raw_list(opts, want, exclude, debug):
+    import make_raw_list as mrl
+    ctx = mrl.make_ssl_context(insecure=bool(opts.get("insecure")))
+    out, attempts = [], 0
+    max_attempts = want * _opt(opts, "max-multiplier", 5, int)
+    while len(out) < want and attempts < max_attempts:
+        attempts += 1
+        u = mrl.extract_raw_url(_opt(opts, "url", ""), ctx=ctx)
+        if not u:
+            continue
+        u = canonical_url(u)
+        if u in exclude or u in out:
+            continue
+        out.append(u)
+        time.sleep(_opt(opts, "sleep", 0.2, float))
+    return out
+
+def run_commons(opts, want, exclude, debug):
+    import wiki_commons_fetch as wcf
+    timeout = _opt(opts, "timeout", 15, int)
+    import envion_commons
+    from envion_filters import compile_filters
+    flt = compile_filters(
+        exts=_csv(opts, "extensions") or [".ogg", ".wav", ".flac"],
+        exclude_terms=_csv(opts, "exclude") + [".mid", ".midi"],
+        max_dur=_opt(opts, "max-dur", 0.0, float),
+        max_size_mb=_opt(opts, "max-size-mb", 0.0, float),
+    )
+    transcodes = envion_commons.parse_transcodes(_opt(opts, "transcodes", "mp3,ogg"))
+    results = wcf.search_pages(_opt(opts, "q", ""), want, timeout, debug)
+    pages = wcf.fetch_imageinfo([str(r["pageid"]) for r in results], timeout, debug)
+    out = []
+    for page in pages.values():
+        info = envion_commons.page_info(page)
+        if not info or not info.get("url") or canonical_url(info["url"]) in exclude:
+            continue
+        url, _ = wcf.pick_url(flt, page.get("title", ""), info, transcodes, debug)
+        url = canonical_url(url) if url else ""
+        if not url or url in exclude or url in out:
+            continue
+        out.append(url)
+        if len(out) >= want:
+            break
+    return out
+
+RUNNERS = {
+    "internet_archive_fine_tuning": run_ia_fine_tuning,
+    "make_internetarchive_search": run_ia_search,
+    "make_bbc_search_ia": run_bbc,
+    "make_raw_list": run_raw_list,
+    "wiki_commons_fetch": run_commons,
+}
+
+# --- Scheduler ----------------------------------------------------------------
+
+def refill_query(con, q, target, history_set, debug):
+    """Porta il pool di q fino a target candidati. Ritorna quanti ne ha aggiunti."""
+    have = pool_urls(con, q["id"])
+    want = target - len(have)
+    if want <= 0:
+        return 0
+    exclude = history_set | {canonical_url(u) for u in have}
+    try:
+        urls = RUNNERS[q["script"]](q["opts"], want, exclude, debug)
+    except Exception as e:
+        print(f"[WARN] refill {q['id']} fallito: {e}", file=sys.stderr)
+        return 0
+    fresh = [u for u in urls if u not in exclude]
+    add_candidates(con, q["id"], fresh)
+    dbg(debug, f"refill {q['id']} ({q['label']}): +{len(fresh)} -> {len(have) + len(fresh)}")
+    return len(fresh)
+
+def refill_all(con, queries, target, low_water, history_path, force, debug):
+    history_set = read_history_set(history_path)
+    total = 0
+    for q in queries:
+        if not force and pool_size(con, q["id"]) >= low_water:
+            continue
+        total += refill_query(con, q, target, history_set, debug)
+    return total
+
+def spawn_background_refill(args, qid):
+    """Lancia un refill staccato dal processo corrente (non blocca il draw)."""
+    cmd = [
+        sys.executable, os.path.abspath(__file__), "refill",
+        "--query", qid,
+        "--db", args.db,
+        "--makefile-dir", args.makefile_dir,
+        "--recipes-dir", args.recipes_dir,
+        "--history", args.history,
+        "--pool-size", str(args.pool_size),
+        "--low-water", str(args.low_water),
+    ]
+    subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                     start_new_session=True)
+
+# --- Main ---------------------------------------------------------------------
+
+def select_queries(queries, qid):
+    if not qid:
+        return queries
+    sel = [q for q in queries if q["id"] == qid or q["id"].startswith(qid)]
+    if not sel:
+        print(f"[ERROR] query sconosciuta: {qid}", file=sys.stderr)
+        sys.exit(2)
+    return sel
+
+def main():
+    ap = argparse.ArgumentParser(description="Precomputed candidate pools for Envion saved queries.")
+    ap.add_argument("command", choices=["list", "refill", "serve", "draw"])
+    ap.add_argument("--query", type=str, default="", help="ID (o prefisso) della query salvata")
+    ap.add_argument("--makefile-dir", type=str, default=DEFAULT_MAKEFILE_DIR,
+                    help="cartella con le query salvate")
+    ap.add_argument("--recipes-dir", type=str, default=DEFAULT_RECIPES_DIR,
+                    help="cartella con le ricette dichiarative")
+    ap.add_argument("--db", type=str, default=DEFAULT_DB, help="store SQLite dei pool")
+    ap.add_argument("--history", type=str, default=DEFAULT_HISTORY, help="file di history per dedupe")
+    ap.add_argument("--pool-size", type=int, default=DEFAULT_POOL_SIZE,
+                    help="candidati da tenere per query (default 300)")
+    ap.add_argument("--low-water", type=int, default=DEFAULT_LOW_WATER,
+                    help="sotto questa soglia il pool viene ricaricato (default 100)")
+    ap.add_argument("--interval", type=float, default=600.0,
+                    help="(serve) secondi fra due giri dello scheduler")
+    ap.add_argument("--force", action="store_true", help="(refill) ricarica anche sopra la watermark")
+    ap.add_argument("--count", type=int, default=8, help="(draw) quanti URL estrarre")
+    ap.add_argument("--out-dir", type=str, default="netsound", help="(draw) cartella di output")
+    ap.add_argument("--basename", type=str, default="", help="(draw) basename opzionale della lista")
+    ap.add_argument("--no-background", action="store_true",
+                    help="(draw) non lanciare il refill in background")
+    ap.add_argument("--debug", action="store_true")
+    args = ap.parse_args()
+
+    queries = load_saved_queries(args.makefile_dir, args.recipes_dir)
+    con = open_store(args.db)
+    register_queries(con, queries)
+    selected = select_queries(queries, args.query)
+
+    if args.command == "list":
+        for q in selected:
+            print(f"{q['id']}\t{pool_size(con, q['id']):4d}\t{q['script']}\t{q['label'] or q['opts'].get('q') or q['opts'].get('url')}")
+        return
+
+    if args.command == "refill":
+        added = refill_all(con, selected, args.pool_size, args.low_water,
+                           args.history, args.force, args.debug)
+        print(f"[OK] refill: +{added} candidati")
+        return
+
+    if args.command == "serve":
+        print(f"[SERVE] {len(selected)} query, pool={args.pool_size}, low-water={args.low_water}, "
+              f"interval={args.interval}s", file=sys.stderr)
+        while True:
+            added = refill_all(con, selected, args.pool_size, args.low_water,
+                               args.history, False, args.debug)
+            dbg(args.debug, f"giro scheduler: +{added}")
+            time.sleep(args.interval)
+
+    # draw
+    if len(selected) != 1:
+        print("[ERROR] draw richiede --query con un solo ID", file=sys.stderr)
+        sys.exit(2)
+    q = selected[0]
+    history_set = read_history_set(args.history)
+    urls = take_candidates(con, q["id"], args.count, history_set)
+
+    if len(urls) < args.count:
+        # pool vuoto o quasi: refill sincrono, poi riprova
+        dbg(args.debug, "pool insufficiente, refill sincrono")
+        refill_query(con, q, args.pool_size, history_set | set(urls), args.debug)
+        urls += take_candidates(con, q["id"], args.count - len(urls), history_set | set(urls))
+
+    if not urls:
+        print("[WARN] Pool vuoto e nessun candidato trovato.", file=sys.stderr)
+        sys.exit(1)
+
+    if args.basename:
+        stamp = time.strftime("%Y%m%d_%H%M%S")
+        out_path = os.path.join(args.out_dir, f"{args.basename}_{stamp}.txt")
+        ensure_dir(args.out_dir)
+    else:
+        out_path = next_progressive_filename(args.out_dir)
+    with open(out_path, "w", encoding="utf-8") as f:
+        for u in urls:
+            f.write(u + ";\n")
+    # nel pool ci sono solo URL: il sidecar porta query e script d'origine
+    envion_catalog.write_sidecar(out_path, urls, query=q["opts"].get("q") or q["opts"].get("url"),
+                                 script=f"candidate_pool:{q['script']}")
+    append_history(args.history, urls)
+    print(out_path)
+
+    if not args.no_background and pool_size(con, q["id"]) < args.low_water:
+        spawn_background_refill(args, q["id"])
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,11 @@
 import sys, re, pathlib
-from urllib.parse import urlsplit, urlunsplit, quote
+
+from envion_urls import encode_url as _encode_url
 
 def encode_url(u: str) -> str:
-    u = u.strip().rstrip(';')  # via i ; finali
-    if not u:
-        return u
-    parts = urlsplit(u)
-    # Encoda path e filename preservando /-_.~
-    path_enc = quote(parts.path, safe="/-_.~")
-    # (opzionale) encoda anche query e fragment se presenti
-    query_enc = quote(parts.query, safe="=&-_.~")
-    frag_enc = quote(parts.fragment, safe="-_.~")
-    return urlunsplit((parts.scheme, parts.netloc, path_enc, query_enc, frag_enc))
+    # via i ; finali; path/query decodificati e ri-encodati (envion_urls):
+    # un URL già encodato resta uguale (niente %2520)
+    return _encode_url(u)
 
 def process(infile):
     p = pathlib.Path(infile)
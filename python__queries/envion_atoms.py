@@ -0,0 +1,462 @@
+# -*- coding: utf-8 -*-
+
+"""
+envion_atoms.py
+Estrazione di "atomi": finestre brevi dentro registrazioni lunghe di
+archive.org, scaricando solo il range di byte della finestra.
+
+--max-dur negli script IA scarta ogni file lungo, cioè quasi tutto il corpus
+audio di IA. In modalità --atoms un file più lungo di --max-dur non viene
+scartato: se ne estrae una finestra di --max-dur secondi e la si scrive come
+clip locale (default netsound/atoms/). Il costo del fetch dipende dalla durata
+della clip, non da quella del file.
+
+- WAV:  header RIFF -> offset esatto in byte; la clip è lo stesso PCM con un
+        header nuovo (niente decodifica)
+- FLAC: solo STREAMINFO (totale campioni e MD5 azzerati) + i frame completi
+        che coprono la finestra (sync con CRC-8 dell'header di frame)
+- MP3:  salto del tag ID3v2, TOC Xing/Info se VBR, bitrate se CBR; taglio
+        su confini di frame verificati a catena, alla durata della finestra
+Il range scaricato ha dei margini (stima dell'offset); la clip scritta no:
+al più un frame in più per lato.
+Finestra: casuale (default) oppure allineata a un onset (--atom-align onset):
+si scarica un po' di anticipo (--atom-lead), si cerca il primo attacco
+netto e si taglia lì (numpy; per MP3/FLAC anche ffmpeg, che converte in WAV).
+Senza ffmpeg i FLAC restano .flac (Pd non sempre li apre: vedi AUDIO_EXTS
+in make_bbc_search_ia.py).
+"""
+
+import hashlib
+import os
+import random
+import re
+import struct
+import subprocess
+import sys
+from urllib.parse import unquote
+
+import envion_trace as trace
+from envion_audio import (AudioError, decode_ffmpeg, have_ffmpeg, have_numpy,
+                          is_riff_wave, np, parse_wav_header, pcm_to_float, to_mono)
+
+DEFAULT_DIR = "netsound/atoms"
+HEAD_BYTES = 65536
+ALIGN_CHOICES = ("random", "onset")
+ONSET_RATE = 22050
+PRE_ROLL = 0.005       # secondi lasciati prima dell'attacco
+
+# --- Fetch ------------------------------------------------------------------------
+
+def _fetch(url, start, end):
+    import envion_http
+    data, total, partial = envion_http.get_range_hedged(url, start, end)
+    if not partial and start > 0:
+        raise AudioError("il server ignora le richieste Range: niente atomi da questo host")
+    return data, total
+
+# --- WAV ---------------------------------------------------------------------------
+
+def wav_bytes(fmt, raw):
+    """PCM raw + formato -> file WAV completo (header minimo 'fmt ' + 'data')."""
+    raw = raw[:len(raw) // fmt.block_align * fmt.block_align]
+    fmt_chunk = struct.pack("<HHIIHH", fmt.tag, fmt.channels, fmt.rate,
+                            fmt.rate * fmt.block_align, fmt.block_align, fmt.bits)
+    body = b"WAVE" + b"fmt " + struct.pack("<I", len(fmt_chunk)) + fmt_chunk \
+        + b"data" + struct.pack("<I", len(raw)) + raw + (b"\0" if len(raw) & 1 else b"")
+    return b"RIFF" + struct.pack("<I", len(body)) + body
+
+def _wav_info(head, total):
+    fmt = parse_wav_header(head)
+    size = fmt.data_size
+    if total is not None:
+        size = min(size, total - fmt.data_offset)
+    return fmt, size / float(fmt.rate * fmt.block_align)
+
+def _wav_window(url, fmt, start, span):
+    first = fmt.data_offset + int(start * fmt.rate) * fmt.block_align
+    n = int(span * fmt.rate) * fmt.block_align
+    raw, _ = _fetch(url, first, first + n - 1)
+    return raw
+
+# --- FLAC --------------------------------------------------------------------------
+
+def _crc8(data):
+    crc = 0
+    for b in data:
+        crc ^= b
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+    return crc
+
+def _utf8_number(buf, i):
+    """Numero 'UTF-8' dell'header di frame FLAC -> (valore, byte usati) o None."""
+    b0 = buf[i]
+    if b0 < 0x80:
+        return b0, 1
+    n = 0
+    while n < 7 and b0 & (0x80 >> n):
+        n += 1
+    if n < 2 or n > 7 or i + n > len(buf):
+        return None
+    v = b0 & (0x7F >> n)
+    for k in range(1, n):
+        c = buf[i + k]
+        if c & 0xC0 != 0x80:
+            return None
+        v = (v << 6) | (c & 0x3F)
+    return v, n
+
+def _flac_frame_header(buf, i):
+    """Se in buf[i] c'è un header di frame FLAC valido -> (numero, variabile) altrimenti None."""
+    if i + 6 > len(buf) or buf[i] != 0xFF or buf[i + 1] & 0xFE != 0xF8:
+        return None
+    bs_code, sr_code = buf[i + 2] >> 4, buf[i + 2] & 0x0F
+    ch, ss = buf[i + 3] >> 4, (buf[i + 3] >> 1) & 0x07
+    if bs_code == 0 or sr_code == 15 or ch > 10 or ss == 3 or buf[i + 3] & 1:
+        return None
+    num = _utf8_number(buf, i + 4)
+    if num is None:
+        return None
+    j = i + 4 + num[1]
+    j += {6: 1, 7: 2}.get(bs_code, 0)
+    j += {12: 1, 13: 2, 14: 2}.get(sr_code, 0)
+    if j >= len(buf) or _crc8(buf[i:j]) != buf[j]:
+        return None
+    return num[0], bool(buf[i + 1] & 1)
+
+def _flac_info(url, head, total):
+    """-> (streaminfo 34 byte, inizio audio, rate, min_block, max_frame, durata)."""
+    if head[:4] != b"fLaC":
+        raise AudioError("non è un FLAC")
+    pos, si, buf, base = 4, None, head, 0
+    while True:
+        if pos + 4 > base + len(buf):
+            buf, _ = _fetch(url, pos, pos + HEAD_BYTES - 1)
+            base = pos
+        hdr = buf[pos - base:pos - base + 4]
+        last, btype = hdr[0] & 0x80, hdr[0] & 0x7F
+        length = int.from_bytes(hdr[1:4], "big")
+        if btype == 0:
+            if pos + 4 + 34 > base + len(buf):
+                buf, _ = _fetch(url, pos, pos + HEAD_BYTES - 1)
+                base = pos
+            si = bytes(buf[pos - base + 4:pos - base + 38])
+        pos += 4 + length
+        if last:
+            break
+    if si is None:
+        raise AudioError("FLAC senza STREAMINFO")
+    min_block = struct.unpack(">H", si[0:2])[0]
+    max_frame = int.from_bytes(si[7:10], "big")
+    packed = int.from_bytes(si[10:18], "big")
+    rate = packed >> 44
+    samples = packed & ((1 << 36) - 1)
+    if not rate:
+        raise AudioError("FLAC con sample rate nullo")
+    dur = samples / float(rate) if samples else None
+    return si, pos, rate, min_block, max_frame or 16384, dur
+
+def _flac_stream_header(si):
+    si = bytearray(si)
+    packed = int.from_bytes(si[10:18], "big") & ~((1 << 36) - 1)   # totale campioni: ignoto
+    si[10:18] = packed.to_bytes(8, "big")
+    si[18:34] = bytes(16)                                          # MD5: non calcolato
+    return b"fLaC" + bytes([0x80]) + (34).to_bytes(3, "big") + bytes(si)
+
+def _flac_window(url, info, total, start, span):
+    si, audio_start, rate, min_block, max_frame, dur = info
+    if not dur or total is None:
+        raise AudioError("FLAC senza durata o dimensione: offset non stimabile")
+    bps = (total - audio_start) / dur
+    first = max(audio_start, audio_start + int(start * bps) - 2 * max_frame)
+    last = min(total - 1, first + int(span * bps * 1.25) + 4 * max_frame)
+    buf, _ = _fetch(url, first, last)
+    syncs, strategy = [], None
+    i = buf.find(b"\xff")
+    while i >= 0:
+        h = _flac_frame_header(buf, i)
+        if h is not None and (strategy is None or h[1] == strategy):
+            strategy = h[1]
+            syncs.append((i, h[0]))
+        i = buf.find(b"\xff", i + 1)
+    if len(syncs) < 2:
+        raise AudioError("nessun frame FLAC completo nel range")
+    # frame k: [times[k], times[k+1]); si tengono quelli che coprono [start, start+span]
+    times = [(num if strategy else num * min_block) / float(rate) for _, num in syncs]
+    a = max([k for k, t in enumerate(times[:-1]) if t <= start] or [0])
+    b = next((k for k in range(a + 1, len(syncs)) if times[k] >= start + span), len(syncs) - 1)
+    return _flac_stream_header(si) + bytes(buf[syncs[a][0]:syncs[b][0]]), times[a]
+
+# --- MP3 ---------------------------------------------------------------------------
+
+_MP3_BITRATES = {
+    1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],   # MPEG1 L3
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],       # MPEG2/2.5 L3
+}
+_MP3_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+def _mp3_header(buf, i):
+    """Header di frame MP3 (Layer III) in buf[i] -> dict oppure None."""
+    if i + 4 > len(buf) or buf[i] != 0xFF or buf[i + 1] & 0xE0 != 0xE0:
+        return None
+    ver = (buf[i + 1] >> 3) & 3
+    layer = (buf[i + 1] >> 1) & 3
+    br_idx, sr_idx = buf[i + 2] >> 4, (buf[i + 2] >> 2) & 3
+    if ver == 1 or layer != 1 or br_idx in (0, 15) or sr_idx == 3:
+        return None
+    mpeg1 = ver == 3
+    br = _MP3_BITRATES[1 if mpeg1 else 2][br_idx] * 1000
+    sr = _MP3_RATES[ver][sr_idx]
+    pad = (buf[i + 2] >> 1) & 1
+    mono = (buf[i + 3] >> 6) == 3
+    return {
+        "ver": ver, "sr": sr, "br": br, "mono": mono,
+        "len": (144 if mpeg1 else 72) * br // sr + pad,
+        "spf": 1152 if mpeg1 else 576,
+        "side": (17 if mono else 32) if mpeg1 else (9 if mono else 17),
+    }
+
+def _mp3_info(url, head, total):
+    """-> (inizio audio, header primo frame, durata, TOC Xing o None, byte audio)."""
+    pos, base = 0, 0
+    if head[:3] == b"ID3":
+        sz = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+        pos = 10 + sz + (10 if head[5] & 0x10 else 0)
+        if pos + 4 > len(head):
+            # tag ID3 grande (copertina): si riparte dalla fine del tag
+            head, _ = _fetch(url, pos, pos + HEAD_BYTES - 1)
+            base = pos
+    buf, i = head, pos - base
+    while i + 4 <= len(buf):
+        h = _mp3_header(buf, i)
+        if h and _mp3_header(buf, i + h["len"]):
+            break
+        i += 1
+    else:
+        raise AudioError("nessun frame MP3 Layer III valido")
+    audio_start = base + i
+    audio_bytes = (total - audio_start) if total is not None else None
+    dur, toc = None, None
+    x = i + 4 + h["side"]
+    if buf[x:x + 4] in (b"Xing", b"Info"):
+        flags = struct.unpack(">I", buf[x + 4:x + 8])[0]
+        p = x + 8
+        if flags & 1:
+            frames = struct.unpack(">I", buf[p:p + 4])[0]
+            dur = frames * h["spf"] / float(h["sr"])
+            p += 4
+        if flags & 2:
+            audio_bytes = struct.unpack(">I", buf[p:p + 4])[0]
+            p += 4
+        if flags & 4:
+            toc = bytes(buf[p:p + 100])
+    if dur is None and audio_bytes:
+        dur = audio_bytes * 8.0 / h["br"]
+    if dur is None:
+        raise AudioError("MP3 senza durata stimabile")
+    return audio_start, h, dur, toc, audio_bytes
+
+def _mp3_offset(info, t):
+    audio_start, h, dur, toc, audio_bytes = info
+    if toc and audio_bytes:
+        pct = min(99.0, max(0.0, 100.0 * t / dur))
+        k = int(pct)
+        a = toc[k]
+        b = toc[k + 1] if k < 99 else 256
+        return audio_start + int((a + (b - a) * (pct - k)) / 256.0 * audio_bytes)
+    return audio_start + int(t * h["br"] / 8.0)
+
+def _mp3_window(url, info, total, start, span):
+    audio_start, h, dur, toc, audio_bytes = info
+    first = max(audio_start, _mp3_offset(info, start) - 2 * h["len"])
+    last = _mp3_offset(info, min(dur, start + span)) + 4 * h["len"] + 4096
+    if total is not None:
+        last = min(total - 1, last)
+    buf, _ = _fetch(url, first, last)
+    # catena di frame consecutivi: la prima sync valida seguita da un'altra valida
+    i = 0
+    while i + 4 <= len(buf):
+        fh = _mp3_header(buf, i)
+        if fh and fh["sr"] == h["sr"] and _mp3_header(buf, i + fh["len"]):
+            break
+        i += 1
+    else:
+        raise AudioError("nessun frame MP3 completo nel range")
+    # il primo frame può dipendere dal bit reservoir del precedente: è il margine
+    t0 = max(0.0, start - 2 * h["spf"] / float(h["sr"]))
+    frames = int((start + span - t0) * h["sr"] / h["spf"]) + 1
+    start_i, end = i, i
+    while frames > 0:
+        fh = _mp3_header(buf, end)
+        if not fh or fh["sr"] != h["sr"] or end + fh["len"] > len(buf):
+            break
+        end += fh["len"]
+        frames -= 1
+    return bytes(buf[start_i:end]), t0
+
+# --- Onset ---------------------------------------------------------------------------
+
+def onset_time(x, sr, search):
+    """Primo attacco netto entro 'search' secondi di x (mono float) -> secondi."""
+    hop = 256
+    n = min(len(x), int((search + 0.1) * sr)) // hop
+    if n < 4:
+        return 0.0
+    e = np.log10((x[:n * hop].reshape(n, hop) ** 2).sum(axis=1) + 1e-9)
+    flux = np.maximum(0.0, np.diff(e))
+    k = int(search * sr) // hop
+    flux = flux[:max(1, k)]
+    thr = flux.mean() + 2.0 * flux.std()
+    hits = np.nonzero(flux > thr)[0]
+    j = int(hits[0]) if len(hits) else int(flux.argmax())
+    return max(0.0, (j + 1) * hop / float(sr) - PRE_ROLL)
+
+# --- API -----------------------------------------------------------------------------
+
+def _clip_name(url, start, ext):
+    base = os.path.splitext(os.path.basename(unquote(url.split("?")[0])))[0]
+    base = re.sub(r"[^\w.-]+", "_", base)[:48].strip("_") or "atom"
+    h = hashlib.sha1(url.encode("utf-8")).hexdigest()[:8]
+    return f"{base}_{h}_{int(start * 1000):08d}.{ext}"
+
+def _write(path, data):
+    tmp = path + ".part"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def _transcode_wav(data, path, offset, dur):
+    cmd = ["ffmpeg", "-v", "quiet", "-y", "-i", "pipe:0", "-ss", f"{offset:.3f}", "-t", f"{dur:.3f}",
+           "-c:a", "pcm_s16le", "-f", "wav", path]
+    p = subprocess.run(cmd, input=data, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=120)
+    if p.returncode != 0 or not os.path.isfile(path):
+        raise AudioError("ffmpeg: conversione della clip fallita")
+
+class AtomExtractor:
+    """
+    dur:   durata della clip (secondi) = --max-dur dello script
+    align: "random" | "onset"
+    lead:  secondi di anticipo scaricati per cercare l'onset
+    Tiene la mappa clip -> URL sorgente, così la history registra la sorgente.
+    """
+
+    def __init__(self, out_dir=DEFAULT_DIR, dur=4.0, align="random", lead=1.5, seed=None, debug=False):
+        if dur <= 0:
+            raise ValueError("la modalità atomi richiede una durata > 0 (--max-dur)")
+        self.out_dir = out_dir
+        self.dur = float(dur)
+        self.align = align
+        self.lead = float(lead) if align == "onset" else 0.0
+        self.rng = random.Random(seed)
+        self.debug = debug
+        self.origin = {}
+        self.fetched = 0
+        if align == "onset" and not have_numpy():
+            print("[WARN] --atom-align onset richiede numpy: finestra casuale.", file=sys.stderr)
+            self.align, self.lead = "random", 0.0
+
+    def _start(self, length):
+        return self.rng.uniform(0.0, max(0.0, length - self.dur - self.lead))
+
+    def extract(self, url, length=None):
+        """
+        Estrae una clip da url. Ritorna il percorso locale oppure None se il file
+        non è più lungo della clip (va usato l'URL intero). length (secondi,
+        dal catalogo) evita anche la lettura dell'header per i file corti.
+        Alza AudioError.
+        """
+        with trace.span("atom"):
+            return self._extract(url, length)
+
+    def _extract(self, url, length):
+        if length is not None and length <= self.dur:
+            return None
+        head, total = _fetch(url, 0, HEAD_BYTES - 1)
+        span = self.dur + self.lead
+        os.makedirs(self.out_dir, exist_ok=True)
+
+        if is_riff_wave(head):
+            fmt, file_dur = _wav_info(head, total)
+            if file_dur <= self.dur:
+                return None
+            start = self._start(file_dur)
+            raw = _wav_window(url, fmt, start, span)
+            self.fetched += len(head) + len(raw)
+            if self.align == "onset":
+                x = to_mono(pcm_to_float(raw, fmt))
+                off = onset_time(x, fmt.rate, self.lead)
+                cut = int(off * fmt.rate) * fmt.block_align
+                raw = raw[cut:]
+                start += off
+            raw = raw[:int(self.dur * fmt.rate) * fmt.block_align]
+            path = os.path.join(self.out_dir, _clip_name(url, start, "wav"))
+            _write(path, wav_bytes(fmt, raw))
+            return self._done(url, path, start)
+
+        # MP3/FLAC: senza ffmpeg non si può tagliare sull'onset, niente anticipo
+        if not have_ffmpeg():
+            span = self.dur
+        if head[:4] == b"fLaC":
+            info = _flac_info(url, head, total)
+            file_dur = info[5] or length
+            if file_dur is not None and file_dur <= self.dur:
+                return None
+            start = self._start(file_dur or 0.0)
+            data, t0 = _flac_window(url, info, total, start, span)
+            return self._compressed(url, data, t0, start, "flac")
+
+        info = _mp3_info(url, head, total)
+        file_dur = length or info[2]
+        if file_dur <= self.dur:
+            return None
+        start = self._start(file_dur)
+        data, t0 = _mp3_window(url, info, total, start, span)
+        return self._compressed(url, data, t0, start, "mp3")
+
+    def _compressed(self, url, data, t0, start, ext):
+        self.fetched += HEAD_BYTES + len(data)
+        offset = max(0.0, start - t0)
+        if self.align == "onset" and have_ffmpeg():
+            x = decode_ffmpeg(data, offset + self.dur + self.lead, ONSET_RATE)
+            offset += onset_time(x[int(offset * ONSET_RATE):], ONSET_RATE, self.lead)
+        if have_ffmpeg() and (ext == "flac" or self.align == "onset"):
+            path = os.path.join(self.out_dir, _clip_name(url, t0 + offset, "wav"))
+            _transcode_wav(data, path, offset, self.dur)
+        else:
+            # niente ffmpeg: clip nel formato d'origine, allineata ai frame
+            path = os.path.join(self.out_dir, _clip_name(url, t0, ext))
+            _write(path, data)
+        return self._done(url, path, t0 + offset)
+
+    def _done(self, url, path, start):
+        self.origin[path] = url
+        if self.debug:
+            print(f"[DEBUG] atomo {start:.2f}s+{self.dur:g}s: {url} -> {path}", file=sys.stderr)
+        return path
+
+    def history_urls(self, entries):
+        """Voci di lista -> URL da registrare in history (la sorgente per le clip)."""
+        out = []
+        for e in entries:
+            p = e.strip().rstrip(";")
+            out.append(self.origin.get(p, p))
+        return out
+
+def add_cli_args(ap):
+    ap.add_argument("--atoms", action="store_true",
+                    help="i file più lunghi di --max-dur non vengono scartati: se ne estrae una clip "
+                         "di --max-dur secondi scaricando solo quel range di byte")
+    ap.add_argument("--atoms-dir", type=str, default=DEFAULT_DIR, help=f"cartella delle clip (default: {DEFAULT_DIR})")
+    ap.add_argument("--atom-align", choices=ALIGN_CHOICES, default="random",
+                    help="finestra casuale o allineata al primo onset (default: random)")
+    ap.add_argument("--atom-lead", type=float, default=1.5,
+                    help="secondi extra scaricati per cercare l'onset (default: 1.5)")
+
+def extractor_from_args(args, debug=False):
+    """AtomExtractor dagli argomenti CLI, oppure None se --atoms non è attivo."""
+    if not getattr(args, "atoms", False):
+        return None
+    if not args.max_dur or args.max_dur <= 0:
+        print("[ERROR] --atoms richiede --max-dur > 0 (durata della clip).", file=sys.stderr)
+        sys.exit(2)
+    return AtomExtractor(args.atoms_dir, args.max_dur, args.atom_align, args.atom_lead, debug=debug)
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+"""
+envion_audio.py
+Decodifica minima di audio parziale (primi secondi di un file remoto).
+
+- WAV (PCM intero 8/16/24/32 bit, float 32/64, WAVE_FORMAT_EXTENSIBLE):
+  header RIFF letto a mano, campioni convertiti con numpy; funziona anche
+  su un file troncato (il chunk 'data' dichiara più byte di quelli letti)
+- Tutto il resto (MP3, OGG, FLAC, AIFF): ffmpeg, se è nel PATH, da stdin
+  a float32 mono
+
+numpy e ffmpeg sono opzionali: senza, le funzioni alzano AudioError e chi
+chiama decide se saltare il candidato o lasciarlo passare.
+"""
+
+import shutil
+import struct
+import subprocess
+from collections import namedtuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy opzionale
+    np = None
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+WavFormat = namedtuple("WavFormat", "tag channels rate bits block_align data_offset data_size")
+
+class AudioError(ValueError):
+    pass
+
+def have_numpy():
+    return np is not None
+
+def have_ffmpeg():
+    return shutil.which("ffmpeg") is not None
+
+def is_riff_wave(buf):
+    return len(buf) >= 12 and buf[:4] == b"RIFF" and buf[8:12] == b"WAVE"
+
+def parse_wav_header(buf):
+    """Header RIFF/WAVE -> WavFormat. Serve arrivare almeno all'inizio del chunk 'data'."""
+    if not is_riff_wave(buf):
+        raise AudioError("non è un file RIFF/WAVE")
+    pos, fmt = 12, None
+    while pos + 8 <= len(buf):
+        cid = buf[pos:pos + 4]
+        size = struct.unpack_from("<I", buf, pos + 4)[0]
+        body = pos + 8
+        if cid == b"fmt ":
+            if body + 16 > len(buf):
+                break
+            tag, ch, rate, _, align, bits = struct.unpack_from("<HHIIHH", buf, body)
+            if tag == WAVE_FORMAT_EXTENSIBLE and size >= 40 and body + 26 <= len(buf):
+                tag = struct.unpack_from("<H", buf, body + 24)[0]  # primi 2 byte del SubFormat GUID
+            fmt = (tag, ch, rate, bits, align)
+        elif cid == b"data":
+            if fmt is None:
+                raise AudioError("chunk 'data' prima di 'fmt '")
+            return WavFormat(*fmt, body, size)
+        pos = body + size + (size & 1)
+    raise AudioError("header WAV incompleto")
+
+def pcm_to_float(raw, fmt):
+    """Byte PCM interleaved -> array float32 (frame, canali) in [-1, 1]."""
+    if np is None:
+        raise AudioError("numpy non disponibile")
+    ch, bits = fmt.channels, fmt.bits
+    width = bits // 8
+    n = len(raw) // (width * ch) * width * ch
+    raw = raw[:n]
+    if fmt.tag == WAVE_FORMAT_IEEE_FLOAT and bits in (32, 64):
+        x = np.frombuffer(raw, dtype="<f4" if bits == 32 else "<f8").astype(np.float32)
+    elif fmt.tag == WAVE_FORMAT_PCM and bits == 8:
+        x = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif fmt.tag == WAVE_FORMAT_PCM and bits == 16:
+        x = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768.0
+    elif fmt.tag == WAVE_FORMAT_PCM and bits == 24:
+        b = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        v = b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)
+        x = (np.where(v & 0x800000, v - 0x1000000, v)).astype(np.float32) / 8388608.0
+    elif fmt.tag == WAVE_FORMAT_PCM and bits == 32:
+        x = np.frombuffer(raw, dtype="<i4").astype(np.float32) / 2147483648.0
+    else:
+        raise AudioError(f"formato WAV non supportato (tag={fmt.tag}, bits={bits})")
+    return x.reshape(-1, ch)
+
+def to_mono(x):
+    return x.mean(axis=1) if x.ndim == 2 else x
+
+def resample(x, sr, target):
+    """Ricampionamento lineare (basta per fingerprint/anteprime)."""
+    if sr == target or len(x) == 0:
+        return x.astype(np.float32)
+    n = int(round(len(x) * target / float(sr)))
+    t = np.arange(n, dtype=np.float64) * (sr / float(target))
+    return np.interp(t, np.arange(len(x)), x).astype(np.float32)
+
+def decode_ffmpeg(data, seconds, rate, start=0.0):
+    """Decodifica byte (anche troncati) con ffmpeg -> float32 mono a rate."""
+    if np is None:
+        raise AudioError("numpy non disponibile")
+    exe = shutil.which("ffmpeg")
+    if not exe:
+        raise AudioError("ffmpeg non trovato nel PATH")
+    cmd = [exe, "-v", "quiet", "-i", "pipe:0"]
+    if start > 0:
+        cmd += ["-ss", f"{start:.3f}"]
+    cmd += ["-t", f"{seconds:.3f}", "-ac", "1", "-ar", str(int(rate)), "-f", "f32le", "pipe:1"]
+    try:
+        p = subprocess.run(cmd, input=data, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=60)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise AudioError(f"ffmpeg: {e}")
+    # su input troncato ffmpeg può uscire con errore dopo aver decodificato: conta l'output
+    if not p.stdout:
+        raise AudioError("ffmpeg non ha decodificato nulla")
+    return np.frombuffer(p.stdout[:len(p.stdout) // 4 * 4], dtype="<f4").copy()
+
+def decode_head(data, seconds, rate):
+    """Primi 'seconds' di data (WAV o altro) -> float32 mono a rate."""
+    if np is None:
+        raise AudioError("numpy non disponibile")
+    if is_riff_wave(data):
+        try:
+            fmt = parse_wav_header(data)
+            end = min(len(data), fmt.data_offset + int(seconds * fmt.rate) * fmt.block_align)
+            x = to_mono(pcm_to_float(data[fmt.data_offset:end], fmt))
+            return resample(x, fmt.rate, rate)
+        except AudioError:
+            if not have_ffmpeg():
+                raise
+    return decode_ffmpeg(data, seconds, rate)
@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+envion_bbcindex.py
+Indice locale (SQLite FTS5) dei file delle collezioni BBC su Internet Archive.
+
+Le collezioni BBC sono un corpus fisso, ma ogni ricerca con scope bbc rifaceva
+advancedsearch + /metadata di ogni item. Qui l'elenco dei file (nome, titolo,
+durata, dimensione) viene raccolto una volta sola in netsound/bbc_index.sqlite
+e le ricerche (--scope bbc-local negli script IA) rispondono in millisecondi,
+senza rete.
+
+Raccolta (harvest):
+- item della collezione da advancedsearch (identifier, titolo, item_size,
+  publicdate) più BBCSoundEffectsComplete, letto direttamente
+- per ogni item un timbro (item_size|publicdate, o item_last_updated per gli
+  item letti direttamente): se non è cambiato l'item non viene riletto
+- i file degli item cambiati arrivano in streaming da /metadata/<id>/files
+  (envion_http.iter_files); si tengono solo i file audio
+- gli item spariti dalla collezione vengono tolti dall'indice, ma solo se
+  l'elenco è completo (tutti i numFound, nessuna pagina fallita)
+
+Ricerca: parole della query in AND (prefisso: wood trova wooden); "a OR b"
+vuole almeno una delle due, "NOT a" esclude i file con a; filtri su durata
+ed estensione. Se SQLite non ha FTS5 si ripiega su LIKE (più lento, stesso
+risultato).
+
+Uso:
+  python3 envion_bbcindex.py harvest --verbose        # prima volta / aggiornamento
+  python3 envion_bbcindex.py query --q wood --max-dur 4 --limit 8
+  python3 envion_bbcindex.py stats
+"""
+
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+import envion_http
+from envion_filters import normalize_exts, parse_length, parse_size
+from envion_urls import archive_download_url
+
+DEFAULT_DB = "netsound/bbc_index.sqlite"
+INDEX_VERSION = 1
+
+# scrape API: paginazione a cursore, senza il tetto di ~10k righe di advancedsearch
+IA_SCRAPE = "https://archive.org/services/search/v1/scrape"
+BBC_COLLECTIONS = ("BBCSoundEffectsComplete", "bbcsoundeffects")
+# item enormi letti direttamente (non sono membri della collezione)
+ROOT_ITEMS = ("BBCSoundEffectsComplete",)
+AUDIO_EXTS = normalize_exts({"wav", "wave", "aiff", "aif", "flac", "mp3", "ogg"})
+
+SEARCH_ROWS = 5000
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_OPERATORS = {"OR", "AND", "NOT"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS items (
+    identifier TEXT PRIMARY KEY, title TEXT, stamp TEXT, n INTEGER, harvested TEXT
+);
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    identifier TEXT NOT NULL, name TEXT NOT NULL, title TEXT,
+    length REAL, size INTEGER, ext TEXT
+);
+CREATE INDEX IF NOT EXISTS files_identifier ON files(identifier);
+CREATE INDEX IF NOT EXISTS files_length ON files(length);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS files_fts USING fts5(
+    name, title, content='files', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS files_ai AFTER INSERT ON files BEGIN
+    INSERT INTO files_fts(rowid, name, title) VALUES (new.id, new.name, new.title);
+END;
+CREATE TRIGGER IF NOT EXISTS files_ad AFTER DELETE ON files BEGIN
+    INSERT INTO files_fts(files_fts, rowid, name, title) VALUES ('delete', old.id, old.name, old.title);
+END;
+"""
+
+# --- Apertura ----------------------------------------------------------------
+
+def has_fts(con):
+    return con.execute("SELECT 1 FROM sqlite_master WHERE name='files_fts'").fetchone() is not None
+
+def open_index(db_path):
+    d = os.path.dirname(db_path)
+    if d:
+        os.makedirs(d, exist_ok=True)
+    con = sqlite3.connect(db_path)
+    con.row_factory = sqlite3.Row
+    con.executescript(SCHEMA)
+    row = con.execute("SELECT value FROM meta WHERE key='version'").fetchone()
+    if row and int(row[0]) != INDEX_VERSION:
+        # schema vecchio: si riparte da zero (l'harvest successivo rilegge tutto)
+        con.close()
+        os.remove(db_path)
+        return open_index(db_path)
+    try:
+        con.executescript(FTS_SCHEMA)
+    except sqlite3.OperationalError:
+        pass   # SQLite senza FTS5: query() usa LIKE
+    con.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (str(INDEX_VERSION),))
+    return con
+
+# --- Harvest -----------------------------------------------------------------
+
+def _ext_of(name):
+    dot = name.rfind(".")
+    return name[dot + 1:].lower() if dot > name.rfind("/") else ""
+
+def list_collection(timeout=60):
+    """
+    Item delle collezioni BBC: (identifier -> (titolo, timbro), completo).
+    completo è False se una pagina è fallita o gli item letti sono meno di
+    quelli dichiarati dal servizio: in quel caso l'elenco non basta per
+    decidere cosa togliere dall'indice.
+    """
+    q = f'collection:({" OR ".join(BBC_COLLECTIONS)})'
+    out, cursor, total, ok = {}, None, None, True
+    while True:
+        params = {"q": q, "fields": "identifier,title,item_size,publicdate", "count": SEARCH_ROWS}
+        if cursor:
+            params["cursor"] = cursor
+        try:
+            data = envion_http.get_json(IA_SCRAPE + "?" + urlencode(params), timeout=timeout)
+        except Exception:
+            if not out:
+                raise
+            ok = False
+            break
+        if total is None:
+            total = int(data.get("total") or 0)
+        for d in data.get("items") or []:
+            ident = d.get("identifier")
+            if ident:
+                title = d.get("title")
+                if isinstance(title, list):
+                    title = title[0] if title else None
+                out[ident] = (title, f"{d.get('item_size', '')}|{d.get('publicdate', '')}")
+        cursor = data.get("cursor")
+        if not cursor or not data.get("items"):
+            break
+    return out, ok and len(out) >= (total or 0)
+
+def root_item_stamp(identifier, timeout=30):
+    data = envion_http.get_json(f"{envion_http.IA_META}/{identifier}/item_last_updated", timeout=timeout)
+    return str(data.get("result", ""))
+
+def harvest_item(identifier, timeout=60):
+    """File audio di un item (streaming): lista di dict name/title/length/size/ext."""
+    out = []
+    for f in envion_http.iter_files(identifier, timeout=timeout):
+        name = f.get("name") or ""
+        ext = _ext_of(name)
+        if ext not in AUDIO_EXTS:
+            continue
+        out.append({"name": name, "title": f.get("title"), "length": parse_length(f.get("length")),
+                    "size": parse_size(f.get("size")), "ext": ext})
+    return out
+
+def store_item(con, identifier, title, stamp, files):
+    con.execute("DELETE FROM files WHERE identifier=?", (identifier,))
+    con.executemany(
+        "INSERT INTO files (identifier, name, title, length, size, ext) VALUES (?,?,?,?,?,?)",
+        [(identifier, f["name"], f["title"] or title, f["length"], f["size"], f["ext"]) for f in files])
+    con.execute("INSERT OR REPLACE INTO items (identifier, title, stamp, n, harvested) VALUES (?,?,?,?,?)",
+                (identifier, title, stamp, len(files), time.strftime("%Y-%m-%dT%H:%M:%S")))
+
+def harvest(con, workers=8, verbose=False, timeout=60):
+    """
+    Aggiornamento incrementale dell'indice.
+    Ritorna (item aggiornati, item rimossi, item invariati, item falliti).
+    """
+    wanted, complete = list_collection(timeout)
+    listed = len(wanted)
+    for ident in ROOT_ITEMS:
+        wanted[ident] = (wanted.get(ident, (None, ""))[0] or ident, root_item_stamp(ident, timeout))
+    known = {r["identifier"]: r["stamp"] for r in con.execute("SELECT identifier, stamp FROM items")}
+    todo = [i for i, (_, stamp) in wanted.items() if known.get(i) != stamp]
+    same = len(wanted) - len(todo)
+    updated = failed = 0
+
+    def job(ident):
+        try:
+            return ident, harvest_item(ident, timeout), None
+        except Exception as e:
+            return ident, None, e
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        for ident, files, err in ex.map(job, todo):
+            if err is not None:
+                failed += 1
+                if verbose:
+                    print(f"[bbcindex] {ident}: errore {err}", file=sys.stderr)
+                continue
+            title, stamp = wanted[ident]
+            with con:
+                store_item(con, ident, title, stamp, files)
+            updated += 1
+            if verbose:
+                print(f"[bbcindex] {ident}: {len(files)} file audio")
+
+    gone = [i for i in known if i not in wanted]
+    if gone and not complete:
+        print(f"[bbcindex] elenco della collezione incompleto ({listed} item): "
+              f"{len(gone)} item non rimossi dall'indice", file=sys.stderr)
+        gone = []
+    with con:
+        for ident in gone:
+            con.execute("DELETE FROM files WHERE identifier=?", (ident,))
+            con.execute("DELETE FROM items WHERE identifier=?", (ident,))
+    return updated, len(gone), same, failed
+
+# --- Ricerca -----------------------------------------------------------------
+
+def _parse_query(q):
+    """
+    Query -> (gruppi richiesti, gruppi esclusi). Un gruppo è una lista di
+    alternative (unite da OR), un'alternativa la lista dei token di una
+    parola (in AND). AND è implicito; NOT esclude il gruppo che segue.
+    'wood OR metal NOT door' -> ([[["wood"], ["metal"]]], [[["door"]]])
+    """
+    pos, neg = [], []
+    last, want_or, want_not = None, False, False
+    for p in (q or "").split():
+        if p == "NOT":
+            want_not = True
+            continue
+        if p in _OPERATORS:
+            want_or = p == "OR" and last is not None
+            continue
+        alt = _TOKEN_RE.findall(p.lower())
+        if not alt:
+            continue
+        if want_or:
+            last.append(alt)
+        else:
+            last = [alt]
+            (neg if want_not else pos).append(last)
+            want_not = False
+        want_or = False
+    return pos, neg
+
+def _fts_group(group):
+    alts = [" AND ".join(f'"{t}"*' for t in alt) for alt in group]
+    alts = [f"({a})" if len(alt) > 1 else a for a, alt in zip(alts, group)]
+    return f"({' OR '.join(alts)})" if len(alts) > 1 else alts[0]
+
+def match_expr(q):
+    """
+    'wood knock' -> '"wood"* AND "knock"*'; 'wood NOT door' -> '"wood"* NOT "door"*'.
+    FTS5 non ha il NOT unario: senza parole richieste l'espressione è quella
+    dei gruppi esclusi (in OR) e il secondo valore è True (da negare).
+    """
+    pos, neg = _parse_query(q)
+    if not pos:
+        return " OR ".join(_fts_group(g) for g in neg), True
+    expr = " AND ".join(_fts_group(g) for g in pos)
+    if neg:
+        expr = f"({expr})" + "".join(f" NOT {_fts_group(g)}" for g in neg)
+    return expr, False
+
+def _like_group(group, args):
+    alts = []
+    for alt in group:
+        conds = []
+        for t in alt:
+            conds.append("(lower(f.name) LIKE ? OR lower(coalesce(f.title, '')) LIKE ?)")
+            args += [f"%{t}%", f"%{t}%"]
+        alts.append("(" + " AND ".join(conds) + ")")
+    return "(" + " OR ".join(alts) + ")"
+
+def query(con, q, max_dur=0, min_dur=None, exts=None, limit=0, random=False):
+    """
+    File che corrispondono alla query. Ritorna dict con url (download IA,
+    forma canonica), identifier, name, title, length, size, ext.
+    Con max_dur > 0 i file senza durata nota sono esclusi.
+    """
+    where, args = [], []
+    pos, neg = _parse_query(q)
+    if (pos or neg) and has_fts(con):
+        expr, negate = match_expr(q)
+        where.append(f"f.id {'NOT IN' if negate else 'IN'} "
+                     "(SELECT rowid FROM files_fts WHERE files_fts MATCH ?)")
+        args.append(expr)
+    else:
+        for g in pos:
+            where.append(_like_group(g, args))
+        for g in neg:
+            where.append("NOT " + _like_group(g, args))
+    if max_dur and max_dur > 0:
+        where.append("f.length IS NOT NULL AND f.length <= ?")
+        args.append(float(max_dur))
+    if min_dur is not None:
+        where.append("f.length >= ?")
+        args.append(float(min_dur))
+    exts = normalize_exts(exts)
+    if exts:
+        where.append(f"f.ext IN ({','.join('?' * len(exts))})")
+        args += sorted(exts)
+    sql = "SELECT f.identifier, f.name, f.title, f.length, f.size, f.ext FROM files f"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY random()" if random else " ORDER BY f.identifier, f.name"
+    if limit and limit > 0:
+        sql += f" LIMIT {int(limit)}"
+    out = []
+    for r in con.execute(sql, args):
+        d = dict(r)
+        d["url"] = archive_download_url(d["identifier"], d["name"])
+        out.append(d)
+    return out
+
+def sidecar_meta(row):
+    """Riga di query() -> metadati da sidecar (envion_catalog)."""
+    return {"source": "bbc", "identifier": row["identifier"], "name": row["name"],
+            "title": row["title"], "length": row["length"], "size": row["size"]}
+
+def open_for_query(db_path):
+    """Indice pronto per le ricerche, oppure None se manca o è vuoto."""
+    if not os.path.exists(db_path):
+        return None
+    con = open_index(db_path)
+    if con.execute("SELECT 1 FROM files LIMIT 1").fetchone() is None:
+        con.close()
+        return None
+    return con
+
+# --- CLI ---------------------------------------------------------------------
+
+def main():
+    ap = argparse.ArgumentParser(description="Local full-text index of the BBC sound-effects collections on IA.")
+    ap.add_argument("--db", default=DEFAULT_DB, help=f"indice (default: {DEFAULT_DB})")
+    ap.add_argument("--workdir", default="", help="cartella di lavoro (root di Envion); vuoto = cartella corrente")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    h = sub.add_parser("harvest", help="raccoglie/aggiorna l'elenco dei file (solo item cambiati)")
+    h.add_argument("--workers", type=int, default=8, help="item letti in parallelo (default: 8)")
+    h.add_argument("--timeout", type=int, default=60)
+    h.add_argument("--verbose", action="store_true")
+    q = sub.add_parser("query", help="cerca nell'indice (offline)")
+    q.add_argument("--q", default="", help="parole in AND; 'a OR b' una delle due, 'NOT a' esclude")
+    q.add_argument("--max-dur", type=float, default=0.0)
+    q.add_argument("--min-dur", type=float, default=None)
+    q.add_argument("--formats", default="", help="estensioni ammesse separate da virgola")
+    q.add_argument("--limit", type=int, default=0)
+    q.add_argument("--random", action="store_true", help="ordine casuale")
+    q.add_argument("--out", default=None, help="scrive gli URL come lista netsound (';' finale)")
+    q.add_argument("--details", action="store_true", help="stampa anche durata e titolo")
+    sub.add_parser("stats", help="riepilogo dell'indice")
+    args = ap.parse_args()
+
+    if args.workdir:
+        os.chdir(args.workdir)
+    con = open_index(args.db)
+    try:
+        if args.cmd == "harvest":
+            t0 = time.perf_counter()
+            try:
+                up, gone, same, failed = harvest(con, args.workers, args.verbose, args.timeout)
+            except Exception as e:
+                print(f"[ERROR] elenco della collezione non disponibile: {e}", file=sys.stderr)
+                sys.exit(2)
+            n = con.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+            print(f"[OK] {up} item aggiornati, {gone} rimossi, {same} invariati, {failed} falliti; "
+                  f"{n} file in {time.perf_counter() - t0:.1f}s -> {args.db}")
+            if failed:
+                sys.exit(1)
+        elif args.cmd == "query":
+            t0 = time.perf_counter()
+            exts = [e for e in args.formats.split(",") if e.strip()]
+            rows = query(con, args.q, args.max_dur, args.min_dur, exts, args.limit, args.random)
+            dt = time.perf_counter() - t0
+            if args.out:
+                with open(args.out, "w", encoding="utf-8") as f:
+                    for r in rows:
+                        f.write(r["url"] + ";\n")
+            for r in rows:
+                if args.details:
+                    dur = f"{r['length']:.2f}s" if r["length"] is not None else "?"
+                    print(f"{r['url']};  [{dur}, {r['title'] or ''}]")
+                else:
+                    print(r["url"] + ";")
+            print(f"[OK] {len(rows)} file in {dt * 1000:.1f} ms" + (f" -> {args.out}" if args.out else ""), file=sys.stderr)
+        elif args.cmd == "stats":
+            n_items = con.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+            n_files, n_dur = con.execute("SELECT COUNT(*), COUNT(length) FROM files").fetchone()
+            last = con.execute("SELECT MAX(harvested) FROM items").fetchone()[0]
+            print(f"item: {n_items}  file: {n_files}  con durata: {n_dur}  ultimo harvest: {last or '-'}"
+                  f"  fts5: {'sì' if has_fts(con) else 'no'}")
+            for ext, n in con.execute("SELECT ext, COUNT(*) FROM files GROUP BY ext ORDER BY 2 DESC"):
+                print(f"  {ext:<6} {n}")
+    finally:
+        con.close()
+
+if __name__ == "__main__":
+    main()
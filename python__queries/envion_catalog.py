@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+envion_catalog.py
+Sidecar di metadati per le liste netsound e catalogo interrogabile.
+
+Sidecar: accanto a ogni lista (netsound/xxx.txt) i fetcher scrivono
+netsound/xxx.jsonl, una riga per voce con i metadati che avevano già in mano
+al momento del fetch:
+  {"entry": "<voce di lista>", "url": "<URL sorgente>", "source": "ia|bbc|commons|raw",
+   "identifier": "...", "name": "...", "title": "...", "length": 3.2, "size": 123456,
+   "format": "VBR MP3", "mime": "audio/mpeg", "tags": [...], "query": "wood",
+   "script": "make_bbc_search_ia", "fetched": "2025-10-06T13:54:43"}
+Campi assenti = non noti. Le liste Pd restano identiche (il .jsonl non è
+letto dal patch).
+
+Catalogo: netsound/catalog.sqlite, costruito in modo incrementale da liste
+e sidecar (si rileggono solo i file cambiati: mtime/dimensione). Le liste
+senza sidecar (quelle vecchie) entrano lo stesso, con quello che si ricava
+dall'URL (sorgente dall'host, identifier IA, nome file) e dal nome della
+lista (tag, data dal timestamp nel nome o mtime).
+
+Tag di una voce: tag del sidecar + parole della query + parole del nome
+della lista (bbc_wood_20251006_135443 -> bbc, wood; ..._041-contact-mics ->
+contact, mics).
+
+Uso:
+  python3 envion_catalog.py build                     # aggiorna netsound/catalog.sqlite
+  python3 envion_catalog.py query --tag wood --max-dur 2 --limit 8
+  python3 envion_catalog.py query --source bbc --since 2025-10-01 --format wav --random --out ../netsound/reuse_wood.txt
+  python3 envion_catalog.py stats
+"""
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from urllib.parse import unquote, urlsplit
+
+from envion_filters import parse_length, parse_size
+from envion_urls import archive_item, canonical_url, strip_entry
+
+DEFAULT_DB = "netsound/catalog.sqlite"
+DEFAULT_ROOT = "netsound"
+SIDECAR_EXT = ".jsonl"
+CATALOG_VERSION = 1
+
+# parole del nome lista che non dicono nulla del contenuto
+_STOP_TAGS = {"envion", "random", "raw", "urls", "txt", "list", "lista"}
+_STAMP_RE = re.compile(r"(\d{8})_(\d{6})")
+_WORD_RE = re.compile(r"[a-z][a-z0-9]+")
+
+# --- Sidecar -----------------------------------------------------------------
+
+def sidecar_path(list_path):
+    return os.path.splitext(list_path)[0] + SIDECAR_EXT
+
+def now_iso():
+    return time.strftime("%Y-%m-%dT%H:%M:%S")
+
+def ia_file_meta(identifier, f, item_meta=None, source="ia"):
+    """Voce di md['files'] di IA (+ md['metadata'] dell'item) -> metadati da sidecar."""
+    item_meta = item_meta or {}
+    subjects = item_meta.get("subject") or []
+    if isinstance(subjects, str):
+        subjects = [s for s in re.split(r"[;,]", subjects)]
+    return {
+        "source": source,
+        "identifier": identifier,
+        "name": f.get("name"),
+        "title": f.get("title") or item_meta.get("title"),
+        "length": parse_length(f.get("length")),
+        "size": parse_size(f.get("size")),
+        "format": f.get("format"),
+        "tags": [s.strip().lower() for s in subjects if s and s.strip()],
+    }
+
+def commons_meta(title, info):
+    """Pagina Commons (titolo + imageinfo[0]) -> metadati da sidecar."""
+    return {
+        "source": "commons",
+        "title": title,
+        "name": title.split(":", 1)[-1] if title else None,
+        "mime": info.get("mime"),
+        "size": parse_size(info.get("size")),
+        "length": parse_length(info.get("duration")),
+        "derivative": info.get("derivative"),
+        "original": info.get("original"),
+    }
+
+def sidecar_line(entry, extra=None, url=None, query=None, script=None, fetched=None):
+    """Una riga JSONL di sidecar (campi vuoti omessi)."""
+    e = strip_entry(entry)
+    rec = {"entry": e, "url": strip_entry(url) if url else e}
+    rec.update({k: v for k, v in (extra or {}).items() if v not in (None, "", [])})
+    if query:
+        rec.setdefault("query", query)
+    if script:
+        rec.setdefault("script", script)
+    rec.setdefault("fetched", fetched or now_iso())
+    return json.dumps(rec, ensure_ascii=False) + "\n"
+
+def write_sidecar(list_path, entries, meta=None, sources=None, query=None, script=None, mode="w"):
+    """
+    Scrive (o accoda, mode="a") il sidecar di list_path.
+    entries: voci della lista (con o senza ';'); sources: URL sorgente per voce
+    (clip locali -> URL originale); meta: dict URL sorgente o voce -> metadati.
+    """
+    meta = meta or {}
+    fetched = now_iso()
+    with open(sidecar_path(list_path), mode, encoding="utf-8") as f:
+        for i, e in enumerate(entries):
+            src = strip_entry(sources[i] if sources else e)
+            extra = meta.get(src) or meta.get(canonical_url(src)) or meta.get(strip_entry(e))
+            f.write(sidecar_line(e, extra, src, query, script, fetched))
+
+def read_sidecar(path):
+    """Sidecar -> dict voce -> record (righe troncate ignorate)."""
+    out = {}
+    if not os.path.isfile(path):
+        return out
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(rec, dict) and rec.get("entry"):
+                out[rec["entry"]] = rec
+    return out
+
+# --- Inferenza per le liste senza sidecar -----------------------------------
+
+def words(text):
+    return [w for w in _WORD_RE.findall((text or "").lower()) if w not in _STOP_TAGS]
+
+def list_tags(list_path):
+    base = os.path.splitext(os.path.basename(list_path))[0]
+    return words(_STAMP_RE.sub(" ", base).replace("_", " "))
+
+def list_date(list_path):
+    m = _STAMP_RE.search(os.path.basename(list_path))
+    if m:
+        d, t = m.groups()
+        return f"{d[:4]}-{d[4:6]}-{d[6:]}T{t[:2]}:{t[2:4]}:{t[4:]}"
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(os.path.getmtime(list_path)))
+
+def infer_meta(url):
+    """Metadati ricavabili dal solo URL."""
+    p = urlsplit(url)
+    host = (p.hostname or "").lower()
+    if not p.scheme:
+        return {"source": "local", "name": os.path.basename(url)}
+    item = archive_item(url)
+    if item:
+        ident, name = item
+        return {"source": "bbc" if ident.lower().startswith("bbcsoundeffects") else "ia",
+                "identifier": ident, "name": name}
+    name = unquote(os.path.basename(p.path))
+    if "wikimedia.org" in host or "wikipedia.org" in host:
+        return {"source": "commons", "name": name}
+    if "freesound.org" in host:
+        return {"source": "freesound", "name": name}
+    return {"source": host or "raw", "name": name}
+
+def _fmt_of(rec):
+    name = (rec.get("name") or rec.get("url") or "").lower()
+    ext = os.path.splitext(urlsplit(name).path if "://" in name else name)[1].lstrip(".")
+    return ext or None
+
+# --- Catalogo -----------------------------------------------------------------
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS lists (
+    path TEXT PRIMARY KEY, stamp TEXT NOT NULL, n INTEGER, date TEXT
+);
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY,
+    list TEXT NOT NULL, pos INTEGER NOT NULL,
+    entry TEXT NOT NULL, url TEXT, key TEXT,
+    source TEXT, identifier TEXT, name TEXT, title TEXT,
+    duration REAL, size INTEGER, ext TEXT, format TEXT, mime TEXT,
+    query TEXT, script TEXT, date TEXT
+);
+CREATE TABLE IF NOT EXISTS tags (item INTEGER NOT NULL, tag TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS items_list ON items(list);
+CREATE INDEX IF NOT EXISTS items_key ON items(key);
+CREATE INDEX IF NOT EXISTS items_source_date ON items(source, date);
+CREATE INDEX IF NOT EXISTS items_duration ON items(duration);
+CREATE INDEX IF NOT EXISTS items_date ON items(date);
+CREATE INDEX IF NOT EXISTS tags_tag ON tags(tag, item);
+CREATE INDEX IF NOT EXISTS tags_item ON tags(item);
+"""
+
+def open_catalog(db_path):
+    d = os.path.dirname(db_path)
+    if d:
+        os.makedirs(d, exist_ok=True)
+    con = sqlite3.connect(db_path)
+    con.executescript(SCHEMA)
+    row = con.execute("SELECT value FROM meta WHERE key='version'").fetchone()
+    if row and int(row[0]) != CATALOG_VERSION:
+        # schema vecchio: si ricostruisce da zero (le sorgenti sono liste e sidecar)
+        con.close()
+        os.remove(db_path)
+        return open_catalog(db_path)
+    con.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (str(CATALOG_VERSION),))
+    return con
+
+def find_lists(root):
+    """Liste .txt sotto root (history, checkpoint e file nascosti esclusi)."""
+    out = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+        for n in filenames:
+            if n.endswith(".txt") and "history" not in n.lower() and not n.startswith("."):
+                out.append(os.path.join(dirpath, n))
+    return sorted(out)
+
+def _stamp(path):
+    parts = []
+    for p in (path, sidecar_path(path)):
+        try:
+            st = os.stat(p)
+            parts.append(f"{st.st_mtime_ns}:{st.st_size}")
+        except OSError:
+            parts.append("-")
+    return "|".join(parts)
+
+def read_entries(list_path):
+    with open(list_path, "r", encoding="utf-8", errors="ignore") as f:
+        return [e for e in (strip_entry(line) for line in f) if e and not e.startswith("#")]
+
+def index_list(con, list_path):
+    """(Re)indicizza una lista; ritorna il numero di voci."""
+    entries = read_entries(list_path)
+    side = read_sidecar(sidecar_path(list_path))
+    ltags = list_tags(list_path)
+    ldate = list_date(list_path)
+    old = [r[0] for r in con.execute("SELECT id FROM items WHERE list=?", (list_path,))]
+    con.executemany("DELETE FROM tags WHERE item=?", [(i,) for i in old])
+    con.execute("DELETE FROM items WHERE list=?", (list_path,))
+    for pos, e in enumerate(entries):
+        rec = dict(infer_meta(e))
+        s = side.get(e)
+        if s:
+            rec.update({k: v for k, v in s.items() if v not in (None, "", [])})
+        url = rec.get("url") or e
+        cur = con.execute(
+            "INSERT INTO items (list, pos, entry, url, key, source, identifier, name, title, duration, size,"
+            " ext, format, mime, query, script, date) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)",
+            (list_path, pos, e, url, canonical_url(url), rec.get("source"), rec.get("identifier"),
+             rec.get("name"), rec.get("title"), parse_length(rec.get("length")), parse_size(rec.get("size")),
+             _fmt_of(rec), rec.get("format"), rec.get("mime"), rec.get("query"), rec.get("script"),
+             rec.get("fetched") or ldate))
+        tags = set(ltags) | set(words(rec.get("query")))
+        tags |= {t.strip().lower() for t in (rec.get("tags") or []) if isinstance(t, str) and t.strip()}
+        con.executemany("INSERT INTO tags (item, tag) VALUES (?, ?)", [(cur.lastrowid, t) for t in sorted(tags)])
+    con.execute("INSERT OR REPLACE INTO lists (path, stamp, n, date) VALUES (?, ?, ?, ?)",
+                (list_path, _stamp(list_path), len(entries), ldate))
+    return len(entries)
+
+def build(con, root=DEFAULT_ROOT, verbose=False):
+    """Aggiornamento incrementale; ritorna (liste aggiornate, liste rimosse, liste invariate)."""
+    known = dict(con.execute("SELECT path, stamp FROM lists"))
+    found = find_lists(root)
+    updated = same = 0
+    with con:
+        for p in found:
+            if known.get(p) == _stamp(p):
+                same += 1
+                continue
+            n = index_list(con, p)
+            updated += 1
+            if verbose:
+                print(f"[catalog] {p}: {n} voci")
+        gone = [p for p in known if p not in set(found)]
+        for p in gone:
+            ids = [r[0] for r in con.execute("SELECT id FROM items WHERE list=?", (p,))]
+            con.executemany("DELETE FROM tags WHERE item=?", [(i,) for i in ids])
+            con.execute("DELETE FROM items WHERE list=?", (p,))
+            con.execute("DELETE FROM lists WHERE path=?", (p,))
+    return updated, len(gone), same
+
+def query(con, tags=None, source=None, min_dur=None, max_dur=None, since=None, until=None,
+          ext=None, text=None, limit=0, random=False, unique=True):
+    """Voci che soddisfano tutti i filtri (tag in AND). Ritorna righe sqlite3.Row."""
+    where, args = [], []
+    for t in tags or []:
+        where.append("i.id IN (SELECT item FROM tags WHERE tag=?)")
+        args.append(t.lower())
+    if source:
+        where.append("i.source=?")
+        args.append(source)
+    if min_dur is not None:
+        where.append("i.duration>=?")
+        args.append(min_dur)
+    if max_dur is not None:
+        where.append("i.duration<=?")
+        args.append(max_dur)
+    if since:
+        where.append("i.date>=?")
+        args.append(since)
+    if until:
+        where.append("i.date<?")
+        args.append(until)
+    if ext:
+        where.append("i.ext=?")
+        args.append(ext.lower().lstrip("."))
+    if text:
+        where.append("(i.name LIKE ? OR i.title LIKE ? OR i.url LIKE ?)")
+        args += [f"%{text}%"] * 3
+    sql = "SELECT i.* FROM items i"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    if unique:
+        sql += " GROUP BY i.key"
+    sql += " ORDER BY RANDOM()" if random else " ORDER BY i.date DESC, i.list, i.pos"
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+    con.row_factory = sqlite3.Row
+    try:
+        return con.execute(sql, args).fetchall()
+    finally:
+        con.row_factory = None
+
+def main():
+    ap = argparse.ArgumentParser(description="Envion netsound catalog (lists + JSONL sidecars -> SQLite).")
+    ap.add_argument("--db", default=DEFAULT_DB, help=f"catalogo (default: {DEFAULT_DB})")
+    ap.add_argument("--root", default=DEFAULT_ROOT, help=f"cartella delle liste (default: {DEFAULT_ROOT})")
+    ap.add_argument("--workdir", default="", help="cartella di lavoro (root di Envion); vuoto = cartella corrente")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="aggiorna il catalogo (solo liste cambiate)")
+    b.add_argument("--verbose", action="store_true")
+    q = sub.add_parser("query", help="cerca voci nel catalogo")
+    q.add_argument("--tag", action="append", default=[], help="tag richiesto (ripetibile, in AND)")
+    q.add_argument("--source", default=None, help="ia | bbc | commons | freesound | local | <host>")
+    q.add_argument("--min-dur", type=float, default=None)
+    q.add_argument("--max-dur", type=float, default=None)
+    q.add_argument("--since", default=None, help="data minima (YYYY-MM-DD)")
+    q.add_argument("--until", default=None, help="data massima esclusa (YYYY-MM-DD)")
+    q.add_argument("--format", dest="ext", default=None, help="estensione (wav, mp3, flac...)")
+    q.add_argument("--text", default=None, help="sottostringa in nome, titolo o URL")
+    q.add_argument("--limit", type=int, default=0)
+    q.add_argument("--random", action="store_true", help="ordine casuale")
+    q.add_argument("--no-build", action="store_true", help="non aggiornare il catalogo prima della query")
+    q.add_argument("--out", default=None, help="scrive le voci come lista netsound (';' finale)")
+    q.add_argument("--details", action="store_true", help="stampa anche durata, sorgente e lista")
+    sub.add_parser("stats", help="riepilogo del catalogo")
+    args = ap.parse_args()
+
+    if args.workdir:
+        os.chdir(args.workdir)
+    con = open_catalog(args.db)
+    try:
+        if args.cmd == "build":
+            t0 = time.perf_counter()
+            up, gone, same = build(con, args.root, args.verbose)
+            print(f"[OK] {up} liste aggiornate, {gone} rimosse, {same} invariate in {time.perf_counter() - t0:.3f}s -> {args.db}")
+        elif args.cmd == "query":
+            if not args.no_build:
+                build(con, args.root)
+            t0 = time.perf_counter()
+            rows = query(con, args.tag, args.source, args.min_dur, args.max_dur, args.since, args.until,
+                         args.ext, args.text, args.limit, args.random)
+            dt = time.perf_counter() - t0
+            if args.out:
+                with open(args.out, "w", encoding="utf-8") as f:
+                    for r in rows:
+                        f.write(r["entry"] + ";\n")
+            for r in rows:
+                if args.details:
+                    dur = f"{r['duration']:.2f}s" if r["duration"] is not None else "?"
+                    print(f"{r['entry']};  [{r['source']}, {dur}, {r['date'][:10]}, {r['list']}]")
+                else:
+                    print(r["entry"] + ";")
+            print(f"[OK] {len(rows)} voci in {dt * 1000:.1f} ms" + (f" -> {args.out}" if args.out else ""), file=sys.stderr)
+        elif args.cmd == "stats":
+            build(con, args.root)
+            n_lists = con.execute("SELECT COUNT(*) FROM lists").fetchone()[0]
+            n_items, n_keys = con.execute("SELECT COUNT(*), COUNT(DISTINCT key) FROM items").fetchone()
+            n_dur = con.execute("SELECT COUNT(*) FROM items WHERE duration IS NOT NULL").fetchone()[0]
+            print(f"liste: {n_lists}  voci: {n_items}  URL unici: {n_keys}  con durata: {n_dur}")
+            for src, n in con.execute("SELECT source, COUNT(*) FROM items GROUP BY source ORDER BY 2 DESC"):
+                print(f"  {src:<20} {n}")
+            top = con.execute("SELECT tag, COUNT(*) FROM tags GROUP BY tag ORDER BY 2 DESC LIMIT 20").fetchall()
+            print("tag: " + ", ".join(f"{t} ({n})" for t, n in top))
+    finally:
+        con.close()
+
+if __name__ == "__main__":
+    main()
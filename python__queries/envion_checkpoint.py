@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+"""
+envion_checkpoint.py
+Journal di avanzamento per fetch lunghi (--rows/--pages grandi, sitewide).
+
+Ogni run scrive in append un file JSONL sotto netsound/.checkpoints/:
+  {"ev": "params", "params": {...}}            parametri della run
+  {"ev": "page", "page": 3, "ids": [...]}      cursore di ricerca: pagina fatta + identifier trovati
+  {"ev": "item", "id": "...", "urls": [...]}   identifier fatto + candidati accettati dai filtri
+
+Con --resume lo script rilegge il journal e riparte da dove era: pagine di
+ricerca e identifier già fatti non vengono richiesti di nuovo, i candidati
+già trovati vengono riusati. Un identifier fallito (errore di rete) non
+viene registrato, quindi al resume viene ritentato.
+
+Una riga troncata da un'interruzione viene ignorata in rilettura.
+"""
+
+import hashlib
+import json
+import os
+
+DEFAULT_DIR = "netsound/.checkpoints"
+
+def checkpoint_path(script, params, base_dir=DEFAULT_DIR):
+    """Percorso stabile per (script, parametri)."""
+    h = hashlib.sha1(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(base_dir, f"{script}_{h}.jsonl")
+
+class CheckpointError(RuntimeError):
+    pass
+
+class FetchJournal:
+    """
+    path:   file JSONL del journal
+    params: dict dei parametri della run (devono coincidere per il resume)
+    resume: True = rilegge il journal esistente; False = lo riparte da zero
+    """
+
+    def __init__(self, path, params, resume=False):
+        self.path = path
+        self.params = params
+        self.pages = {}
+        self.items = {}
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        if resume and os.path.isfile(path):
+            self._replay()
+            mode = "a"
+        else:
+            mode = "w"
+        self._fh = open(path, mode, encoding="utf-8")
+        if mode == "w":
+            self._write({"ev": "params", "params": params})
+
+    def _replay(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    ev = json.loads(line)
+                except ValueError:
+                    continue  # riga troncata
+                kind = ev.get("ev")
+                if kind == "params":
+                    if ev.get("params") != self.params:
+                        raise CheckpointError(
+                            f"{self.path}: il checkpoint è di una run con parametri diversi")
+                elif kind == "page":
+                    self.pages[ev["page"]] = ev.get("ids") or []
+                elif kind == "item":
+                    self.items[ev["id"]] = ev.get("urls") or []
+
+    def _write(self, ev):
+        self._fh.write(json.dumps(ev, ensure_ascii=False) + "\n")
+        self._fh.flush()
+
+    # --- cursore di ricerca ---------------------------------------------------
+
+    def has_page(self, page):
+        return page in self.pages
+
+    def page_ids(self, page):
+        return self.pages.get(page, [])
+
+    def record_page(self, page, ids):
+        self.pages[page] = list(ids)
+        self._write({"ev": "page", "page": page, "ids": list(ids)})
+
+    # --- identifier -----------------------------------------------------------
+
+    def is_done(self, ident):
+        return ident in self.items
+
+    def item_urls(self, ident):
+        return self.items.get(ident, [])
+
+    def record_item(self, ident, urls):
+        self.items[ident] = list(urls)
+        self._write({"ev": "item", "id": ident, "urls": list(urls)})
+
+    def candidates(self):
+        """Tutti i candidati registrati, nell'ordine in cui sono stati trovati."""
+        out = []
+        for urls in self.items.values():
+            out.extend(urls)
+        return out
+
+    def close(self, remove=False):
+        """remove=True a run completata: il checkpoint non serve più."""
+        if self._fh:
+            self._fh.close()
+            self._fh = None
+        if remove and os.path.isfile(self.path):
+            os.remove(self.path)
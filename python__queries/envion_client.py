@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+envion_client.py
+Client minimo per envion_service: stessi argomenti degli script, risposta
+dal servizio residente (connessioni, history e cache già calde).
+
+Importa solo moduli della libreria standard leggeri (niente requests): il
+costo è l'avvio dell'interprete. Se il servizio non accetta la connessione
+lo script viene eseguito direttamente, con gli stessi argomenti; se cade
+dopo aver ricevuto la richiesta si segnala l'errore (niente doppio lavoro).
+
+Uso:
+  python3 envion_client.py make_internetarchive_search --q wind --max-dur 8 --count 8 --out-dir netsound
+  python3 envion_client.py internet_archive_fine_tuning --recipe ...
+  python3 envion_client.py make_raw_list --url ... --count 8
+  python3 envion_client.py --ping
+  python3 envion_client.py --stop
+
+Socket: $ENVION_SOCKET, altrimenti envion-<uid>.sock in $XDG_RUNTIME_DIR o /tmp.
+Il client usa solo la libreria standard: con "python3 -S" si salta anche
+site (e i .pth dei pacchetti installati), che è la parte lenta dell'avvio.
+"""
+
+import json
+import os
+import socket
+import sys
+
+SCRIPTS = ("make_internetarchive_search", "internet_archive_fine_tuning", "make_raw_list")
+MAX_LINE = 1 << 20
+
+def socket_path():
+    p = os.environ.get("ENVION_SOCKET")
+    if p:
+        return p
+    base = os.environ.get("XDG_RUNTIME_DIR") or "/tmp"
+    return os.path.join(base, f"envion-{os.getuid()}.sock")
+
+def connect(path=None, timeout=None):
+    """Socket connesso al servizio (OSError se non c'è)."""
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.settimeout(timeout)
+        s.connect(path or socket_path())
+    except OSError:
+        s.close()
+        raise
+    return s
+
+def exchange(s, req):
+    """Manda una richiesta (dict) su un socket connesso, ritorna la risposta (dict)."""
+    try:
+        s.sendall(json.dumps(req).encode("utf-8") + b"\n")
+        s.shutdown(socket.SHUT_WR)
+        buf = bytearray()
+        while True:
+            chunk = s.recv(65536)
+            if not chunk:
+                break
+            buf += chunk
+    finally:
+        s.close()
+    return json.loads(buf.decode("utf-8"))
+
+def call(req, path=None, timeout=None):
+    """Manda una richiesta (dict) al servizio, ritorna la risposta (dict)."""
+    return exchange(connect(path, timeout), req)
+
+def run_direct(script, argv):
+    here = os.path.dirname(os.path.abspath(__file__))
+    path = os.path.join(here, script + ".py")
+    os.execv(sys.executable, [sys.executable, path] + argv)
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if not argv or argv[0] in ("-h", "--help"):
+        print(__doc__.strip(), file=sys.stderr)
+        sys.exit(0 if argv else 2)
+    if argv[0] in ("--ping", "--stop"):
+        try:
+            res = call({"cmd": argv[0][2:]}, timeout=5)
+        except OSError as e:
+            print(f"[envion] servizio non raggiungibile su {socket_path()}: {e}", file=sys.stderr)
+            sys.exit(1)
+        print(json.dumps(res, ensure_ascii=False))
+        return
+    script = argv[0][:-3] if argv[0].endswith(".py") else argv[0]
+    script = os.path.basename(script)
+    if script not in SCRIPTS:
+        print(f"[envion] script non gestito: {argv[0]} (ammessi: {', '.join(SCRIPTS)})", file=sys.stderr)
+        sys.exit(2)
+    try:
+        s = connect()
+    except OSError:
+        run_direct(script, argv[1:])   # niente servizio: stesso risultato, solo più lento
+    # richiesta partita: il lavoro può essere già in corso, rieseguirlo qui lo farebbe due volte
+    try:
+        res = exchange(s, {"script": script, "argv": argv[1:], "cwd": os.getcwd()})
+    except (OSError, ValueError) as e:
+        print(f"[envion] risposta del servizio persa ({e}): il lavoro non viene ripetuto", file=sys.stderr)
+        sys.exit(1)
+    if res.get("out"):
+        sys.stdout.write(res["out"])
+    if res.get("err"):
+        sys.stderr.write(res["err"])
+    sys.exit(int(res.get("rc") or 0))
+
+if __name__ == "__main__":
+    main()
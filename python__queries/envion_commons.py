@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+"""
+envion_commons.py
+Metadati dei file Commons e scelta dell'URL da scaricare.
+
+Gli script Commons chiedevano solo iiprop=url|mime: niente durata né
+dimensione, quindi nessun limite applicabile e a volte WAV/FLAC da centinaia
+di MB. Qui la stessa chiamata batch (pageids o generator) chiede anche:
+- imageinfo: url, mime, size (include 'duration' per i file audio/video)
+- videoinfo (TimedMediaHandler): derivatives, cioè i transcode già pronti
+  su upload.wikimedia.org (mp3, ogg vorbis, ...) con la loro 'bandwidth'
+
+choose() applica il filtro compilato (envion_filters) all'originale; se
+l'originale è scartato solo per la dimensione prova i derivati audio,
+nell'ordine di preferenza, stimandone la dimensione da bandwidth * durata.
+La durata di un derivato è quella dell'originale, quindi il limite di
+durata non si aggira con un transcode.
+"""
+
+from envion_filters import REASON_SIZE, parse_length, parse_size
+
+# da unire ai parametri di action=query (pageids=... o generator=...)
+MEDIA_PARAMS = {
+    "prop": "imageinfo|videoinfo",
+    "iiprop": "url|mime|size",
+    "viprop": "derivatives",
+}
+
+# limite API per pageids/titles senza apihighlimits
+PAGEIDS_BATCH = 50
+
+DEFAULT_TRANSCODES = ("mp3", "ogg")
+
+def batches(ids, n=PAGEIDS_BATCH):
+    ids = list(ids)
+    for i in range(0, len(ids), n):
+        yield ids[i:i + n]
+
+def parse_transcodes(value):
+    """'mp3,ogg' -> ('mp3', 'ogg'); '' -> () (transcode disattivati)."""
+    return tuple(t.strip().lower() for t in (value or "").split(",") if t.strip())
+
+def page_info(page):
+    """
+    Pagina della risposta -> dict con url, mime, size, duration, derivatives
+    (lista, eventualmente vuota); None se la pagina non ha imageinfo.
+    """
+    infos = page.get("imageinfo") or []
+    if not infos:
+        return None
+    info = dict(infos[0])
+    vinfos = page.get("videoinfo") or []
+    info["derivatives"] = (vinfos[0].get("derivatives") or []) if vinfos else []
+    return info
+
+def derivative_size(d, duration):
+    """Dimensione stimata di un derivato (byte) da bandwidth (bit/s) e durata."""
+    bw = parse_size(d.get("bandwidth"))
+    sec = parse_length(duration)
+    if not bw or sec is None:
+        return None
+    return int(bw * sec / 8)
+
+def _audio_derivatives(info, transcodes):
+    by_key = {}
+    for d in info.get("derivatives") or []:
+        key = (d.get("transcodekey") or "").lower()
+        src = d.get("src") or ""
+        mime = (d.get("type") or "").split(";", 1)[0].strip().lower()
+        if key and src and mime.startswith("audio/") and key not in by_key:
+            by_key[key] = (src, mime, d)
+    return [(k,) + by_key[k] for k in transcodes if k in by_key]
+
+def choose(flt, title, info, transcodes=DEFAULT_TRANSCODES):
+    """
+    Sceglie l'URL per un file Commons.
+    Ritorna (url, meta, None) se accettato, (None, None, motivo) se scartato.
+    meta è il dict di imageinfo con url/mime/size del file scelto, più
+    'derivative' (transcodekey) e 'original' se è stato scelto un transcode.
+    """
+    url = info.get("url") or ""
+    mime = info.get("mime") or ""
+    duration = info.get("duration")
+    reason = flt.reject_reason(title, length=duration, size=info.get("size"), url=url, mime=mime)
+    if reason is None:
+        return url, info, None
+    if reason != REASON_SIZE:
+        return None, None, reason
+    for key, src, dmime, d in _audio_derivatives(info, transcodes):
+        size = derivative_size(d, duration)
+        if size is None:
+            continue
+        if flt.reject_reason(title, length=duration, size=size, url=src, mime=dmime) is None:
+            meta = dict(info, url=src, mime=dmime, size=size, derivative=key, original=url)
+            return src, meta, None
+    return None, None, reason
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+
+"""
+envion_filters.py
+Filtri dei candidati condivisi da tutti gli script NET-AUDIO.
+
+Estensione, durata, dimensione, parole escluse e "nome contiene" erano
+reimplementati con piccole differenze in ogni script (is_good_ext, length_ok,
+size_ok, valid_audio_file, parse_len, is_small_file, is_audio, is_audio_ok,
+pass_filters). Qui la specifica viene compilata una volta sola:
+- estensioni -> frozenset (senza punto, minuscole)
+- parole escluse -> un'unica regex combinata
+- limiti numerici -> secondi e byte già convertiti
+e poi applicata a liste intere di file (md["files"] di IA, pagine Commons).
+
+Regole comuni:
+- estensione: presa dal nome (o dall'URL); un MIME audio/* la sostituisce
+  se allow_audio_mime è attivo (Commons)
+- durata: 'length' in secondi, "m:ss" o "h:mm:ss"; se manca il file passa,
+  a meno di require_length
+- dimensione: 'size' in byte, limite in MB decimali (1 MB = 1_000_000 byte);
+  se manca il file passa
+- esclusioni: match case-insensitive su nome, titolo e URL
+"""
+
+import re
+from urllib.parse import urlsplit
+
+# motivi di scarto (usati anche per statistiche/debug)
+REASON_NAME = "name"
+REASON_EXT = "ext"
+REASON_DURATION = "duration"
+REASON_SIZE = "size"
+REASON_EXCLUDE = "exclude"
+REASON_CONTAINS = "contains"
+
+_CLOCK_RE = re.compile(r"^\s*(?:(\d+):)?(\d+):(\d{1,2}(?:\.\d+)?)\s*$")
+
+def parse_length(value):
+    """'83.5' / 83 / '1:23' / '1:02:03' -> secondi (float) oppure None."""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    m = _CLOCK_RE.match(str(value))
+    if not m:
+        return None
+    h = int(m.group(1) or 0)
+    return h * 3600 + int(m.group(2)) * 60 + float(m.group(3))
+
+def parse_size(value):
+    """'12345' / 12345 -> byte (int) oppure None."""
+    if value is None or value == "":
+        return None
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+def normalize_exts(exts):
+    """{'.WAV', 'mp3', ' flac '} -> frozenset({'wav', 'mp3', 'flac'})."""
+    return frozenset(e.strip().lower().lstrip(".") for e in (exts or ()) if e and e.strip())
+
+def _ext_of(lower_name):
+    # niente split/splitext: solo l'ultimo punto dopo l'ultimo '/'
+    dot = lower_name.rfind(".")
+    if dot < 0 or lower_name.rfind("/") > dot:
+        return ""
+    return lower_name[dot + 1:]
+
+class CandidateFilter:
+    """Specifica di filtro compilata. Vedi compile_filters()."""
+
+    __slots__ = ("exts", "max_dur", "max_bytes", "exclude_re", "contains",
+                 "require_length", "allow_audio_mime")
+
+    def __init__(self, exts, max_dur, max_bytes, exclude_re, contains,
+                 require_length, allow_audio_mime):
+        self.exts = exts
+        self.max_dur = max_dur
+        self.max_bytes = max_bytes
+        self.exclude_re = exclude_re
+        self.contains = contains
+        self.require_length = require_length
+        self.allow_audio_mime = allow_audio_mime
+
+    def reject_reason(self, name, length=None, size=None, url="", title="", mime=""):
+        """None se il candidato passa, altrimenti il motivo dello scarto."""
+        if not name and not url:
+            return REASON_NAME
+        lname = name.lower() if name else ""
+
+        if self.contains and self.contains not in lname:
+            return REASON_CONTAINS
+
+        if self.exclude_re is not None:
+            if self.exclude_re.search(lname) or (url and self.exclude_re.search(url)) \
+                    or (title and self.exclude_re.search(title)):
+                return REASON_EXCLUDE
+
+        if self.exts:
+            if not (self.allow_audio_mime and mime and mime.lower().startswith("audio/")):
+                ext = _ext_of(lname)
+                if ext not in self.exts and (not url or _ext_of(urlsplit(url).path.lower()) not in self.exts):
+                    return REASON_EXT
+
+        if self.max_dur > 0 or self.require_length:
+            sec = parse_length(length)
+            if sec is None:
+                if self.require_length:
+                    return REASON_DURATION
+            elif self.max_dur > 0 and sec > self.max_dur:
+                return REASON_DURATION
+
+        if self.max_bytes > 0:
+            b = parse_size(size)
+            if b is not None and b > self.max_bytes:
+                return REASON_SIZE
+        return None
+
+    def file_reason(self, fobj):
+        """Come reject_reason, per un file object di IA (name/length/size)."""
+        return self.reject_reason(fobj.get("name") or "", fobj.get("length"), fobj.get("size"))
+
+    def accepts(self, fobj):
+        return self.file_reason(fobj) is None
+
+    def filter_files(self, files, rejected=None):
+        """
+        Filtra un'intera lista md["files"]; ritorna i file accettati in ordine.
+        rejected: dict opzionale motivo -> conteggio, aggiornato in place.
+        """
+        out = []
+        reason_of = self.file_reason
+        for f in files:
+            r = reason_of(f)
+            if r is None:
+                out.append(f)
+            elif rejected is not None:
+                rejected[r] = rejected.get(r, 0) + 1
+        return out
+
+def compile_filters(exts=None, max_dur=0.0, max_size_mb=0.0, exclude_terms=None,
+                    name_contains=None, require_length=False, allow_audio_mime=False):
+    """
+    Compila una specifica di filtro.
+
+    exts:             estensioni ammesse (con o senza punto); vuoto = tutte
+    max_dur:          secondi; <= 0 nessun limite
+    max_size_mb:      MB decimali; <= 0 nessun limite
+    exclude_terms:    parole escluse (nome, titolo, URL)
+    name_contains:    sottostringa richiesta nel nome del file
+    require_length:   scarta i file senza 'length'
+    allow_audio_mime: un MIME audio/* basta anche con estensione sconosciuta
+    """
+    terms = [t.strip().lower() for t in (exclude_terms or ()) if t and t.strip()]
+    exclude_re = re.compile("|".join(re.escape(t) for t in terms), re.IGNORECASE) if terms else None
+    max_dur = float(max_dur or 0)
+    max_bytes = int(float(max_size_mb or 0) * 1_000_000)
+    contains = name_contains.strip().lower() if name_contains and name_contains.strip() else None
+    return CandidateFilter(normalize_exts(exts), max_dur, max_bytes, exclude_re, contains,
+                           bool(require_length), bool(allow_audio_mime))
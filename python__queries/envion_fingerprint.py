@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+envion_fingerprint.py
+Dedupe acustica: lo stesso suono come item BBC su IA, ri-upload sitewide,
+file Commons e preview freesound ha URL diversi, e la history (anche con
+chiavi canoniche) non lo vede.
+
+Per ogni candidato:
+- si scaricano solo i primi secondi (richiesta Range; per i WAV prima
+  l'header, poi esattamente i byte che servono)
+- si decodificano in mono a 11025 Hz (envion_audio: WAV a mano, resto ffmpeg)
+- si calcola un fingerprint spettrale a 64 bit: energie log in 32 bande
+  logaritmiche, profilo medio (indipendente dal guadagno) + variabilità
+  nel tempo, proiettati su 64 iperpiani fissi (simhash)
+- si confronta con l'indice persistente (SQLite) in distanza di Hamming;
+  l'indice è diviso in threshold+1 blocchi di bit (multi-index hashing):
+  per il principio dei cassetti un vicino entro soglia coincide esattamente
+  su almeno un blocco, quindi si confrontano solo quei pochi candidati
+
+Un near-duplicate di qualcosa già in history viene scartato prima di finire
+in una lista netsound. Se un candidato non si riesce a decodificare passa
+(fail-open): il fingerprint non deve svuotare le liste.
+
+Negli script: --fingerprint [--fp-index ... --fp-threshold ... --fp-seconds ...]
+
+Uso diretto:
+  python3 envion_fingerprint.py index netsound/netsound_history.txt --limit 200
+  python3 envion_fingerprint.py check "https://archive.org/download/.../x.wav"
+  python3 envion_fingerprint.py stats
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import envion_trace as trace
+from envion_audio import AudioError, decode_head, have_numpy, is_riff_wave, parse_wav_header, np
+from envion_urls import canonical_url, strip_entry
+
+DEFAULT_INDEX = "netsound/fingerprints.sqlite"
+DEFAULT_SECONDS = 6.0
+DEFAULT_THRESHOLD = 6
+
+FP_RATE = 11025
+FP_BITS = 64
+FP_VERSION = 1          # cambia se cambiano parametri/iperpiani: l'indice va ricostruito
+N_FFT = 1024
+HOP = 512
+N_BANDS = 32
+F_MIN, F_MAX = 150.0, 5000.0
+SEED = 0x0E4710
+
+HEAD_PROBE_BYTES = 65536
+# compressi (mp3/ogg/flac): abbastanza per DEFAULT_SECONDS anche a bitrate alti
+COMPRESSED_BYTES_PER_SEC = 160_000
+
+# --- Fingerprint ----------------------------------------------------------------
+
+_planes = None
+_band_matrix = None
+
+def _setup():
+    global _planes, _band_matrix
+    if _planes is None:
+        rng = np.random.default_rng(SEED)
+        _planes = rng.standard_normal((FP_BITS, 2 * N_BANDS))
+        freqs = np.fft.rfftfreq(N_FFT, 1.0 / FP_RATE)
+        edges = np.geomspace(F_MIN, F_MAX, N_BANDS + 1)
+        m = np.zeros((len(freqs), N_BANDS), dtype=np.float32)
+        for b in range(N_BANDS):
+            m[(freqs >= edges[b]) & (freqs < edges[b + 1]), b] = 1.0
+        _band_matrix = m
+
+def fingerprint(samples):
+    """float32 mono a FP_RATE -> intero a 64 bit."""
+    if np is None:
+        raise AudioError("numpy non disponibile")
+    _setup()
+    n = (len(samples) - N_FFT) // HOP + 1
+    if n < 4:
+        raise AudioError("audio troppo corto per il fingerprint")
+    idx = np.arange(N_FFT)[None, :] + HOP * np.arange(n)[:, None]
+    frames = samples[idx] * np.hanning(N_FFT).astype(np.float32)
+    power = np.abs(np.fft.rfft(frames, axis=1)) ** 2
+    logb = np.log10(power @ _band_matrix + 1e-10)
+    # frame quasi silenziosi fuori: dominano il profilo senza dire nulla
+    energy = logb.mean(axis=1)
+    loud = logb[energy >= energy.max() - 4.0]
+    if len(loud) < 4:
+        loud = logb
+    shape = (loud - loud.mean(axis=1, keepdims=True)).mean(axis=0)   # profilo spettrale
+    motion = loud.std(axis=0)                                         # variabilità per banda
+    feat = np.concatenate([shape - shape.mean(), motion - motion.mean()])
+    bits = (_planes @ feat) > 0
+    h = 0
+    for i, b in enumerate(bits):
+        if b:
+            h |= 1 << i
+    return h
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+def fetch_head(url, seconds=DEFAULT_SECONDS, timeout=30):
+    """Primi byte di url sufficienti per 'seconds' di audio."""
+    import envion_http  # requests serve solo se il fingerprint è attivo
+    data, total, partial = envion_http.get_range_hedged(url, 0, HEAD_PROBE_BYTES - 1, timeout=timeout)
+    if is_riff_wave(data):
+        try:
+            fmt = parse_wav_header(data)
+            need = fmt.data_offset + int(seconds * fmt.rate) * fmt.block_align
+        except AudioError:
+            need = HEAD_PROBE_BYTES * 4
+    else:
+        need = int(seconds * COMPRESSED_BYTES_PER_SEC)
+    if total is not None:
+        need = min(need, total)
+    if need > len(data) and len(data) >= HEAD_PROBE_BYTES:
+        if partial:
+            rest, _, partial = envion_http.get_range_hedged(url, len(data), need - 1, timeout=timeout)
+            data = data + rest if partial else rest
+        else:
+            data, _, _ = envion_http.get_range_hedged(url, 0, need - 1, timeout=timeout)
+    return data
+
+def url_fingerprint(url, seconds=DEFAULT_SECONDS, timeout=30):
+    with trace.span("fingerprint"):
+        data = fetch_head(url, seconds, timeout)
+        return fingerprint(decode_head(data, seconds, FP_RATE))
+
+# --- Indice persistente --------------------------------------------------------
+
+def _to_db(h):
+    return h - (1 << 64) if h >= (1 << 63) else h
+
+def _from_db(v):
+    return v + (1 << 64) if v < 0 else v
+
+class FingerprintIndex:
+    """
+    Indice chiave canonica -> fingerprint, in SQLite e in memoria.
+    I blocchi del multi-index dipendono dalla soglia (threshold+1 blocchi).
+    """
+
+    def __init__(self, path=DEFAULT_INDEX, threshold=DEFAULT_THRESHOLD):
+        self.path = path
+        self.threshold = max(0, int(threshold))
+        self._lock = threading.Lock()
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self.con = sqlite3.connect(path, check_same_thread=False)
+        self.con.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v TEXT);
+            CREATE TABLE IF NOT EXISTS fingerprints (
+                key TEXT PRIMARY KEY, hash INTEGER NOT NULL, source TEXT, added_at REAL
+            );
+        """)
+        row = self.con.execute("SELECT v FROM meta WHERE k='version'").fetchone()
+        if row is None:
+            with self.con:
+                self.con.execute("INSERT INTO meta VALUES ('version', ?)", (str(FP_VERSION),))
+        elif int(row[0]) != FP_VERSION:
+            raise RuntimeError(f"{path}: indice fingerprint versione {row[0]}, attesa {FP_VERSION}: ricostruirlo")
+
+        nblk = min(FP_BITS, self.threshold + 1)
+        bounds = [FP_BITS * i // nblk for i in range(nblk + 1)]
+        self._blocks = [(lo, (1 << (hi - lo)) - 1) for lo, hi in zip(bounds, bounds[1:])]
+        self._tables = [{} for _ in self._blocks]
+        self.hashes = {}
+        self.pending = []
+        for key, v in self.con.execute("SELECT key, hash FROM fingerprints"):
+            self._insert(key, _from_db(v))
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def _insert(self, key, h):
+        self.hashes[key] = h
+        for (lo, mask), table in zip(self._blocks, self._tables):
+            table.setdefault((h >> lo) & mask, []).append(key)
+
+    def match(self, h):
+        """(chiave, distanza) del vicino più prossimo entro soglia, oppure None."""
+        best = None
+        with self._lock:
+            checked = set()
+            for (lo, mask), table in zip(self._blocks, self._tables):
+                for key in table.get((h >> lo) & mask, ()):
+                    if key in checked:
+                        continue
+                    checked.add(key)
+                    d = hamming(h, self.hashes[key])
+                    if d <= self.threshold and (best is None or d < best[1]):
+                        best = (key, d)
+        return best
+
+    def add(self, key, h, source="", persist=True):
+        with self._lock:
+            if key in self.hashes:
+                return
+            self._insert(key, h)
+            if persist:
+                with self.con:
+                    self.con.execute("INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?)",
+                                     (key, _to_db(h), source, time.time()))
+            else:
+                self.pending.append((key, h, source))
+
+    def commit(self, keys=None):
+        """Salva i fingerprint pendenti (solo quelli in keys, se indicato)."""
+        with self._lock:
+            keep = [p for p in self.pending if keys is None or p[0] in keys]
+            with self.con:
+                self.con.executemany("INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?)",
+                                     [(k, _to_db(h), s, time.time()) for k, h, s in keep])
+            self.pending = []
+        return len(keep)
+
+    def close(self):
+        self.con.close()
+
+# --- Gate per gli script di fetch -----------------------------------------------
+
+class FingerprintGate:
+    """
+    Filtro acustico per i candidati di un run. admit() calcola il fingerprint e
+    lo confronta con l'indice e con i candidati già ammessi nel run; commit()
+    rende persistenti quelli finiti davvero in lista/history.
+    """
+
+    def __init__(self, index, seconds=DEFAULT_SECONDS, verbose=False):
+        self.index = index
+        self.seconds = seconds
+        self.verbose = verbose
+        self.failed = 0
+        self.rejected = 0
+
+    def admit(self, url, source=""):
+        key = canonical_url(url)
+        if key in self.index.hashes:
+            self.rejected += 1
+            trace.rejects({"fingerprint": 1})
+            return False
+        try:
+            h = url_fingerprint(url, self.seconds)
+        except Exception as e:
+            self.failed += 1
+            if self.verbose:
+                print(f"[FP] non decodificabile, passa: {url} ({e})", file=sys.stderr)
+            return True
+        m = self.index.match(h)
+        if m is not None:
+            self.rejected += 1
+            trace.rejects({"fingerprint": 1})
+            if self.verbose:
+                print(f"[FP] near-duplicate (d={m[1]}): {url} ~ {m[0]}", file=sys.stderr)
+            return False
+        self.index.add(key, h, source, persist=False)
+        return True
+
+    def commit(self, urls=None):
+        keys = None if urls is None else {canonical_url(u) for u in urls}
+        return self.index.commit(keys)
+
+def add_cli_args(ap):
+    ap.add_argument("--fingerprint", action="store_true",
+                    help="scarta i near-duplicate acustici di quanto già in history (indice fingerprint)")
+    ap.add_argument("--fp-index", type=str, default=DEFAULT_INDEX, help=f"indice fingerprint (default: {DEFAULT_INDEX})")
+    ap.add_argument("--fp-threshold", type=int, default=DEFAULT_THRESHOLD,
+                    help=f"distanza di Hamming massima per dire 'stesso suono' (default: {DEFAULT_THRESHOLD})")
+    ap.add_argument("--fp-seconds", type=float, default=DEFAULT_SECONDS,
+                    help=f"secondi iniziali decodificati per il fingerprint (default: {DEFAULT_SECONDS:g})")
+
+def gate_from_args(args, verbose=False):
+    """FingerprintGate dagli argomenti CLI, oppure None se --fingerprint non è attivo."""
+    if not getattr(args, "fingerprint", False):
+        return None
+    if not have_numpy():
+        print("[WARN] --fingerprint richiede numpy: dedupe acustica disattivata.", file=sys.stderr)
+        return None
+    return FingerprintGate(FingerprintIndex(args.fp_index, args.fp_threshold), args.fp_seconds, verbose)
+
+# --- CLI -------------------------------------------------------------------------
+
+def _read_urls(paths):
+    out = []
+    for p in paths:
+        with open(p, "r", encoding="utf-8", errors="ignore") as f:
+            out.extend(u for u in (strip_entry(line) for line in f) if u)
+    return out
+
+def main():
+    ap = argparse.ArgumentParser(description="Acoustic fingerprint index for Envion NET-AUDIO dedupe.")
+    ap.add_argument("--fp-index", type=str, default=DEFAULT_INDEX)
+    ap.add_argument("--fp-threshold", type=int, default=DEFAULT_THRESHOLD)
+    ap.add_argument("--fp-seconds", type=float, default=DEFAULT_SECONDS)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p_idx = sub.add_parser("index", help="aggiunge all'indice gli URL di history/liste")
+    p_idx.add_argument("files", nargs="+")
+    p_idx.add_argument("--limit", type=int, default=0, help="massimo URL nuovi da indicizzare (0 = tutti)")
+    p_chk = sub.add_parser("check", help="cerca near-duplicate di questi URL")
+    p_chk.add_argument("urls", nargs="+")
+    sub.add_parser("stats", help="dimensione dell'indice")
+    trace.add_cli_args(ap)
+    args = ap.parse_args()
+    trace.setup(args.trace, args.profile)
+
+    if args.cmd != "stats" and not have_numpy():
+        print("[ERROR] serve numpy per calcolare i fingerprint.", file=sys.stderr)
+        sys.exit(2)
+    index = FingerprintIndex(args.fp_index, args.fp_threshold)
+
+    if args.cmd == "stats":
+        print(f"{args.fp_index}: {len(index)} fingerprint (versione {FP_VERSION})")
+        return
+
+    if args.cmd == "check":
+        for u in args.urls:
+            try:
+                h = url_fingerprint(u, args.fp_seconds)
+            except Exception as e:
+                print(f"[FAIL] {u}: {e}")
+                continue
+            m = index.match(h)
+            print(f"[DUP d={m[1]}] {u} ~ {m[0]}" if m else f"[NEW] {u} {h:016x}")
+        return
+
+    added = failed = dups = 0
+    for u in _read_urls(args.files):
+        key = canonical_url(u)
+        if key in index.hashes:
+            continue
+        if args.limit and added >= args.limit:
+            break
+        try:
+            h = url_fingerprint(u, args.fp_seconds)
+        except Exception as e:
+            failed += 1
+            print(f"[FAIL] {u}: {e}", file=sys.stderr)
+            continue
+        if index.match(h):
+            dups += 1
+        index.add(key, h, source="index")
+        added += 1
+        print(f"[OK {added}] {key} {h:016x}")
+    print(f"[DONE] +{added} fingerprint ({dups} già simili a voci esistenti, {failed} falliti) -> {len(index)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,520 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+envion_harvest.py
+Harvest di una query salvata su più macchine, con una coda di shard su file.
+
+Un pool grande (IA sitewide, Commons) da un solo processo richiede ore e i
+limiti per IP non si aggirano con più thread. Qui la query viene divisa in
+shard indipendenti (intervalli di pagine di advancedsearch, intervalli di
+sroffset di Commons) messi in una cartella condivisa; i worker, anche su
+macchine diverse, prendono uno shard alla volta, eseguono la stessa ricerca,
+lo stesso /metadata e gli stessi filtri degli script (candidate_pool usa le
+stesse funzioni) e scrivono i risultati. merge li unisce in un'unica lista
+deduplicata. Il tempo scala col numero di worker finché bastano gli shard.
+
+Coda: una cartella su un filesystem condiviso (NFS, SMB, ...): serve solo
+che rename() sia atomico.
+  <coda>/job.json            query (script + opzioni) e parametri del piano
+  <coda>/todo/<n>.json       shard da fare
+  <coda>/leased/<n>.json     shard presi; il worker ne rinnova il mtime ogni
+                             --lease/3 secondi (lease). Chi trova un mtime più
+                             vecchio di --lease rimette lo shard in todo/
+  <coda>/done/<n>.json       shard finiti
+  <coda>/failed/<n>.json     shard falliti MAX_ATTEMPTS volte (vedi errors.log)
+  <coda>/results/<n>.jsonl   URL accettati: {"url": ..., "meta": {...}} per riga
+
+Prendere uno shard = rename todo/ -> leased/: uno solo ci riesce. Se un
+worker muore il suo lease scade e lo shard torna in coda; se un worker lento
+finisce uno shard già riassegnato, i due file di risultati hanno lo stesso
+nome e lo stesso contenuto, e merge comunque deduplica. Il lease si misura
+sul mtime del file: gli orologi delle macchine devono essere allineati molto
+meglio di --lease (NTP basta).
+
+advancedsearch non pagina oltre ~10000 righe e CirrusSearch oltre
+sroffset=10000: il piano copre al più quella finestra.
+
+Uso:
+  python3 envion_harvest.py plan  --queue /mnt/shared/wind --query make_internet --rows 100 --pages-per-shard 2
+  python3 envion_harvest.py plan  --queue /mnt/shared/wind \\
+      --cmd "python3 make_internetarchive_search.py --q wind --scope sitewide --max-dur 8"
+  python3 envion_harvest.py work  --queue /mnt/shared/wind            # su ogni macchina
+  python3 envion_harvest.py status --queue /mnt/shared/wind
+  python3 envion_harvest.py merge --queue /mnt/shared/wind --out-dir netsound --basename wind \\
+      --history netsound/netsound_history.txt [--pool-db netsound/candidate_pool.sqlite]
+"""
+
+import argparse
+import glob
+import json
+import math
+import os
+import socket
+import sys
+import threading
+import time
+from urllib.parse import urlencode
+
+import candidate_pool
+import envion_catalog
+import envion_http
+import envion_sample
+from envion_urls import canonical_url, read_history_set
+
+DEFAULT_LEASE = 300.0
+DEFAULT_ROWS = 100
+DEFAULT_PAGES_PER_SHARD = 2
+COMMONS_LIMIT = 50            # srlimit senza apihighlimits
+COMMONS_MAX_OFFSET = 10000    # CirrusSearch non va oltre
+MAX_ATTEMPTS = 3
+ALL = 10 ** 9                 # "count" per le funzioni di raccolta: tutto lo shard
+
+IA_SCRIPTS = ("make_internetarchive_search", "internet_archive_fine_tuning", "make_bbc_search_ia")
+COMMONS_SCRIPTS = ("wiki_commons_fetch",)
+
+class HarvestError(ValueError):
+    pass
+
+def dbg(enabled, *msg):
+    if enabled:
+        print("[DEBUG]", *msg, file=sys.stderr, flush=True)
+
+_opt = candidate_pool._opt
+_csv = candidate_pool._csv
+
+# --- Query e shard ------------------------------------------------------------
+
+def ia_params(q):
+    """Parametri advancedsearch (q, fl[], sort[]) della query salvata, come li costruisce lo script."""
+    opts, script = q["opts"], q["script"]
+    if script == "make_internetarchive_search":
+        import make_internetarchive_search as mis
+        scope = _opt(opts, "scope", "bbc")
+        if scope == "bbc-local":
+            raise HarvestError("scope bbc-local: già offline, niente da distribuire")
+        return mis.search_params(_opt(opts, "q", ""), scope, _csv(opts, "exclude"))
+    if script == "internet_archive_fine_tuning":
+        import internet_archive_fine_tuning as ft
+        return ft.search_params(_opt(opts, "q", ""), _opt(opts, "scope", "sitewide"), _csv(opts, "exclude"),
+                                _csv(opts, "exclude-collections"), _csv(opts, "include-subjects"))
+    if script == "make_bbc_search_ia":
+        import make_bbc_search_ia as bbc
+        return bbc.bbc_search_params(_opt(opts, "q", ""))
+    raise HarvestError(f"script non distribuibile: {script}")
+
+def commons_search_url(q, offset, limit):
+    import wiki_commons_fetch as wcf
+    params = {
+        "action": "query", "format": "json", "list": "search",
+        "srsearch": f"({_opt(q['opts'], 'q', '')})", "srnamespace": "6",
+        "srlimit": str(limit), "sroffset": str(offset), "srinfo": "totalhits",
+        "srqiprofile": "classic_noboostlinks", "origin": "*",
+    }
+    return wcf.COMMONS_API + "?" + urlencode(params)
+
+def commons_total(q, timeout=15):
+    import wiki_commons_fetch as wcf
+    data = json.loads(wcf.http_get(commons_search_url(q, 0, 1), timeout))
+    return int(((data.get("query") or {}).get("searchinfo") or {}).get("totalhits") or 0)
+
+def plan_shards(q, rows=DEFAULT_ROWS, pages_per_shard=DEFAULT_PAGES_PER_SHARD, window=envion_sample.MAX_WINDOW,
+                max_pages=0):
+    """Divide la query in shard (dict); ritorna (shard, risultati totali dichiarati)."""
+    if q["script"] in IA_SCRIPTS:
+        total = envion_sample.num_found(ia_params(q))
+        pages = math.ceil(min(total, window) / rows)
+        if max_pages:
+            pages = min(pages, max_pages)
+        shards = [{"kind": "ia", "rows": rows, "page_from": p, "page_to": min(pages, p + pages_per_shard - 1)}
+                  for p in range(1, pages + 1, pages_per_shard)]
+        return shards, total
+    if q["script"] in COMMONS_SCRIPTS:
+        total = commons_total(q)
+        span = COMMONS_LIMIT * pages_per_shard
+        end = min(total, COMMONS_MAX_OFFSET, window)
+        if max_pages:
+            end = min(end, max_pages * COMMONS_LIMIT)
+        shards = [{"kind": "commons", "offset_from": o, "offset_to": min(end, o + span)}
+                  for o in range(0, end, span)]
+        return shards, total
+    raise HarvestError(f"script non distribuibile: {q['script']}")
+
+# --- Esecuzione di uno shard (stessa logica degli script) ---------------------
+
+def ia_page_docs(params, rows, page):
+    data = envion_http.cached_json(envion_sample.search_url(params, rows, page), timeout=30)
+    return (data.get("response") or {}).get("docs") or []
+
+def run_ia_shard(q, shard, debug):
+    opts, script = q["opts"], q["script"]
+    params = ia_params(q)
+    meta, urls = {}, []
+    for page in range(shard["page_from"], shard["page_to"] + 1):
+        docs = ia_page_docs(params, shard["rows"], page)
+        dbg(debug, f"pagina {page}: {len(docs)} docs")
+        if script == "make_internetarchive_search":
+            import make_internetarchive_search as mis
+            exts = {x.lower() for x in _csv(opts, "formats")} or set(mis.DEFAULT_EXTS)
+            urls += mis.collect_urls_from_docs(docs, ALL, exts, _opt(opts, "max-dur", 0.0, float),
+                                               set(), True, debug, meta=meta)
+        elif script == "internet_archive_fine_tuning":
+            import internet_archive_fine_tuning as ft
+            exts = {x.lower() for x in _csv(opts, "formats")} or set(ft.DEFAULT_EXTS)
+            urls += ft.collect_urls(docs, ALL, exts, _opt(opts, "max-dur", 0.0, float),
+                                    _opt(opts, "max-size-mb", 10.0, float), set(), True, debug, meta=meta)
+        else:
+            import make_bbc_search_ia as bbc
+            for d in docs:
+                ident = d.get("identifier")
+                if not ident:
+                    continue
+                try:
+                    urls += bbc.files_from_identifier(ident, _opt(opts, "max-dur", 0, int), debug, meta=meta)
+                except Exception as e:
+                    dbg(debug, f"metadata fetch failed for {ident}: {e}")
+    # le funzioni degli script ritornano voci di lista ("url;")
+    urls = [canonical_url(u.rstrip(";")) for u in urls]
+    return [(u, meta.get(u)) for u in urls]
+
+def run_commons_shard(q, shard, debug):
+    import envion_commons
+    import wiki_commons_fetch as wcf
+    from envion_filters import compile_filters
+    opts = q["opts"]
+    timeout = _opt(opts, "timeout", 15, int)
+    flt = compile_filters(
+        exts=_csv(opts, "extensions") or [".ogg", ".wav", ".flac"],
+        exclude_terms=_csv(opts, "exclude") + [".mid", ".midi"],
+        max_dur=_opt(opts, "max-dur", 0.0, float),
+        max_size_mb=_opt(opts, "max-size-mb", 0.0, float),
+    )
+    transcodes = envion_commons.parse_transcodes(_opt(opts, "transcodes", "mp3,ogg"))
+    out = []
+    for offset in range(shard["offset_from"], shard["offset_to"], COMMONS_LIMIT):
+        limit = min(COMMONS_LIMIT, shard["offset_to"] - offset)
+        data = json.loads(wcf.http_get(commons_search_url(q, offset, limit), timeout))
+        results = (data.get("query") or {}).get("search") or []
+        pages = wcf.fetch_imageinfo([str(r["pageid"]) for r in results], timeout, debug)
+        for page in pages.values():
+            info = envion_commons.page_info(page)
+            if not info or not info.get("url"):
+                continue
+            url, meta = wcf.pick_url(flt, page.get("title", ""), info, transcodes, debug)
+            if url:
+                out.append((canonical_url(url), envion_catalog.commons_meta(page.get("title", ""), meta)))
+    return out
+
+def run_shard(q, shard, debug=False):
+    """Shard -> lista di (url canonico, metadati per il sidecar o None)."""
+    if shard["kind"] == "ia":
+        return run_ia_shard(q, shard, debug)
+    if shard["kind"] == "commons":
+        return run_commons_shard(q, shard, debug)
+    raise HarvestError(f"shard sconosciuto: {shard['kind']}")
+
+# --- Coda su file -------------------------------------------------------------
+
+class WorkQueue:
+    """Coda di shard in una cartella condivisa (vedi docstring del modulo)."""
+
+    STATES = ("todo", "leased", "done", "failed")
+
+    def __init__(self, path):
+        self.path = path
+
+    def dir(self, state):
+        return os.path.join(self.path, state)
+
+    def job(self):
+        with open(os.path.join(self.path, "job.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def create(self, job, shards):
+        if os.path.exists(os.path.join(self.path, "job.json")):
+            raise HarvestError(f"coda già pianificata: {self.path}")
+        for state in self.STATES + ("results",):
+            os.makedirs(self.dir(state), exist_ok=True)
+        for i, shard in enumerate(shards):
+            _write_json(os.path.join(self.dir("todo"), f"{i:05d}.json"), dict(shard, shard=i, attempts=0))
+        _write_json(os.path.join(self.path, "job.json"), dict(job, shards=len(shards)))
+
+    def names(self, state):
+        try:
+            return sorted(n for n in os.listdir(self.dir(state)) if n.endswith(".json"))
+        except FileNotFoundError:
+            return []
+
+    def claim(self):
+        """Prende il primo shard libero: (nome, shard) o None."""
+        for name in self.names("todo"):
+            src = os.path.join(self.dir("todo"), name)
+            dst = os.path.join(self.dir("leased"), name)
+            try:
+                os.utime(src)   # il rename conserva il mtime: il lease parte da adesso
+                os.rename(src, dst)
+            except FileNotFoundError:
+                continue        # preso da un altro worker
+            os.utime(dst)
+            with open(dst, "r", encoding="utf-8") as f:
+                return name, json.load(f)
+        return None
+
+    def renew(self, name):
+        """Rinnova il lease; False se lo shard non è più nostro (scaduto e riassegnato)."""
+        try:
+            os.utime(os.path.join(self.dir("leased"), name))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def complete(self, name, rows):
+        base = os.path.splitext(name)[0]
+        res = os.path.join(self.dir("results"), base + ".jsonl")
+        tmp = f"{res}.{socket.gethostname()}.{os.getpid()}.part"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for url, meta in rows:
+                f.write(json.dumps({"url": url, "meta": meta}, ensure_ascii=False) + "\n")
+        os.replace(tmp, res)
+        try:
+            os.rename(os.path.join(self.dir("leased"), name), os.path.join(self.dir("done"), name))
+        except FileNotFoundError:
+            # lease perso nel frattempo: lo shard è stato rimesso in coda, il risultato vale comunque
+            try:
+                os.rename(os.path.join(self.dir("todo"), name), os.path.join(self.dir("done"), name))
+            except FileNotFoundError:
+                pass
+
+    def release(self, name, shard, error):
+        """Shard fallito: torna in todo/ (o in failed/ dopo MAX_ATTEMPTS tentativi)."""
+        shard = dict(shard, attempts=shard.get("attempts", 0) + 1, error=str(error))
+        state = "failed" if shard["attempts"] >= MAX_ATTEMPTS else "todo"
+        # prima lo si toglie da leased/ (se nel frattempo è stato riassegnato non è più nostro)
+        mine = os.path.join(self.dir("leased"), f".{name}.{socket.gethostname()}.{os.getpid()}.release")
+        try:
+            os.rename(os.path.join(self.dir("leased"), name), mine)
+        except FileNotFoundError:
+            return
+        _write_json(mine, shard)
+        os.rename(mine, os.path.join(self.dir(state), name))
+        with open(os.path.join(self.path, "errors.log"), "a", encoding="utf-8") as f:
+            f.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} {socket.gethostname()} {name} "
+                    f"tentativo {shard['attempts']}: {error}\n")
+
+    def expired(self, lease):
+        """Shard in leased/ con il mtime più vecchio di lease secondi."""
+        now, out = time.time(), []
+        for name in self.names("leased"):
+            try:
+                if now - os.stat(os.path.join(self.dir("leased"), name)).st_mtime > lease:
+                    out.append(name)
+            except FileNotFoundError:
+                continue
+        return out
+
+    def reclaim(self, lease):
+        """Rimette in todo/ gli shard con lease scaduto; ritorna quanti."""
+        n = 0
+        for name in self.expired(lease):
+            try:
+                os.rename(os.path.join(self.dir("leased"), name), os.path.join(self.dir("todo"), name))
+                n += 1
+            except FileNotFoundError:
+                continue
+        return n
+
+    def counts(self):
+        return {state: len(self.names(state)) for state in self.STATES}
+
+    def results(self):
+        """(url, meta) di tutti gli shard finiti, nell'ordine degli shard."""
+        for path in sorted(glob.glob(os.path.join(self.dir("results"), "*.jsonl"))):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue
+                    if rec.get("url"):
+                        yield rec["url"], rec.get("meta")
+
+def _write_json(path, obj):
+    with open(path + ".part", "w", encoding="utf-8") as f:
+        json.dump(obj, f, indent=1, sort_keys=True)
+    os.replace(path + ".part", path)
+
+# --- Worker -------------------------------------------------------------------
+
+class Heartbeat(threading.Thread):
+    """Rinnova i lease degli shard in lavorazione ogni lease/3 secondi."""
+
+    def __init__(self, queue, lease):
+        super().__init__(daemon=True)
+        self.queue, self.interval = queue, max(1.0, lease / 3.0)
+        self.held, self.lock, self.stop = set(), threading.Lock(), threading.Event()
+
+    def hold(self, name):
+        with self.lock:
+            self.held.add(name)
+
+    def drop(self, name):
+        with self.lock:
+            self.held.discard(name)
+
+    def run(self):
+        while not self.stop.wait(self.interval):
+            with self.lock:
+                names = list(self.held)
+            for name in names:
+                if not self.queue.renew(name):
+                    print(f"[harvest] lease perso: {name}", file=sys.stderr)
+
+def work(queue, lease, poll, wait, debug, stats):
+    """Un giro di worker: prende shard finché ce ne sono (e, con wait, finché non sono tutti chiusi)."""
+    q = queue.job()["query"]
+    beat = stats["heartbeat"]
+    while True:
+        queue.reclaim(lease)
+        got = queue.claim()
+        if got is None:
+            if not wait or not queue.names("leased"):
+                return
+            time.sleep(poll)   # shard ancora in mano ad altri: se un worker muore il lease scade
+            continue
+        name, shard = got
+        beat.hold(name)
+        t0 = time.perf_counter()
+        try:
+            rows = run_shard(q, shard, debug)
+        except Exception as e:
+            queue.release(name, shard, e)
+            print(f"[harvest] shard {name} fallito: {e}", file=sys.stderr)
+            continue
+        finally:
+            beat.drop(name)
+        queue.complete(name, rows)
+        with stats["lock"]:
+            stats["shards"] += 1
+            stats["urls"] += len(rows)
+        print(f"[harvest] shard {name}: {len(rows)} URL in {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+
+# --- Main ---------------------------------------------------------------------
+
+def load_query(args):
+    if args.cmd:
+        found = candidate_pool.parse_saved_queries(args.cmd, source="cmd")
+        if not found:
+            raise HarvestError(f"comando non riconosciuto: {args.cmd}")
+        return found[0]
+    queries = candidate_pool.load_saved_queries(args.makefile_dir, args.recipes_dir)
+    sel = candidate_pool.select_queries(queries, args.query)
+    if len(sel) != 1:
+        raise HarvestError("--query deve indicare una sola query salvata (o usare --cmd)")
+    return sel[0]
+
+def merge(queue, history_path, out_path, pool_db, debug):
+    """Unisce i risultati: dedupe su URL canonico e history; scrive lista + sidecar (e pool)."""
+    q = queue.job()["query"]
+    history_set = read_history_set(history_path) if history_path else set()
+    urls, meta, seen, dup = [], {}, set(), 0
+    for url, m in queue.results():
+        url = canonical_url(url)
+        if url in seen or url in history_set:
+            dup += 1
+            continue
+        seen.add(url)
+        urls.append(url)
+        if m:
+            meta[url] = m
+    candidate_pool.ensure_dir(os.path.dirname(out_path))
+    with open(out_path, "w", encoding="utf-8") as f:
+        for u in urls:
+            f.write(u + ";\n")
+    envion_catalog.write_sidecar(out_path, urls, meta=meta, query=q["opts"].get("q"),
+                                 script=f"envion_harvest:{q['script']}")
+    if pool_db:
+        con = candidate_pool.open_store(pool_db)
+        candidate_pool.register_queries(con, [q])
+        candidate_pool.add_candidates(con, q["id"], urls)
+    dbg(debug, f"merge: {len(urls)} URL, {dup} duplicati/history scartati")
+    return urls, dup
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Sharded harvest of a saved query across machines (file-based work queue).")
+    ap.add_argument("command", choices=["plan", "work", "status", "merge"])
+    ap.add_argument("--queue", type=str, required=True, help="cartella condivisa della coda")
+    ap.add_argument("--query", type=str, default="", help="(plan) ID o prefisso di una query salvata (candidate_pool list)")
+    ap.add_argument("--cmd", type=str, default="", help="(plan) riga di comando di uno script, al posto di --query")
+    ap.add_argument("--makefile-dir", type=str, default=candidate_pool.DEFAULT_MAKEFILE_DIR)
+    ap.add_argument("--recipes-dir", type=str, default=candidate_pool.DEFAULT_RECIPES_DIR)
+    ap.add_argument("--rows", type=int, default=DEFAULT_ROWS, help=f"(plan) righe per pagina IA (default {DEFAULT_ROWS})")
+    ap.add_argument("--pages-per-shard", type=int, default=DEFAULT_PAGES_PER_SHARD,
+                    help=f"(plan) pagine per shard (default {DEFAULT_PAGES_PER_SHARD})")
+    ap.add_argument("--max-pages", type=int, default=0, help="(plan) limite di pagine totali (0 = tutta la finestra)")
+    ap.add_argument("--lease", type=float, default=DEFAULT_LEASE,
+                    help=f"(work) secondi senza rinnovo dopo cui uno shard torna in coda (default {DEFAULT_LEASE:g})")
+    ap.add_argument("--slots", type=int, default=1, help="(work) shard in parallelo su questa macchina (default 1)")
+    ap.add_argument("--poll", type=float, default=10.0, help="(work) attesa fra due controlli quando la coda è vuota")
+    ap.add_argument("--no-wait", action="store_true",
+                    help="(work) esce appena todo/ è vuota, senza aspettare gli shard in mano ad altri")
+    ap.add_argument("--history", type=str, default="", help="(merge) history per dedupe")
+    ap.add_argument("--out-dir", type=str, default="netsound", help="(merge) cartella della lista")
+    ap.add_argument("--basename", type=str, default="harvest", help="(merge) basename della lista")
+    ap.add_argument("--pool-db", type=str, default="", help="(merge) aggiunge gli URL al pool di candidate_pool")
+    ap.add_argument("--debug", action="store_true")
+    envion_http.add_cli_args(ap)
+    args = ap.parse_args(argv)
+    envion_http.setup_cache(args)
+
+    queue = WorkQueue(args.queue)
+    try:
+        if args.command == "plan":
+            q = load_query(args)
+            shards, total = plan_shards(q, args.rows, max(1, args.pages_per_shard), max_pages=args.max_pages)
+            queue.create({"query": q, "total": total, "rows": args.rows, "created": time.time()}, shards)
+            print(f"[harvest] {q['id']} ({q['script']}): {total} risultati, {len(shards)} shard in {args.queue}")
+            return
+
+        if args.command == "status":
+            job = queue.job()
+            c = queue.counts()
+            stale = len(queue.expired(args.lease))
+            print(f"[harvest] {job['query']['id']}: {job['shards']} shard, "
+                  + ", ".join(f"{k} {v}" for k, v in c.items()) + f", lease scaduti {stale}")
+            return
+
+        if args.command == "work":
+            queue.job()   # errore chiaro se la coda non è pianificata
+            stats = {"shards": 0, "urls": 0, "lock": threading.Lock(), "heartbeat": Heartbeat(queue, args.lease)}
+            stats["heartbeat"].start()
+            t0 = time.perf_counter()
+            threads = [threading.Thread(target=work, args=(queue, args.lease, args.poll, not args.no_wait,
+                                                           args.debug, stats))
+                       for _ in range(max(1, args.slots))]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            stats["heartbeat"].stop.set()
+            print(f"[harvest] {socket.gethostname()}: {stats['shards']} shard, {stats['urls']} URL "
+                  f"in {time.perf_counter() - t0:.1f}s; coda: {queue.counts()}")
+            return
+
+        # merge
+        c = queue.counts()
+        partial = c["todo"] or c["leased"] or c["failed"]
+        if partial:
+            print(f"[WARN] shard non finiti (todo {c['todo']}, leased {c['leased']}, falliti {c['failed']}): "
+                  "merge parziale", file=sys.stderr)
+        out_path = os.path.join(args.out_dir, f"{args.basename}_{time.strftime('%Y%m%d_%H%M%S')}.txt")
+        urls, dup = merge(queue, args.history, out_path, args.pool_db, args.debug)
+        print(out_path)
+        print(f"[harvest] {len(urls)} URL unici ({dup} duplicati o già in history)", file=sys.stderr)
+        if partial:
+            sys.exit(1)   # lista scritta, ma non copre tutta la query
+    except (HarvestError, OSError, ValueError) as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
+        sys.exit(2)
+
+if __name__ == "__main__":
+    main()
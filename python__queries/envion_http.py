@@ -0,0 +1,587 @@
+# -*- coding: utf-8 -*-
+
+"""
+envion_http.py
+Layer HTTP condiviso dagli script NET-AUDIO.
+
+- Una sola requests.Session per processo, con pool di connessioni
+  (keep-alive e TLS riusati fra ricerche e /metadata)
+- Cache in memoria dei /metadata di Internet Archive
+- Letture parziali con Range (get_range) per fingerprint ed estrazione clip;
+  get_range_hedged va direttamente al nodo di storage di IA (server/dir da
+  /metadata, niente 302 di /download) e, se la risposta non arriva entro
+  --hedge-ms, manda la stessa richiesta alla replica (d1/d2): vince la prima
+- Lista file di un item in streaming (iter_files): /metadata/<id>/files
+  letto a pezzi e decodificato un file alla volta, per le collezioni enormi
+- Richieste identiche in volo collassate in una sola (single-flight):
+  se due ricette chiedono lo stesso identifier nello stesso momento,
+  parte una sola GET e il risultato viene condiviso
+- Cache su disco delle risposte di ricerca (cached_get / cached_json),
+  solo su richiesta (--http-cache o $ENVION_HTTP_CACHE): senza, ogni
+  ricerca va in rete e i list builder vedono sempre risultati nuovi.
+  advancedsearch e api.php di Commons, chiave = URL normalizzato, corpi
+  compressi in SQLite, richieste condizionali (ETag / Last-Modified) alla
+  scadenza della finestra di freschezza, LRU sul totale dei byte
+- Ogni richiesta e ogni accesso in cache finiscono in envion_trace
+  (latenze per host, hit rate) quando la strumentazione è attiva
+"""
+
+import codecs
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import envion_trace as trace
+from envion_urls import archive_item, archive_node_urls
+
+UA = "Envion-NetAudio/1.3 (+https://www.peamarte.it/)"
+
+IA_META = "https://archive.org/metadata"
+
+DEFAULT_POOL_SIZE = 16
+
+_session = None
+_session_lock = threading.Lock()
+
+def session(pool_size=DEFAULT_POOL_SIZE):
+    """Session condivisa (creata al primo uso)."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            s = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            s.mount("https://", adapter)
+            s.mount("http://", adapter)
+            s.headers["User-Agent"] = UA
+            _session = s
+        return _session
+
+def get(url, timeout=30, **kwargs):
+    t = time.perf_counter()
+    try:
+        r = session().get(url, timeout=timeout, **kwargs)
+    except Exception as e:
+        trace.request(url, (time.perf_counter() - t) * 1000.0, error=e)
+        raise
+    trace.request(url, (time.perf_counter() - t) * 1000.0, status=r.status_code,
+                  nbytes=len(r.content) if not kwargs.get("stream") else None)
+    return r
+
+def get_range(url, start, end, timeout=30):
+    """
+    Byte [start, end] (inclusi) di url con una richiesta Range.
+    Ritorna (dati, totale, parziale): totale dal Content-Range (o None),
+    parziale=False se il server ha ignorato il Range e risponde dall'inizio;
+    in quel caso si legge comunque al massimo end-start+1 byte.
+    """
+    want = end - start + 1
+    t = time.perf_counter()
+    try:
+        r = session().get(url, timeout=timeout, stream=True,
+                          headers={"Range": f"bytes={start}-{end}"})
+        r.raise_for_status()
+        buf = bytearray()
+        for chunk in r.iter_content(chunk_size=min(want, 65536)):
+            buf += chunk
+            if len(buf) >= want:
+                break
+        r.close()
+    except Exception as e:
+        trace.request(url, (time.perf_counter() - t) * 1000.0, error=e)
+        raise
+    trace.request(url, (time.perf_counter() - t) * 1000.0, status=r.status_code, nbytes=len(buf))
+    total = None
+    cr = r.headers.get("Content-Range", "")
+    if "/" in cr and not cr.endswith("/*"):
+        try:
+            total = int(cr.rsplit("/", 1)[1])
+        except ValueError:
+            pass
+    elif r.status_code == 200 and r.headers.get("Content-Length"):
+        total = int(r.headers["Content-Length"])
+    return bytes(buf[:want]), total, r.status_code == 206
+
+def get_json(url, timeout=30):
+    r = get(url, timeout=timeout)
+    r.raise_for_status()
+    return r.json()
+
+# --- Streaming JSON ----------------------------------------------------------
+
+_SKIP = re.compile(r"[\s,]*")
+
+def iter_json_array(chunks, key="result"):
+    """
+    Elementi dell'array JSON sotto 'key' ({"key": [ {...}, {...} ]}), decodificati
+    man mano che arrivano i pezzi (bytes) con raw_decode: in memoria resta solo
+    l'elemento corrente più il resto del pezzo. Interrompere il ciclo è lecito.
+    """
+    dec = json.JSONDecoder()
+    udec = codecs.getincrementaldecoder("utf-8")("replace")
+    marker = f'"{key}"'
+    buf, pos, started = "", 0, False
+    for chunk in chunks:
+        buf = buf[pos:] + udec.decode(chunk)
+        pos = 0
+        if not started:
+            k = buf.find(marker)
+            i = buf.find("[", k + len(marker)) if k >= 0 else -1
+            if i < 0:
+                # tieni solo la coda, il marker può essere a cavallo di due pezzi
+                pos = max(0, len(buf) - len(marker) - 64)
+                continue
+            pos, started = i + 1, True
+        while True:
+            pos = _SKIP.match(buf, pos).end()
+            if pos >= len(buf):
+                break
+            if buf[pos] == "]":
+                return
+            try:
+                obj, end = dec.raw_decode(buf, pos)
+            except ValueError:
+                break   # elemento incompleto: serve il pezzo successivo
+            yield obj
+            pos = end
+
+def iter_files(identifier, timeout=30, chunk_size=65536):
+    """
+    File di un item da /metadata/<identifier>/files, uno alla volta.
+    Il corpo non viene mai tenuto tutto in memoria; se il chiamante smette
+    di iterare la connessione viene chiusa subito.
+    """
+    url = f"{IA_META}/{identifier}/files"
+    t = time.perf_counter()
+    nbytes, status, error = 0, None, None
+    r = None
+    try:
+        r = session().get(url, timeout=timeout, stream=True)
+        status = r.status_code
+        r.raise_for_status()
+        def chunks():
+            nonlocal nbytes
+            for c in r.iter_content(chunk_size=chunk_size):
+                nbytes += len(c)
+                yield c
+        yield from iter_json_array(chunks())
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        if r is not None:
+            r.close()
+        trace.request(url, (time.perf_counter() - t) * 1000.0, status=status,
+                      nbytes=nbytes, error=error)
+
+def fetch_item_metadata(identifier, timeout=30):
+    """Solo il blocco 'metadata' di un item (/metadata/<identifier>/metadata)."""
+    data = get_json(f"{IA_META}/{identifier}/metadata", timeout=timeout)
+    return data.get("result") or {}
+
+# --- Single-flight cache ------------------------------------------------------
+
+class SingleFlightCache:
+    """
+    Cache chiave -> valore in cui il loader di una chiave gira una volta sola
+    anche con più thread che la chiedono insieme. Gli errori non vengono
+    memorizzati: la richiesta successiva riprova.
+    """
+
+    def __init__(self, name="cache"):
+        self.name = name
+        self._lock = threading.Lock()
+        self._values = {}
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, loader):
+        with self._lock:
+            if key in self._values:
+                self.hits += 1
+                trace.cache(self.name, True)
+                return self._values[key]
+            waiter = self._inflight.get(key)
+            if waiter is None:
+                waiter = self._inflight[key] = {"event": threading.Event()}
+                leader = True
+                self.misses += 1
+            else:
+                leader = False
+                self.hits += 1
+        trace.cache(self.name, not leader)
+
+        if not leader:
+            waiter["event"].wait()
+            if "error" in waiter:
+                raise waiter["error"]
+            return waiter["value"]
+
+        try:
+            value = loader()
+        except Exception as e:
+            waiter["error"] = e
+            with self._lock:
+                del self._inflight[key]
+            waiter["event"].set()
+            raise
+        waiter["value"] = value
+        with self._lock:
+            self._values[key] = value
+            del self._inflight[key]
+        waiter["event"].set()
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+_metadata_cache = SingleFlightCache("metadata")
+
+def metadata_cache():
+    return _metadata_cache
+
+def fetch_metadata(identifier, timeout=30):
+    """/metadata/<identifier> via session condivisa, cache e single-flight."""
+    url = f"{IA_META}/{identifier}"
+    md = _metadata_cache.get(url, lambda: get_json(url, timeout=timeout))
+    remember_nodes(identifier, md)
+    return md
+
+# --- Nodi di storage IA e richieste hedged -------------------------------------
+
+DEFAULT_HEDGE_MS = 800.0
+
+_nodes = {}                      # identifier -> {"server", "d1", "d2", "dir"}
+_fetch_cfg = {"hedge_ms": None, "direct": True}
+_hedge_pool = None
+_hedge_lock = threading.Lock()
+
+def remember_nodes(identifier, md):
+    """Tiene server/d1/d2/dir di un /metadata già letto (chi ha md completo lo passa qui)."""
+    if md and md.get("dir"):
+        _nodes[identifier] = {k: md.get(k) for k in ("server", "d1", "d2", "dir")}
+
+def node_urls(url, resolve=True, timeout=30):
+    """
+    URL da provare per un file, nell'ordine: nodo primario, replica.
+    Per archive.org: nodi da /metadata (già letto, o letto ora se resolve);
+    con un solo nodo la replica è /download (redirect a un nodo a scelta di IA).
+    Altri host, o metadata non disponibile: [url].
+    """
+    item = archive_item(url)
+    if item is None or not _fetch_cfg["direct"]:
+        return [url]
+    ident, name = item
+    nodes = _nodes.get(ident)
+    if nodes is None and resolve:
+        try:
+            fetch_metadata(ident, timeout=timeout)
+        except Exception:
+            pass
+        nodes = _nodes.get(ident)
+    urls = archive_node_urls(nodes, name) if nodes else []
+    if len(urls) == 1:
+        urls.append(url)
+    return urls or [url]
+
+def direct_url(url):
+    """URL diretto sul nodo primario se i nodi dell'item sono già noti, altrimenti url."""
+    return node_urls(url, resolve=False)[0]
+
+def direct_entries(entries):
+    """Voci di una lista (con ';' o a capo in coda) con l'URL sul nodo primario al posto di /download."""
+    out = []
+    for e in entries:
+        body = e.rstrip(";\n")
+        out.append(direct_url(body) + e[len(body):])
+    return out
+
+def configure_fetch(hedge_ms=None, direct=None):
+    """hedge_ms: ritardo della richiesta di riserva (<= 0 disattiva); direct: usa i nodi di storage."""
+    if hedge_ms is not None:
+        _fetch_cfg["hedge_ms"] = float(hedge_ms)
+    if direct is not None:
+        _fetch_cfg["direct"] = bool(direct)
+
+def hedge_delay():
+    """Secondi prima della richiesta di riserva (None = hedging spento)."""
+    ms = _fetch_cfg["hedge_ms"]
+    if ms is None:
+        ms = float(os.environ.get("ENVION_HEDGE_MS") or DEFAULT_HEDGE_MS)
+    return ms / 1000.0 if ms > 0 else None
+
+def _pool():
+    global _hedge_pool
+    with _hedge_lock:
+        if _hedge_pool is None:
+            _hedge_pool = ThreadPoolExecutor(max_workers=DEFAULT_POOL_SIZE, thread_name_prefix="hedge")
+        return _hedge_pool
+
+def get_range_hedged(url, start, end, timeout=30):
+    """
+    Come get_range, ma sui nodi di storage (node_urls). Se il primo nodo non
+    risponde entro hedge_delay() parte la stessa richiesta sulla replica e
+    vince la prima risposta riuscita; l'altra finisce in background e si
+    butta (sono Range piccoli: head e finestre delle clip).
+    """
+    # solo nodi già noti: un /metadata completo per una lettura di pochi KB non conviene
+    # (BBCSoundEffectsComplete); gli script lo leggono comunque prima di fingerprint/atomi
+    urls = node_urls(url, resolve=False)
+    delay = hedge_delay()
+    if len(urls) == 1 or delay is None:
+        last = None
+        for u in urls:
+            try:
+                return get_range(u, start, end, timeout=timeout)
+            except Exception as e:
+                last = e
+        raise last
+    pool = _pool()
+    pending = {pool.submit(get_range, urls[0], start, end, timeout)}
+    done, _ = wait(pending, timeout=delay)
+    if done and not next(iter(done)).exception():
+        return next(iter(done)).result()
+    # primo nodo lento (o già fallito): richiesta di riserva sulla replica
+    trace.cache("hedge", False)
+    pending.add(pool.submit(get_range, urls[1], start, end, timeout))
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for fut in done:
+            if fut.exception() is None:
+                return fut.result()
+            error = fut.exception()
+    raise error
+
+# --- Cache HTTP su disco (risposte di ricerca) ---------------------------------
+
+DEFAULT_CACHE_PATH = "netsound/.http_cache.sqlite"
+DEFAULT_CACHE_FRESH = 6 * 3600      # secondi senza nemmeno chiedere al server
+DEFAULT_CACHE_MB = 256
+
+CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY, url TEXT NOT NULL,
+    etag TEXT, last_modified TEXT,
+    stored REAL NOT NULL, accessed REAL NOT NULL,
+    size INTEGER NOT NULL, body BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed);
+"""
+
+def normalize_url(url):
+    """
+    Chiave di cache: schema e host minuscoli, parametri ordinati per nome
+    (l'ordine dei valori ripetuti, es. fl[], resta quello originale),
+    frammento tolto.
+    """
+    sp = urlsplit(url)
+    params = sorted(parse_qsl(sp.query, keep_blank_values=True), key=lambda kv: kv[0])
+    return urlunsplit((sp.scheme.lower(), sp.netloc.lower(), sp.path or "/", urlencode(params), ""))
+
+class ResponseCache:
+    """
+    Risposte HTTP 200 in SQLite, corpo compresso con zlib. Entro 'fresh'
+    secondi dal salvataggio (o dall'ultima rivalidazione) la risposta si usa
+    senza rete; dopo si manda una richiesta condizionale se il server aveva
+    dato ETag/Last-Modified (304 = si riusa il corpo), altrimenti si
+    riscarica. Oltre max_bytes (corpi compressi) si tolgono le voci usate
+    meno di recente.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_mb=DEFAULT_CACHE_MB, fresh=DEFAULT_CACHE_FRESH):
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self.path = path
+        self.max_bytes = int(float(max_mb) * 1_000_000)
+        self.fresh = float(fresh)
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._con.executescript(CACHE_SCHEMA)
+
+    def lookup(self, key):
+        with self._lock:
+            row = self._con.execute(
+                "SELECT etag, last_modified, stored, body FROM responses WHERE key=?", (key,)).fetchone()
+            if row is None:
+                return None
+            with self._con:
+                self._con.execute("UPDATE responses SET accessed=? WHERE key=?", (time.time(), key))
+        try:
+            body = zlib.decompress(row[3])
+        except zlib.error:
+            return None
+        return {"etag": row[0], "last_modified": row[1], "stored": row[2], "body": body}
+
+    def revalidated(self, key):
+        with self._lock, self._con:
+            now = time.time()
+            self._con.execute("UPDATE responses SET stored=?, accessed=? WHERE key=?", (now, now, key))
+
+    def store(self, key, url, body, etag=None, last_modified=None):
+        blob = zlib.compress(body, 6)
+        now = time.time()
+        with self._lock, self._con:
+            self._con.execute(
+                "INSERT OR REPLACE INTO responses (key, url, etag, last_modified, stored, accessed, size, body)"
+                " VALUES (?,?,?,?,?,?,?,?)", (key, url, etag, last_modified, now, now, len(blob), blob))
+            self._evict()
+
+    def _evict(self):
+        if self.max_bytes <= 0:
+            return
+        total = self._con.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        drop = []
+        for key, size in self._con.execute("SELECT key, size FROM responses ORDER BY accessed"):
+            drop.append((key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+        self._con.executemany("DELETE FROM responses WHERE key=?", drop)
+
+    def stats(self):
+        with self._lock:
+            return self._con.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+
+    def clear(self):
+        with self._lock, self._con:
+            self._con.execute("DELETE FROM responses")
+
+_response_cache = None
+_cache_conf = None      # None = da variabili d'ambiente (default: spenta), False = disattivata
+_cache_lock = threading.Lock()
+_open_caches = {}       # (percorso assoluto, max_mb, fresh) -> ResponseCache già aperta
+
+def configure_cache(path=None, max_mb=None, fresh=None, enabled=True):
+    """
+    Accende la cache di processo (prima del primo uso); senza path quello
+    di $ENVION_HTTP_CACHE o DEFAULT_CACHE_PATH. path vuoto o enabled=False
+    la spengono.
+    """
+    global _response_cache, _cache_conf
+    with _cache_lock:
+        _response_cache = None
+        _cache_conf = {"path": path, "max_mb": max_mb, "fresh": fresh} if enabled and path != "" else False
+
+def _env_cache_path():
+    """$ENVION_HTTP_CACHE: percorso, "1"/"on" = DEFAULT_CACHE_PATH, vuoto/"0"/"off" = spenta ("")."""
+    v = os.environ.get("ENVION_HTTP_CACHE", "").strip()
+    if v.lower() in ("", "0", "off", "no"):
+        return ""
+    return DEFAULT_CACHE_PATH if v.lower() in ("1", "on", "yes") else v
+
+def response_cache():
+    """
+    Cache condivisa, aperta al primo uso; None = spenta (il default). Senza
+    configure_cache() la accende solo ENVION_HTTP_CACHE; valgono anche
+    ENVION_HTTP_CACHE_FRESH (secondi) ed ENVION_HTTP_CACHE_MB.
+    """
+    global _response_cache
+    with _cache_lock:
+        if _response_cache is not None or _cache_conf is False:
+            return _response_cache
+        conf = _cache_conf or {}
+        path = conf.get("path") or _env_cache_path()
+        if not path and _cache_conf:
+            path = DEFAULT_CACHE_PATH   # accesa esplicitamente, senza percorso
+        if not path:
+            return None
+        fresh = conf.get("fresh")
+        if fresh is None:
+            fresh = float(os.environ.get("ENVION_HTTP_CACHE_FRESH", DEFAULT_CACHE_FRESH))
+        max_mb = conf.get("max_mb")
+        if max_mb is None:
+            max_mb = float(os.environ.get("ENVION_HTTP_CACHE_MB", DEFAULT_CACHE_MB))
+        # percorso relativo = rispetto alla cwd di chi apre (nel servizio: del lavoro)
+        key = (os.path.abspath(path), float(max_mb), float(fresh))
+        if key not in _open_caches:
+            try:
+                _open_caches[key] = ResponseCache(key[0], max_mb, fresh)
+            except (OSError, sqlite3.Error):
+                return None   # cartella non scrivibile: si va sempre in rete
+        _response_cache = _open_caches[key]
+        return _response_cache
+
+def cached_get(url, timeout=30, headers=None):
+    """
+    Corpo (bytes) di una GET che passa dalla cache su disco. Se la rete
+    fallisce e c'è una copia (anche scaduta) si usa quella.
+    """
+    cache = response_cache()
+    if cache is None:
+        r = get(url, timeout=timeout, headers=headers)
+        r.raise_for_status()
+        return r.content
+    key = hashlib.sha1(normalize_url(url).encode("utf-8")).hexdigest()
+    ent = cache.lookup(key)
+    if ent is not None and time.time() - ent["stored"] < cache.fresh:
+        trace.cache("http", True)
+        return ent["body"]
+    h = dict(headers or {})
+    if ent is not None:
+        if ent["etag"]:
+            h["If-None-Match"] = ent["etag"]
+        if ent["last_modified"]:
+            h["If-Modified-Since"] = ent["last_modified"]
+    try:
+        r = get(url, timeout=timeout, headers=h)
+    except requests.RequestException:
+        if ent is None:
+            raise
+        trace.cache("http", True)
+        return ent["body"]
+    if r.status_code == 304 and ent is not None:
+        cache.revalidated(key)
+        trace.cache("http", True)
+        return ent["body"]
+    r.raise_for_status()
+    trace.cache("http", False)
+    cache.store(key, url, r.content, r.headers.get("ETag"), r.headers.get("Last-Modified"))
+    return r.content
+
+def cached_json(url, timeout=30, headers=None):
+    return json.loads(cached_get(url, timeout=timeout, headers=headers))
+
+def add_cli_args(ap):
+    ap.add_argument("--http-cache", type=str, nargs="?", const="", default=None, metavar="PATH",
+                    help="cache su disco delle risposte di ricerca, spenta se non richiesta "
+                         f"(senza PATH: $ENVION_HTTP_CACHE o {DEFAULT_CACHE_PATH})")
+    ap.add_argument("--no-http-cache", action="store_true", help="spegne la cache anche se $ENVION_HTTP_CACHE è impostata")
+    ap.add_argument("--http-cache-fresh", type=float, default=None,
+                    help=f"secondi in cui una risposta vale senza chiedere al server (default: {DEFAULT_CACHE_FRESH})")
+    ap.add_argument("--hedge-ms", type=float, default=None,
+                    help="letture Range (fingerprint, atomi): dopo quanti ms senza risposta si chiede anche "
+                         f"alla replica del nodo IA; 0 = mai (default: $ENVION_HEDGE_MS o {DEFAULT_HEDGE_MS:g})")
+    ap.add_argument("--no-direct-nodes", action="store_true",
+                    help="letture Range via archive.org/download (redirect) invece dei nodi di storage")
+
+def reset():
+    """Fetch e cache tornano ai default (variabili d'ambiente); le cache già aperte si riusano."""
+    global _response_cache, _cache_conf
+    _fetch_cfg.update(hedge_ms=None, direct=True)
+    with _cache_lock:
+        _response_cache = None
+        _cache_conf = None
+
+def setup_cache(args):
+    """Applica gli argomenti di add_cli_args() partendo dai default, non da quelli di prima."""
+    reset()
+    configure_fetch(getattr(args, "hedge_ms", None), False if getattr(args, "no_direct_nodes", False) else None)
+    if getattr(args, "no_http_cache", False):
+        configure_cache(enabled=False)
+    elif getattr(args, "http_cache", None) is not None or getattr(args, "http_cache_fresh", None) is not None:
+        configure_cache(args.http_cache or None, fresh=args.http_cache_fresh)
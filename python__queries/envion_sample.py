@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+"""
+envion_sample.py
+Campionamento casuale uniforme dei risultati di advancedsearch.
+
+Gli script prendevano la prima pagina (--rows 300) nell'ordine del server
+(downloads desc sitewide) e al più la mescolavano: tornano sempre gli stessi
+item popolari e la dedupe su history li butta via uno a uno. Qui:
+- una richiesta con rows=0 dà numFound
+- si estraggono indici casuali distinti in [0, numFound) e per ciascuno si
+  chiede la pagina di una riga (rows=1, page=indice+1)
+- i doc escono uno alla volta, in ordine casuale: chi li consuma si ferma
+  quando ha abbastanza URL, quindi richieste e memoria sono O(count)
+
+advancedsearch non pagina oltre le prime ~10000 righe: oltre quella finestra
+(window) il campione è uniforme sulle prime 'window' righe nell'ordine di sort.
+"""
+
+import random as _random
+from urllib.parse import urlencode
+
+import envion_http
+
+IA_SEARCH = "https://archive.org/advancedsearch.php"
+MAX_WINDOW = 10000
+MAX_ERRORS = 5
+
+def search_url(params, rows, page):
+    p = dict(params, rows=rows, page=page, output="json")
+    return IA_SEARCH + "?" + urlencode(p, doseq=True)
+
+def num_found(params, timeout=30):
+    """Numero di risultati della query (rows=0, passa dalla cache HTTP)."""
+    data = envion_http.cached_json(search_url(params, 0, 1), timeout=timeout)
+    return int((data.get("response") or {}).get("numFound") or 0)
+
+def random_indices(n, rng):
+    """
+    Indici distinti di range(n) in ordine casuale uniforme, generati uno alla
+    volta: memoria proporzionale a quanti se ne consumano, non a n.
+    """
+    drawn = set()
+    # estrazione con rifiuto finché i già estratti sono meno di metà
+    while len(drawn) < n // 2:
+        i = rng.randrange(n)
+        if i not in drawn:
+            drawn.add(i)
+            yield i
+    # il resto (qui n <= 2 * consumati): permutazione esplicita
+    rest = [i for i in range(n) if i not in drawn]
+    rng.shuffle(rest)
+    yield from rest
+
+def iter_random_docs(params, rng=None, window=MAX_WINDOW, timeout=30, total=None):
+    """
+    Doc di advancedsearch in ordine casuale uniforme, senza ripetizioni.
+    params: q, fl[], sort[] (rows/page/output vengono impostati qui).
+    """
+    rng = rng or _random.Random()
+    if total is None:
+        total = num_found(params, timeout)
+    n = min(total, window) if window else total
+    errors = 0
+    for i in random_indices(n, rng):
+        try:
+            data = envion_http.get_json(search_url(params, 1, i + 1), timeout=timeout)
+        except Exception:
+            # una pagina persa non cambia l'uniformità; troppe di fila = rete giù,
+            # il campione si chiude con quello che c'è
+            errors += 1
+            if errors >= MAX_ERRORS:
+                return
+            continue
+        errors = 0
+        docs = (data.get("response") or {}).get("docs") or []
+        if docs:
+            yield docs[0]
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+envion_service.py
+Servizio residente per i fetcher NET-AUDIO, raggiungibile su socket Unix.
+
+Ogni lista costava un nuovo interprete: import di requests, nuove
+connessioni TLS, history riletta da capo. Quando è Pd a chiedere una lista
+durante un set quel tempo è tutto sul percorso critico. Il servizio resta
+acceso e tiene caldi:
+- moduli già importati (make_internetarchive_search, internet_archive_fine_tuning,
+  make_raw_list e le librerie envion_*)
+- la Session di envion_http con il pool di connessioni keep-alive
+- la cache /metadata in memoria e la cache HTTP su disco già aperta
+- le history già lette (envion_urls rilegge solo le righe aggiunte)
+
+Protocollo: una riga JSON per richiesta, una riga JSON di risposta.
+  {"script": "make_internetarchive_search", "argv": [...], "cwd": "/path"}
+  -> {"rc": 0, "out": "<stdout>", "err": "<stderr>", "ms": 812.4}
+  {"cmd": "ping"} / {"cmd": "stop"}
+
+Gli script girano in-process con main(argv): cwd e stdout/stderr sono del
+processo, quindi un lavoro alla volta (le richieste in più aspettano).
+
+Uso:
+  python3 envion_service.py                      # socket di default (vedi envion_client)
+  python3 envion_service.py --history netsound/netsound_history.txt
+  python3 envion_client.py make_internetarchive_search --q wind --count 8 --out-dir netsound
+"""
+
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+import traceback
+
+import envion_client
+import envion_http
+import envion_trace as trace
+from envion_urls import read_history_set
+
+class Service(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path):
+        super().__init__(path, Handler)
+        self.job_lock = threading.Lock()
+        self.started = time.time()
+        self.jobs = 0
+        self.modules = {}
+
+    def module(self, name):
+        if name not in self.modules:
+            self.modules[name] = importlib.import_module(name)
+        return self.modules[name]
+
+    def run_job(self, script, argv, cwd):
+        """Esegue script.main(argv) in cwd; ritorna rc, stdout e stderr catturati."""
+        out, err = io.StringIO(), io.StringIO()
+        t0 = time.perf_counter()
+        with self.job_lock:
+            old_cwd = os.getcwd()
+            rc = 0
+            try:
+                if cwd:
+                    os.chdir(cwd)
+                # niente stato dal lavoro precedente: profilo, cache HTTP, hedging
+                trace.setup()
+                envion_http.reset()
+                with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+                    try:
+                        self.module(script).main([str(a) for a in argv])
+                    except SystemExit as e:
+                        if isinstance(e.code, int) or e.code is None:
+                            rc = e.code or 0
+                        else:
+                            print(e.code, file=sys.stderr)
+                            rc = 1
+                    except Exception:
+                        traceback.print_exc()
+                        rc = 1
+                    finally:
+                        trace.finish()   # --profile/--trace del lavoro, non del servizio
+            finally:
+                os.chdir(old_cwd)
+                self.jobs += 1
+        return {"rc": rc, "out": out.getvalue(), "err": err.getvalue(),
+                "ms": round((time.perf_counter() - t0) * 1000.0, 1)}
+
+    def status(self):
+        return {"ok": True, "pid": os.getpid(), "uptime": round(time.time() - self.started, 1),
+                "jobs": self.jobs, "busy": self.job_lock.locked(), "modules": sorted(self.modules)}
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            req = json.loads(self.rfile.readline(envion_client.MAX_LINE) or b"{}")
+        except ValueError as e:
+            return self.reply({"rc": 2, "err": f"[envion] richiesta non valida: {e}\n"})
+        cmd = req.get("cmd")
+        if cmd == "ping":
+            return self.reply(self.server.status())
+        if cmd == "stop":
+            self.reply({"ok": True, "stopping": True})
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+            return
+        script = req.get("script")
+        if script not in envion_client.SCRIPTS:
+            return self.reply({"rc": 2, "err": f"[envion] script non gestito: {script}\n"})
+        self.reply(self.server.run_job(script, req.get("argv") or [], req.get("cwd")))
+
+    def reply(self, res):
+        self.wfile.write(json.dumps(res, ensure_ascii=False).encode("utf-8") + b"\n")
+
+def _in_use(path):
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(path)
+        return True
+    except OSError:
+        return False
+    finally:
+        s.close()
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Resident NET-AUDIO fetch service (Unix socket).")
+    ap.add_argument("--socket", default=None, help="percorso del socket (default: come envion_client)")
+    ap.add_argument("--history", action="append", default=[], help="history da caricare subito (ripetibile)")
+    ap.add_argument("--no-preload", action="store_true", help="non importa gli script all'avvio")
+    args = ap.parse_args(argv)
+
+    path = args.socket or envion_client.socket_path()
+    if os.path.exists(path):
+        if _in_use(path):
+            print(f"[envion] servizio già attivo su {path}", file=sys.stderr)
+            sys.exit(1)
+        os.unlink(path)   # socket orfano di un servizio terminato male
+
+    srv = Service(path)
+    os.chmod(path, 0o600)
+    if not args.no_preload:
+        for name in envion_client.SCRIPTS:
+            srv.module(name)
+    envion_http.session()
+    for h in args.history:
+        n = len(read_history_set(h))
+        print(f"[envion] history {h}: {n} chiavi", file=sys.stderr)
+    print(f"[envion] in ascolto su {path} (pid {os.getpid()})", file=sys.stderr)
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        srv.server_close()
+        with contextlib.suppress(OSError):
+            os.unlink(path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+
+"""
+envion_trace.py
+Strumentazione del percorso di fetch (ricerca, metadata, filtri, history).
+
+Quando una lista ci mette troppo, serve sapere quale stadio è lento.
+Questo modulo raccoglie, in modo thread-safe:
+- span per stadio (search, metadata, filter, history, write, ...)
+- latenza delle richieste HTTP per host, con istogramma a bucket
+- hit/miss delle cache
+- candidati scartati per motivo del filtro (ext, duration, size, ...)
+
+Gli eventi vanno in un file JSONL (--trace FILE); con --profile a fine run
+(anche con sys.exit) viene stampata una tabella riassuntiva su stderr.
+Se non è attivo, ogni chiamata è un no-op quasi gratuito.
+
+Uso negli script:
+  import envion_trace as trace
+  trace.add_cli_args(ap)            # --trace / --profile
+  trace.setup(args.trace, args.profile)
+  with trace.span("search"):
+      ...
+"""
+
+import atexit
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+# limiti superiori dei bucket di latenza (ms); l'ultimo è "oltre"
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.profile = False
+        self._fh = None
+        self._lock = threading.Lock()
+        self._t0 = time.perf_counter()
+        self.stages = {}     # stage -> [count, total_ms, max_ms]
+        self.hosts = {}      # host -> [latenze ms]
+        self.errors = {}     # host -> conteggio
+        self.caches = {}     # nome -> [hit, miss]
+        self.rejected = {}   # motivo -> conteggio
+        self._atexit = False
+
+    def setup(self, trace_path=None, profile=False):
+        """Riparte da zero: nel servizio residente ogni lavoro ha il suo profilo."""
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+        self.stages, self.hosts, self.errors, self.caches, self.rejected = {}, {}, {}, {}, {}
+        self.enabled = bool(trace_path or profile)
+        self.profile = bool(profile)
+        if trace_path:
+            self._fh = open(trace_path, "a", encoding="utf-8")
+        self._t0 = time.perf_counter()
+        if self.enabled and not self._atexit:
+            atexit.register(self.finish)
+            self._atexit = True
+
+    def _emit(self, ev):
+        if self._fh is None:
+            return
+        ev["t"] = round((time.perf_counter() - self._t0) * 1000.0, 3)
+        line = json.dumps(ev, ensure_ascii=False)
+        with self._lock:
+            self._fh.write(line + "\n")
+
+    # --- span ----------------------------------------------------------------
+
+    @contextmanager
+    def span(self, stage, **attrs):
+        if not self.enabled:
+            yield
+            return
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            ms = (time.perf_counter() - t) * 1000.0
+            with self._lock:
+                s = self.stages.setdefault(stage, [0, 0.0, 0.0])
+                s[0] += 1
+                s[1] += ms
+                s[2] = max(s[2], ms)
+            self._emit({"ev": "span", "stage": stage, "ms": round(ms, 3), **attrs})
+
+    # --- richieste HTTP ------------------------------------------------------
+
+    def request(self, url, ms, status=None, nbytes=None, error=None):
+        if not self.enabled:
+            return
+        host = urlsplit(url).netloc or "?"
+        with self._lock:
+            self.hosts.setdefault(host, []).append(ms)
+            if error is not None or (status is not None and status >= 400):
+                self.errors[host] = self.errors.get(host, 0) + 1
+        ev = {"ev": "request", "host": host, "url": url, "ms": round(ms, 3)}
+        if status is not None:
+            ev["status"] = status
+        if nbytes is not None:
+            ev["bytes"] = nbytes
+        if error is not None:
+            ev["error"] = str(error)
+        self._emit(ev)
+
+    @contextmanager
+    def timed_request(self, url):
+        """Per client HTTP che non passano da envion_http (urllib)."""
+        if not self.enabled:
+            yield
+            return
+        t = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.request(url, (time.perf_counter() - t) * 1000.0, error=e)
+            raise
+        self.request(url, (time.perf_counter() - t) * 1000.0)
+
+    # --- cache e filtri ------------------------------------------------------
+
+    def cache(self, name, hit):
+        if not self.enabled:
+            return
+        with self._lock:
+            c = self.caches.setdefault(name, [0, 0])
+            c[0 if hit else 1] += 1
+        self._emit({"ev": "cache", "cache": name, "hit": bool(hit)})
+
+    def rejects(self, counts):
+        """counts: dict motivo -> numero (es. da CandidateFilter.filter_files)."""
+        if not self.enabled or not counts:
+            return
+        with self._lock:
+            for reason, n in counts.items():
+                self.rejected[reason] = self.rejected.get(reason, 0) + n
+        self._emit({"ev": "reject", "counts": dict(counts)})
+
+    def reject(self, reason, n=1):
+        self.rejects({reason: n})
+
+    # --- riepilogo -----------------------------------------------------------
+
+    def summary(self):
+        with self._lock:
+            hosts = {}
+            for host, lat in self.hosts.items():
+                lat = sorted(lat)
+                buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+                for ms in lat:
+                    i = 0
+                    while i < len(LATENCY_BUCKETS_MS) and ms > LATENCY_BUCKETS_MS[i]:
+                        i += 1
+                    buckets[i] += 1
+                hosts[host] = {
+                    "count": len(lat),
+                    "errors": self.errors.get(host, 0),
+                    "p50": _pct(lat, 50), "p90": _pct(lat, 90), "p99": _pct(lat, 99),
+                    "max": lat[-1] if lat else 0.0,
+                    "buckets": buckets,
+                }
+            return {
+                "wall_ms": round((time.perf_counter() - self._t0) * 1000.0, 3),
+                "stages": {k: {"count": v[0], "total_ms": round(v[1], 3), "max_ms": round(v[2], 3)}
+                           for k, v in self.stages.items()},
+                "hosts": hosts,
+                "caches": {k: {"hit": v[0], "miss": v[1]} for k, v in self.caches.items()},
+                "rejected": dict(self.rejected),
+            }
+
+    def print_profile(self, s, out=None):
+        out = out or sys.stderr
+        p = lambda *a: print(*a, file=out)
+        p(f"\n[PROFILE] wall {s['wall_ms']:.0f} ms")
+        if s["stages"]:
+            p(f"  {'stage':<18}{'count':>7}{'total ms':>12}{'avg ms':>10}{'max ms':>10}")
+            for k, v in sorted(s["stages"].items(), key=lambda kv: -kv[1]["total_ms"]):
+                avg = v["total_ms"] / v["count"] if v["count"] else 0.0
+                p(f"  {k:<18}{v['count']:>7}{v['total_ms']:>12.1f}{avg:>10.1f}{v['max_ms']:>10.1f}")
+        if s["hosts"]:
+            heads = "".join(f"{'<=' + str(b):>8}" for b in LATENCY_BUCKETS_MS) + f"{'>' + str(LATENCY_BUCKETS_MS[-1]):>8}"
+            p(f"  {'host':<28}{'req':>5}{'err':>5}{'p50':>8}{'p90':>8}{'p99':>8}{heads}")
+            for host, h in sorted(s["hosts"].items(), key=lambda kv: -kv[1]["count"]):
+                bks = "".join(f"{n:>8}" for n in h["buckets"])
+                p(f"  {host[:28]:<28}{h['count']:>5}{h['errors']:>5}"
+                  f"{h['p50']:>8.0f}{h['p90']:>8.0f}{h['p99']:>8.0f}{bks}")
+        for name, c in sorted(s["caches"].items()):
+            tot = c["hit"] + c["miss"]
+            rate = 100.0 * c["hit"] / tot if tot else 0.0
+            p(f"  cache {name:<14} hit {c['hit']}  miss {c['miss']}  ({rate:.0f}%)")
+        if s["rejected"]:
+            parts = ", ".join(f"{k} {v}" for k, v in sorted(s["rejected"].items(), key=lambda kv: -kv[1]))
+            p(f"  scartati: {parts}")
+
+    def finish(self):
+        if not self.enabled:
+            return
+        self.enabled = False
+        s = self.summary()
+        self._emit({"ev": "summary", **s})
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+        if self.profile:
+            self.print_profile(s)
+
+def _pct(sorted_vals, q):
+    if not sorted_vals:
+        return 0.0
+    i = min(len(sorted_vals) - 1, int(round(q / 100.0 * (len(sorted_vals) - 1))))
+    return sorted_vals[i]
+
+# --- tracer di processo e scorciatoie ----------------------------------------
+
+TRACER = Tracer()
+
+def setup(trace_path=None, profile=False):
+    TRACER.setup(trace_path, profile)
+
+def span(stage, **attrs):
+    return TRACER.span(stage, **attrs)
+
+def request(url, ms, status=None, nbytes=None, error=None):
+    TRACER.request(url, ms, status, nbytes, error)
+
+def timed_request(url):
+    return TRACER.timed_request(url)
+
+def cache(name, hit):
+    TRACER.cache(name, hit)
+
+def rejects(counts):
+    TRACER.rejects(counts)
+
+def finish():
+    TRACER.finish()
+
+def add_cli_args(ap):
+    ap.add_argument("--trace", type=str, default="",
+                    help="scrive eventi di strumentazione (span, richieste, cache, scarti) in questo JSONL")
+    ap.add_argument("--profile", action="store_true",
+                    help="a fine run stampa su stderr la tabella dei tempi per stadio/host")
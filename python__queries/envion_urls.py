@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+
+"""
+envion_urls.py
+Chiavi URL canoniche e history condivisa per la dedupe di NET-AUDIO.
+
+Lo stesso file di archive.org finiva in history in forme diverse:
+nome percent-encoded (make_bbc_search_ia), nome con spazi crudi
+(make_internetarchive_search), query ri-encodata (encode_netsound_urls),
+http/https, www., nodi di storage iaNNN.us.archive.org/.../items/...
+Qui c'è una sola canonicalizzazione, usata per ogni controllo di
+appartenenza e ogni scrittura in history:
+
+- schema http/https -> https, host minuscolo, porte di default tolte
+- path decodificato e ri-encodato (idempotente: niente %2520)
+- query decodificata e ri-encodata, fragment tolto
+- archive.org: qualunque host/percorso di un file di un item diventa
+  https://archive.org/download/<identifier>/<filename>
+"""
+
+import os
+import re
+from urllib.parse import parse_qsl, quote, unquote, urlencode, urlsplit, urlunsplit
+
+# caratteri lasciati in chiaro nel path (come encode_netsound_urls / fix_netsound_spaces_only)
+PATH_SAFE = "/-_.~"
+QUERY_SAFE = "-_.~"
+
+_IA_HOST_RE = re.compile(r"^(?:www\.)?(?:[a-z0-9-]+\.)*archive\.org$")
+# /download/<id>/<file>  |  /<n>/items/<id>/<file>
+_IA_PATH_RE = re.compile(r"^/(?:download|\d+/items)/([^/]+)/(.+)$")
+
+def strip_entry(u):
+    """Riga di lista/history -> URL nudo (senza spazi e ';' finali)."""
+    return u.strip().rstrip(";").strip()
+
+def _reencode_path(path):
+    return quote(unquote(path), safe=PATH_SAFE)
+
+def _reencode_query(query):
+    if not query:
+        return ""
+    pairs = parse_qsl(query, keep_blank_values=True)
+    return urlencode(pairs, quote_via=quote, safe=QUERY_SAFE)
+
+def encode_url(u):
+    """
+    Encoding sicuro per Pd: path e query decodificati e ri-encodati,
+    schema e host invariati. Idempotente.
+    """
+    u = strip_entry(u)
+    if not u:
+        return u
+    p = urlsplit(u)
+    return urlunsplit((p.scheme, p.netloc, _reencode_path(p.path),
+                       _reencode_query(p.query), quote(unquote(p.fragment), safe=QUERY_SAFE)))
+
+def archive_item(u):
+    """URL di un file archive.org -> (identifier, filename decodificato) oppure None."""
+    p = urlsplit(strip_entry(u))
+    host = (p.hostname or "").lower()
+    if not _IA_HOST_RE.match(host):
+        return None
+    m = _IA_PATH_RE.match(unquote(p.path))
+    if not m:
+        return None
+    return m.group(1), m.group(2)
+
+def archive_download_url(identifier, filename):
+    """URL canonico (e caricabile da Pd) di un file di un item IA."""
+    return f"https://archive.org/download/{quote(identifier, safe=PATH_SAFE)}/{quote(filename, safe=PATH_SAFE)}"
+
+def archive_node_urls(md, filename):
+    """
+    URL diretti di un file IA sui nodi di storage, da /metadata dell'item:
+    server (primario), poi d1/d2 (repliche). Niente redirect 302 di
+    /download; la chiave canonica resta la stessa (vedi canonical_url).
+    [] se la risposta non ha 'dir' o nessun nodo.
+    """
+    d = (md or {}).get("dir")
+    if not d:
+        return []
+    out = []
+    for host in (md.get("server"), md.get("d1"), md.get("d2")):
+        if not host:
+            continue
+        u = f"https://{host}{quote(d, safe=PATH_SAFE)}/{quote(filename, safe=PATH_SAFE)}"
+        if u not in out:
+            out.append(u)
+    return out
+
+def canonical_url(u):
+    """Chiave canonica di un URL per dedupe e history."""
+    u = strip_entry(u)
+    if not u:
+        return u
+    item = archive_item(u)
+    if item:
+        return archive_download_url(*item)
+    p = urlsplit(u)
+    scheme = p.scheme.lower()
+    host = (p.hostname or "").lower()
+    port = p.port
+    if scheme in ("http", "https"):
+        if port in (80, 443):
+            port = None
+        scheme = "https"
+    netloc = host if port is None else f"{host}:{port}"
+    if p.username:
+        netloc = f"{p.username}@{netloc}"
+    return urlunsplit((scheme, netloc, _reencode_path(p.path), _reencode_query(p.query), ""))
+
+# --- History -----------------------------------------------------------------
+
+# history già lette in questo processo: path -> (inode, offset, set).
+# La history è append-only: in un processo lungo (envion_service) si rilegge
+# solo la coda aggiunta dall'ultima lettura.
+_history_cache = {}
+
+def read_history_set(history_path):
+    """
+    File di history -> set di chiavi canoniche (file mancante = set vuoto).
+    Il set è quello della cache di processo, senza copia: va solo letto
+    (chi vuole aggiungere chiavi se ne fa una copia con set(...)).
+    """
+    if not history_path or not os.path.isfile(history_path):
+        return set()
+    path = os.path.abspath(history_path)
+    st = os.stat(path)
+    ino, offset, keys = _history_cache.get(path, (None, 0, None))
+    if keys is None or ino != st.st_ino or st.st_size < offset:
+        offset, keys = 0, set()
+    partial = b""
+    if st.st_size > offset:
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+        # l'ultima riga senza a capo vale per questa lettura ma non entra in
+        # cache: se è ancora in scrittura si rilegge intera la volta dopo
+        end = data.rfind(b"\n") + 1
+        data, partial = data[:end], data[end:]
+        for line in data.decode("utf-8", errors="ignore").splitlines():
+            key = canonical_url(line)
+            if key:
+                keys.add(key)
+        offset += len(data)
+    _history_cache[path] = (st.st_ino, offset, keys)
+    key = canonical_url(partial.decode("utf-8", errors="ignore")) if partial else None
+    if key and key not in keys:
+        return keys | {key}   # riga ancora in scrittura: solo in questo caso una copia
+    return keys
+
+def append_history(history_path, urls):
+    """Aggiunge le chiavi canoniche di urls alla history (una per riga, con ';')."""
+    if not history_path or not urls:
+        return
+    d = os.path.dirname(history_path)
+    if d:
+        os.makedirs(d, exist_ok=True)
+    with open(history_path, "a", encoding="utf-8") as f:
+        for u in urls:
+            key = canonical_url(u)
+            if key:
+                f.write(key + ";\n")
@@ -1,11 +1,22 @@
 #!/usr/bin/env python3
-import sys, json, time, urllib.parse
+import os, sys, json, time, urllib.parse
 from urllib.request import urlopen, Request
 
+import envion_catalog
+import envion_trace as trace
+from envion_checkpoint import CheckpointError, FetchJournal, checkpoint_path
+from envion_filters import compile_filters
+
 # Script "tutto in uno":
 # 1) interroga archive.org/advancedsearch per ottenere gli identifier
 # 2) per ogni identifier scarica i metadata e filtra i file audio con length <= max_seconds
-# 3) stampa le URL dirette con ; finale (ok per Envion)
+# 3) stampa le URL dirette con ; finale (ok per Envion); con --out scrive
+#    anche il sidecar .jsonl con durata/dimensione/formato (envion_catalog)
+# 4) l'avanzamento (pagine, identifier, URL trovate) va in un journal sotto
+#    netsound/.checkpoints/: con --resume una run interrotta riparte da lì
+# 5) solo con --http-cache/--http-cache-fresh (o $ENVION_HTTP_CACHE) le ricerche
+#    passano dalla cache su disco di envion_http, che richiede requests;
+#    senza, bastano urllib e la libreria standard
 
 ADV_URL = "https://archive.org/advancedsearch.php"
 META_BASE = "https://archive.org/metadata/"
@@ -17,14 +28,27 @@ DEFAULT_PAGES = 2
 DEFAULT_MAX_SECONDS = 7.0
 DEFAULT_EXT = {".mp3", ".wav", ".flac", ".ogg"}
 
+_cached_json = None   # envion_http.cached_json se la cache è attiva
+
+def enable_http_cache(path=None, fresh=None):
+    global _cached_json
+    import envion_http   # import qui: requests serve solo con la cache
+    envion_http.configure_cache(path, fresh=fresh)
+    _cached_json = envion_http.cached_json
+
 def http_json(url):
     req = Request(url, headers={"User-Agent":"Envion-IA/1.0"})
-    with urlopen(req) as r:
-        return json.loads(r.read().decode("utf-8", errors="ignore"))
+    with trace.timed_request(url):
+        with urlopen(req) as r:
+            body = r.read()
+    return json.loads(body.decode("utf-8", errors="ignore"))
 
-def adv_search(q, rows=DEFAULT_ROWS, pages=DEFAULT_PAGES):
+def adv_search(q, rows=DEFAULT_ROWS, pages=DEFAULT_PAGES, journal=None):
     ids = []
     for page in range(1, pages+1):
+        if journal is not None and journal.has_page(page):
+            ids.extend(journal.page_ids(page))
+            continue
         params = {
             "q": q,
             "fl[]": DEFAULT_FIELDS,
@@ -33,12 +57,14 @@ def adv_search(q, rows=DEFAULT_ROWS, pages=DEFAULT_PAGES):
             "page": str(page),
         }
         url = ADV_URL + "?" + urllib.parse.urlencode(params, doseq=True)
-        data = http_json(url)
+        with trace.span("search", page=page):
+            # con la cache su disco rilanciare la stessa query costa al più un 304
+            data = _cached_json(url) if _cached_json is not None else http_json(url)
         docs = data.get("response", {}).get("docs", [])
-        for d in docs:
-            ident = d.get("identifier")
-            if ident:
-                ids.append(ident)
+        page_ids = [d.get("identifier") for d in docs if d.get("identifier")]
+        if journal is not None:
+            journal.record_page(page, page_ids)
+        ids.extend(page_ids)
         time.sleep(0.15)  # rate limit gentile
     return ids
 
@@ -49,32 +75,45 @@ def fetch_meta(identifier):
     url = META_BASE + urllib.parse.quote(identifier)
     return http_json(url)
 
-def is_small_file(f, max_seconds, allow_ext):
-    name = f.get("name","")
-    if "." not in name:
-        return False
-    ext = "." + name.split(".")[-1].lower()
-    if ext not in allow_ext:
-        return False
-    length = f.get("length", None)
-    try:
-        sec = float(length) if length is not None else None
-    except:
-        sec = None
-    return (sec is not None) and (sec <= max_seconds)
-
-def run(q, rows, pages, max_seconds, allow_ext):
-    identifiers = adv_search(q, rows=rows, pages=pages)
+def run(q, rows, pages, max_seconds, allow_ext, out=None, journal=None, side=None):
+    # qui la durata è obbligatoria: senza 'length' il file viene scartato
+    # side: file del sidecar JSONL (envion_catalog), scritto insieme alla lista
+    flt = compile_filters(exts=allow_ext, max_dur=max_seconds, require_length=True)
+    out = out or sys.stdout
+    identifiers = adv_search(q, rows=rows, pages=pages, journal=journal)
+    failed = 0
     for ident in identifiers:
-        try:
-            meta = fetch_meta(ident)
-            files = meta.get("files", [])
-            for f in files:
-                if is_small_file(f, max_seconds, allow_ext):
-                    print(file_url(ident, f["name"]))
-            time.sleep(0.1)
-        except Exception as e:
-            print(f"# errore su {ident}: {e}", file=sys.stderr)
+        info = {}
+        if journal is not None and journal.is_done(ident):
+            urls = journal.item_urls(ident)
+        else:
+            try:
+                with trace.span("metadata"):
+                    meta = fetch_meta(ident)
+                files = meta.get("files", [])
+                rejected = {}
+                with trace.span("filter", files=len(files)):
+                    accepted = flt.filter_files(files, rejected)
+                trace.rejects(rejected)
+                urls = [file_url(ident, f["name"]) for f in accepted]
+                if side is not None:
+                    info = {u: envion_catalog.ia_file_meta(ident, f, meta.get("metadata"))
+                            for u, f in zip(urls, accepted)}
+                time.sleep(0.1)
+            except Exception as e:
+                print(f"# errore su {ident}: {e}", file=sys.stderr)
+                failed += 1
+                continue
+            if journal is not None:
+                journal.record_item(ident, urls)
+        # scrittura incrementale: un'interruzione non perde quanto già trovato
+        for u in urls:
+            print(u, file=out, flush=True)
+            if side is not None:
+                side.write(envion_catalog.sidecar_line(
+                    u, info.get(u) or {"source": "ia", "identifier": ident}, query=q, script="ia_short_audio"))
+                side.flush()
+    return failed
 
 def parse_args(argv):
     # parsing minimale (senza argparse per compatibilità massima)
@@ -84,6 +123,13 @@ def parse_args(argv):
     max_seconds = DEFAULT_MAX_SECONDS
     allow_ext = set(DEFAULT_EXT)
     out_path = None
+    resume = False
+    checkpoint = None
+    use_checkpoint = True
+    trace_path = None
+    profile = False
+    http_cache = None
+    http_cache_fresh = None
 
     i = 1
     while i < len(argv):
@@ -106,23 +152,69 @@ def parse_args(argv):
                 allow_ext.add(part)
         elif a == "--out":
             i += 1; out_path = argv[i]
+        elif a == "--resume":
+            resume = True
+        elif a == "--checkpoint":
+            i += 1; checkpoint = argv[i]
+        elif a == "--no-checkpoint":
+            use_checkpoint = False
+        elif a == "--trace":
+            i += 1; trace_path = argv[i]
+        elif a == "--profile":
+            profile = True
+        elif a == "--http-cache":
+            i += 1; http_cache = argv[i]
+        elif a == "--http-cache-fresh":
+            i += 1; http_cache_fresh = float(argv[i])
         else:
             print(f"# argomento sconosciuto: {a}", file=sys.stderr)
         i += 1
 
     if not q:
-        print("Uso:\n  python3 ia_short_audio.py --q '<query advancedsearch>' [--rows 50] [--pages 2] [--max-seconds 7] [--ext mp3,wav,flac,ogg] [--out path]\n", file=sys.stderr)
+        print("Uso:\n  python3 ia_short_audio.py --q '<query advancedsearch>' [--rows 50] [--pages 2] [--max-seconds 7] [--ext mp3,wav,flac,ogg] [--out path] [--resume] [--checkpoint file] [--no-checkpoint] [--trace file.jsonl] [--profile] [--http-cache file.sqlite] [--http-cache-fresh s]\n", file=sys.stderr)
         sys.exit(1)
-    return q, rows, pages, max_seconds, allow_ext, out_path
+    trace.setup(trace_path, profile)
+    env_cache = os.environ.get("ENVION_HTTP_CACHE", "")
+    if http_cache is not None or http_cache_fresh is not None or \
+            (env_cache and env_cache.lower() not in ("0", "off", "no")):
+        enable_http_cache(http_cache, http_cache_fresh)
+    return q, rows, pages, max_seconds, allow_ext, out_path, resume, checkpoint, use_checkpoint
 
 if __name__ == "__main__":
-    q, rows, pages, max_seconds, allow_ext, out_path = parse_args(sys.argv)
-    if out_path:
-        import io, contextlib
-        buf = io.StringIO()
-        with contextlib.redirect_stdout(buf):
-            run(q, rows, pages, max_seconds, allow_ext)
-        with open(out_path, "w", encoding="utf-8") as f:
-            f.write(buf.getvalue())
-    else:
-        run(q, rows, pages, max_seconds, allow_ext)
+    q, rows, pages, max_seconds, allow_ext, out_path, resume, checkpoint, use_checkpoint = parse_args(sys.argv)
+
+    journal = None
+    if use_checkpoint:
+        params = {"script": "ia_short_audio", "q": q, "rows": rows, "pages": pages,
+                  "max_seconds": max_seconds, "ext": sorted(allow_ext)}
+        checkpoint = checkpoint or checkpoint_path("ia_short_audio", params)
+        try:
+            journal = FetchJournal(checkpoint, params, resume=resume)
+        except CheckpointError as e:
+            print(f"# {e}", file=sys.stderr)
+            sys.exit(2)
+
+    try:
+        if out_path:
+            # niente buffer in memoria: le URL vanno su file man mano
+            with open(out_path, "w", encoding="utf-8") as f, \
+                    open(envion_catalog.sidecar_path(out_path), "w", encoding="utf-8") as side:
+                failed = run(q, rows, pages, max_seconds, allow_ext, out=f, journal=journal, side=side)
+        else:
+            failed = run(q, rows, pages, max_seconds, allow_ext, journal=journal)
+    except (Exception, KeyboardInterrupt) as e:
+        hint = ""
+        if journal is not None:
+            journal.close()
+            hint = f"; riprendi con --resume (checkpoint: {checkpoint})"
+        if isinstance(e, KeyboardInterrupt):
+            print(f"# interrotto{hint}", file=sys.stderr)
+            sys.exit(2)
+        print(f"# errore: {e!r}{hint}", file=sys.stderr)
+        raise   # errore inatteso: il traceback resta
+
+    if journal is not None:
+        # con identifier falliti il checkpoint resta: --resume ritenta solo quelli
+        journal.close(remove=not failed)
+        if failed:
+            print(f"# {failed} identifier falliti; ritenta con --resume (checkpoint: {checkpoint})", file=sys.stderr)
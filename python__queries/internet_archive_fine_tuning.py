@@ -9,8 +9,14 @@ Funzionalità:
 - Modalità sitewide o BBC
 - Filtri su subject (inclusione) e collection (esclusione)
 - Filtri per titolo, formato, durata, dimensione, nome file
-- Dedupe via history
-- Output: envion_random_raw_XXX.txt (ogni URL termina con ';')
+- Dedupe via history (chiavi URL canoniche, envion_urls)
+- Dedupe acustica opzionale (--fingerprint, envion_fingerprint)
+- Modalità atomi (--atoms): dai file lunghi una clip di --max-dur secondi
+  scaricando solo quel range (envion_atoms)
+- Output: envion_random_raw_XXX.txt (ogni URL termina con ';') + sidecar
+  envion_random_raw_XXX.jsonl con durata/dimensione/formato (envion_catalog)
+- HTTP condiviso (envion_http): session con pool e cache /metadata,
+  così lo stesso modulo gira anche dentro batch_runner.py
 """
 
 import argparse
@@ -20,11 +26,14 @@ import re
 import sys
 from datetime import datetime
 from urllib.parse import urlencode
-import requests
 
-# --- Directory di lavoro ------------------------------------------------------
-
-os.chdir("/Users/emiliano/Documents/PureData/Envion-Algo-Score")
+import envion_atoms
+import envion_catalog
+import envion_fingerprint
+import envion_http
+import envion_trace as trace
+from envion_filters import compile_filters, parse_length
+from envion_urls import append_history, archive_download_url, read_history_set
 
 # --- Costanti -----------------------------------------------------------------
 
@@ -53,27 +62,6 @@ def ensure_dir(path):
     if path:
         os.makedirs(path, exist_ok=True)
 
-def read_history_set(history_path):
-    s = set()
-    if history_path and os.path.isfile(history_path):
-        try:
-            with open(history_path, "r", encoding="utf-8", errors="ignore") as f:
-                for line in f:
-                    u = line.strip().rstrip(";")
-                    if u:
-                        s.add(u)
-        except Exception:
-            pass
-    return s
-
-def append_history(history_path, urls):
-    if not history_path or not urls:
-        return
-    ensure_dir(os.path.dirname(history_path))
-    with open(history_path, "a", encoding="utf-8") as f:
-        for u in urls:
-            f.write(u.rstrip(";") + ";\n")
-
 def next_progressive_filename(out_dir, prefix="envion_random_raw_", ext=".txt"):
     ensure_dir(out_dir)
     pattern = re.compile(rf"^{re.escape(prefix)}(\d+){re.escape(ext)}$")
@@ -88,14 +76,13 @@ def next_progressive_filename(out_dir, prefix="envion_random_raw_", ext=".txt"):
     return os.path.join(out_dir, f"{prefix}{max_n+1:03d}{ext}")
 
 def safe_get(url, timeout=30):
-    return requests.get(url, timeout=timeout)
+    return envion_http.get(url, timeout=timeout)
 
 # --- Query IA -----------------------------------------------------------------
 
-def search_docs(query_text, rows, scope, debug,
-                exclude_tokens=None, exclude_collections=None,
-                include_subjects=None):
-    """Costruisce e invia una query avanzata su Internet Archive."""
+def search_params(query_text, scope, exclude_tokens=None, exclude_collections=None,
+                  include_subjects=None):
+    """Parametri advancedsearch (q, fl[], sort[]) della query, senza rows/page."""
     if scope == "bbc":
         base_q = f'(collection:({" OR ".join(BBC_COLLECTIONS)})) AND mediatype:audio'
         fl_fields = ["identifier", "title", "collection", "mediatype"]
@@ -137,21 +124,26 @@ def search_docs(query_text, rows, scope, debug,
     for col in excl_cols:
         q_parts.append(f'NOT collection:{col}')
 
-    query = " AND ".join(q_parts)
-
-    params = {"q": query, "rows": rows, "page": 1, "output": "json"}
+    params = {"q": " AND ".join(q_parts)}
     for f in fl_fields:
         params.setdefault("fl[]", []).append(f)
     if sort:
         for s in sort:
             params.setdefault("sort[]", []).append(s)
+    return params
+
+def search_docs(query_text, rows, scope, debug,
+                exclude_tokens=None, exclude_collections=None,
+                include_subjects=None):
+    """Costruisce e invia una query avanzata su Internet Archive."""
+    params = search_params(query_text, scope, exclude_tokens, exclude_collections, include_subjects)
+    params.update({"rows": rows, "page": 1, "output": "json"})
 
     url = IA_SEARCH + "?" + urlencode(params, doseq=True)
     dbg(debug, "search URL:", url)
 
-    r = safe_get(url)
-    r.raise_for_status()
-    data = r.json()
+    # con --http-cache stessa query = stesso URL: dalla cache su disco, al più un 304
+    data = envion_http.cached_json(url)
     docs = (data.get("response") or {}).get("docs") or []
     dbg(debug, f"hits ({scope}) = {len(docs)}")
     if docs:
@@ -159,76 +151,78 @@ def search_docs(query_text, rows, scope, debug,
     return docs
 
 def fetch_metadata(identifier, debug=False):
-    r = safe_get(f"{IA_META}/{identifier}")
-    r.raise_for_status()
-    return r.json()
-
-# --- Filtri -------------------------------------------------------------------
-
-def is_good_ext(name, exts):
-    return name and "." in name and name.rsplit(".", 1)[-1].lower() in exts
-
-def length_ok(fobj, max_dur):
-    if max_dur <= 0:
-        return True
-    l = fobj.get("length")
-    if l is None:
-        return True
-    try:
-        return float(l) <= float(max_dur)
-    except:
-        return True
-
-def size_ok(fobj, max_mb):
-    if max_mb <= 0:
-        return True
-    s = fobj.get("size")
-    if s is None:
-        return True
-    try:
-        return int(s) <= int(max_mb * 1_000_000)
-    except:
-        return True
+    return envion_http.fetch_metadata(identifier)
+
+# --- URL ---------------------------------------------------------------------
 
 def build_url(identifier, name):
-    return f"https://archive.org/download/{identifier}/{name}"
+    # già in forma canonica (envion_urls): stessa chiave della history
+    return archive_download_url(identifier, name)
 
 # --- Raccolta URL -------------------------------------------------------------
 
 def collect_urls(docs, count, exts, max_dur, max_mb,
-                 history_set, dedupe, debug):
+                 history_set, dedupe, debug, claim=None, gate=None, atoms=None, meta=None):
+    """
+    claim: callable opzionale url -> bool; se ritorna False l'URL è già stato
+    preso da un'altra ricetta dello stesso batch e viene saltato.
+    gate:  FingerprintGate opzionale; scarta i near-duplicate acustici.
+    atoms: AtomExtractor opzionale; i file più lunghi di max_dur diventano
+           clip locali (voce di lista = percorso della clip).
+    meta:  dict opzionale riempito con URL -> metadati del file (sidecar, envion_catalog).
+    """
     out, seen = [], set()
+    if atoms is not None:
+        # durata e dimensione non scartano più nulla: il fetch è limitato alla clip
+        flt = compile_filters(exts=exts)
+    else:
+        flt = compile_filters(exts=exts, max_dur=max_dur, max_size_mb=max_mb)
     for d in docs:
         ident = d.get("identifier")
         if not ident:
             continue
         try:
-            md = fetch_metadata(ident)
+            with trace.span("metadata"):
+                md = fetch_metadata(ident)
         except Exception as e:
             dbg(debug, f"metadata fail {ident}: {e}")
             continue
         files = md.get("files") or []
-        for f in files:
-            name = f.get("name")
-            if not name or not is_good_ext(name, exts):
-                continue
-            if not length_ok(f, max_dur):
+        rejected = {}
+        with trace.span("filter", files=len(files)):
+            accepted = flt.filter_files(files, rejected)
+        trace.rejects(rejected)
+        for f in accepted:
+            url = build_url(ident, f["name"])
+            if dedupe:
+                if url in seen or url in history_set:
+                    trace.rejects({"history": 1})
+                    continue
+            if claim is not None and not claim(url):
+                trace.rejects({"claimed": 1})
                 continue
-            if not size_ok(f, max_mb):
+            if gate is not None and not gate.admit(url, source=ident):
                 continue
-            url = build_url(ident, name)
-            if dedupe:
-                if url in seen or url.rstrip(";") in history_set:
+            entry = url
+            length = parse_length(f.get("length"))
+            if atoms is not None and (length is None or length > max_dur):
+                try:
+                    entry = atoms.extract(url, length) or url
+                except Exception as e:
+                    dbg(debug, f"atom fail {url}: {e}")
+                    trace.rejects({"atom": 1})
                     continue
-            out.append(url + ";")
+            out.append(entry + ";")
             seen.add(url)
+            if meta is not None:
+                meta[url] = envion_catalog.ia_file_meta(ident, f, md.get("metadata"))
             if len(out) >= count:
                 return out
     return out
 
 # --- Main ---------------------------------------------------------------------
 
-def main():
+def main(argv=None):
     ap = argparse.ArgumentParser(description="Fine-tuned Internet Archive search for Envion NET-AUDIO")
     ap.add_argument("--q", type=str, default="", help="termine da cercare")
     ap.add_argument("--rows", type=int, default=300)
@@ -239,6 +233,8 @@ def main():
     ap.add_argument("--basename", type=str, default="")
     ap.add_argument("--history", type=str, default="")
     ap.add_argument("--dedupe", action="store_true")
+    ap.add_argument("--direct-urls", action="store_true",
+                    help="nella lista URL diretti sul nodo di storage IA invece di /download")
     ap.add_argument("--debug", action="store_true")
     ap.add_argument("--scope", choices=["bbc", "sitewide"], default="sitewide")
     ap.add_argument("--exclude", type=str, default="",
@@ -248,14 +244,25 @@ def main():
     ap.add_argument("--include-subjects", type=str, default="",
                     help="subject richiesti (virgole)")
     ap.add_argument("--formats", type=str, default="wav,wave,aiff,aif,flac,mp3")
-    args = ap.parse_args()
+    ap.add_argument("--workdir", type=str, default="",
+                    help="cartella di lavoro (root di Envion); vuoto = cartella corrente")
+    envion_atoms.add_cli_args(ap)
+    envion_fingerprint.add_cli_args(ap)
+    envion_http.add_cli_args(ap)
+    trace.add_cli_args(ap)
+    args = ap.parse_args(argv)
+    trace.setup(args.trace, args.profile)
+    envion_http.setup_cache(args)
+
+    if args.workdir:
+        os.chdir(args.workdir)
 
     debug = args.debug
     ensure_dir(args.out_dir)
 
-
     exts = {x.strip().lower() for x in args.formats.split(",") if x.strip()}
-    history_set = read_history_set(args.history) if args.dedupe else set()
+    with trace.span("history_read"):
+        history_set = read_history_set(args.history) if args.dedupe else set()
     exclude_tokens = [t.strip() for t in args.exclude.split(",") if t.strip()]
     excl_cols = [c.strip() for c in args.exclude_collections.split(",") if c.strip()]
     incl_subj = [s.strip() for s in args.include_subjects.split(",") if s.strip()]
@@ -263,24 +270,30 @@ def main():
     dbg(debug, "exclude_collections:", excl_cols)
     dbg(debug, "include_subjects:", incl_subj)
 
-    docs = search_docs(
-        query_text=args.q,
-        rows=args.rows,
-        scope=args.scope,
-        debug=debug,
-        exclude_tokens=exclude_tokens,
-        exclude_collections=excl_cols,
-        include_subjects=incl_subj
-    )
+    with trace.span("search"):
+        docs = search_docs(
+            query_text=args.q,
+            rows=args.rows,
+            scope=args.scope,
+            debug=debug,
+            exclude_tokens=exclude_tokens,
+            exclude_collections=excl_cols,
+            include_subjects=incl_subj
+        )
 
     if not docs:
         print("[WARN] Nessun risultato dalla ricerca.", file=sys.stderr)
         sys.exit(1)
 
+    gate = envion_fingerprint.gate_from_args(args, verbose=debug)
+    atoms = envion_atoms.extractor_from_args(args, debug=debug)
+    meta = {}
     urls = collect_urls(
         docs, args.count, exts, args.max_dur, args.max_size_mb,
-        history_set, args.dedupe, debug
+        history_set, args.dedupe, debug, gate=gate, atoms=atoms, meta=meta
     )
+    # in history va la sorgente delle clip, non il percorso locale
+    sources = atoms.history_urls(urls) if atoms is not None else urls
 
     if not urls:
         print("[WARN] Nessun file compatibile trovato.", file=sys.stderr)
@@ -292,15 +305,23 @@ def main():
     else:
         out_path = next_progressive_filename(args.out_dir)
 
-    with open(out_path, "w", encoding="utf-8") as f:
-        for u in urls:
-            f.write(u + ("\n" if not u.endswith("\n") else ""))
+    # nella lista l'URL diretto sul nodo di storage (le clip locali restano come sono)
+    entries = envion_http.direct_entries(urls) if args.direct_urls else urls
+    with trace.span("write"):
+        with open(out_path, "w", encoding="utf-8") as f:
+            for u in entries:
+                f.write(u + ("\n" if not u.endswith("\n") else ""))
+        envion_catalog.write_sidecar(out_path, entries, meta, sources=sources, query=args.q,
+                                     script="internet_archive_fine_tuning")
 
     print(out_path)
 
     if args.dedupe and args.history:
-        append_history(args.history, urls)
+        with trace.span("history_write"):
+            append_history(args.history, sources)
         dbg(debug, f"history updated +{len(urls)}")
+    if gate is not None:
+        dbg(debug, f"fingerprint: +{gate.commit(sources)} in indice, {gate.rejected} scartati, {gate.failed} non decodificati")
 
 if __name__ == "__main__":
     main()
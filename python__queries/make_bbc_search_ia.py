@@ -1,11 +1,20 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import argparse, os, sys, time, re, json
-from urllib.parse import urlencode, quote
-import requests
+import argparse, os, sys, time, re, json, random
+from urllib.parse import urlencode
 from random import shuffle
 
+import envion_atoms
+import envion_bbcindex
+import envion_catalog
+import envion_fingerprint
+import envion_http
+import envion_sample
+import envion_trace as trace
+from envion_filters import compile_filters
+from envion_urls import append_history, archive_download_url, read_history_set
+
 IA_SEARCH = "https://archive.org/advancedsearch.php"
 IA_META   = "https://archive.org/metadata/"
 BBC_COLLECTIONS = {"BBCSoundEffectsComplete", "bbcsoundeffects"}
@@ -15,63 +24,58 @@ def dbg(flag, *msg):
     if flag:
         print("[DEBUG]", *msg, file=sys.stdout)
 
-def parse_len(value):
-    if value is None:
-        return None
-    try:
-        return int(float(value))
-    except Exception:
-        pass
-    m = re.match(r"^\s*(\d+):(\d{1,2})\s*$", str(value))
-    if m:
-        return int(m.group(1)) * 60 + int(m.group(2))
-    return None
-
-def load_history(path):
-    s = set()
-    if not path or not os.path.exists(path):
-        return s
-    with open(path, "r", encoding="utf-8", errors="ignore") as f:
-        for line in f:
-            u = line.strip().rstrip(";")
-            if u:
-                s.add(u)
-    return s
-
-def append_history(path, urls):
-    if not path:
-        return
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "a", encoding="utf-8") as f:
-        for u in urls:
-            f.write(u + ";\n")
-
-def valid_audio_file(fobj, max_dur):
-    name = fobj.get("name") or ""
-    ext = os.path.splitext(name.lower())[1]
-    if ext not in AUDIO_EXTS:
-        return False
-    if max_dur > 0:
-        dur = parse_len(fobj.get("length"))
-        if dur is not None and dur > max_dur:
-            return False
-    return True
-
-def files_from_identifier(identifier, max_dur, debug, name_contains=None):
-    url = IA_META + identifier
-    r = requests.get(url, timeout=30)
-    r.raise_for_status()
-    meta = r.json()
-    files = meta.get("files", []) or []
+def files_from_identifier(identifier, max_dur, debug, name_contains=None, meta=None, limit=None, skip=None):
+    # meta: dict opzionale riempito con URL -> metadati del file (sidecar, envion_catalog)
+    # limit: legge /metadata/<id>/files in streaming e si ferma al limit-esimo match
+    #        (BBCSoundEffectsComplete: decine di migliaia di file, non si carica tutto)
+    # skip: URL canonici già usati (history); in streaming non contano per limit
+    flt = compile_filters(exts=AUDIO_EXTS, max_dur=max_dur, name_contains=name_contains)
+    rejected = {}
+    if limit:
+        accepted, scanned = [], 0
+        files = envion_http.iter_files(identifier, timeout=30)
+        with trace.span("metadata", stream=True):
+            try:
+                for f in files:
+                    scanned += 1
+                    r = flt.file_reason(f)
+                    if r is None and skip and archive_download_url(identifier, f["name"]) in skip:
+                        r = "history"
+                    if r is not None:
+                        rejected[r] = rejected.get(r, 0) + 1
+                        continue
+                    accepted.append(f)
+                    if len(accepted) >= limit:
+                        break
+            finally:
+                files.close()   # chiude subito la connessione
+        dbg(debug, f"identifier={identifier}: {scanned} file letti in streaming, {len(accepted)} match")
+        item_meta = None
+        if meta is not None and accepted:
+            try:
+                item_meta = envion_http.fetch_item_metadata(identifier)
+            except Exception as e:
+                dbg(debug, f"item metadata failed for {identifier}: {e}")
+    else:
+        url = IA_META + identifier
+        with trace.span("metadata"):
+            r = envion_http.get(url, timeout=30)
+            r.raise_for_status()
+            meta_doc = r.json()
+        envion_http.remember_nodes(identifier, meta_doc)
+        files = meta_doc.get("files", []) or []
+        with trace.span("filter", files=len(files)):
+            accepted = flt.filter_files(files, rejected)
+        item_meta = meta_doc.get("metadata")
+    trace.rejects(rejected)
     out = []
-    for f in files:
-        name = f.get("name") or ""
-        if name_contains and name_contains.lower() not in name.lower():
-            continue
-        if not valid_audio_file(f, max_dur):
-            continue
-        encoded_name = quote(name, safe="/")  # <-- encode per PureData
-        out.append(f"https://archive.org/download/{identifier}/{encoded_name}")
+    for f in accepted:
+        # encode per PureData, già chiave canonica per la history
+        u = archive_download_url(identifier, f["name"])
+        out.append(u)
+        if meta is not None:
+            src = "bbc" if identifier in BBC_COLLECTIONS else "ia"
+            meta[u] = envion_catalog.ia_file_meta(identifier, f, item_meta, source=src)
     seen, uniq = set(), []
     for u in out:
         if u not in seen:
@@ -80,20 +84,16 @@ def files_from_identifier(identifier, max_dur, debug, name_contains=None):
     dbg(debug, f"identifier={identifier} -> {len(uniq)} candidates (filter='{name_contains}')")
     return uniq
 
-def search_bbc_docs(query_text, rows, debug):
+def bbc_search_params(query_text):
     query = f'(collection:({" OR ".join(BBC_COLLECTIONS)})) AND mediatype:audio AND text:{query_text}'
-    params = {
-        "q": query,
-        "rows": rows,
-        "page": 1,
-        "output": "json",
-        "fl[]": ["identifier", "title", "collection", "mediatype"]
-    }
+    return {"q": query, "fl[]": ["identifier", "title", "collection", "mediatype"]}
+
+def search_bbc_docs(query_text, rows, debug):
+    params = dict(bbc_search_params(query_text), rows=rows, page=1, output="json")
     url = IA_SEARCH + "?" + urlencode(params, doseq=True)
     dbg(debug, "search URL:", url)
-    r = requests.get(url, timeout=30)
-    r.raise_for_status()
-    data = r.json()
+    with trace.span("search"):
+        data = envion_http.cached_json(url, timeout=30)
     docs = (data.get("response") or {}).get("docs") or []
     dbg(debug, f"hits (bbc-only) = {len(docs)}")
     dbg(debug, "primi identifier:", [d.get("identifier") for d in docs[:10]])
@@ -110,23 +110,71 @@ def main():
     ap.add_argument("--history", default=None, help="history file (for dedupe)")
     ap.add_argument("--dedupe", action="store_true", help="skip URLs already in history")
     ap.add_argument("--no-fallback", action="store_true", help="do not fall back to non-BBC items")
+    ap.add_argument("--sample", action="store_true",
+                    help="uniform random sample of all matching items (numFound + random offsets) instead of --rows docs")
+    ap.add_argument("--seed", type=int, default=None, help="(--sample) random seed")
+    ap.add_argument("--fallback-limit", type=int, default=0,
+                    help="stop the BBCSoundEffectsComplete scan after N matches (default: 3 x --count)")
+    ap.add_argument("--scope", choices=["bbc", "bbc-local"], default="bbc",
+                    help="bbc = advancedsearch + metadata (default); bbc-local = local index, offline")
+    ap.add_argument("--index", default=envion_bbcindex.DEFAULT_DB,
+                    help=f"local BBC index for --scope bbc-local (default: {envion_bbcindex.DEFAULT_DB})")
+    ap.add_argument("--direct-urls", action="store_true",
+                    help="list entries point at the IA storage node (server/dir from /metadata) instead of /download")
     ap.add_argument("--debug", action="store_true", help="debug prints")
+    envion_atoms.add_cli_args(ap)
+    envion_fingerprint.add_cli_args(ap)
+    envion_http.add_cli_args(ap)
+    trace.add_cli_args(ap)
     args = ap.parse_args()
+    trace.setup(args.trace, args.profile)
+    envion_http.setup_cache(args)
 
     os.makedirs(args.out_dir, exist_ok=True)
-
-    # 1) query “docs”
-    try:
-        docs = search_bbc_docs(args.q, args.rows, args.debug)
-    except Exception as e:
-        print(f"[ERROR] search request failed: {e}", file=sys.stderr)
-        docs = []
+    atoms = envion_atoms.extractor_from_args(args, debug=args.debug)
+    # con --atoms i file lunghi restano candidati: se ne estrae una clip
+    max_dur = 0 if atoms is not None else args.max_dur
 
     candidates = []
+    meta = {}
+    docs = []
+
+    if args.scope == "bbc-local":
+        # indice locale (envion_bbcindex): niente advancedsearch né /metadata
+        con = envion_bbcindex.open_for_query(args.index)
+        if con is None:
+            print(f"[ERROR] local BBC index missing or empty: {args.index} "
+                  f"(build it with: python3 envion_bbcindex.py --db {args.index} harvest)", file=sys.stderr)
+            sys.exit(2)
+        try:
+            with trace.span("search", scope="bbc-local"):
+                rows = envion_bbcindex.query(con, args.q, max_dur=max_dur, exts=AUDIO_EXTS, random=True)
+        finally:
+            con.close()
+        dbg(args.debug, f"hits (bbc-local) = {len(rows)}")
+        for r in rows:
+            candidates.append(r["url"])
+            meta[r["url"]] = envion_bbcindex.sidecar_meta(r)
+    elif args.sample:
+        # 1) doc in ordine casuale uniforme, letti uno alla volta (envion_sample)
+        params = bbc_search_params(args.q)
+        try:
+            total = envion_sample.num_found(params)
+            dbg(args.debug, f"numFound (bbc) = {total}")
+            docs = envion_sample.iter_random_docs(params, random.Random(args.seed), total=total)
+        except Exception as e:
+            print(f"[ERROR] search request failed: {e}", file=sys.stderr)
+    else:
+        # 1) query “docs”
+        try:
+            docs = search_bbc_docs(args.q, args.rows, args.debug)
+        except Exception as e:
+            print(f"[ERROR] search request failed: {e}", file=sys.stderr)
 
     # 2) tenta dai docs
     if docs:
-        shuffle(docs)
+        if isinstance(docs, list):
+            shuffle(docs)
         for d in docs:
             raw_colls = d.get("collection")
             if isinstance(raw_colls, list):
@@ -135,28 +183,34 @@ def main():
                 colls = {raw_colls}
             else:
                 colls = set()
-            if args.no-fallback and not (colls & BBC_COLLECTIONS):
+            if args.no_fallback and not (colls & BBC_COLLECTIONS):
                 continue
             ident = d.get("identifier")
             if not ident:
                 continue
             try:
-                urls = files_from_identifier(ident, args.max_dur, args.debug)
+                urls = files_from_identifier(ident, max_dur, args.debug, meta=meta)
                 candidates.extend(urls)
             except Exception as e:
                 dbg(args.debug, f"metadata fetch failed for {ident}: {e}")
             if len(candidates) >= args.count * 3:
                 break
 
+    with trace.span("history_read"):
+        history = read_history_set(args.history) if args.dedupe else set()
+
     # 3) fallback diretto nella collezione BBC
-    if not candidates:
+    if not candidates and args.scope == "bbc":
         dbg(args.debug, "fallback: scan files of BBCSoundEffectsComplete by filename match")
         try:
             from_bbc_root = files_from_identifier(
                 "BBCSoundEffectsComplete",
-                args.max_dur,
+                max_dur,
                 args.debug,
-                name_contains=args.q
+                name_contains=args.q,
+                meta=meta,
+                limit=args.fallback_limit or args.count * 3,
+                skip=history,
             )
             shuffle(from_bbc_root)
             candidates.extend(from_bbc_root)
@@ -164,12 +218,23 @@ def main():
             dbg(args.debug, f"fallback scan failed: {e}")
 
     # 4) dedupe + limit
-    history = load_history(args.history) if args.dedupe else set()
+    gate = envion_fingerprint.gate_from_args(args, verbose=args.debug)
     final = []
     for u in candidates:
         if args.dedupe and u in history:
             dbg(args.debug, "skip (history):", u)
+            trace.rejects({"history": 1})
             continue
+        if gate is not None and not gate.admit(u):
+            dbg(args.debug, "skip (fingerprint):", u)
+            continue
+        if atoms is not None:
+            try:
+                u = atoms.extract(u, length=(meta.get(u) or {}).get("length")) or u
+            except Exception as e:
+                dbg(args.debug, f"atom fail {u}: {e}")
+                trace.rejects({"atom": 1})
+                continue
         final.append(u)
         if len(final) >= args.count:
             break
@@ -178,15 +243,26 @@ def main():
         print("[WARN] No candidates found with current filters.", file=sys.stderr)
         sys.exit(1)
 
-    base = args.basename or f"bbc_{re.sub(r'\\W+', '_', args.q.strip())}"
+    slug = re.sub(r"\W+", "_", args.q.strip())
+    base = args.basename or f"bbc_{slug}"
     stamp = time.strftime("%Y%m%d_%H%M%S")
     out_path = os.path.join(args.out_dir, f"{base}_{stamp}.txt")
 
-    with open(out_path, "w", encoding="utf-8") as f:
-        for u in final:
-            f.write(u + ";\n")
-
-    append_history(args.history, final)
+    # in history va la sorgente delle clip, non il percorso locale
+    sources = atoms.history_urls(final) if atoms is not None else final
+    # nella lista l'URL diretto sul nodo di storage; il fallback in streaming e bbc-local
+    # non leggono server/dir dell'item: quelle voci restano su /download
+    entries = envion_http.direct_entries(final) if args.direct_urls else final
+    with trace.span("write"):
+        with open(out_path, "w", encoding="utf-8") as f:
+            for u in entries:
+                f.write(u + ";\n")
+        envion_catalog.write_sidecar(out_path, entries, meta, sources=sources, query=args.q,
+                                     script="make_bbc_search_ia")
+    with trace.span("history_write"):
+        append_history(args.history, sources)
+    if gate is not None:
+        gate.commit(sources)
 
     print(f"[OK] wrote {len(final)} URLs → {out_path}")
     for u in final:
@@ -7,12 +7,19 @@ Genera una lista di URL "raw" (con punto e virgola finale) da Internet Archive
 per Envion NET-AUDIO.
 
 Caratteristiche:
-- Ricerca su IA via advancedsearch (collections BBC o sitewide)
+- Ricerca su IA via advancedsearch (collections BBC o sitewide), oppure
+  offline sull'indice locale delle collezioni BBC (--scope bbc-local,
+  envion_bbcindex.py harvest per crearlo)
 - Per ogni item: /metadata/<identifier> per estrarre i file reali
 - Filtri per formato e durata (se disponibile)
-- Dedupe via history file + dedupe in memoria
-- Output: file con nome progressivo envion_random_raw_XXX.txt in --out-dir
+- Dedupe via history file + dedupe in memoria (chiavi URL canoniche, envion_urls)
+- Dedupe acustica opzionale (--fingerprint): near-duplicate di file già in history
+- Output: file con nome progressivo envion_random_raw_XXX.txt in --out-dir,
+  più il sidecar .jsonl con i metadati dei file (envion_catalog)
 - Ogni URL termina con ';' come richiesto
+- Strumentazione opzionale (--trace FILE, --profile): tempi per stadio e per host
+- Checkpoint: pagine di ricerca, identifier fatti e candidati vanno in un journal
+  sotto netsound/.checkpoints/; con --resume una run interrotta riparte da lì
 
 Uso tipico (solo BBC):
   python3 make_bbc_search_ia.py \
@@ -37,18 +44,31 @@ Uso sitewide (tutto IA):
     --dedupe \
     --debug \
     --scope sitewide
+
+Campione casuale (ogni run item diversi, non i più scaricati):
+  python3 make_internetarchive_search.py --q "wind" --scope sitewide --sample \
+    --count 8 --out-dir "netsound" --history "netsound/netsound_history.txt" --dedupe
 """
 
 import argparse
 import json
 import os
+import random
 import re
 import sys
 import time
 from datetime import datetime
 from urllib.parse import urlencode
 
-import requests
+import envion_bbcindex
+import envion_catalog
+import envion_fingerprint
+import envion_http
+import envion_sample
+import envion_trace as trace
+from envion_checkpoint import CheckpointError, FetchJournal, checkpoint_path
+from envion_filters import compile_filters
+from envion_urls import append_history, archive_download_url, canonical_url, read_history_set
 
 # --- Costanti e default -------------------------------------------------------
 
@@ -75,29 +95,6 @@ def ensure_dir(path):
         return
     os.makedirs(path, exist_ok=True)
 
-def read_history_set(history_path):
-    s = set()
-    if not history_path:
-        return s
-    if os.path.isfile(history_path):
-        try:
-            with open(history_path, "r", encoding="utf-8", errors="ignore") as f:
-                for line in f:
-                    url = line.strip().rstrip(";")
-                    if url:
-                        s.add(url)
-        except Exception:
-            pass
-    return s
-
-def append_history(history_path, urls):
-    if not history_path or not urls:
-        return
-    ensure_dir(os.path.dirname(history_path))
-    with open(history_path, "a", encoding="utf-8") as f:
-        for u in urls:
-            f.write(u.rstrip(";") + ";\n")
-
 def next_progressive_filename(out_dir, prefix="envion_random_raw_", ext=".txt"):
     """
     Trova il prossimo nome progressivo envion_random_raw_XXX.txt
@@ -117,14 +114,11 @@ def next_progressive_filename(out_dir, prefix="envion_random_raw_", ext=".txt"):
                 pass
     return os.path.join(out_dir, f"{prefix}{max_n+1:03d}{ext}")
 
-def safe_get(url, timeout=30):
-    return requests.get(url, timeout=timeout)
-
 # --- Query IA -----------------------------------------------------------------
 
-def search_docs(query_text, rows, scope, debug, no_fallback=False, exclude_tokens=None):
+def search_params(query_text, scope, exclude_tokens=None):
     """
-    Ritorna il vettore 'docs' da IA advancedsearch in base allo scope.
+    Parametri advancedsearch (q, fl[], sort[]) in base allo scope, senza rows/page.
 
     scope:
       - "bbc": limita a collezioni BBCSoundEffectsComplete / bbcsoundeffects
@@ -156,26 +150,24 @@ def search_docs(query_text, rows, scope, debug, no_fallback=False, exclude_token
                 # escludiamo match basilari su title
                 q_parts.append(f'NOT title:"{tok}"')
 
-    query = " AND ".join(q_parts)
-
-    params = {
-        "q": query,
-        "rows": rows,
-        "page": 1,
-        "output": "json",
-    }
+    params = {"q": " AND ".join(q_parts)}
     for f in fl_fields:
         params.setdefault("fl[]", []).append(f)
     if sort:
         for s in sort:
             params.setdefault("sort[]", []).append(s)
+    return params
+
+def search_docs(query_text, rows, scope, debug, no_fallback=False, exclude_tokens=None, page=1):
+    """Ritorna il vettore 'docs' da IA advancedsearch (una pagina) in base allo scope."""
+    params = search_params(query_text, scope, exclude_tokens)
+    params.update({"rows": rows, "page": page, "output": "json"})
 
     url = IA_SEARCH + "?" + urlencode(params, doseq=True)
     dbg(debug, "search URL:", url)
 
-    r = safe_get(url)
-    r.raise_for_status()
-    data = r.json()
+    # con --http-cache stessa query = stesso URL: dalla cache su disco, al più un 304
+    data = envion_http.cached_json(url)
     docs = (data.get("response") or {}).get("docs") or []
     dbg(debug, f"hits ({scope}) = {len(docs)}")
     if docs:
@@ -183,115 +175,162 @@ def search_docs(query_text, rows, scope, debug, no_fallback=False, exclude_token
     return docs
 
 def fetch_metadata(identifier, debug=False):
-    url = f"{IA_META}/{identifier}"
-    r = safe_get(url)
-    r.raise_for_status()
-    data = r.json()
-    return data
+    # cache condivisa; tiene anche i nodi di storage dell'item (--direct-urls)
+    return envion_http.fetch_metadata(identifier)
 
 def files_from_metadata(md):
     """Ritorna lista di dict file da md['files'] (o [])"""
     return md.get("files") or []
 
-# --- Filtri file --------------------------------------------------------------
-
-def is_good_ext(name, wanted_exts):
-    if not name or "." not in name:
-        return False
-    ext = name.rsplit(".", 1)[-1].lower()
-    return ext in wanted_exts
-
-def length_ok(fobj, max_dur):
-    """
-    max_dur <= 0: nessun limite
-    se disponibile, usa 'length' (in secondi) nel file object; se assente, passa.
-    """
-    if max_dur is None or max_dur <= 0:
-        return True
-    length = fobj.get("length")
-    if length is None:
-        # spesso mancante: se non c'è, non blocchiamo
-        return True
-    try:
-        return float(length) <= float(max_dur)
-    except Exception:
-        return True
+# --- URL ---------------------------------------------------------------------
 
 def build_download_url(identifier, name):
-    return f"https://archive.org/download/{identifier}/{name}"
+    # già in forma canonica (envion_urls): stessa chiave della history
+    return archive_download_url(identifier, name)
 
 # --- Selezione file -----------------------------------------------------------
 
-def collect_urls_from_docs(docs, count, wanted_exts, max_dur, history_set, dedupe, debug):
+def collect_urls_from_docs(docs, count, wanted_exts, max_dur, history_set, dedupe, debug, journal=None, gate=None,
+                           meta=None):
     """
     Scorre i docs, legge /metadata, filtra i file e restituisce fino a 'count' URL unici.
     Aggiunge ';' alla fine di ciascun URL.
+
+    journal: FetchJournal opzionale; gli identifier già registrati non vengono
+    richiesti di nuovo, i nuovi vengono registrati con i loro candidati.
+    gate: FingerprintGate opzionale; scarta i near-duplicate acustici.
+    meta: dict opzionale riempito con URL -> metadati del file (sidecar); per gli
+    identifier ripresi dal journal si conoscono solo identifier e nome.
     """
     out = []
     seen = set()
+    # filtri compilati una volta (envion_filters): 'length' assente = passa
+    flt = compile_filters(exts=wanted_exts, max_dur=max_dur or 0)
 
     for doc in docs:
         ident = doc.get("identifier")
         if not ident:
             continue
-        try:
-            md = fetch_metadata(ident, debug=debug)
-        except Exception as e:
-            dbg(debug, f"metadata error for {ident}: {e}")
-            continue
-
-        files = files_from_metadata(md)
-        if not files:
-            continue
-
-        for f in files:
-            name = f.get("name")
-            if not name:
-                continue
-            if not is_good_ext(name, wanted_exts):
-                continue
-            if not length_ok(f, max_dur):
+        files_by_url = {}
+        if journal is not None and journal.is_done(ident):
+            candidates = journal.item_urls(ident)
+        else:
+            try:
+                with trace.span("metadata"):
+                    md = fetch_metadata(ident, debug=debug)
+            except Exception as e:
+                dbg(debug, f"metadata error for {ident}: {e}")
                 continue
-
-            url = build_download_url(ident, name)
-
+            files = files_from_metadata(md)
+            rejected = {}
+            with trace.span("filter", files=len(files)):
+                accepted = flt.filter_files(files, rejected)
+            trace.rejects(rejected)
+            if meta is not None:
+                item_meta = md.get("metadata")
+                files_by_url = {build_download_url(ident, f["name"]): envion_catalog.ia_file_meta(ident, f, item_meta)
+                                for f in accepted}
+            candidates = [build_download_url(ident, f["name"]) for f in accepted]
+            if journal is not None:
+                journal.record_item(ident, candidates)
+
+        for url in candidates:
+            # i candidati di un checkpoint vecchio possono non essere canonici
+            url = canonical_url(url)
             # dedupe: history + turno corrente
             if dedupe:
                 if url in seen:
                     continue
-                if url.rstrip(";") in history_set:
+                if url in history_set:
                     dbg(debug, "skip (history):", url)
+                    trace.rejects({"history": 1})
                     continue
+            if gate is not None and not gate.admit(url, source=ident):
+                dbg(debug, "skip (fingerprint):", url)
+                continue
 
             out.append(url + ";")
             seen.add(url)
+            if meta is not None:
+                meta[url] = files_by_url.get(url) or {"source": "ia", "identifier": ident}
 
             if len(out) >= count:
                 return out
 
     return out
 
+def collect_urls_from_index(con, query_text, count, wanted_exts, max_dur, history_set, dedupe, debug,
+                            gate=None, meta=None):
+    """
+    Come collect_urls_from_docs, ma dall'indice locale BBC (envion_bbcindex):
+    nessuna richiesta di rete, ordine casuale come lo shuffle dei docs.
+    """
+    with trace.span("search", scope="bbc-local"):
+        rows = envion_bbcindex.query(con, query_text, max_dur=max_dur, exts=wanted_exts, random=True)
+    dbg(debug, f"hits (bbc-local) = {len(rows)}")
+    out, seen = [], set()
+    for r in rows:
+        url = r["url"]
+        if dedupe:
+            if url in seen:
+                continue
+            if url in history_set:
+                dbg(debug, "skip (history):", url)
+                trace.rejects({"history": 1})
+                continue
+        if gate is not None and not gate.admit(url, source=r["identifier"]):
+            dbg(debug, "skip (fingerprint):", url)
+            continue
+        out.append(url + ";")
+        seen.add(url)
+        if meta is not None:
+            meta[url] = envion_bbcindex.sidecar_meta(r)
+        if len(out) >= count:
+            break
+    return out
+
 # --- Main ---------------------------------------------------------------------
 
-def main():
+def main(argv=None):
     ap = argparse.ArgumentParser(description="Generate raw URL lists from Internet Archive (BBC or sitewide) for Envion NET-AUDIO.")
     ap.add_argument("--q", type=str, default="", help="testo da cercare (es. wind, drums, wood)")
     ap.add_argument("--rows", type=int, default=300, help="righe per advancedsearch (default 300)")
+    ap.add_argument("--pages", type=int, default=1, help="pagine di advancedsearch da scorrere (default 1)")
     ap.add_argument("--count", type=int, default=8, help="quanti URL finali generare (default 8)")
     ap.add_argument("--max-dur", type=float, default=0.0, help="durata massima (sec); 0 = nessun limite")
     ap.add_argument("--out-dir", type=str, required=True, help="cartella di output per il file lista")
     ap.add_argument("--basename", type=str, default="", help="basename opzionale per il file (senza numero). Se vuoto usa envion_random_raw_XXX.txt")
     ap.add_argument("--history", type=str, default="", help="file di history per dedupe")
     ap.add_argument("--dedupe", action="store_true", help="evita URL già presenti in history e duplicati nel run")
+    ap.add_argument("--direct-urls", action="store_true",
+                    help="nella lista URL diretti sul nodo di storage IA (server/dir da /metadata) invece di /download")
     ap.add_argument("--debug", action="store_true", help="stampa log di debug")
     ap.add_argument("--no-fallback", action="store_true", help="(compat) non allargare ad altre collezioni quando in scope bbc")
-    ap.add_argument("--scope", choices=["bbc", "sitewide"], default="bbc",
-                    help="bbc = solo collezioni BBC (default); sitewide = tutto IA (audio)")
+    ap.add_argument("--scope", choices=["bbc", "bbc-local", "sitewide"], default="bbc",
+                    help="bbc = solo collezioni BBC (default); bbc-local = indice BBC locale, offline; "
+                         "sitewide = tutto IA (audio)")
+    ap.add_argument("--index", type=str, default=envion_bbcindex.DEFAULT_DB,
+                    help=f"(bbc-local) indice locale (default: {envion_bbcindex.DEFAULT_DB})")
     ap.add_argument("--exclude", type=str, default="",
                     help='(sitewide) parole da escludere dal titolo, separate da virgola, es: "podcast,sermon,radio"')
     ap.add_argument("--formats", type=str, default="wav,wave,aiff,aif,flac,mp3",
                     help="estensioni accettate separate da virgola")
-    args = ap.parse_args()
+    ap.add_argument("--sample", action="store_true",
+                    help="campione casuale uniforme dei risultati (numFound + offset casuali) invece delle prime pagine")
+    ap.add_argument("--sample-window", type=int, default=envion_sample.MAX_WINDOW,
+                    help=f"(--sample) righe raggiungibili da advancedsearch (default: {envion_sample.MAX_WINDOW})")
+    ap.add_argument("--seed", type=int, default=None, help="(--sample) seed del campione (default: casuale)")
+    ap.add_argument("--resume", action="store_true",
+                    help="riprende una run interrotta dal suo checkpoint (stessi parametri)")
+    ap.add_argument("--checkpoint", type=str, default="",
+                    help="file di checkpoint (default: netsound/.checkpoints/<hash parametri>.jsonl)")
+    ap.add_argument("--no-checkpoint", action="store_true", help="non scrivere il journal di avanzamento")
+    envion_fingerprint.add_cli_args(ap)
+    envion_http.add_cli_args(ap)
+    trace.add_cli_args(ap)
+    args = ap.parse_args(argv)
+    trace.setup(args.trace, args.profile)
+    envion_http.setup_cache(args)
 
     debug = args.debug
 
@@ -302,7 +341,8 @@ def main():
         wanted_exts = set(DEFAULT_EXTS)
 
     # history per dedupe
-    history_set = read_history_set(args.history) if args.dedupe else set()
+    with trace.span("history_read"):
+        history_set = read_history_set(args.history) if args.dedupe else set()
     dbg(debug, "dedupe=", args.dedupe, "history_count=", len(history_set))
 
     # exclude tokens
@@ -311,27 +351,98 @@ def main():
         exclude_tokens = [t.strip() for t in args.exclude.split(",") if t.strip()]
         dbg(debug, "exclude tokens:", exclude_tokens)
 
-    # 1) advancedsearch
-    try:
-        docs = search_docs(
-            query_text=args.q,
-            rows=args.rows,
-            scope=args.scope,
-            debug=debug,
-            no_fallback=args.no_fallback,
-            exclude_tokens=exclude_tokens
-        )
-    except Exception as e:
-        print(f"[ERROR] search failed: {e}", file=sys.stderr)
-        sys.exit(2)
+    gate = envion_fingerprint.gate_from_args(args, verbose=debug)
+    meta = {}
+
+    if args.scope == "bbc-local":
+        # tutto offline: niente advancedsearch, /metadata né checkpoint
+        con = envion_bbcindex.open_for_query(args.index)
+        if con is None:
+            print(f"[ERROR] indice BBC assente o vuoto: {args.index} "
+                  f"(crealo con: python3 envion_bbcindex.py --db {args.index} harvest)", file=sys.stderr)
+            sys.exit(2)
+        try:
+            urls = collect_urls_from_index(con, args.q, args.count, wanted_exts, args.max_dur,
+                                           history_set, args.dedupe, debug, gate=gate, meta=meta)
+        finally:
+            con.close()
+        finish_run(args, urls, meta, gate, None)
+        return
+
+    if args.sample:
+        # item in ordine casuale, letti uno alla volta: ci si ferma a --count URL
+        params = search_params(args.q, args.scope, exclude_tokens)
+        try:
+            with trace.span("search", sample=True):
+                total = envion_sample.num_found(params)
+        except Exception as e:
+            print(f"[ERROR] search failed: {e}", file=sys.stderr)
+            sys.exit(2)
+        dbg(debug, f"numFound ({args.scope}) = {total}, window = {args.sample_window}")
+        if not total:
+            print("[WARN] Nessun risultato dalla ricerca.", file=sys.stderr)
+            sys.exit(1)
+        docs = envion_sample.iter_random_docs(params, random.Random(args.seed), args.sample_window, total=total)
+        urls = collect_urls_from_docs(docs=docs, count=args.count, wanted_exts=wanted_exts, max_dur=args.max_dur,
+                                      history_set=history_set, dedupe=args.dedupe, debug=debug,
+                                      gate=gate, meta=meta)
+        finish_run(args, urls, meta, gate, None)
+        return
+
+    # 0) checkpoint (journal di avanzamento)
+    journal = None
+    if not args.no_checkpoint:
+        params = {
+            "script": "make_internetarchive_search", "q": args.q, "rows": args.rows,
+            "pages": args.pages, "scope": args.scope, "exclude": exclude_tokens,
+            "formats": sorted(wanted_exts), "max_dur": args.max_dur,
+        }
+        ckpt = args.checkpoint or checkpoint_path("make_internetarchive_search", params)
+        try:
+            journal = FetchJournal(ckpt, params, resume=args.resume)
+        except CheckpointError as e:
+            print(f"[ERROR] {e}", file=sys.stderr)
+            sys.exit(2)
+        dbg(debug, f"checkpoint: {ckpt} (pagine fatte={len(journal.pages)}, item fatti={len(journal.items)})")
+
+    # 1) advancedsearch (pagina per pagina: il cursore va nel journal)
+    docs = []
+    for page in range(1, max(1, args.pages) + 1):
+        if journal is not None and journal.has_page(page):
+            docs.extend({"identifier": i} for i in journal.page_ids(page))
+            continue
+        try:
+            with trace.span("search", page=page):
+                page_docs = search_docs(
+                    query_text=args.q,
+                    rows=args.rows,
+                    scope=args.scope,
+                    debug=debug,
+                    no_fallback=args.no_fallback,
+                    exclude_tokens=exclude_tokens,
+                    page=page
+                )
+        except Exception as e:
+            print(f"[ERROR] search failed: {e}", file=sys.stderr)
+            if journal is not None:
+                journal.close()   # resta su disco per --resume
+                print(f"[INFO] riprendi con --resume (checkpoint: {journal.path})", file=sys.stderr)
+            sys.exit(2)
+        if journal is not None:
+            journal.record_page(page, [d["identifier"] for d in page_docs if d.get("identifier")])
+        docs.extend(page_docs)
+        if len(page_docs) < args.rows:
+            break
 
     if not docs:
         print("[WARN] Nessun risultato dalla ricerca.", file=sys.stderr)
         # usciamo generando file vuoto per coerenza?
-        # meglio uscire con codice 1
+        # meglio uscire con codice 1 (run conclusa: il checkpoint non serve più)
+        if journal is not None:
+            journal.close(remove=True)
         sys.exit(1)
 
-    # 2) metadata -> filtra -> raccogli URL
+    # 2) metadata -> filtra -> (fingerprint) -> raccogli URL
     urls = collect_urls_from_docs(
         docs=docs,
         count=args.count,
@@ -339,11 +450,21 @@ def main():
         max_dur=args.max_dur,
         history_set=history_set,
         dedupe=args.dedupe,
-        debug=debug
+        debug=debug,
+        journal=journal,
+        gate=gate,
+        meta=meta
     )
 
+    finish_run(args, urls, meta, gate, journal)
+
+def finish_run(args, urls, meta, gate, journal):
+    """Scrive lista + sidecar, aggiorna history e fingerprint, chiude il checkpoint."""
+    debug = args.debug
     if not urls:
         print("[WARN] Nessun file compatibile trovato (formato/durata/dedupe).", file=sys.stderr)
+        if journal is not None:
+            journal.close(remove=True)
         sys.exit(1)
 
     # 3) output file
@@ -354,16 +475,28 @@ def main():
     else:
         out_path = next_progressive_filename(args.out_dir, prefix="envion_random_raw_", ext=".txt")
 
-    with open(out_path, "w", encoding="utf-8") as f:
-        for u in urls:
-            f.write(u + ("\n" if not u.endswith("\n") else ""))
+    # nella lista l'URL diretto sul nodo di storage; sidecar, history e indice restano canonici
+    entries = envion_http.direct_entries(urls) if args.direct_urls else urls
+    with trace.span("write"):
+        with open(out_path, "w", encoding="utf-8") as f:
+            for u in entries:
+                f.write(u + ("\n" if not u.endswith("\n") else ""))
+        envion_catalog.write_sidecar(out_path, entries, meta, sources=urls, query=args.q,
+                                     script="make_internetarchive_search")
 
     print(out_path)
 
     # 4) aggiorna history
     if args.dedupe and args.history:
-        append_history(args.history, urls)
+        with trace.span("history_write"):
+            append_history(args.history, urls)
         dbg(debug, f"history updated: +{len(urls)}")
+    if gate is not None:
+        dbg(debug, f"fingerprint: +{gate.commit(urls)} in indice, {gate.rejected} scartati, {gate.failed} non decodificati")
+
+    # run completata: il checkpoint non serve più
+    if journal is not None:
+        journal.close(remove=True)
 
 if __name__ == "__main__":
     main()
@@ -6,9 +6,11 @@ make_raw_list.py
 Genera una lista di URL (una per riga, con ';' finale) pescandole da una URL remota (es. freesound_get.php?mode=raw).
 Supporta:
 - --history: file di storico persistente (append) per deduplica
-- --dedupe: salta URL già viste nello storico
+- --dedupe: salta URL già viste nello storico (chiavi canoniche, envion_urls)
+- --fingerprint: salta anche i near-duplicate acustici (envion_fingerprint)
 - --insecure: disabilita la verifica SSL (workaround per macOS vecchi)
 - auto-increment del file di output: envion_random_raw_001.txt, _002, ...
+  (+ sidecar .jsonl per il catalogo, envion_catalog)
 - usa 'certifi' se disponibile per risolvere CERTIFICATE_VERIFY_FAILED su sistemi vecchi
 """
 
@@ -20,6 +22,10 @@ import time
 import ssl
 from urllib import request, error
 
+import envion_catalog
+import envion_fingerprint
+from envion_urls import canonical_url, read_history_set
+
 MP3_URL_RE = re.compile(r"https?://[^\s\"'<>]+?\.mp3", re.IGNORECASE)
 
 def norm(u: str) -> str:
@@ -87,7 +93,7 @@ def extract_raw_url(source_url: str, ctx: ssl.SSLContext):
         return norm(m.group(0))
     return None
 
-def main():
+def main(argv=None):
     ap = argparse.ArgumentParser(description="Genera liste di URL MP3 casuali (una per riga, con ';').")
     ap.add_argument("--url", required=True, help="Endpoint remoto che restituisce una URL .mp3 (es. freesound_get.php?mode=raw).")
     ap.add_argument("--count", type=int, default=8, help="Quante URL raccogliere per la lista (default: 8).")
@@ -98,7 +104,8 @@ def main():
     ap.add_argument("--insecure", action="store_true", help="Disabilita la verifica SSL (solo se necessario).")
     ap.add_argument("--max-multiplier", type=int, default=50, help="Tentativi max = count * max-multiplier (default: 50).")
     ap.add_argument("--sleep", type=float, default=0.2, help="Pausa fra tentativi in secondi (default: 0.2).")
-    args = ap.parse_args()
+    envion_fingerprint.add_cli_args(ap)
+    args = ap.parse_args(argv)
 
     out_dir = pathlib.Path(args.out_dir).expanduser().resolve()
     out_dir.mkdir(parents=True, exist_ok=True)
@@ -110,16 +117,13 @@ def main():
         hist_path = pathlib.Path(args.history).expanduser().resolve()
         if hist_path.exists():
             try:
-                with open(hist_path, "r", encoding="utf-8") as hf:
-                    for line in hf:
-                        s = norm(line)
-                        if s:
-                            seen.add(s)
+                seen = read_history_set(str(hist_path))
             except Exception as e:
                 print(f"[WARN] Impossibile leggere history: {e}", file=sys.stderr)
         else:
             hist_path.parent.mkdir(parents=True, exist_ok=True)
 
+    gate = envion_fingerprint.gate_from_args(args, verbose=True)
     urls = []
     attempts = 0
     max_attempts = max(args.count, 1) * max(args.max_multiplier, 1)
@@ -134,10 +138,15 @@ def main():
             continue
 
         u_clean = norm(u)
-        if args.dedupe and u_clean in seen:
+        key = canonical_url(u_clean)
+        if args.dedupe and key in seen:
             print(f"[SKIP {attempts}] duplicate")
             time.sleep(args.sleep)
             continue
+        if gate is not None and not gate.admit(u_clean):
+            print(f"[SKIP {attempts}] near-duplicate (fingerprint)")
+            time.sleep(args.sleep)
+            continue
 
         urls.append(u_clean + ";")
         print(f"[OK {len(urls)}/{args.count}] {u_clean}")
@@ -145,8 +154,8 @@ def main():
         if args.history:
             try:
                 with open(pathlib.Path(args.history).expanduser().resolve(), "a", encoding="utf-8") as hf:
-                    hf.write(u_clean + ";\n")
-                seen.add(u_clean)
+                    hf.write(key + ";\n")
+                seen.add(key)
             except Exception as e:
                 print(f"[WARN] Impossibile scrivere history: {e}", file=sys.stderr)
 
@@ -161,9 +170,12 @@ def main():
             for line in urls:
                 f.write(line + ("\n" if not line.endswith("\n") else ""))
         print(f"[WRITE] {out_path} ({len(urls)} righe)")
+        envion_catalog.write_sidecar(str(out_path), urls, query=args.url, script="make_raw_list")
     except Exception as e:
         print(f"[ERROR] Scrittura output fallita: {e}", file=sys.stderr)
         sys.exit(1)
+    if gate is not None:
+        print(f"[FP] +{gate.commit()} fingerprint in indice ({gate.rejected} near-duplicate, {gate.failed} non decodificati)")
 
     print("[DONE]")
 
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+migrate_history.py
+Migrazione una tantum delle history NET-AUDIO alle chiavi URL canoniche.
+
+Fonde netsound_history.txt, netsound_history_lowercase.txt e la history
+wiki in un'unica history canonica (vedi envion_urls.canonical_url):
+lo stesso file scritto in forme diverse (spazi crudi, %20, http/https,
+nodi di storage IA) diventa una riga sola. L'ordine è quello della prima
+apparizione. L'output originale viene salvato in .bak prima di riscriverlo.
+
+Uso:
+  python3 migrate_history.py                      # default di Envion
+  python3 migrate_history.py --dry-run
+  python3 migrate_history.py --out netsound/netsound_history.txt \\
+    netsound/netsound_history.txt netsound/netsound_history_lowercase.txt
+  python3 migrate_history.py --remove-merged      # le sorgenti fuse vanno in .bak
+"""
+
+import argparse
+import os
+import shutil
+import sys
+
+from envion_urls import canonical_url
+
+DEFAULT_OUT = "netsound/netsound_history.txt"
+DEFAULT_SOURCES = [
+    "netsound/netsound_history.txt",
+    "netsound/netsound_history_lowercase.txt",
+    "netsound/wiki/netsound_history.txt",
+]
+
+def merge(sources):
+    """Ritorna (chiavi canoniche in ordine, righe lette per sorgente)."""
+    keys, seen, counts = [], set(), {}
+    for src in sources:
+        n = 0
+        with open(src, "r", encoding="utf-8", errors="ignore") as f:
+            for line in f:
+                key = canonical_url(line)
+                if not key:
+                    continue
+                n += 1
+                if key not in seen:
+                    seen.add(key)
+                    keys.append(key)
+        counts[src] = n
+    return keys, counts
+
+def backup(path):
+    bak = path + ".bak"
+    shutil.copy2(path, bak)
+    return bak
+
+def main():
+    ap = argparse.ArgumentParser(description="Merge Envion history files into canonical URL keys.")
+    ap.add_argument("sources", nargs="*", default=DEFAULT_SOURCES,
+                    help="history da fondere (default: IA, lowercase, wiki)")
+    ap.add_argument("--out", default=DEFAULT_OUT, help=f"history canonica risultante (default: {DEFAULT_OUT})")
+    ap.add_argument("--remove-merged", action="store_true",
+                    help="sposta in .bak le sorgenti diverse da --out dopo la fusione")
+    ap.add_argument("--dry-run", action="store_true", help="mostra i conteggi senza scrivere")
+    args = ap.parse_args()
+
+    sources = [s for s in args.sources if os.path.isfile(s)]
+    for s in args.sources:
+        if s not in sources:
+            print(f"[SKIP] {s}: non esiste")
+    if not sources:
+        print("[WARN] Nessuna history da migrare.", file=sys.stderr)
+        sys.exit(1)
+
+    keys, counts = merge(sources)
+    total = sum(counts.values())
+    for src, n in counts.items():
+        print(f"[READ] {src}: {n} righe")
+    print(f"[MERGE] {total} righe -> {len(keys)} chiavi canoniche ({total - len(keys)} duplicati fusi)")
+    if args.dry_run:
+        return
+
+    if os.path.isfile(args.out):
+        print(f"[BAK] {backup(args.out)}")
+    d = os.path.dirname(args.out)
+    if d:
+        os.makedirs(d, exist_ok=True)
+    tmp = args.out + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        for key in keys:
+            f.write(key + ";\n")
+    os.replace(tmp, args.out)
+    print(f"[OK] {args.out}")
+
+    if args.remove_merged:
+        out_abs = os.path.abspath(args.out)
+        for src in sources:
+            if os.path.abspath(src) != out_abs:
+                os.replace(src, src + ".bak")
+                print(f"[MOVED] {src} -> {src}.bak")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+"""
+query_recipes.py
+Formato dichiarativo delle ricette di query per internet_archive_fine_tuning.py.
+
+Una ricetta è un file .toml o .json (vedi recipes/) al posto dei lunghi
+comandi shell salvati in makefile/. I percorsi sono relativi alla root di
+Envion (--root di batch_runner.py), niente /Users/... cablati.
+
+Campi (tutti opzionali tranne query):
+  name                 nome della ricetta (default: nome file)
+  query                testo TEXT: per advancedsearch
+  scope                "sitewide" (default) | "bbc"
+  subjects             lista di subject richiesti (OR)
+  exclude_collections  lista di collection da escludere
+  exclude_titles       parole da escludere dal titolo
+  formats              estensioni accettate
+  max_dur              durata massima in secondi (0 = nessun limite)
+  max_size_mb          dimensione massima in MB (0 = nessun limite)
+  rows                 righe advancedsearch
+  count                quanti URL nella lista
+
+  [output]
+  dir                  cartella della lista (default "netsound")
+  basename             vuoto = envion_random_raw_XXX.txt, altrimenti <basename>_<stamp>.txt
+  history              file di history (default "netsound/netsound_history.txt")
+  dedupe               true/false (default true)
+"""
+
+import glob
+import json
+import os
+
+try:
+    import tomllib  # Python 3.11+
+except ImportError:  # pragma: no cover
+    tomllib = None
+
+DEFAULTS = {
+    "scope": "sitewide",
+    "subjects": [],
+    "exclude_collections": [],
+    "exclude_titles": [],
+    "formats": ["wav", "wave", "aiff", "aif", "flac", "mp3"],
+    "max_dur": 0.0,
+    "max_size_mb": 10.0,
+    "rows": 300,
+    "count": 8,
+}
+
+OUTPUT_DEFAULTS = {
+    "dir": "netsound",
+    "basename": "",
+    "history": "netsound/netsound_history.txt",
+    "dedupe": True,
+}
+
+KNOWN_KEYS = set(DEFAULTS) | {"name", "query", "output"}
+
+class RecipeError(ValueError):
+    pass
+
+def _as_list(value):
+    if isinstance(value, str):
+        return [t.strip() for t in value.split(",") if t.strip()]
+    return [str(t).strip() for t in (value or []) if str(t).strip()]
+
+def parse_recipe(data, name=""):
+    """dict grezzo (da TOML/JSON) -> ricetta normalizzata con tutti i default."""
+    unknown = set(data) - KNOWN_KEYS
+    if unknown:
+        raise RecipeError(f"{name}: campi sconosciuti {sorted(unknown)}")
+    if not str(data.get("query", "")).strip():
+        raise RecipeError(f"{name}: 'query' mancante")
+    if data.get("scope", DEFAULTS["scope"]) not in ("sitewide", "bbc"):
+        raise RecipeError(f"{name}: scope deve essere 'sitewide' o 'bbc'")
+
+    r = dict(DEFAULTS)
+    r.update({k: v for k, v in data.items() if k != "output"})
+    r["name"] = str(data.get("name") or name)
+    r["query"] = str(data["query"]).strip()
+    for key in ("subjects", "exclude_collections", "exclude_titles"):
+        r[key] = _as_list(r[key])
+    r["formats"] = [f.lower().lstrip(".") for f in _as_list(r["formats"])]
+    r["max_dur"] = float(r["max_dur"])
+    r["max_size_mb"] = float(r["max_size_mb"])
+    r["rows"] = int(r["rows"])
+    r["count"] = int(r["count"])
+
+    out = dict(OUTPUT_DEFAULTS)
+    out.update(data.get("output") or {})
+    out["dedupe"] = bool(out["dedupe"])
+    r["output"] = out
+    return r
+
+def load_recipe(path):
+    name = os.path.splitext(os.path.basename(path))[0]
+    if path.endswith(".toml"):
+        if tomllib is None:
+            raise RecipeError(f"{path}: TOML richiede Python 3.11+ (usa .json)")
+        with open(path, "rb") as f:
+            data = tomllib.load(f)
+    elif path.endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    else:
+        raise RecipeError(f"{path}: estensione non supportata (.toml o .json)")
+    recipe = parse_recipe(data, name)
+    recipe["path"] = path
+    return recipe
+
+def find_recipe_files(paths):
+    """File e cartelle -> lista ordinata di file .toml/.json."""
+    out = []
+    for p in paths:
+        if os.path.isdir(p):
+            out += sorted(glob.glob(os.path.join(p, "*.toml")) + glob.glob(os.path.join(p, "*.json")))
+        else:
+            out.append(p)
+    return out
+
+def load_recipes(paths):
+    return [load_recipe(p) for p in find_recipe_files(paths)]
+
+def recipe_to_opts(recipe):
+    """Ricetta -> opzioni CLI equivalenti di internet_archive_fine_tuning.py."""
+    opts = {
+        "q": recipe["query"],
+        "scope": recipe["scope"],
+        "rows": str(recipe["rows"]),
+        "max-dur": str(recipe["max_dur"]),
+    }
+    # solo se diversi dai default dello script, come nei comandi salvati
+    if recipe["max_size_mb"] != DEFAULTS["max_size_mb"]:
+        opts["max-size-mb"] = str(recipe["max_size_mb"])
+    if recipe["formats"] != DEFAULTS["formats"]:
+        opts["formats"] = ",".join(recipe["formats"])
+    if recipe["subjects"]:
+        opts["include-subjects"] = ",".join(recipe["subjects"])
+    if recipe["exclude_collections"]:
+        opts["exclude-collections"] = ",".join(recipe["exclude_collections"])
+    if recipe["exclude_titles"]:
+        opts["exclude"] = ",".join(recipe["exclude_titles"])
+    return opts
@@ -4,20 +4,26 @@
 wiki_commons_fetch.py — Cerca file audio su Wikimedia Commons e salva URL raw.
 - Usa MediaWiki API (Commons) con CirrusSearch: mediatype:audio + filetype filters
 - Estensioni coperte: .ogg, .wav, .flac (escludi .mid/.midi di default)
+- Limiti --max-dur / --max-size-mb come negli script IA; se l'originale è
+  troppo grande usa un transcode di Commons (mp3/ogg) quando rientra
 - Scrive una lista di URL (uno per riga) e aggiorna una history opzionale
 """
 
 import argparse, os, sys, time, json, re
 from urllib.parse import urlencode
-import urllib.request
+
+import envion_catalog
+import envion_commons
+import envion_http
+from envion_filters import compile_filters
+from envion_urls import append_history, canonical_url, read_history_set
 
 COMMONS_API = "https://commons.wikimedia.org/w/api.php"
 UA = "Envion-NetAudio/1.0 (contact: user)"
 
 def http_get(url, timeout=15):
-    req = urllib.request.Request(url, headers={"User-Agent": UA})
-    with urllib.request.urlopen(req, timeout=timeout) as r:
-        return r.read().decode("utf-8")
+    # api.php: con --http-cache stessa query = stesso URL, dalla cache su disco (envion_http)
+    return envion_http.cached_get(url, timeout=timeout, headers={"User-Agent": UA}).decode("utf-8")
 
 def search_pages(q, limit, timeout, verbose):
     # CirrusSearch via list=search; limitiamo a namespace File (6), audio only
@@ -40,44 +46,30 @@ def search_pages(q, limit, timeout, verbose):
     return data.get("query", {}).get("search", [])
 
 def fetch_imageinfo(pageids, timeout, verbose):
-    # Per pageids -> imageinfo.url (originale)
-    if not pageids:
-        return {}
-    params = {
-        "action": "query",
-        "format": "json",
-        "prop": "imageinfo",
-        "iiprop": "url|mime",
-        "pageids": "|".join(map(str, pageids)),
-        "origin": "*",
-    }
-    url = COMMONS_API + "?" + urlencode(params)
-    if verbose: print("[imageinfo]", url)
-    data = json.loads(http_get(url, timeout))
-    return data.get("query", {}).get("pages", {})
-
-def pass_filters(filename, url, include_exts, exclude_terms, verbose):
-    name_lower = filename.lower()
-    url_lower  = url.lower()
-    # estensione
-    ok_ext = any(name_lower.endswith(ext) or url_lower.endswith(ext) for ext in include_exts)
-    if not ok_ext:
-        return False
-    # exclude terms nel titolo o url
-    for term in exclude_terms:
-        if term and (term.lower() in name_lower or term.lower() in url_lower):
-            if verbose: print("  · skip (exclude term):", term, "→", filename)
-            return False
-    return True
-
-def read_history_set(history_path):
-    s = set()
-    if history_path and os.path.isfile(history_path):
-        with open(history_path, "r", encoding="utf-8", errors="ignore") as f:
-            for line in f:
-                u = line.strip()
-                if u: s.add(u)
-    return s
+    # Per pageids -> imageinfo (url, mime, size/durata) + derivati, a blocchi di 50
+    pages = {}
+    for chunk in envion_commons.batches(pageids):
+        params = {
+            "action": "query",
+            "format": "json",
+            "pageids": "|".join(map(str, chunk)),
+            "origin": "*",
+        }
+        params.update(envion_commons.MEDIA_PARAMS)
+        url = COMMONS_API + "?" + urlencode(params)
+        if verbose: print("[imageinfo]", url)
+        data = json.loads(http_get(url, timeout))
+        pages.update(data.get("query", {}).get("pages", {}))
+    return pages
+
+def pick_url(flt, title, info, transcodes, verbose):
+    """flt: filtro compilato (envion_filters). -> (url, meta) oppure (None, None)."""
+    url, meta, reason = envion_commons.choose(flt, title, info, transcodes)
+    if verbose and reason in ("exclude", "duration", "size"):
+        print(f"  · skip ({reason}):", title)
+    elif verbose and meta and meta.get("derivative"):
+        print(f"  · originale troppo grande, uso il transcode {meta['derivative']}:", title)
+    return url, meta
 
 def main():
     p = argparse.ArgumentParser(description="Fetch audio URLs from Wikimedia Commons.")
@@ -91,12 +83,21 @@ def main():
     p.add_argument("--timeout", type=int, default=15, help="Timeout HTTP sec (default: 15)")
     p.add_argument("--exclude", default="", help="Parole da escludere (comma-separated)")
     p.add_argument("--extensions", default=".ogg,.wav,.flac", help="Estensioni ammesse (comma-separated)")
+    p.add_argument("--max-dur", type=float, default=0.0, help="Durata massima in secondi (0 = nessun limite)")
+    p.add_argument("--max-size-mb", type=float, default=0.0, help="Dimensione massima in MB (0 = nessun limite)")
+    p.add_argument("--transcodes", default="mp3,ogg",
+                   help="Transcode Commons ammessi se l'originale supera --max-size-mb, in ordine di preferenza ('' = mai)")
+    envion_http.add_cli_args(p)
     args = p.parse_args()
+    envion_http.setup_cache(args)
 
     include_exts = [e.strip().lower() for e in args.extensions.split(",") if e.strip()]
     # Aggiungi esclusioni MIDI sempre
     exclude_terms = [t.strip() for t in args.exclude.split(",") if t.strip()]
     exclude_terms += [".mid", ".midi"]
+    flt = compile_filters(exts=include_exts, exclude_terms=exclude_terms,
+                          max_dur=args.max_dur, max_size_mb=args.max_size_mb)
+    transcodes = envion_commons.parse_transcodes(args.transcodes)
 
     os.makedirs(args.out_dir, exist_ok=True)
     out_path = os.path.join(args.out_dir, args.out_file)
@@ -106,6 +107,7 @@ def main():
         print("→ Query:", args.q)
         print("→ Estensioni:", include_exts)
         print("→ Escludi:", exclude_terms)
+        print("→ Limiti: dur", args.max_dur or "-", "s, size", args.max_size_mb or "-", "MB")
         print("→ Out:", out_path)
         print("→ History:", hist_path, "(dedupe:", args.dedupe, ")")
 
@@ -119,21 +121,23 @@ def main():
 
     # 3) Filtra e prepara lista URL
     seen = read_history_set(hist_path) if args.dedupe else set()
-    urls = []
+    urls, meta = [], {}
     for pid, page in pages.items():
         title = page.get("title", "")
-        infos = page.get("imageinfo", []) or []
-        if not infos: 
+        info = envion_commons.page_info(page)
+        if not info or not info.get("url"):
             continue
-        url = infos[0].get("url", "")
-        if not url: 
+        if args.dedupe and canonical_url(info["url"]) in seen:
+            if args.verbose: print("  · già in history:", info["url"])
             continue
-        if args.dedupe and url in seen:
-            if args.verbose: print("  · già in history:", url)
+        url, info = pick_url(flt, title, info, transcodes, args.verbose)
+        if not url:
             continue
-        if not pass_filters(title, url, include_exts, exclude_terms, args.verbose):
+        if args.dedupe and canonical_url(url) in seen:
+            if args.verbose: print("  · già in history:", url)
             continue
         urls.append(url)
+        meta[url] = envion_catalog.commons_meta(title, info)
         if args.verbose: print("  ✓", url)
         if len(urls) >= args.count:
             break
@@ -146,10 +150,9 @@ def main():
     with open(out_path, "a", encoding="utf-8") as f:
         for u in urls:
             f.write(u.strip() + ";\n")  # punto e virgola finale (compat PD)
+    envion_catalog.write_sidecar(out_path, urls, meta, query=args.q, script="wiki_commons_fetch", mode="a")
     if hist_path:
-        with open(hist_path, "a", encoding="utf-8") as f:
-            for u in urls:
-                f.write(u.strip() + "\n")
+        append_history(hist_path, urls)
 
     print(f"✅ Salvati {len(urls)} URL in: {out_path}")
     if args.dedupe:
@@ -2,22 +2,29 @@
 # -*- coding: utf-8 -*-
 """
 wiki_commons_fetch_v2.py — Commons audio fetch robusto:
-- Usa list=search su namespace File, poi prop=imageinfo (url,mime)
+- Usa list=search su namespace File, poi prop=imageinfo|videoinfo
+  (url, mime, size/durata, derivati) in un'unica chiamata per blocco
+- --max-dur / --max-size-mb come negli script IA; un originale troppo grande
+  viene sostituito dal transcode Commons (mp3/ogg) se questo rientra
 - Accetta il file se MIME inizia con 'audio/' OPPURE l'estensione è tra quelle permesse
 - Aggiunge ';' a fine riga per compatibilità Pure Data
 """
 
 import argparse, os, sys, json
 from urllib.parse import urlencode
-import urllib.request
+
+import envion_catalog
+import envion_commons
+import envion_http
+from envion_filters import compile_filters
+from envion_urls import append_history, canonical_url, read_history_set
 
 COMMONS_API = "https://commons.wikimedia.org/w/api.php"
 UA = "Envion-NetAudio/1.1 (contact: user)"
 
 def http_get(url, timeout=15):
-    req = urllib.request.Request(url, headers={"User-Agent": UA})
-    with urllib.request.urlopen(req, timeout=timeout) as r:
-        return r.read().decode("utf-8")
+    # api.php: con --http-cache stessa query = stesso URL, dalla cache su disco (envion_http)
+    return envion_http.cached_get(url, timeout=timeout, headers={"User-Agent": UA}).decode("utf-8")
 
 def search_pages(q, limit, timeout, verbose):
     params = {
@@ -37,43 +44,21 @@ def search_pages(q, limit, timeout, verbose):
     return data.get("query", {}).get("search", [])
 
 def fetch_imageinfo(pageids, timeout, verbose):
-    if not pageids:
-        return {}
-    params = {
-        "action": "query",
-        "format": "json",
-        "prop": "imageinfo",
-        "iiprop": "url|mime",
-        "pageids": "|".join(map(str, pageids)),
-        "origin": "*",
-    }
-    url = COMMONS_API + "?" + urlencode(params)
-    if verbose: print("[imageinfo]", url)
-    data = json.loads(http_get(url, timeout))
-    return data.get("query", {}).get("pages", {})
-
-def read_history_set(path):
-    s=set()
-    if path and os.path.isfile(path):
-        with open(path, "r", encoding="utf-8", errors="ignore") as f:
-            for line in f:
-                u=line.strip()
-                if u: s.add(u)
-    return s
-
-def is_audio_ok(title, url, mime, include_exts, exclude_terms):
-    t = (title or "").lower()
-    u = (url or "").lower()
-    m = (mime or "").lower()
-    # escludi parole
-    for term in exclude_terms:
-        if term and (term.lower() in t or term.lower() in u):
-            return False
-    # MIME prevale
-    if m.startswith("audio/"):
-        return True
-    # fallback: estensione
-    return any(u.endswith(ext) or t.endswith(ext) for ext in include_exts)
+    # url, mime, size/durata + derivati nella stessa chiamata, a blocchi di 50 pageids
+    pages = {}
+    for chunk in envion_commons.batches(pageids):
+        params = {
+            "action": "query",
+            "format": "json",
+            "pageids": "|".join(map(str, chunk)),
+            "origin": "*",
+        }
+        params.update(envion_commons.MEDIA_PARAMS)
+        url = COMMONS_API + "?" + urlencode(params)
+        if verbose: print("[imageinfo]", url)
+        data = json.loads(http_get(url, timeout))
+        pages.update(data.get("query", {}).get("pages", {}))
+    return pages
 
 def main():
     ap = argparse.ArgumentParser(description="Fetch audio URLs from Wikimedia Commons (robusto).")
@@ -87,11 +72,19 @@ def main():
     ap.add_argument("--timeout", type=int, default=15)
     ap.add_argument("--exclude", default="")
     ap.add_argument("--extensions", default=".ogg,.oga,.wav,.flac")
+    ap.add_argument("--max-dur", type=float, default=0.0, help="secondi, 0 = nessun limite")
+    ap.add_argument("--max-size-mb", type=float, default=0.0, help="MB, 0 = nessun limite")
+    ap.add_argument("--transcodes", default="mp3,ogg", help="transcode ammessi per originali troppo grandi ('' = mai)")
+    envion_http.add_cli_args(ap)
     args = ap.parse_args()
+    envion_http.setup_cache(args)
 
     include_exts = [e.strip().lower() for e in args.extensions.split(",") if e.strip()]
     exclude_terms = [t.strip() for t in args.exclude.split(",") if t.strip()]
     exclude_terms += [".mid", ".midi"]
+    flt = compile_filters(exts=include_exts, exclude_terms=exclude_terms, allow_audio_mime=True,
+                          max_dur=args.max_dur, max_size_mb=args.max_size_mb)
+    transcodes = envion_commons.parse_transcodes(args.transcodes)
 
     os.makedirs(args.out_dir, exist_ok=True)
     out_path = os.path.join(args.out_dir, args.out_file)
@@ -111,23 +104,27 @@ def main():
     pages = fetch_imageinfo(pageids, args.timeout, args.verbose)
 
     seen = read_history_set(hist_path) if args.dedupe else set()
-    urls = []
+    urls, meta = [], {}
     for pid, page in pages.items():
         title = page.get("title", "")
-        infos = page.get("imageinfo", []) or []
-        if not infos: 
+        info = envion_commons.page_info(page)
+        if not info or not info.get("url"):
             continue
-        url = infos[0].get("url", "")
-        mime = infos[0].get("mime", "")
+        if args.dedupe and canonical_url(info["url"]) in seen:
+            if args.verbose: print("  · già in history:", info["url"])
+            continue
+        url, info, reason = envion_commons.choose(flt, title, info, transcodes)
         if not url:
+            if args.verbose and reason in ("duration", "size"):
+                print(f"  · skip ({reason}):", title)
             continue
-        if args.dedupe and url in seen:
+        if args.dedupe and canonical_url(url) in seen:
             if args.verbose: print("  · già in history:", url)
             continue
-        if not is_audio_ok(title, url, mime, include_exts, exclude_terms):
-            continue
         urls.append(url)
-        if args.verbose: print("  ✓", url, "|", mime)
+        meta[url] = envion_catalog.commons_meta(title, info)
+        if args.verbose:
+            print("  ✓", url, "|", info.get("mime", ""), "|", info.get("derivative") or "originale")
         if len(urls) >= args.count:
             break
 
@@ -138,10 +135,9 @@ def main():
     with open(out_path, "a", encoding="utf-8") as f:
         for u in urls:
             f.write(u.strip() + ";\n")
+    envion_catalog.write_sidecar(out_path, urls, meta, query=args.q, script="wiki_commons_fetch_v2", mode="a")
     if hist_path:
-        with open(hist_path, "a", encoding="utf-8") as f:
-            for u in urls:
-                f.write(u.strip() + "\n")
+        append_history(hist_path, urls)
 
     print(f"✅ Salvati {len(urls)} URL in: {out_path}")
     if args.dedupe:
@@ -2,15 +2,25 @@
 # -*- coding: utf-8 -*-
 """
 wiki_commons_fetch_v3.py — Wikimedia Commons audio fetch (solido):
-1) Tenta con generator=search (namespace File) + prop=imageinfo (url,mime)
-2) Accetta solo MIME che iniziano per 'audio/'
-3) Fallback: list=allimages con aimime=audio/*
+1) Tenta con generator=search (namespace File) + prop=imageinfo|videoinfo
+   (url, mime, size/durata e derivati nella stessa chiamata)
+2) Accetta solo MIME che iniziano per 'audio/', entro --max-dur / --max-size-mb;
+   un originale troppo grande viene sostituito dal transcode Commons (mp3/ogg)
+3) Fallback: list=allimages con aimime=audio/* (url, mime, size; niente durata)
 4) Scrive URL raw con ';' finale (compat PD), dedupe opzionale
+   (URL canonici; con --fingerprint anche near-duplicate acustici)
 """
 
 import argparse, os, sys, json, time
 from urllib.parse import urlencode, quote
-import urllib.request
+
+import envion_catalog
+import envion_commons
+import envion_fingerprint
+import envion_http
+import envion_trace as trace
+from envion_filters import compile_filters
+from envion_urls import append_history, canonical_url, read_history_set
 
 COMMONS_API = "https://commons.wikimedia.org/w/api.php"
 UA = "Envion-NetAudio/1.2 (contact: user)"
@@ -24,9 +34,8 @@ AUDIO_MIME = [
 AUDIO_EXT = [".ogg",".oga",".opus",".wav",".flac",".mp3"]
 
 def http_get(url, timeout=15):
-    req = urllib.request.Request(url, headers={"User-Agent": UA})
-    with urllib.request.urlopen(req, timeout=timeout) as r:
-        return r.read().decode("utf-8")
+    # api.php: con --http-cache stessa query = stesso URL, dalla cache su disco (envion_http)
+    return envion_http.cached_get(url, timeout=timeout, headers={"User-Agent": UA}).decode("utf-8")
 
 def pages_via_generator_search(q, limit, timeout, verbose):
     # aggiungo un filtro filetype minimo per ridurre immagini
@@ -38,10 +47,9 @@ def pages_via_generator_search(q, limit, timeout, verbose):
         "gsrsearch": gq,
         "gsrnamespace": "6",     # File:
         "gsrlimit": "200",
-        "prop": "imageinfo",
-        "iiprop": "url|mime",
         "origin": "*",
     }
+    params.update(envion_commons.MEDIA_PARAMS)
     url = COMMONS_API + "?" + urlencode(params)
     if verbose: print("[gensearch]", url)
     data = json.loads(http_get(url, timeout))
@@ -54,6 +62,7 @@ def list_allimages_audio(limit, aicontinue=None, timeout=15, verbose=False):
         "list": "allimages",
         "ailimit": "200",
         "aimime": "|".join(AUDIO_MIME),
+        "aiprop": "url|mime|size",
         "origin": "*",
     }
     if aicontinue:
@@ -63,26 +72,6 @@ def list_allimages_audio(limit, aicontinue=None, timeout=15, verbose=False):
     data = json.loads(http_get(url, timeout))
     return data
 
-def is_audio(title, url, mime):
-    t = (title or "").lower()
-    u = (url or "").lower()
-    m = (mime or "").lower()
-    if m.startswith("audio/"):
-        return True
-    for ext in AUDIO_EXT:
-        if u.endswith(ext) or t.endswith(ext):
-            return True
-    return False
-
-def read_history_set(path):
-    s=set()
-    if path and os.path.isfile(path):
-        with open(path, "r", encoding="utf-8", errors="ignore") as f:
-            for line in f:
-                u=line.strip()
-                if u: s.add(u)
-    return s
-
 def main():
     ap = argparse.ArgumentParser(description="Fetch audio URLs from Wikimedia Commons (v3 robust).")
     ap.add_argument("--q", required=True)
@@ -93,46 +82,63 @@ def main():
     ap.add_argument("--dedupe", action="store_true")
     ap.add_argument("--verbose", action="store_true")
     ap.add_argument("--timeout", type=int, default=15)
+    ap.add_argument("--max-dur", type=float, default=0.0, help="secondi, 0 = nessun limite")
+    ap.add_argument("--max-size-mb", type=float, default=0.0, help="MB, 0 = nessun limite")
+    ap.add_argument("--transcodes", default="mp3,ogg", help="transcode ammessi per originali troppo grandi ('' = mai)")
+    envion_fingerprint.add_cli_args(ap)
+    envion_http.add_cli_args(ap)
+    trace.add_cli_args(ap)
     args = ap.parse_args()
+    trace.setup(args.trace, args.profile)
+    envion_http.setup_cache(args)
 
     os.makedirs(args.out_dir, exist_ok=True)
     out_path = os.path.join(args.out_dir, args.out_file)
     hist_path = args.history
-    seen = read_history_set(hist_path) if args.dedupe else set()
+    with trace.span("history_read"):
+        seen = read_history_set(hist_path) if args.dedupe else set()
 
     if args.verbose:
         print("→ Query:", args.q)
         print("→ Out:", out_path)
         print("→ History:", hist_path, "(dedupe:", args.dedupe, ")")
 
-    urls = []
+    flt = compile_filters(exts=AUDIO_EXT, allow_audio_mime=True,
+                          max_dur=args.max_dur, max_size_mb=args.max_size_mb)
+    transcodes = envion_commons.parse_transcodes(args.transcodes)
+    gate = envion_fingerprint.gate_from_args(args, verbose=args.verbose)
+    urls, meta = [], {}
 
     # 1) generator=search
-    pages = pages_via_generator_search(args.q, args.count, args.timeout, args.verbose)
+    with trace.span("search"):
+        pages = pages_via_generator_search(args.q, args.count, args.timeout, args.verbose)
     if args.verbose: print("[gensearch pages]", len(pages))
     for pid, page in pages.items():
         title = page.get("title","")
-        infos = page.get("imageinfo",[]) or []
-        if not infos: 
+        info = envion_commons.page_info(page)
+        if not info or not info.get("url"):
             continue
-        url = infos[0].get("url","")
-        mime = infos[0].get("mime","")
+        url, info, reason = envion_commons.choose(flt, title, info, transcodes)
         if not url:
+            trace.rejects({reason: 1})
             continue
-        if not is_audio(title, url, mime):
-            continue
-        if args.dedupe and url in seen:
+        if args.dedupe and (canonical_url(url) in seen or canonical_url(info.get("original") or url) in seen):
             if args.verbose: print("  · già in history:", url)
+            trace.rejects({"history": 1})
+            continue
+        if gate is not None and not gate.admit(url, source=title):
             continue
         urls.append(url)
-        if args.verbose: print("  ✓", url, "|", mime)
+        meta[url] = envion_catalog.commons_meta(title, info)
+        if args.verbose: print("  ✓", url, "|", info.get("mime",""), "|", info.get("derivative") or "originale")
         if len(urls) >= args.count:
             break
 
     # 2) fallback: allimages (aimime=audio/*)
     aicont = None
     while len(urls) < args.count:
-        data = list_allimages_audio(args.count, aicont, args.timeout, args.verbose)
+        with trace.span("search", fallback="allimages"):
+            data = list_allimages_audio(args.count, aicont, args.timeout, args.verbose)
         items = data.get("query",{}).get("allimages",[]) or []
         if args.verbose: print("[allimages items]", len(items))
         if not items:
@@ -143,11 +149,14 @@ def main():
             mime = it.get("mime","")
             if not url:
                 continue
-            if not is_audio(title, url, mime):
+            if flt.reject_reason(title, size=it.get("size"), url=url, mime=mime) is not None:
                 continue
-            if args.dedupe and url in seen:
+            if args.dedupe and canonical_url(url) in seen:
+                continue
+            if url in urls or (gate is not None and not gate.admit(url, source=title)):
                 continue
             urls.append(url)
+            meta[url] = envion_catalog.commons_meta(title, it)
             if args.verbose: print("  ✓", url, "|", mime)
             if len(urls) >= args.count:
                 break
@@ -159,13 +168,16 @@ def main():
         print("❌  Nessun file audio utile trovato — nulla salvato.")
         sys.exit(1)
 
-    with open(out_path, "a", encoding="utf-8") as f:
-        for u in urls:
-            f.write(u.strip() + ";\n")
-    if hist_path:
-        with open(hist_path, "a", encoding="utf-8") as f:
+    with trace.span("write"):
+        with open(out_path, "a", encoding="utf-8") as f:
             for u in urls:
-                f.write(u.strip() + "\n")
+                f.write(u.strip() + ";\n")
+        envion_catalog.write_sidecar(out_path, urls, meta, query=args.q, script="wiki_commons_fetch_v3", mode="a")
+    if hist_path:
+        with trace.span("history_write"):
+            append_history(hist_path, urls)
+    if gate is not None:
+        gate.commit(urls)
 
     print(f"✅ Salvati {len(urls)} URL in: {out_path}")
     if args.dedupe:
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+bench_cpu.py
+Microbenchmark dei percorsi CPU (niente rete) di NET-AUDIO, a più scale.
+
+I costi di CPU crescono coi dati e nessuno li misura. Casi:
+  history_cold      read_history_set su una history di n righe, cache di processo vuota
+  history_tail      read_history_set dopo 1 riga aggiunta (cache calda: legge solo la coda)
+  next_filename     next_progressive_filename in una cartella con n liste
+  filter_files      CandidateFilter.filter_files su un md["files"] di n voci
+  encode_urls       encode_url (encode_netsound_urls) su n URL
+  presets_sign      canonical_dump + HMAC-SHA256 di un presets.json con n preset
+
+I dati sono sintetici (seed fisso), generati in una cartella temporanea a
+ogni scala. Per ogni caso e scala: tempo minimo su --repeat ripetizioni
+(ognuna ripete la chiamata finché dura almeno --min-time) e picco di memoria
+allocata durante una chiamata (tracemalloc, in una misura a parte).
+
+Rapporto di scala: pendenza di log(tempo) su log(n) fra le scale. ~1 =
+lineare, ~0 = costante; sopra --superlinear (default 1.15) il caso è segnalato
+come super-lineare. La memoria ha la sua pendenza.
+
+Report JSON con confronto sul baseline (--baseline): regressione se il tempo
+sale oltre --tolerance o la memoria oltre --tolerance. Exit code 1 se ce n'è
+almeno una.
+
+Uso:
+  python3 python__tools/bench_cpu.py                         # tutti i casi, scale di default
+  python3 python__tools/bench_cpu.py --save-baseline
+  python3 python__tools/bench_cpu.py --cases history_cold filter_files --max-n 20000
+  python3 python__tools/bench_cpu.py --scales 1000 10000 100000 --repeat 7
+"""
+
+import argparse
+import hashlib
+import hmac
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, os.path.join(ROOT, "python__queries"))
+sys.path.insert(0, ROOT)   # presets_admin
+
+import envion_urls
+from candidate_pool import next_progressive_filename
+from encode_netsound_urls import encode_url
+from envion_filters import compile_filters
+from presets_admin import canonical_dump
+
+DEFAULT_BASELINE = os.path.join(HERE, "bench_cpu_baseline.json")
+DEFAULT_REPORT = "bench_cpu.json"
+SEED = 1234
+
+WORDS = ("wind", "rain", "door", "creak", "metal", "wood", "birds", "crowd", "engine", "water",
+         "glass", "hum", "radio", "bell", "steps", "ambience", "fire", "train", "city", "night")
+EXTS = ("wav", "mp3", "flac", "ogg", "aiff", "xml", "png", "txt", "sqlite", "torrent")
+
+# --- Dati sintetici -----------------------------------------------------------
+
+def _name(rng, ext=None):
+    words = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 4)))
+    return f"{words} {rng.randint(1, 999):03d}.{ext or rng.choice(EXTS)}"
+
+def gen_urls(n, rng):
+    """URL come finiscono in lista/history: IA in tutte le forme, Commons, raw, con e senza ';'."""
+    out = []
+    for i in range(n):
+        ident = f"{rng.choice(WORDS)}_{rng.randint(0, n)}"
+        name = _name(rng, rng.choice(("wav", "mp3", "flac")))
+        k = i % 5
+        if k == 0:
+            u = envion_urls.archive_download_url(ident, name)
+        elif k == 1:
+            u = f"https://archive.org/download/{ident}/{name}"               # spazi crudi
+        elif k == 2:
+            u = f"http://ia80{rng.randint(0, 9)}.us.archive.org/{rng.randint(1, 30)}/items/{ident}/{name}"
+        elif k == 3:
+            u = f"https://upload.wikimedia.org/wikipedia/commons/{rng.randint(0, 9)}/{rng.randint(10, 99)}/{name}"
+        else:
+            u = f"https://freesound.example.org/data/{ident}.wav?token={rng.randint(0, 10 ** 6)}&dl=1"
+        out.append(u + (";" if rng.random() < 0.7 else ""))
+    return out
+
+def gen_files(n, rng):
+    """md["files"] di un item grande (BBCSoundEffectsComplete: decine di migliaia di voci)."""
+    files = []
+    for _ in range(n):
+        f = {"name": _name(rng), "source": rng.choice(("original", "derivative")),
+             "size": str(rng.randint(1_000, 80_000_000)), "format": "VBR MP3"}
+        if rng.random() < 0.8:
+            f["length"] = rng.choice((f"{rng.uniform(0.2, 600):.2f}", f"{rng.randint(0, 9)}:{rng.randint(0, 59):02d}"))
+        files.append(f)
+    return files
+
+def gen_presets(n, rng):
+    return {f"preset-{i:05d}": {"path": f"read data/vline_perc_{rng.randint(1, 40)}.txt",
+                                "drone": rng.randint(0, 4), "stretch": rng.randint(1, 96),
+                                "act": [rng.randint(0, 1) for _ in range(4)],
+                                "sample": f"read -resize audio/{rng.choice(WORDS)}.wav samplebufL samplebufR"}
+            for i in range(n)}
+
+# --- Casi ---------------------------------------------------------------------
+# setup(n, tmp, rng) -> funzione senza argomenti da misurare
+
+def case_history_cold(n, tmp, rng):
+    path = os.path.join(tmp, "history.txt")
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(u.rstrip(";") + ";\n" for u in gen_urls(n, rng))
+    def run():
+        envion_urls._history_cache.clear()
+        envion_urls.read_history_set(path)
+    return run
+
+def case_history_tail(n, tmp, rng):
+    path = os.path.join(tmp, "history.txt")
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(u.rstrip(";") + ";\n" for u in gen_urls(n, rng))
+    envion_urls._history_cache.clear()
+    envion_urls.read_history_set(path)
+    extra = gen_urls(1, rng)[0].rstrip(";") + ";\n"
+    def run():
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(extra)
+        envion_urls.read_history_set(path)
+    return run
+
+def case_next_filename(n, tmp, rng):
+    d = os.path.join(tmp, "netsound")
+    os.makedirs(d)
+    for i in range(1, n + 1):
+        name = f"envion_random_raw_{i:03d}.txt" if i % 4 else f"bbc_{rng.choice(WORDS)}_{i}.txt"
+        open(os.path.join(d, name), "w").close()
+    return lambda: next_progressive_filename(d)
+
+def case_filter_files(n, tmp, rng):
+    files = gen_files(n, rng)
+    flt = compile_filters(exts={"wav", "mp3", "flac", "aiff"}, max_dur=8.0, max_size_mb=10.0,
+                          exclude_terms=["podcast", "sermon", "radio"])
+    return lambda: flt.filter_files(files, {})
+
+def case_encode_urls(n, tmp, rng):
+    urls = gen_urls(n, rng)
+    return lambda: [encode_url(u) for u in urls]
+
+def case_presets_sign(n, tmp, rng):
+    data = gen_presets(n, rng)
+    secret = b"\x01" * 32
+    return lambda: hmac.new(secret, canonical_dump(data), hashlib.sha256).hexdigest()
+
+CASES = {
+    "history_cold": (case_history_cold, (1_000, 10_000, 100_000)),
+    "history_tail": (case_history_tail, (1_000, 10_000, 100_000)),
+    "next_filename": (case_next_filename, (100, 1_000, 10_000)),
+    "filter_files": (case_filter_files, (1_000, 10_000, 50_000)),
+    "encode_urls": (case_encode_urls, (1_000, 10_000, 100_000)),
+    "presets_sign": (case_presets_sign, (10, 100, 1_000, 10_000)),
+}
+
+# --- Misura -------------------------------------------------------------------
+
+def measure(fn, repeat, min_time):
+    """Secondi per chiamata: minimo su repeat giri, ciascuno lungo almeno min_time."""
+    fn()   # riscaldamento (cache di import, page cache)
+    loops, t0 = 1, time.perf_counter()
+    fn()
+    one = time.perf_counter() - t0
+    if one < min_time:
+        loops = max(1, int(min_time / max(one, 1e-7)))
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        best = min(best, (time.perf_counter() - t0) / loops)
+    return best, loops
+
+def peak_memory(fn):
+    """Picco di memoria allocata (byte) durante una chiamata."""
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        fn()
+        return max(0, tracemalloc.get_traced_memory()[1] - base)
+    finally:
+        tracemalloc.stop()
+
+def slope(xs, ys):
+    """Pendenza ai minimi quadrati di log(y) su log(x) (None con meno di 2 punti validi)."""
+    pts = [(math.log(x), math.log(y)) for x, y in zip(xs, ys) if x > 0 and y > 0]
+    if len(pts) < 2:
+        return None
+    mx = sum(p[0] for p in pts) / len(pts)
+    my = sum(p[1] for p in pts) / len(pts)
+    den = sum((p[0] - mx) ** 2 for p in pts)
+    if den == 0:
+        return None
+    return round(sum((p[0] - mx) * (p[1] - my) for p in pts) / den, 3)
+
+def bench_case(name, scales, args):
+    setup = CASES[name][0]
+    points = []
+    for n in scales:
+        tmp = tempfile.mkdtemp(prefix=f"bench_cpu_{name}_")
+        try:
+            fn = setup(n, tmp, random.Random(SEED))
+            sec, loops = measure(fn, args.repeat, args.min_time)
+            mem = peak_memory(fn)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+            envion_urls._history_cache.clear()
+        points.append({"key": f"{name}|{n}", "case": name, "n": n, "ms": round(sec * 1000.0, 4),
+                       "us_per_item": round(sec * 1e6 / n, 4), "peak_kb": round(mem / 1024.0, 1), "loops": loops})
+        print(f"[OK] {name:14s} n={n:<7d} {sec * 1000.0:10.3f} ms  {sec * 1e6 / n:8.3f} us/item  "
+              f"{mem / 1024.0:10.1f} KB")
+    t_slope = slope([p["n"] for p in points], [p["ms"] for p in points])
+    m_slope = slope([p["n"] for p in points], [p["peak_kb"] for p in points])
+    return points, {"case": name, "time_slope": t_slope, "mem_slope": m_slope,
+                    "superlinear": t_slope is not None and t_slope > args.superlinear}
+
+def compare(results, baseline, tol):
+    """Aggiunge 'baseline' e 'regression' ai risultati, ritorna il numero di regressioni."""
+    ref = {r["key"]: r for r in baseline.get("results", [])}
+    n = 0
+    for r in results:
+        b = ref.get(r["key"])
+        if not b:
+            continue
+        reasons = []
+        if b.get("ms") and r["ms"] > b["ms"] * (1.0 + tol):
+            reasons.append(f"tempo {b['ms']} ms -> {r['ms']} ms")
+        if b.get("peak_kb") and r["peak_kb"] > b["peak_kb"] * (1.0 + tol) and r["peak_kb"] - b["peak_kb"] > 64:
+            reasons.append(f"memoria {b['peak_kb']} KB -> {r['peak_kb']} KB")
+        r["baseline"] = {k: b.get(k) for k in ("ms", "peak_kb")}
+        if reasons:
+            r["regression"] = reasons
+            n += 1
+    return n
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="CPU microbenchmarks of the non-network NET-AUDIO hot paths.")
+    ap.add_argument("--cases", nargs="+", default=list(CASES), choices=list(CASES), help="casi da misurare")
+    ap.add_argument("--scales", nargs="+", type=int, default=None, help="scale n per tutti i casi (default: per caso)")
+    ap.add_argument("--max-n", type=int, default=0, help="salta le scale sopra n (0 = nessun limite)")
+    ap.add_argument("--repeat", type=int, default=5, help="ripetizioni, tiene la migliore (default: 5)")
+    ap.add_argument("--min-time", type=float, default=0.05, help="durata minima di una ripetizione in s (default: 0.05)")
+    ap.add_argument("--superlinear", type=float, default=1.15,
+                    help="pendenza log-log oltre cui un caso è super-lineare (default: 1.15)")
+    ap.add_argument("--report", type=str, default=DEFAULT_REPORT, help=f"report JSON (default: {DEFAULT_REPORT})")
+    ap.add_argument("--baseline", type=str, default=DEFAULT_BASELINE, help="baseline JSON per il confronto")
+    ap.add_argument("--save-baseline", action="store_true", help="scrive i risultati come nuovo baseline")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="scarto ammesso sul baseline (default: 0.25)")
+    args = ap.parse_args(argv)
+
+    results, scaling = [], []
+    for name in args.cases:
+        scales = sorted(set(args.scales or CASES[name][1]))
+        if args.max_n:
+            scales = [n for n in scales if n <= args.max_n]
+        if not scales:
+            continue
+        points, sc = bench_case(name, scales, args)
+        results += points
+        scaling.append(sc)
+
+    regressions = 0
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+
+    print()
+    print(f"{'caso':14s} {'tempo':>8s} {'memoria':>8s}   (pendenza log-log su n)")
+    for sc in scaling:
+        fmt = lambda v: "-" if v is None else f"{v:.2f}"
+        flag = "  SUPER-LINEARE" if sc["superlinear"] else ""
+        print(f"{sc['case']:14s} {fmt(sc['time_slope']):>8s} {fmt(sc['mem_slope']):>8s}{flag}")
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "host": platform.platform(),
+        "machine": platform.machine(),
+        "results": results,
+        "scaling": scaling,
+        "regressions": regressions,
+    }
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"[OK] report -> {args.report}")
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"[OK] baseline -> {args.baseline}")
+    for r in results:
+        for reason in r.get("regression", []):
+            print(f"[REGRESSION] {r['key']}: {reason}", file=sys.stderr)
+    if regressions:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
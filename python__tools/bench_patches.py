@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+bench_patches.py
+Benchmark headless delle varianti del patch (pd -nogui -batch).
+
+Per ogni variante x preset x tabella:
+  1. copia strumentata della variante, accanto all'originale (così data/ e
+     audio/ restano relativi): in coda al canvas principale aggiunge
+       r bench-preset -> route <preset> -> inlet del subpatch del preset
+       r bench-path   -> s $0-path     (read <tabella>)
+       r bench-sample -> s $0-sample   (read -resize <sample> samplebufL samplebufR)
+  2. patch wrapper che a loadbang accende il DSP, lancia il preset, dopo
+     --settle-ms sovrascrive tabella e sample (solo file locali in audio/),
+     poi fa girare il sequencer per --render-sec secondi di tempo logico e
+     stampa il tempo reale impiegato (realtime) prima di "pd quit"
+  3. pd -batch calcola il DSP più veloce del tempo reale: throughput =
+     secondi renderizzati / secondi reali; picco di RSS dal rusage del
+     processo figlio (os.wait4)
+
+Report JSON con confronto sul baseline (--baseline): regressione se il
+throughput scende o l'RSS sale oltre --tolerance. Exit code 1 se ce n'è
+almeno una, così lo si può mettere prima di una release per iPad.
+
+I preset sono i subpatch del canvas principale che mandano a $0-preset
+(plugmain = DEFAULT-PRESET); nomi ripetuti diventano nome-2, nome-3...
+
+Uso:
+  python3 python__tools/bench_patches.py                          # 3 varianti, plugmain, data/default.txt
+  python3 python__tools/bench_patches.py --presets all --tables data/perc.txt data/drone.txt
+  python3 python__tools/bench_patches.py --save-baseline          # fissa il baseline
+  python3 python__tools/bench_patches.py --pd /opt/pd/bin/pd --pd-flag=-path --pd-flag=/opt/pd/extra
+"""
+
+import argparse
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import pdfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+VARIANTS = {
+    "plugdata-4.5": "___ Envion_v4.5_Plugdata.pd",
+    "vanilla-3.9": "vanilla-stable/___ Envion_v3.9_vanilla.pd",
+    "ios-4.1": "iOS_/___ Envion_v4.1_iOS.pd",
+}
+DEFAULT_BASELINE = os.path.join(HERE, "bench_baseline.json")
+DEFAULT_REPORT = "bench_patches.json"
+RENDER_RE = re.compile(r"bench-render:\s*([0-9.eE+-]+)")
+MISSING_RE = re.compile(r"couldn't create")
+
+def find_presets(records):
+    """Subpatch di primo livello con un inlet che mandano a $0-preset -> {nome: indice_oggetto}."""
+    out = {}
+    for n, i, text in pdfile.top_level(records):
+        if not text.startswith("pd "):
+            continue
+        body = pdfile.subpatch_body(records, i)
+        texts = [pdfile.obj_text(r) for r in body if pdfile.kind(r) == "obj"]
+        if "s \\$0-preset" not in texts or not any(t.split()[0] == "inlet" for t in texts if t):
+            continue
+        name = text[3:].strip()
+        key, k = name, 2
+        while key in out:
+            key = f"{name}-{k}"
+            k += 1
+        out[key] = n
+    return out
+
+def instrument(records, presets):
+    """Record della variante + hook bench-* in coda al canvas principale."""
+    base = len(pdfile.top_level(records))
+    keys = list(presets)
+    add = [
+        "#X obj 10 10 r bench-preset",
+        "#X obj 10 40 route " + " ".join(keys),
+        "#X obj 200 10 r bench-path",
+        "#X obj 200 40 s \\$0-path",
+        "#X obj 390 10 r bench-sample",
+        "#X obj 390 40 s \\$0-sample",
+        f"#X connect {base} 0 {base + 1} 0",
+        f"#X connect {base + 2} 0 {base + 3} 0",
+        f"#X connect {base + 4} 0 {base + 5} 0",
+    ]
+    add += [f"#X connect {base + 1} {j} {presets[k]} 0" for j, k in enumerate(keys)]
+    return records + add
+
+def wrapper(preset, table, sample, settle_ms, render_ms):
+    return [
+        "#N canvas 0 50 450 300 12",
+        "#X obj 10 10 loadbang",                                                # 0
+        f"#X msg 10 40 \\; pd dsp 1 \\; bench-preset {preset}",                 # 1
+        f"#X obj 10 70 del {settle_ms:g}",                                      # 2
+        f"#X msg 200 130 \\; bench-path read {table} \\; bench-sample read -resize {sample} samplebufL samplebufR",  # 3
+        "#X obj 10 100 t b b",                                                  # 4
+        "#X obj 10 130 t b b",                                                  # 5
+        "#X obj 10 220 realtime",                                               # 6
+        f"#X obj 10 160 del {render_ms:g}",                                     # 7
+        "#X obj 10 190 t b b",                                                  # 8
+        "#X obj 10 250 print bench-render",                                     # 9
+        "#X msg 100 220 \\; pd quit",                                           # 10
+        "#X connect 0 0 1 0",
+        "#X connect 0 0 2 0",
+        "#X connect 2 0 4 0",
+        "#X connect 4 1 3 0",
+        "#X connect 4 0 5 0",
+        "#X connect 5 1 6 0",
+        "#X connect 5 0 7 0",
+        "#X connect 7 0 8 0",
+        "#X connect 8 1 6 1",
+        "#X connect 8 0 10 0",
+        "#X connect 6 0 9 0",
+    ]
+
+def run_pd(pd, flags, variant_path, wrapper_path, timeout):
+    """Lancia pd, ritorna (wall_s, render_wall_ms o None, picco RSS in MB, stderr, exit code)."""
+    cmd = [pd, "-nogui", "-batch", "-noprefs", "-stderr"] + flags + ["-open", variant_path, "-open", wrapper_path]
+    with tempfile.TemporaryFile() as log:
+        t0 = time.perf_counter()
+        p = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=log, cwd=os.path.dirname(variant_path))
+        timer = threading.Timer(timeout, p.kill)
+        timer.start()
+        try:
+            # wait4: exit status e rusage del solo processo pd (ru_maxrss = picco RSS)
+            _, status, usage = os.wait4(p.pid, 0)
+        finally:
+            timer.cancel()
+        wall = time.perf_counter() - t0
+        p.returncode = os.waitstatus_to_exitcode(status)
+        log.seek(0)
+        err = log.read().decode("utf-8", errors="replace")
+    rss = usage.ru_maxrss / (1048576.0 if sys.platform == "darwin" else 1024.0)
+    m = RENDER_RE.search(err)
+    return wall, float(m.group(1)) if m else None, rss, err, p.returncode
+
+def bench_one(pd, flags, variant, src, records, presets, preset, table, sample, args):
+    d = os.path.dirname(src)
+    var_path = os.path.join(d, f".bench_{variant}.pd")
+    wrap_path = os.path.join(d, ".bench_wrapper.pd")
+    render_ms = args.render_sec * 1000.0
+    try:
+        pdfile.write_records(var_path, instrument(records, presets))
+        pdfile.write_records(wrap_path, wrapper(preset, table, sample, args.settle_ms, render_ms))
+        best = None
+        for _ in range(args.repeat):
+            wall, rt_ms, rss, err, code = run_pd(pd, flags, var_path, wrap_path, args.timeout)
+            res = {
+                "wall_s": round(wall, 3),
+                "render_wall_s": round(rt_ms / 1000.0, 3) if rt_ms is not None else None,
+                "x_realtime": round(render_ms / rt_ms, 2) if rt_ms else None,
+                "peak_rss_mb": round(rss, 1),
+                "missing_objects": len(MISSING_RE.findall(err)),
+                "returncode": code,
+                "ok": rt_ms is not None,
+            }
+            if args.verbose and not res["ok"]:
+                print(err[-2000:], file=sys.stderr)
+            if best is None or (res["x_realtime"] or 0) > (best["x_realtime"] or 0):
+                best = res
+        return best
+    finally:
+        for p in (var_path, wrap_path):
+            if os.path.exists(p):
+                os.remove(p)
+
+def compare(results, baseline, tol):
+    """Aggiunge 'baseline' e 'regression' ai risultati, ritorna il numero di regressioni."""
+    ref = {r["key"]: r for r in baseline.get("results", [])}
+    n = 0
+    for r in results:
+        b = ref.get(r["key"])
+        if not b or not r["ok"] or not b.get("ok"):
+            continue
+        reasons = []
+        if b.get("x_realtime") and r["x_realtime"] < b["x_realtime"] * (1.0 - tol):
+            reasons.append(f"throughput {b['x_realtime']}x -> {r['x_realtime']}x")
+        if b.get("peak_rss_mb") and r.get("peak_rss_mb") and r["peak_rss_mb"] > b["peak_rss_mb"] * (1.0 + tol):
+            reasons.append(f"rss {b['peak_rss_mb']} MB -> {r['peak_rss_mb']} MB")
+        r["baseline"] = {k: b.get(k) for k in ("x_realtime", "peak_rss_mb")}
+        if reasons:
+            r["regression"] = reasons
+            n += 1
+    return n
+
+def pd_version(pd):
+    try:
+        p = subprocess.run([pd, "-version"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=10)
+        return p.stdout.decode("utf-8", errors="replace").strip().splitlines()[0]
+    except (OSError, subprocess.TimeoutExpired, IndexError):
+        return None
+
+def main():
+    ap = argparse.ArgumentParser(description="Headless Pd benchmark of Envion patch variants.")
+    ap.add_argument("--variants", nargs="+", default=list(VARIANTS), choices=list(VARIANTS), help="varianti da misurare")
+    ap.add_argument("--presets", nargs="+", default=["plugmain"], help="preset (nomi dei subpatch) o 'all'")
+    ap.add_argument("--tables", nargs="+", default=["data/default.txt"], help="tabelle di terne (default: data/default.txt)")
+    ap.add_argument("--sample", type=str, default="audio/klick.wav", help="sample locale (default: audio/klick.wav)")
+    ap.add_argument("--render-sec", type=float, default=60.0, help="secondi di audio da calcolare (default: 60)")
+    ap.add_argument("--settle-ms", type=float, default=500.0, help="attesa logica dopo il preset (default: 500)")
+    ap.add_argument("--repeat", type=int, default=1, help="ripetizioni, tiene la migliore (default: 1)")
+    ap.add_argument("--timeout", type=float, default=600.0, help="timeout per run in secondi (default: 600)")
+    ap.add_argument("--pd", type=str, default=None, help="eseguibile pd (default: dal PATH)")
+    ap.add_argument("--pd-flag", action="append", default=[], help="flag extra per pd (ripetibile, es. --pd-flag=-path)")
+    ap.add_argument("--report", type=str, default=DEFAULT_REPORT, help=f"report JSON (default: {DEFAULT_REPORT})")
+    ap.add_argument("--baseline", type=str, default=DEFAULT_BASELINE, help="baseline JSON per il confronto")
+    ap.add_argument("--save-baseline", action="store_true", help="scrive i risultati come nuovo baseline")
+    ap.add_argument("--tolerance", type=float, default=0.10, help="scarto ammesso sul baseline (default: 0.10)")
+    ap.add_argument("--verbose", action="store_true", help="stampa lo stderr di pd dei run falliti")
+    args = ap.parse_args()
+
+    pd = args.pd or shutil.which("pd")
+    if not pd:
+        print("[ERROR] pd non trovato nel PATH (serve Pd vanilla >= 0.54 per -batch).", file=sys.stderr)
+        sys.exit(2)
+    sample = os.path.abspath(args.sample)
+    if not os.path.isfile(sample):
+        print(f"[ERROR] sample non trovato: {args.sample}", file=sys.stderr)
+        sys.exit(2)
+    tables = [os.path.abspath(t) for t in args.tables]
+    for t in tables:
+        if not os.path.isfile(t):
+            print(f"[ERROR] tabella non trovata: {t}", file=sys.stderr)
+            sys.exit(2)
+
+    results = []
+    for variant in args.variants:
+        src = os.path.join(ROOT, VARIANTS[variant])
+        records = pdfile.read_records(src)
+        presets = find_presets(records)
+        wanted = list(presets) if args.presets == ["all"] else args.presets
+        for preset in wanted:
+            if preset not in presets:
+                print(f"[SKIP] {variant}: preset '{preset}' assente", file=sys.stderr)
+                continue
+            for table in tables:
+                key = f"{variant}|{preset}|{os.path.basename(table)}"
+                res = bench_one(pd, args.pd_flag, variant, src, records, presets, preset, table, sample, args)
+                res.update({"key": key, "variant": variant, "preset": preset, "table": os.path.relpath(table, ROOT)})
+                results.append(res)
+                if res["ok"]:
+                    print(f"[OK] {key}: {res['x_realtime']}x realtime, {res['peak_rss_mb']} MB, "
+                          f"{res['missing_objects']} oggetti mancanti")
+                else:
+                    print(f"[FAIL] {key}: nessuna misura (exit {res['returncode']})", file=sys.stderr)
+
+    regressions = 0
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "pd": pd_version(pd),
+        "host": platform.platform(),
+        "machine": platform.machine(),
+        "render_sec": args.render_sec,
+        "sample": os.path.relpath(sample, ROOT),
+        "results": results,
+        "regressions": regressions,
+    }
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"[OK] report -> {args.report}")
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"[OK] baseline -> {args.baseline}")
+    for r in results:
+        for reason in r.get("regression", []):
+            print(f"[REGRESSION] {r['key']}: {reason}", file=sys.stderr)
+    if regressions:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
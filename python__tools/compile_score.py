@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+compile_score.py
+Compila offline una partitura per il Dynatext cloud sequencer.
+
+Nel patch tempi di trigger, slot e righe di tabella sono decisi a run time
+(metro -> random -> spigot -> del): costa CPU e non è riproducibile. Qui le
+stesse scelte vengono fatte in anticipo, vettorizzate con numpy, a partire
+da un seed: stesso seed + stessi parametri = stessa partitura.
+
+Modello (un passo di griglia = metro):
+  - griglia a --tempo BPM, --subdiv passi per battito
+  - ogni passo suona con probabilità --density (lo spigot)
+  - ritardo casuale 0..--jitter ms sul passo (il del)
+  - riga casuale della tabella (random N, righe vuote escluse)
+  - slot netsound casuale, tenuto per --slot-hold trigger in media
+  - stretch casuale in [--stretch-min, --stretch-max] (il $0-factor)
+
+Output: formato qlist / [text sequence], un messaggio per riga, il numero
+iniziale è l'attesa in ms dal messaggio precedente:
+
+  0 envion-slot 3;
+  0 envion-stretch 1.24;
+  0 envion-row 417;
+  250 envion-row 12;
+  ...
+
+Con --urls lo slot viene scritto come "envion-load download <url>;" (stessa
+forma che il patch manda a else/sfload), così il player non deve nemmeno
+fare text get su lista-netsound.
+
+Il player è envion-score.pd (nella radice, già istanziato nelle tre
+varianti): [qlist] con i receive envion-*; riga e stretch escono dai suoi
+outlet verso il cursore list-pos (-> round -> text get lista-sample) e
+[s $0-factor], slot e download vanno a lista-netsound e a else/sfload
+samplebufL/R come nel subpatch net. Nel patch: "read <file>, bang" al suo
+inlet (percorso relativo alla radice del repo). Con un --prefix diverso da
+envion- i receive di envion-score.pd vanno cambiati a mano.
+
+Uso:
+  python3 python__tools/compile_score.py --table data/perc.txt --seed 7 --minutes 60 -o score.txt
+  python3 python__tools/compile_score.py --table data/drone.txt --tempo 40 --density 0.3 \\
+      --slots netsound/bbc_wood_20251006_135443.txt --urls -o wood.txt
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import terne
+
+SLOTS = 8
+
+def read_slots(path, n):
+    """Lista netsound (un URL per riga con ';') -> primi n URL."""
+    urls = []
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        for line in f:
+            u = line.strip().rstrip(";").strip()
+            if u:
+                urls.append(u)
+    return urls[:n]
+
+def compile_events(rng, n_rows, n_slots, duration_ms, tempo, subdiv, density, jitter,
+                   slot_hold, stretch_min, stretch_max):
+    """
+    Eventi della partitura come array numpy (tempo_ms, riga, slot, stretch),
+    ordinati per tempo. n_rows: indici di riga validi (array).
+    """
+    np = terne.np
+    step = 60000.0 / (tempo * subdiv)
+    n = int(duration_ms // step)
+    t = np.arange(n) * step
+    keep = rng.random(n) < density
+    t = t[keep]
+    if jitter > 0:
+        t = t + rng.random(len(t)) * jitter
+        t.sort()
+    m = len(t)
+    rows = n_rows[rng.integers(0, len(n_rows), m)]
+    # slot: cambia con probabilità 1/slot_hold a ogni trigger
+    change = rng.random(m) < (1.0 / max(1.0, slot_hold))
+    if m:
+        change[0] = True
+    seg = np.cumsum(change) - 1
+    slots = rng.integers(0, n_slots, int(seg[-1]) + 1 if m else 0)[seg]
+    stretch = stretch_min + (stretch_max - stretch_min) * rng.random(m)
+    return t, rows, slots, stretch
+
+def _num(v):
+    s = f"{v:.3f}".rstrip("0").rstrip(".")
+    return s or "0"
+
+def format_qlist(t, rows, slots, stretch, prefix, urls=None, fixed_stretch=False):
+    """Eventi -> righe qlist (attese relative, ms)."""
+    t = [round(v, 3) for v in t.tolist()]
+    rows, slots, stretch = rows.tolist(), slots.tolist(), stretch.tolist()
+    out = []
+    prev_t = 0.0
+    prev_slot = None
+    for i in range(len(t)):
+        wait = _num(t[i] - prev_t)
+        prev_t = t[i]
+        if slots[i] != prev_slot:
+            if urls:
+                out.append(f"{wait} {prefix}load download {urls[slots[i]]};")
+            else:
+                out.append(f"{wait} {prefix}slot {slots[i]};")
+            wait = "0"
+            prev_slot = slots[i]
+        if not fixed_stretch or i == 0:
+            out.append(f"{wait} {prefix}stretch {_num(stretch[i])};")
+            wait = "0"
+        out.append(f"{wait} {prefix}row {rows[i]};")
+    return out
+
+def main():
+    ap = argparse.ArgumentParser(description="Compile a reproducible Envion score (Pd qlist format).")
+    ap.add_argument("--table", type=str, required=True, help="tabella di terne (data/*.txt)")
+    ap.add_argument("--seed", type=int, default=0, help="seed (default: 0)")
+    ap.add_argument("--minutes", type=float, default=10.0, help="durata del brano in minuti (default: 10)")
+    ap.add_argument("--tempo", type=float, default=60.0, help="BPM della griglia (default: 60 = metro 1000)")
+    ap.add_argument("--subdiv", type=int, default=1, help="passi per battito (default: 1)")
+    ap.add_argument("--density", type=float, default=1.0, help="probabilità che un passo suoni, 0..1 (default: 1)")
+    ap.add_argument("--jitter", type=float, default=0.0, help="ritardo casuale massimo in ms (default: 0)")
+    ap.add_argument("--slots", type=str, default=None, help="lista netsound da cui prendere gli slot")
+    ap.add_argument("--nslots", type=int, default=SLOTS, help=f"numero di slot (default: {SLOTS})")
+    ap.add_argument("--slot-hold", type=float, default=8.0, help="trigger medi per slot prima di cambiare (default: 8)")
+    ap.add_argument("--urls", action="store_true", help="scrive 'download <url>' al posto dell'indice di slot")
+    ap.add_argument("--stretch-min", type=float, default=1.0, help="stretch minimo (default: 1)")
+    ap.add_argument("--stretch-max", type=float, default=1.0, help="stretch massimo (default: 1)")
+    ap.add_argument("--prefix", type=str, default="envion-", help="prefisso dei receive di envion-score.pd (default: envion-)")
+    ap.add_argument("-o", "--out", type=str, default=None, help="file di output (default: stdout)")
+    args = ap.parse_args()
+
+    if terne.np is None:
+        print("[ERROR] serve numpy.", file=sys.stderr)
+        sys.exit(2)
+    if args.tempo <= 0 or args.subdiv <= 0 or not 0.0 <= args.density <= 1.0:
+        print("[ERROR] --tempo/--subdiv devono essere > 0, --density in 0..1.", file=sys.stderr)
+        sys.exit(2)
+    if args.stretch_min <= 0 or args.stretch_max < args.stretch_min:
+        print("[ERROR] serve 0 < --stretch-min <= --stretch-max.", file=sys.stderr)
+        sys.exit(2)
+
+    np = terne.np
+    t0 = time.perf_counter()
+    rows = terne.read_table(args.table)
+    valid = np.array([i for i, r in enumerate(rows) if r], dtype=np.int64)
+    if not len(valid):
+        print(f"[ERROR] Nessuna riga valida in {args.table}", file=sys.stderr)
+        sys.exit(1)
+
+    urls = None
+    n_slots = args.nslots
+    if args.slots:
+        urls = read_slots(args.slots, args.nslots)
+        if not urls:
+            print(f"[ERROR] Nessun URL in {args.slots}", file=sys.stderr)
+            sys.exit(1)
+        n_slots = len(urls)
+    if args.urls and not urls:
+        print("[ERROR] --urls richiede --slots.", file=sys.stderr)
+        sys.exit(2)
+
+    rng = np.random.default_rng(args.seed)
+    t, r, s, st = compile_events(rng, valid, n_slots, args.minutes * 60000.0, args.tempo, args.subdiv,
+                                 args.density, args.jitter, args.slot_hold, args.stretch_min, args.stretch_max)
+    lines = format_qlist(t, r, s, st, args.prefix, urls if args.urls else None,
+                         fixed_stretch=args.stretch_min == args.stretch_max)
+    text = "\n".join(lines) + ("\n" if lines else "")
+
+    if args.out:
+        d = os.path.dirname(args.out)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        sys.stdout.write(text)
+    print(f"[OK] {len(t)} trigger, {len(lines)} messaggi, {args.minutes:g} min, "
+          f"{len(valid)}/{len(rows)} righe, {n_slots} slot, seed {args.seed} "
+          f"in {time.perf_counter() - t0:.3f}s" + (f" -> {args.out}" if args.out else ""), file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
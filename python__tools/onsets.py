@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+onsets.py
+Mappe di slice precalcolate: attacchi (onset) di ogni sample, offline.
+
+Lo slicing del patch lavora sul sample caricato e i punti di taglio si
+scelgono a mano o si cercano in tempo reale. Qui un rilevatore di onset
+vettoriale gira su audio/ e sulle clip scaricate in netsound/ (un processo
+per core) e lascia accanto a ogni sample la sua mappa:
+
+  <sample>.slices.txt    per [text]: una riga per slice, "offset forza;"
+                         offset in frame dall'inizio del file, forza in [0, 1]
+  <sample>.slices.json   sha256, stat, parametri, sr e frame del sample
+
+Rilevatore: spectral flux su STFT (finestra di Hann, --fft/--hop, magnitudo
+compressa con log1p(gamma * |X|)), somma delle sole differenze positive tra
+frame consecutivi, normalizzata sul massimo del file. Soglia adattiva: media
+mobile su --window-ms più --delta; un frame è onset se supera la soglia ed è
+il massimo locale entro --window-ms / 4; due onset distano almeno
+--min-gap-ms (a parità vince il più forte). I frame sono centrati, quindi
+l'offset è frame * hop.
+
+I WAV si leggono a blocchi con numpy.memmap; gli altri formati passano da
+ffmpeg (mono, 44100 Hz: gli offset sono a quella frequenza, vedi sr nel .json).
+Come per overviews.py si ricalcola solo se il contenuto del file cambia.
+
+In Pd:  [text define slices] <- "read audio/frog.wav.slices.txt"
+        [text get slices] <- indice della slice -> "offset forza"
+
+Uso:
+  python3 python__tools/onsets.py                            # audio/ e netsound/atoms/
+  python3 python__tools/onsets.py audio/frog.wav --delta 0.04 -v
+  python3 python__tools/onsets.py ~/samples --jobs 8 --min-gap-ms 80
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import samplefiles
+from samplefiles import DEFAULT_ROOTS, np
+from envion_audio import AudioError, to_mono
+
+SLICES_SUFFIX = ".slices.txt"
+MANIFEST_SUFFIX = ".slices.json"
+VERSION = 1
+CHUNK_FRAMES = 2048   # frame STFT calcolati per volta
+
+# ---------------------------------------------------------------- calcolo
+
+def read_padded(src, start, n):
+    """n campioni mono da 'start' (anche negativo o oltre la fine: zeri)."""
+    out = np.zeros(n, dtype=np.float32)
+    a, b = max(0, start), min(src.frames, start + n)
+    if b > a:
+        out[a - start:b - start] = to_mono(src.read(a, b - a))
+    return out
+
+def spectral_flux(src, n_fft, hop, gamma):
+    """Flux positivo per frame (centrati: il frame t copre t*hop +- n_fft/2)."""
+    n_frames = 1 + src.frames // hop
+    win = np.hanning(n_fft).astype(np.float32)
+    prev = np.zeros(n_fft // 2 + 1, dtype=np.float32)
+    out = []
+    for f0 in range(0, n_frames, CHUNK_FRAMES):
+        f1 = min(n_frames, f0 + CHUNK_FRAMES)
+        x = read_padded(src, f0 * hop - n_fft // 2, (f1 - f0 - 1) * hop + n_fft)
+        frames = np.lib.stride_tricks.sliding_window_view(x, n_fft)[::hop]
+        mag = np.log1p(gamma * np.abs(np.fft.rfft(frames * win, axis=1))).astype(np.float32)
+        diff = np.diff(np.vstack([prev[None, :], mag]), axis=0)
+        out.append(np.maximum(diff, 0.0).sum(axis=1))
+        prev = mag[-1]
+    flux = np.concatenate(out) if out else np.zeros(0, dtype=np.float32)
+    # finestre che sbordano prima dell'inizio: il passaggio dagli zeri al file
+    # non è un attacco (l'inizio del file è comunque il punto di partenza)
+    flux[:n_fft // (2 * hop) + 1] = 0.0
+    return flux
+
+def moving_mean(x, w):
+    """Media su x[t-w : t+w+1] (bordi riflessi)."""
+    p = np.pad(x.astype(np.float64), w + 1, mode="reflect" if len(x) > w + 1 else "edge")
+    c = np.cumsum(p)
+    return ((c[2 * w + 1:] - c[:-2 * w - 1]) / (2 * w + 1))[:len(x)]
+
+def moving_max(x, w):
+    p = np.pad(x, w, mode="edge")
+    return np.lib.stride_tricks.sliding_window_view(p, 2 * w + 1).max(axis=1)
+
+def pick_onsets(flux, avg_frames, max_frames, delta, gap_frames):
+    """Frame degli onset e loro forza (flux normalizzato)."""
+    if len(flux) == 0 or flux.max() <= 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    f = flux / flux.max()
+    thr = moving_mean(f, avg_frames) + delta
+    cand = np.flatnonzero((f >= thr) & (f >= moving_max(f, max_frames)) & (f > 0))
+    # distanza minima: dal più forte al più debole, scarta chi cade vicino a uno già preso
+    taken = []
+    for i in cand[np.argsort(-f[cand], kind="stable")]:
+        if all(abs(i - j) >= gap_frames for j in taken):
+            taken.append(i)
+    idx = np.sort(np.array(taken, dtype=np.int64))
+    return idx, f[idx].astype(np.float32)
+
+def detect(src, params):
+    """Sample -> (offset in frame, forza) degli onset."""
+    hop = params["hop"]
+    ms = src.rate / 1000.0 / hop   # frame STFT per millisecondo
+    flux = spectral_flux(src, params["fft"], hop, params["gamma"])
+    frames, strength = pick_onsets(flux,
+                                   avg_frames=max(1, int(round(params["window_ms"] * ms / 2))),
+                                   max_frames=max(1, int(round(params["window_ms"] * ms / 8))),
+                                   delta=params["delta"],
+                                   gap_frames=max(1, int(round(params["min_gap_ms"] * ms))))
+    offsets = np.minimum(frames * hop, max(0, src.frames - 1))
+    return offsets, strength
+
+# ---------------------------------------------------------------- file
+
+def params_of(args):
+    return {"version": VERSION, "fft": args.fft, "hop": args.hop, "gamma": args.gamma,
+            "window_ms": args.window_ms, "delta": args.delta, "min_gap_ms": args.min_gap_ms}
+
+def write_slices(path, offsets, strength):
+    tmp = path + ".part"
+    with open(tmp, "w", encoding="utf-8") as f:
+        for off, s in zip(offsets, strength):
+            f.write(f"{int(off)} {float(s):.3f};\n")
+    os.replace(tmp, path)
+
+def process(path, params, force=False):
+    """Lavoro di un processo del pool: ritorna (path, stato, dettaglio)."""
+    try:
+        man_path = path + MANIFEST_SUFFIX
+        man = samplefiles.read_json(man_path)
+        state, digest, stamp = samplefiles.freshness(path, man, params, force)
+        if state == "same":
+            samplefiles.write_json(man_path, dict(man, stat=stamp))
+        if state != "stale":
+            return path, state, ""
+        t0 = time.perf_counter()
+        src = samplefiles.open_source(path)
+        offsets, strength = detect(src, params)
+        write_slices(path + SLICES_SUFFIX, offsets, strength)
+        samplefiles.write_json(man_path, {"sha256": digest, "stat": stamp, "params": params,
+                                          "source": os.path.basename(path), "sr": src.rate,
+                                          "frames": src.frames, "slices": len(offsets)})
+        return path, "built", f"{len(offsets)} slice, {time.perf_counter() - t0:.2f}s"
+    except (AudioError, OSError, ValueError) as e:
+        return path, "error", str(e)
+
+# ---------------------------------------------------------------- main
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Precompute onset slice maps (spectral flux) for every sample.")
+    ap.add_argument("paths", nargs="*", help="file o cartelle (default: audio/ e netsound/atoms/)")
+    ap.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="processi in parallelo (default: CPU)")
+    ap.add_argument("--force", action="store_true", help="ricalcola anche i file invariati")
+    ap.add_argument("--fft", type=int, default=1024, help="finestra STFT in campioni (default: 1024)")
+    ap.add_argument("--hop", type=int, default=256, help="passo STFT in campioni (default: 256)")
+    ap.add_argument("--gamma", type=float, default=100.0, help="compressione log1p(gamma*|X|) (default: 100)")
+    ap.add_argument("--window-ms", type=float, default=150.0, help="finestra della soglia adattiva (default: 150)")
+    ap.add_argument("--delta", type=float, default=0.06, help="soglia sopra la media mobile, flux in 0..1 (default: 0.06)")
+    ap.add_argument("--min-gap-ms", type=float, default=50.0, help="distanza minima tra slice (default: 50)")
+    ap.add_argument("-v", "--verbose", action="store_true")
+    args = ap.parse_args(argv)
+
+    if np is None:
+        print("[onsets] serve numpy", file=sys.stderr)
+        sys.exit(2)
+    if args.fft < 16 or not 0 < args.hop <= args.fft:
+        ap.error("--fft >= 16, 0 < --hop <= --fft")
+
+    with_ffmpeg = shutil.which("ffmpeg") is not None
+    files = samplefiles.find_samples(args.paths or [p for p in DEFAULT_ROOTS if os.path.isdir(p)],
+                                     with_ffmpeg, skip_dirs=[".ov"])   # cartelle di overviews.py
+    if not files:
+        print("[onsets] nessun sample trovato", file=sys.stderr)
+        return
+    params = params_of(args)
+    counts = {}
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        futs = [pool.submit(process, p, params, args.force) for p in files]
+        for fut in as_completed(futs):
+            path, state, detail = fut.result()
+            counts[state] = counts.get(state, 0) + 1
+            if state == "error" or (args.verbose and state == "built"):
+                print(f"[onsets] {state:5s} {os.path.relpath(path)} {detail}".rstrip(), file=sys.stderr)
+    summary = ", ".join(f"{k} {v}" for k, v in sorted(counts.items()))
+    print(f"[onsets] {len(files)} sample in {time.perf_counter() - t0:.1f}s: {summary}", file=sys.stderr)
+    if not with_ffmpeg:
+        print("[onsets] ffmpeg non trovato: solo WAV", file=sys.stderr)
+    if counts.get("error"):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
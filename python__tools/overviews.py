@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+overviews.py
+Panoramiche precalcolate dei sample: piramide di picchi min/max e
+spettrogramma grossolano, in file che Pd carica direttamente negli array.
+
+Il patch disegna la forma d'onda (e lo scope 3D) leggendo tutto il sample al
+caricamento: con i file lunghi di audio/ e delle clip in netsound/ si vede.
+Qui il lavoro si fa una volta sola, offline, in un pool di processi:
+- i campioni del chunk 'data' dei WAV sono letti con numpy.memmap, a blocchi
+  (la piramide) o a finestre sparse (lo spettrogramma): niente copia
+  dell'intero file in memoria
+- gli altri formati (mp3/ogg/flac/aiff) passano da ffmpeg, se c'è
+
+Per ogni sample una cartella accanto al file, <sample>.ov/:
+  peaks_<L>.wav   float32 stereo: canale 1 = minimo, canale 2 = massimo di
+                  ogni blocco (tutti i canali del sample insieme); il livello
+                  L ha blocchi di base * factor^L frame
+  spec.wav        float32 mono: frames x bands valori in [0, 1] (dB
+                  normalizzati sul massimo del file), riga per riga, bande
+                  a spaziatura logaritmica
+  info.txt        per [text]: "sample <sr> <frame> <canali>;",
+                  "peaks <L> <blocco> <punti> peaks_<L>.wav;",
+                  "spec <frames> <bands> <fft> <lo> <hi> spec.wav;"
+  manifest.json   sha256 del sample, stat e parametri usati
+
+Si ricalcola solo se il contenuto cambia: se dimensione e mtime coincidono
+col manifest il file non viene nemmeno letto, altrimenti si rifà lo sha256 e
+si ricalcola solo se è diverso (o se sono cambiati i parametri).
+
+In Pd:  [soundfiler] <- "read -resize audio/frog.wav.ov/peaks_2.wav ovmin ovmax"
+        [soundfiler] <- "read -resize audio/frog.wav.ov/spec.wav ovspec"
+
+Uso:
+  python3 python__tools/overviews.py                         # audio/ e netsound/atoms/
+  python3 python__tools/overviews.py audio/frog.wav --force
+  python3 python__tools/overviews.py ~/samples --jobs 4 --spec-frames 512 --spec-bands 96
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import samplefiles
+from samplefiles import DEFAULT_ROOTS, np, write_float_wav
+from envion_audio import AudioError, to_mono
+
+SIDECAR_SUFFIX = ".ov"
+VERSION = 1
+CHUNK_BLOCKS = 4096   # blocchi di livello 0 letti per volta dal memmap
+
+# ---------------------------------------------------------------- calcolo
+
+def _reduce(lo, hi, factor):
+    """Min/max di blocchi di 'factor' punti (l'ultimo blocco può essere corto)."""
+    n = -(-len(lo) // factor)
+    pad = n * factor - len(lo)
+    if pad:
+        lo = np.concatenate([lo, np.repeat(lo[-1:], pad)])
+        hi = np.concatenate([hi, np.repeat(hi[-1:], pad)])
+    return lo.reshape(n, factor).min(axis=1), hi.reshape(n, factor).max(axis=1)
+
+def peak_pyramid(src, base, factor, min_points):
+    """Lista di (blocco, min, max) dal livello più fine al più grossolano."""
+    if src.frames == 0:
+        return []
+    los, his = [], []
+    step = base * CHUNK_BLOCKS
+    for start in range(0, src.frames, step):
+        x = src.read(start, step)
+        lo, hi = _reduce(x.min(axis=1), x.max(axis=1), base)
+        los.append(lo)
+        his.append(hi)
+    lo, hi = np.concatenate(los), np.concatenate(his)
+    levels, block = [(base, lo, hi)], base
+    while len(lo) > min_points:
+        lo, hi = _reduce(lo, hi, factor)
+        block *= factor
+        levels.append((block, lo, hi))
+    return levels
+
+def band_edges(n_fft, rate, bands, lo_hz, hi_hz):
+    """Bin FFT di inizio/fine di 'bands' bande logaritmiche, almeno un bin ciascuna."""
+    nyq = rate / 2.0
+    hi_hz = min(hi_hz, nyq)
+    lo_hz = min(lo_hz, hi_hz / 2.0)
+    hz = np.geomspace(lo_hz, hi_hz, bands + 1)
+    edges = np.round(hz / nyq * (n_fft // 2)).astype(int)
+    edges = np.clip(edges, 1, n_fft // 2)
+    for i in range(1, len(edges)):
+        edges[i] = max(edges[i], edges[i - 1] + 1)
+    return edges, lo_hz, hi_hz
+
+def spectrogram(src, frames, bands, n_fft, lo_hz, hi_hz, db_range):
+    """Spettrogramma (frames x bands) in [0, 1] da finestre sparse sul file."""
+    if src.frames == 0:
+        return np.zeros((0, bands), dtype=np.float32), lo_hz, hi_hz
+    frames = max(1, min(frames, src.frames // max(1, n_fft // 4)))
+    pos = np.linspace(0, max(0, src.frames - n_fft), frames).astype(np.int64)
+    win = np.hanning(n_fft).astype(np.float32)
+    block = np.zeros((frames, n_fft), dtype=np.float32)
+    for i, p in enumerate(pos):
+        x = to_mono(src.read(int(p), n_fft))
+        block[i, :len(x)] = x
+    power = np.abs(np.fft.rfft(block * win, axis=1)) ** 2
+    edges, lo_hz, hi_hz = band_edges(n_fft, src.rate, bands, lo_hz, hi_hz)
+    edges = np.minimum(edges, power.shape[1] - 1)
+    csum = np.concatenate([np.zeros((frames, 1)), np.cumsum(power, axis=1)], axis=1)
+    counts = np.maximum(edges[1:] - edges[:-1], 1)
+    energy = (csum[:, edges[1:]] - csum[:, edges[:-1]]) / counts
+    db = 10.0 * np.log10(energy + 1e-12)
+    top = db.max()
+    out = np.clip((db - (top - db_range)) / db_range, 0.0, 1.0)
+    return out.astype(np.float32), lo_hz, hi_hz
+
+# ---------------------------------------------------------------- file
+
+def sidecar_dir(path):
+    return path + SIDECAR_SUFFIX
+
+def manifest_path(path):
+    return os.path.join(sidecar_dir(path), "manifest.json")
+
+def params_of(args):
+    return {"version": VERSION, "base": args.base, "factor": args.factor, "min_points": args.min_points,
+            "spec_frames": args.spec_frames, "spec_bands": args.spec_bands, "fft": args.fft,
+            "lo": args.lo, "hi": args.hi, "range": args.spec_range}
+
+def build(path, params):
+    """Calcola e scrive i sidecar di un sample; ritorna le righe di info.txt."""
+    src = samplefiles.open_source(path)
+    out = sidecar_dir(path)
+    os.makedirs(out, exist_ok=True)
+    for name in os.listdir(out):   # livelli di un calcolo precedente con altri parametri
+        if name.startswith("peaks_") and name.endswith(".wav"):
+            os.remove(os.path.join(out, name))
+    info = [f"sample {src.rate} {src.frames} {src.channels}"]
+    levels = peak_pyramid(src, params["base"], params["factor"], params["min_points"])
+    for i, (block, lo, hi) in enumerate(levels):
+        name = f"peaks_{i}.wav"
+        write_float_wav(os.path.join(out, name), np.stack([lo, hi], axis=1), src.rate)
+        info.append(f"peaks {i} {block} {len(lo)} {name}")
+    spec, lo_hz, hi_hz = spectrogram(src, params["spec_frames"], params["spec_bands"], params["fft"],
+                                     params["lo"], params["hi"], params["range"])
+    write_float_wav(os.path.join(out, "spec.wav"), spec.reshape(-1), src.rate)
+    info.append(f"spec {spec.shape[0]} {spec.shape[1]} {params['fft']} {lo_hz:g} {hi_hz:g} spec.wav")
+    with open(os.path.join(out, "info.txt"), "w", encoding="utf-8") as f:
+        f.write("".join(line + ";\n" for line in info))
+    return info
+
+def process(path, params, force=False):
+    """Lavoro di un processo del pool: ritorna (path, stato, dettaglio)."""
+    try:
+        man = samplefiles.read_json(manifest_path(path))
+        state, digest, stamp = samplefiles.freshness(path, man, params, force)
+        if state == "same":
+            samplefiles.write_json(manifest_path(path), dict(man, stat=stamp))
+        if state != "stale":
+            return path, state, ""
+        t0 = time.perf_counter()
+        info = build(path, params)
+        samplefiles.write_json(manifest_path(path), {"sha256": digest, "stat": stamp, "params": params,
+                                                     "source": os.path.basename(path), "info": info})
+        return path, "built", f"{len(info) - 2} livelli, {time.perf_counter() - t0:.2f}s"
+    except (AudioError, OSError, ValueError) as e:
+        return path, "error", str(e)
+
+# ---------------------------------------------------------------- main
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Precompute peak pyramids and coarse spectrograms for Pd display arrays.")
+    ap.add_argument("paths", nargs="*", help="file o cartelle (default: audio/ e netsound/atoms/)")
+    ap.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="processi in parallelo (default: CPU)")
+    ap.add_argument("--force", action="store_true", help="ricalcola anche i file invariati")
+    ap.add_argument("--base", type=int, default=64, help="frame per punto al livello 0 (default: 64)")
+    ap.add_argument("--factor", type=int, default=4, help="fattore tra livelli successivi (default: 4)")
+    ap.add_argument("--min-points", type=int, default=512,
+                    help="si aggiungono livelli finché ce ne sono più di così (default: 512)")
+    ap.add_argument("--spec-frames", type=int, default=256, help="colonne dello spettrogramma (default: 256)")
+    ap.add_argument("--spec-bands", type=int, default=64, help="bande logaritmiche (default: 64)")
+    ap.add_argument("--fft", type=int, default=2048, help="finestra FFT in campioni (default: 2048)")
+    ap.add_argument("--lo", type=float, default=40.0, help="banda più bassa in Hz (default: 40)")
+    ap.add_argument("--hi", type=float, default=20000.0, help="banda più alta in Hz (default: 20000, max Nyquist)")
+    ap.add_argument("--spec-range", type=float, default=80.0, help="dinamica in dB mappata su 0..1 (default: 80)")
+    ap.add_argument("-v", "--verbose", action="store_true")
+    args = ap.parse_args(argv)
+
+    if np is None:
+        print("[overviews] serve numpy", file=sys.stderr)
+        sys.exit(2)
+    if args.base < 1 or args.factor < 2 or args.fft < 16:
+        ap.error("--base >= 1, --factor >= 2, --fft >= 16")
+
+    with_ffmpeg = shutil.which("ffmpeg") is not None
+    files = samplefiles.find_samples(args.paths or [p for p in DEFAULT_ROOTS if os.path.isdir(p)],
+                                     with_ffmpeg, skip_dirs=[SIDECAR_SUFFIX])
+    if not files:
+        print("[overviews] nessun sample trovato", file=sys.stderr)
+        return
+    params = params_of(args)
+    counts = {}
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        futs = [pool.submit(process, p, params, args.force) for p in files]
+        for fut in as_completed(futs):
+            path, state, detail = fut.result()
+            counts[state] = counts.get(state, 0) + 1
+            if state == "error" or (args.verbose and state == "built"):
+                print(f"[overviews] {state:5s} {os.path.relpath(path)} {detail}".rstrip(), file=sys.stderr)
+    summary = ", ".join(f"{k} {v}" for k, v in sorted(counts.items()))
+    print(f"[overviews] {len(files)} sample in {time.perf_counter() - t0:.1f}s: {summary}", file=sys.stderr)
+    if not with_ffmpeg:
+        print("[overviews] ffmpeg non trovato: solo WAV", file=sys.stderr)
+    if counts.get("error"):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+"""
+pdfile.py
+Lettura minima dei file .pd per gli strumenti offline (benchmark, build).
+
+Un file .pd è una sequenza di record chiusi da ';' non escapato ("#X obj ...;",
+"#N canvas ...;", "#X connect a o b i;"). Un record può andare a capo (messaggi
+lunghi, #A set ...). Gli indici usati da "#X connect" contano, dentro ogni
+canvas, gli oggetti nell'ordine del file: obj, msg, floatatom, symbolatom,
+listbox, text, scalar e i subpatch (contati al loro "#X restore").
+
+Per riscrivere un patch (perf_build) c'è anche l'albero dei canvas: parse()
+ne fa Canvas/Node con le connessioni che puntano ai Node, emit() lo riporta
+a record ricalcolando gli indici, quindi si possono togliere o aggiungere
+oggetti senza rinumerare a mano.
+"""
+
+import re
+
+_RECORD_END = re.compile(r"(?<!\\);[ \t]*(?:\r?\n|$)")
+_ATOM = re.compile(r"(?:\\.|[^\s\\])+")
+OBJECT_KINDS = ("obj", "msg", "floatatom", "symbolatom", "listbox", "text", "scalar", "restore")
+
+def split_records(text):
+    """Testo .pd -> lista di record senza il ';' finale (a capo interni conservati)."""
+    out, pos = [], 0
+    for m in _RECORD_END.finditer(text):
+        rec = text[pos:m.start()].strip()
+        if rec:
+            out.append(rec)
+        pos = m.end()
+    tail = text[pos:].strip()
+    if tail:
+        out.append(tail)
+    return out
+
+def join_records(records):
+    return "".join(r + ";\n" for r in records)
+
+def read_records(path):
+    with open(path, "r", encoding="utf-8", errors="surrogateescape") as f:
+        return split_records(f.read())
+
+def write_records(path, records):
+    with open(path, "w", encoding="utf-8", errors="surrogateescape") as f:
+        f.write(join_records(records))
+
+def kind(rec):
+    """'#X obj 10 10 metro 100' -> 'obj'; '#N canvas ...' -> '#N canvas'."""
+    parts = rec.split(None, 2)
+    if len(parts) < 2:
+        return ""
+    if parts[0] == "#X":
+        return parts[1]
+    return f"{parts[0]} {parts[1]}"
+
+def obj_text(rec):
+    """Testo dell'oggetto senza coordinate: '#X obj 10 10 metro 100' -> 'metro 100'."""
+    parts = rec.split(None, 4)
+    return parts[4] if len(parts) > 4 else ""
+
+def atoms(text):
+    """Atomi di un testo .pd: spazi escapati ('receive\\ master') restano nell'atomo."""
+    return _ATOM.findall(text)
+
+def top_level(records):
+    """
+    Oggetti del canvas principale: lista di (indice_oggetto, indice_record, testo).
+    Per i subpatch il testo è quello del restore ('pd nome') e il record è il restore.
+    """
+    out, depth, n = [], 0, 0
+    for i, rec in enumerate(records):
+        k = kind(rec)
+        if k == "#N canvas":
+            depth += 1
+            continue
+        if k == "restore":
+            depth -= 1
+        if depth == 1 and k in OBJECT_KINDS:
+            out.append((n, i, obj_text(rec)))
+            n += 1
+    return out
+
+def subpatch_body(records, restore_index):
+    """Record interni del subpatch chiuso da records[restore_index]."""
+    depth = 0
+    for j in range(restore_index, -1, -1):
+        k = kind(records[j])
+        if k == "restore":
+            depth += 1
+        elif k == "#N canvas":
+            depth -= 1
+            if depth == 0:
+                return records[j + 1:restore_index]
+    return []
+
+# --- Albero dei canvas --------------------------------------------------------
+
+class Node:
+    """Oggetto di un canvas: record ("#X obj ...", o il restore di un subpatch) e subpatch."""
+
+    def __init__(self, rec, sub=None):
+        self.rec = rec
+        self.sub = sub
+
+class Canvas:
+    """
+    head: record "#N canvas ..."; items in ordine di file: ("obj", Node),
+    ("connect", [Node, outlet, Node, inlet]) o ("rec", record) per tutto il
+    resto (coords, array, #A, declare...).
+    """
+
+    def __init__(self, head, pre=()):
+        self.head = head
+        self.pre = list(pre)   # solo nel canvas principale: "#N struct ..." prima di "#N canvas"
+        self.items = []
+
+    def nodes(self):
+        return [it[1] for it in self.items if it[0] == "obj"]
+
+    def connects(self):
+        return [it[1] for it in self.items if it[0] == "connect"]
+
+def parse(records):
+    """Record di un file .pd -> Canvas principale (None se non c'è nessun #N canvas)."""
+    start = next((j for j, rec in enumerate(records) if kind(rec) == "#N canvas"), None)
+    if start is None:
+        return None
+    root = Canvas(records[start], records[:start])
+    stack = [root]
+    for rec in records[start + 1:]:
+        k = kind(rec)
+        cur = stack[-1]
+        if k == "#N canvas":
+            stack.append(Canvas(rec))
+        elif k == "restore" and len(stack) > 1:
+            sub = stack.pop()
+            stack[-1].items.append(("obj", Node(rec, sub)))
+        elif k in OBJECT_KINDS:
+            cur.items.append(("obj", Node(rec)))
+        elif k == "connect":
+            nodes = cur.nodes()
+            try:
+                a, o, b, i = (int(x) for x in rec.split()[2:6])
+                cur.items.append(("connect", [nodes[a], o, nodes[b], i]))
+            except (ValueError, IndexError):
+                cur.items.append(("rec", rec))   # connessione rotta: resta com'è
+        else:
+            cur.items.append(("rec", rec))
+    return root
+
+def emit(canvas):
+    """Canvas -> record, con gli indici di "#X connect" ricalcolati."""
+    out = canvas.pre + [canvas.head]
+    index = {id(n): i for i, n in enumerate(canvas.nodes())}
+    for what, x in canvas.items:
+        if what == "obj":
+            if x.sub is not None:
+                out.extend(emit(x.sub))
+            out.append(x.rec)
+        elif what == "connect":
+            a, o, b, i = x
+            out.append(f"#X connect {index[id(a)]} {o} {index[id(b)]} {i}")
+        else:
+            out.append(x)
+    return out
@@ -0,0 +1,891 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+perf_build.py
+"Performance build" headless di una variante del patch: stesso comportamento,
+meno oggetti da disegnare e da attraversare (iPad).
+
+Trasformazioni, sul testo .pd (albero di pdfile):
+  1. GUI -> la logica che serve davvero, nel canvas stesso (niente subpatch).
+     Per ogni GUI si ricavano dal grafo i selettori che le possono arrivare:
+     fili (attraverso t, sel, spigot, inlet/outlet dei subpatch), [s] e
+     message box "; nome ..." verso il suo receive. Se non si riesce
+     (inlet di astrazioni, oggetti sconosciuti, nomi raggiungibili da fuori,
+     messaggi di aspetto come color o label) la GUI resta com'è. Altrimenti:
+       - float: [clip lo hi] per slider e nbx, [i] [clip 0 n-1] per i radio,
+         niente per toggle e floatatom (il range di un gatom limita solo
+         mouse e tastiera: un float che arriva all'inlet passa così com'è)
+       - bang: lo stato in un [f] prima della conversione; il toggle usa
+         [f] [== 0] [* nonzero] [t f f], che riscrive lo stato prima di uscire
+       - set: [route set] verso l'inlet destro dello stato (o nel vuoto, se
+         nessun bang lo rilegge)
+       - bng: [t b], o niente se arrivano solo bang
+     receive e send diventano [r]/[s] accanto; il filo verso l'[s] è
+     l'ultimo dell'outlet, come nella GUI (prima l'outlet, poi il send).
+     Init = [loadbang] -> [valore( nello stesso punto dell'ordine di
+     caricamento. Una GUI senza uscite è solo un display: resta un
+     [r <receive>] nudo, o niente; una che solo il mouse può azionare sparisce.
+  2. cnv e commenti via (un cnv con receive lascia un [r] nudo, così chi gli
+     manda label/color non trova "no such object").
+  3. Catene pass-through: [t a] a una uscita (anche quelli lasciati dal passo
+     1) sparisce e chi ci entrava si collega direttamente alle sue
+     destinazioni; coppie [s N]/[r N] con N locale ($0-... usato solo da s/r
+     statici) tutte nello stesso canvas diventano fili. Le connessioni nuove
+     prendono il posto di quella vecchia nell'ordine di file, quindi l'ordine
+     di uscita (fan-out) non cambia; i ricevitori di uno stesso nome scattano
+     in ordine inverso di creazione, come in Pd. Se una sostituzione
+     creerebbe un filo doppio si lascia stare.
+
+Verifica di equivalenza (sempre dopo la build, o --check ORIG BUILD):
+l'originale passa dai passi 1 e 2 (lo stesso codice: la forma di ogni GUI
+segue i sorgenti di Pd caso per caso e qui non si riverifica), poi dei due
+patch si estrae il grafo dei messaggi attraversando i nodi pass-through (t a,
+s/r statici); per ogni oggetto rimasto, in ordine, testo identico e per ogni
+outlet la stessa lista ordinata di destinazioni (oggetto, inlet); per ogni
+nome raggiungibile da fuori (non $0, o usato in messaggi e argomenti) gli
+stessi ricevitori. Controlla quindi il passo 3, che è quello che riscrive i
+fili. Non fa girare Pd: tempi e CPU si misurano con bench_patches.py.
+
+Il patch generato va accanto all'originale (<nome>_perf.pd), così data/,
+audio/ e le astrazioni restano relativi.
+
+Uso:
+  python3 python__tools/perf_build.py                        # le 3 varianti
+  python3 python__tools/perf_build.py "___ Envion_v4.5_Plugdata.pd" -o /tmp/envion_perf.pd -v
+  python3 python__tools/perf_build.py --check "___ Envion_v4.5_Plugdata.pd" "___ Envion_v4.5_Plugdata_perf.pd"
+"""
+
+import argparse
+import math
+import os
+import re
+import sys
+from collections import defaultdict
+
+import pdfile
+from bench_patches import ROOT, VARIANTS
+from pdfile import Node
+
+GUI_KINDS = ("bng", "tgl", "hsl", "vsl", "hradio", "vradio", "nbx")
+ATOM_KINDS = ("floatatom", "symbolatom", "listbox")
+_WIDTH = re.compile(r",\s*f\s+\d+\s*$")
+_NUMBER = re.compile(r"[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$")
+_DOLLAR = re.compile(r"\\\$\d+")
+
+# uscite note, per il calcolo dei selettori (Flow)
+BANG_OUT = ("bang", "b", "loadbang", "metro", "del", "delay")
+FLOAT_OUT = ("+", "-", "*", "/", "max", "min", "==", "!=", ">", "<", ">=", "<=", "&&", "||", "&", "|",
+             "<<", ">>", "%", "mod", "div", "pow", "sqrt", "abs", "exp", "log", "wrap", "atan", "atan2",
+             "sin", "cos", "tan", "mtof", "ftom", "dbtorms", "rmstodb", "powtodb", "dbtopow", "clip",
+             "random", "i", "int", "f", "float", "line", "change", "moses", "swap", "v", "value",
+             "timer", "realtime", "cputime", "tabread", "tabread4", "key", "keyup",
+             "notein", "ctlin", "bendin", "pgmin")
+TRIGGER_OUT = {"b": "bang", "f": "float", "s": "symbol", "l": "list"}
+# oggetti che usano $0 come valore (non come nome da raggiungere dall'interno)
+DOLLAR0_VALUE = ("f", "float", "pack", "symbol", "list", "makefilename")
+
+# ---------------------------------------------------------------- classificazione
+
+def atoms_of(node):
+    """Atomi dell'oggetto senza coordinate né larghezza (', f 40')."""
+    return pdfile.atoms(_WIDTH.sub("", pdfile.obj_text(node.rec)))
+
+def _name(a):
+    """Nome di send/receive di una GUI: 'empty' e '-' = nessuno; #0 dei file vecchi = $0."""
+    if a in ("empty", "-"):
+        return ""
+    return re.sub(r"#(\d)", r"\\$\1", a)
+
+def _num(a, default=0.0):
+    try:
+        return float(a)
+    except (TypeError, ValueError):
+        return default
+
+def gui_info(node):
+    """GUI sostituibile -> dict (kind, snd, rcv, init, stato...), altrimenti None."""
+    k = pdfile.kind(node.rec)
+    if k in ATOM_KINDS:
+        a = pdfile.atoms(pdfile.obj_text(node.rec))
+        if len(a) < 7:
+            return None
+        g = {"kind": k, "rcv": _name(a[5]), "snd": _name(a[6]), "init": False,
+             "lo": _num(a[1]), "hi": _num(a[2])}
+    elif k == "obj" and node.sub is None:
+        a = atoms_of(node)
+        if not a or a[0] not in GUI_KINDS:
+            return None
+        kind, a = a[0], a[1:]
+        try:
+            if kind == "bng":
+                g = {"init": a[3] != "0", "snd": _name(a[4]), "rcv": _name(a[5])}
+            elif kind == "tgl":
+                init = a[1] != "0"
+                g = {"init": init, "snd": _name(a[2]), "rcv": _name(a[3]),
+                     "value": _num(a[12]) if init and len(a) > 12 else 0.0,
+                     "nonzero": _num(a[13], 1.0) if len(a) > 13 else 1.0}
+            elif kind in ("hsl", "vsl", "nbx"):
+                init = a[5] != "0"
+                lo, hi, log = _num(a[2]), _num(a[3]), a[4] != "0"
+                g = {"init": init, "snd": _name(a[6]), "rcv": _name(a[7]), "lo": lo, "hi": hi}
+                raw = _num(a[16]) if init and len(a) > 16 else 0.0
+                if kind == "nbx":
+                    g["value"] = min(max(raw, min(lo, hi)), max(lo, hi))
+                else:
+                    # posizione salvata in centesimi di pixel sulla lunghezza del cursore
+                    span = max(1.0, _num(a[0] if kind == "hsl" else a[1]) - 1.0) * 100.0
+                    if log and lo > 0 and hi > 0:
+                        g["value"] = lo * math.exp(math.log(hi / lo) * raw / span)
+                    else:
+                        g["value"] = lo + (hi - lo) * raw / span
+            else:
+                if a[1] == "0":
+                    return None   # radio "vecchio stile": due uscite per cambio
+                init = a[2] != "0"
+                g = {"init": init, "snd": _name(a[4]), "rcv": _name(a[5]), "number": int(_num(a[3], 1)),
+                     "value": _num(a[14]) if init and len(a) > 14 else 0.0}
+        except IndexError:
+            return None
+        g["kind"] = kind
+    else:
+        return None
+    if g["snd"] and g["snd"] == g["rcv"]:
+        return None   # Pd in quel caso non rimanda l'ingresso all'uscita: si lascia la GUI
+    return g
+
+def gui_out(kind):
+    """Selettori in uscita da una GUI (None = non si sa)."""
+    if kind == "bng":
+        return {"bang"}
+    if kind == "symbolatom":
+        return {"symbol"}
+    return None if kind == "listbox" else {"float"}
+
+def cnv_receive(node):
+    """None se non è un cnv, altrimenti il suo receive ('' se non ne ha)."""
+    if pdfile.kind(node.rec) != "obj" or node.sub is not None:
+        return None
+    a = atoms_of(node)
+    if not a or a[0] not in ("cnv", "my_canvas"):
+        return None
+    return _name(a[5]) if len(a) > 5 else ""
+
+def is_passthrough(node):
+    return pdfile.kind(node.rec) == "obj" and node.sub is None \
+        and atoms_of(node) in (["t", "a"], ["t", "anything"], ["trigger", "a"], ["trigger", "anything"])
+
+def static_sr(node):
+    """('s'|'r', nome) per [s nome]/[r nome] con nome fisso, altrimenti None."""
+    if pdfile.kind(node.rec) != "obj" or node.sub is not None:
+        return None
+    a = atoms_of(node)
+    if len(a) == 2 and a[0] in ("s", "send", "r", "receive"):
+        return a[0][0], a[1]
+    return None
+
+def walk(canvas):
+    """Canvas in ordine di file, subpatch compresi."""
+    yield canvas
+    for n in canvas.nodes():
+        if n.sub is not None:
+            yield from walk(n.sub)
+
+def foreign_names(root):
+    """Atomi usati fuori da s/r statici: nomi raggiungibili in modi che qui non si vedono."""
+    out = set()
+    for c in walk(root):
+        out.update(pdfile.atoms(c.head)[2:])
+        for what, x in c.items:
+            if what == "rec":
+                out.update(pdfile.atoms(x))
+            elif what == "obj" and static_sr(x) is None:
+                out.update(pdfile.atoms(pdfile.obj_text(x.rec)))
+    return out
+
+# ---------------------------------------------------------------- selettori
+
+def msg_parts(text):
+    """
+    Testo di un message box -> [(destinatario, atomi), ...]; destinatario
+    None = outlet. None se ci sono separatori attaccati ad altro testo.
+    """
+    parts, dest, cur, want_dest = [], None, [], False
+    for x in pdfile.atoms(text) + ["\\,"]:
+        if x not in ("\\;", "\\,") and ("\\;" in x or "\\," in x):
+            return None
+        if want_dest:
+            dest, want_dest = x, False
+        elif x in ("\\;", "\\,"):
+            if cur:
+                parts.append((dest, cur))
+            cur, want_dest = [], x == "\\;"
+        else:
+            cur.append(x)
+    return parts
+
+def selector(msg):
+    """Selettore di un messaggio ({'float'}, {'set'}, ...); None se dipende da $1."""
+    first = msg[0]
+    if "\\$" in first:
+        return None
+    if _NUMBER.match(first):
+        return {"float" if len(msg) == 1 else "list"}
+    return {first}
+
+def _union(a, b):
+    return None if a is None or b is None else a | b
+
+def _ports(canvas, what):
+    """Inlet o outlet di un subpatch, nell'ordine di Pd (per x; i ~ contano)."""
+    ports = [n for n in canvas.nodes() if atoms_of(n)[:1] in ([what], [what + "~"])]
+    return sorted(ports, key=lambda n: _num(_xy(n.rec)[0]))
+
+class Flow:
+    """
+    Selettori che possono arrivare a un inlet: un insieme ({'float', 'bang'}),
+    oppure None = non si sa.
+    """
+
+    def __init__(self, root):
+        self.ins = defaultdict(list)      # (id(nodo), inlet) -> [(sorgente, outlet)]
+        self.canvas_of = {}               # id(nodo) -> canvas
+        self.parent = {}                  # id(canvas di un subpatch) -> nodo del subpatch
+        self.senders = defaultdict(list)  # nome -> [s nome]
+        self.to_name = {}                 # nome -> selettori da message box e send delle GUI
+        self.patterns = []                # (regex, selettori): destinatari variabili ("; \$2-x ...")
+        self.opaque = set()               # nomi usati da oggetti che qui non si leggono
+        for c in walk(root):
+            for a, o, b, i in c.connects():
+                self.ins[(id(b), i)].append((a, o))
+            for what, x in c.items:
+                if what == "rec":
+                    self.opaque.update(pdfile.atoms(x))
+                elif what == "obj":
+                    self.canvas_of[id(x)] = c
+                    if x.sub is not None:
+                        self.parent[id(x.sub)] = x
+                    self._scan(x)
+
+    def _send(self, dest, sels):
+        if _DOLLAR.search(dest):
+            rx = ".*".join(re.escape(p) for p in _DOLLAR.split(dest))
+            self.patterns.append((re.compile(rx, re.S), sels))
+        else:
+            self.to_name[dest] = _union(self.to_name.get(dest, set()), sels)
+
+    def _scan(self, n):
+        k = pdfile.kind(n.rec)
+        g = gui_info(n)
+        sr = static_sr(n)
+        if k == "text":
+            return
+        if sr is not None:
+            if sr[0] == "s":
+                self.senders[sr[1]].append(n)
+        elif g is not None:
+            if g["snd"]:
+                self._send(g["snd"], gui_out(g["kind"]))
+        elif k == "msg":
+            parts = msg_parts(_WIDTH.sub("", pdfile.obj_text(n.rec)))
+            if parts is None:
+                self._send("\\$1", None)
+            for dest, msg in parts or []:
+                if dest is not None:
+                    self._send(dest, selector(msg))
+        else:
+            a = atoms_of(n)
+            self.opaque.update(a)
+            if a[:1] in (["s"], ["send"]):
+                self._send("\\$1", None)        # [s] senza nome: qualunque destinatario
+            elif "\\$0" in a[1:] and n.sub is None and a[0] not in DOLLAR0_VALUE:
+                self._send("\\$1-\\$2", None)   # astrazione con $0: arriva ai nomi $0-...
+
+    def into(self, node, inlet=0, seen=None):
+        """Selettori che arrivano a node/inlet (fili, receive della GUI)."""
+        seen = {} if seen is None else seen
+        key = ("in", id(node), inlet)
+        if key in seen:
+            return seen[key]
+        seen[key] = set()   # in corso: un ciclo non aggiunge niente
+        out = set()
+        for src, o in self.ins.get((id(node), inlet), []):
+            out = _union(out, self.out(src, o, seen))
+            if out is None:
+                break
+        g = gui_info(node)
+        if out is not None and inlet == 0 and g is not None and g["rcv"]:
+            out = _union(out, self.name(g["rcv"], seen))
+        seen[key] = out
+        return out
+
+    def name(self, name, seen):
+        """Selettori mandati a un nome; None se lo si raggiunge anche da fuori."""
+        if "\\$0" not in name or name in self.opaque:
+            return None
+        key = ("name", name)
+        if key in seen:
+            return seen[key]
+        seen[key] = set()
+        out = self.to_name.get(name, set())
+        probe = _DOLLAR.sub("\0", name)
+        for rx, sels in self.patterns:
+            if rx.fullmatch(probe):
+                out = _union(out, sels)
+        for s in self.senders.get(name, []):
+            out = _union(out, self.into(s, 0, seen))
+        seen[key] = out
+        return out
+
+    def out(self, n, outlet, seen):
+        """Selettori in uscita da n/outlet."""
+        k = pdfile.kind(n.rec)
+        if k == "msg":
+            parts = msg_parts(_WIDTH.sub("", pdfile.obj_text(n.rec)))
+            if parts is None:
+                return None
+            out = set()
+            for dest, msg in parts:
+                if dest is None:
+                    out = _union(out, selector(msg))
+            return out
+        if k in ATOM_KINDS:
+            return gui_out(k)
+        if n.sub is not None:
+            outs = _ports(n.sub, "outlet")
+            return self.into(outs[outlet], 0, seen) if outlet < len(outs) else set()
+        a = atoms_of(n) if k == "obj" else []
+        if not a:
+            return None
+        cls, args = a[0], a[1:]
+        if cls in GUI_KINDS:
+            return gui_out(cls)
+        if cls in BANG_OUT:
+            return {"bang"}
+        if cls in FLOAT_OUT:
+            return {"float"}
+        if cls == "expr":
+            return None if any("symbol" in x for x in args) else {"float"}
+        if cls in ("t", "trigger"):
+            if outlet >= len(args):
+                return None
+            t = args[outlet]
+            if _NUMBER.match(t):
+                return {"float"}
+            if t[0] == "a":
+                return self.into(n, 0, seen)
+            return {TRIGGER_OUT[t[0]]} if t[0] in TRIGGER_OUT else None
+        if cls in ("sel", "select"):
+            return {"bang"} if outlet < max(1, len(args)) else self.into(n, 0, seen)
+        if cls == "spigot":
+            return self.into(n, 0, seen)
+        if cls in ("r", "receive") and len(args) == 1:
+            return self.name(args[0], seen)
+        if cls == "inlet":
+            c = self.canvas_of[id(n)]
+            p = self.parent.get(id(c))
+            return None if p is None else self.into(p, _ports(c, "inlet").index(n), seen)
+        return None
+
+# ---------------------------------------------------------------- GUI -> logica
+
+def _g(x):
+    return f"{x:g}"
+
+def lower(g, sels):
+    """
+    Forma minima della GUI g quando le arrivano i selettori sels:
+    (testi, fili interni (a, outlet, b, inlet), (oggetto, outlet) di uscita);
+    l'ingresso è il primo oggetto. None = la GUI resta com'è.
+    """
+    kind = g["kind"]
+    if sels is None:
+        return None
+    if kind == "bng":
+        if not sels <= {"bang", "float", "symbol", "list"}:
+            return None
+        return ["t a" if sels <= {"bang"} else "t b"], [], (0, 0)
+    if kind in ("symbolatom", "listbox"):
+        return (["t a"], [], (0, 0)) if sels <= {"symbol" if kind == "symbolatom" else "list"} else None
+    if not sels <= {"float", "bang", "set"}:
+        return None
+    value = _g(g.get("value", 0.0))
+
+    if kind == "tgl" and "bang" in sels:
+        # bang: 0 -> nonzero, altro -> 0; [t f f] riscrive lo stato prima di uscire
+        route = [s for s in ("bang", "set") if s in sels]
+        texts = ["route " + " ".join(route)] if sels != {"bang"} else []
+        st = len(texts)
+        texts += ["f " + value, "== 0"] + ([f"* {_g(g['nonzero'])}"] if g["nonzero"] != 1 else []) + ["t f f"]
+        out = len(texts) - 1
+        wires = [(j, 0, j + 1, 0) for j in range(st, out)] + [(out, 1, st, 1)]
+        if st:
+            wires.append((0, 0, st, 0))
+            if "set" in sels:
+                wires.append((0, 1, st, 1))
+            if "float" in sels:
+                wires.append((0, len(route), out, 0))
+        return texts, wires, (out, 0)
+
+    if kind in ("hradio", "vradio"):
+        conv = ["i", f"clip 0 {max(0, g['number'] - 1)}"]
+    elif kind in ("hsl", "vsl", "nbx"):
+        conv = [f"clip {_g(min(g['lo'], g['hi']))} {_g(max(g['lo'], g['hi']))}"]
+    else:
+        conv = []   # floatatom e toggle senza bang: il float esce com'è
+    texts = (["route set"] if "set" in sels else []) + (["f " + value] if "bang" in sels else []) + conv
+    if not texts:
+        return ["t a"], [], (0, 0)
+    wires = []
+    for j in range(len(texts) - 1):
+        if j == 0 and "set" in sels:
+            if "bang" in sels:
+                wires.append((0, 0, 1, 1))   # set -> stato, senza uscita
+            wires.append((0, 1, 1, 0))
+        else:
+            wires.append((j, 0, j + 1, 0))
+    exit_ = (0, 1) if texts == ["route set"] else (len(texts) - 1, 0)
+    return texts, wires, exit_
+
+# ---------------------------------------------------------------- trasformazione
+
+def _xy(rec):
+    p = rec.split(None, 4)
+    return p[2], p[3]
+
+def gui_role(g, node, fed, feeds):
+    """
+    'display' = nessuna uscita (né fili né send); 'mouse' = nessun ingresso
+    (né fili né receive né init): senza GUI non scatta mai; 'gui' altrimenti.
+    """
+    if id(node) not in feeds and not g["snd"]:
+        return "display"
+    if id(node) not in fed and not g["rcv"] and not g["init"]:
+        return "mouse"
+    return "gui"
+
+def plan_guis(root):
+    """id(GUI) -> (info, ruolo, forma o None), calcolato sul patch intatto."""
+    flow = Flow(root)
+    plan = {}
+    for c in walk(root):
+        fed = {id(w[2]) for w in c.connects()}
+        feeds = {id(w[0]) for w in c.connects()}
+        for n in c.nodes():
+            g = gui_info(n)
+            if g is None:
+                continue
+            role = gui_role(g, n, fed, feeds)
+            form = None
+            if role == "gui":
+                sels = flow.into(n)
+                if sels is not None and g["init"]:
+                    sels = sels | {"bang" if g["kind"] == "bng" else "float"}
+                form = lower(g, sels)
+            plan[id(n)] = (g, role, form)
+    return plan
+
+def _drop(canvas, dead):
+    """Toglie i nodi in dead (id) e le loro connessioni."""
+    canvas.items = [it for it in canvas.items
+                    if not (it[0] == "obj" and id(it[1]) in dead)
+                    and not (it[0] == "connect" and (id(it[1][0]) in dead or id(it[1][2]) in dead))]
+
+def strip_canvas(canvas, plan, keep_comments, stats):
+    """GUI, cnv e commenti di un canvas (passi 1 e 2) secondo plan_guis()."""
+    dead, deaf, items, extra = set(), set(), [], []
+    for what, x in canvas.items:
+        if what != "obj":
+            items.append((what, x))
+            continue
+        rcv = cnv_receive(x)
+        g, role, form = plan.get(id(x), (None, None, None))
+        if pdfile.kind(x.rec) == "text" and not keep_comments:
+            dead.add(id(x))
+            stats["comments"] += 1
+        elif rcv is not None:
+            stats["cnv"] += 1
+            if rcv:
+                x.rec = "#X obj {} {} r {}".format(*_xy(x.rec), rcv)
+            else:
+                dead.add(id(x))
+        elif g is None or role != "gui":
+            if role is not None:
+                stats[role] += 1
+            if role == "mouse" or (role == "display" and not g["rcv"]):
+                dead.add(id(x))
+            elif role == "display":
+                x.rec = "#X obj {} {} r {}".format(*_xy(x.rec), g["rcv"])
+                deaf.add(id(x))
+        elif form is None:
+            stats["kept"] += 1
+        else:
+            stats["lowered"] += 1
+            items.extend(_lower_node(canvas, x, g, form, extra))
+            continue
+        items.append((what, x))
+    canvas.items = [it for it in items if not (it[0] == "connect" and id(it[1][2]) in deaf)] + extra
+    _drop(canvas, dead)
+
+def _lower_node(canvas, x, g, form, extra):
+    """
+    Sostituisce la GUI x con la forma di lower(): ritorna gli oggetti da
+    mettere al suo posto (receive e loadbang prima, così l'ordine di
+    creazione non cambia), aggiunge a extra i fili nuovi.
+    """
+    texts, wires, (ex, eo) = form
+    x0, y0 = _xy(x.rec)
+    y = int(_num(y0))
+    # stesso Node per l'ingresso: i fili che arrivano alla GUI restano validi
+    x.rec = f"#X obj {x0} {y0} {texts[0]}"
+    objs = [x] + [Node(f"#X obj {x0} {y + 20 * j} {t}") for j, t in enumerate(texts[1:], 1)]
+    before = []
+    if g["rcv"]:
+        r = Node(f"#X obj {x0} {y} r {g['rcv']}")
+        before.append(r)
+        extra.append(("connect", [r, 0, x, 0]))
+    if g["init"]:
+        lb = Node(f"#X obj {x0} {y} loadbang")
+        before.append(lb)
+        if g["kind"] == "bng":
+            extra.append(("connect", [lb, 0, x, 0]))
+        else:
+            m = Node(f"#X msg {x0} {y} {_g(g['value'])}")
+            before.append(m)
+            extra += [("connect", [lb, 0, m, 0]), ("connect", [m, 0, x, 0])]
+    for w in canvas.connects():
+        if w[0] is x and w[1] == 0:
+            w[0], w[1] = objs[ex], eo
+    extra += [("connect", [objs[a], o, objs[b], i]) for a, o, b, i in wires]
+    after = objs[1:]
+    if g["snd"]:
+        s = Node(f"#X obj {x0} {y + 20 * len(objs)} s {g['snd']}")
+        after.append(s)
+        extra.append(("connect", [objs[ex], eo, s, 0]))   # ultimo filo dell'outlet: dopo i fili della GUI
+    return [("obj", n) for n in before + [x] + after]
+
+def lower_patch(root, keep_comments=False, stats=None):
+    """
+    Passi 1 e 2 su tutto l'albero (in place), fino a punto fisso: una GUI
+    che riceveva solo da una GUI tolta può diventare a sua volta 'mouse'.
+    """
+    stats = defaultdict(int) if stats is None else stats
+    while True:
+        step = defaultdict(int)
+        plan = plan_guis(root)
+        for c in list(walk(root)):
+            strip_canvas(c, plan, keep_comments, step)
+        stats["kept"] = step.pop("kept", 0)
+        for k, v in step.items():
+            stats[k] += v
+        if not step:
+            return stats
+
+def _key(w):
+    return id(w[0]), w[1], id(w[2]), w[3]
+
+def _splice(canvas, inputs, dests, dead):
+    """
+    Ogni filo in inputs (id) diventa tanti fili verso dests, nello stesso
+    punto dell'ordine; via i nodi dead e i loro fili. False (e nessuna
+    modifica) se ne uscirebbe un filo doppio.
+    """
+    items = []
+    for what, x in canvas.items:
+        if what == "connect" and id(x) in inputs:
+            items.extend(("connect", [x[0], x[1], d[2], d[3]]) for d in dests)
+        elif not ((what == "obj" and id(x) in dead)
+                  or (what == "connect" and (id(x[0]) in dead or id(x[2]) in dead))):
+            items.append((what, x))
+    keys = [_key(x) for what, x in items if what == "connect"]
+    if len(keys) != len(set(keys)):
+        return False
+    canvas.items = items
+    return True
+
+def collapse_triggers(canvas, stats):
+    """[t a] a una uscita: chi ci entra va direttamente alle sue destinazioni."""
+    changed = False
+    for t in [n for n in canvas.nodes() if is_passthrough(n)]:
+        wires = canvas.connects()
+        outs = [w for w in wires if w[0] is t]
+        if any(w[2] is t for w in outs):
+            continue
+        ins = {id(w) for w in wires if w[2] is t}
+        if _splice(canvas, ins, outs, {id(t)}):
+            stats["t"] += 1
+            changed = True
+    return changed
+
+def collapse_names(root, local, stats):
+    """
+    s/r statici: [s] senza fili in ingresso e [r] locali senza nessun [s]
+    via; coppie locali tutte nello stesso canvas -> fili; un [r A] locale
+    che fa solo da ponte verso un [s B] -> ogni [s A] diventa [s B].
+    """
+    where = defaultdict(list)
+    for c in walk(root):
+        for n in c.nodes():
+            sr = static_sr(n)
+            if sr is not None:
+                where[sr[1]].append((c, sr[0], n))
+    changed = False
+    for name, ent in where.items():
+        for c, k, n in ent:
+            if k == "s" and not any(w[2] is n for w in c.connects()):
+                _drop(c, {id(n)})
+                stats["s/r"] += 1
+                changed = True
+        ent = [(c, k, n) for c, k, n in ent if any(n is m for m in c.nodes())]
+        senders = [n for _, k, n in ent if k == "s"]
+        receivers = [(c, n) for c, k, n in ent if k == "r"]
+        if not local(name) or not receivers:
+            continue
+        if not senders:
+            for c, n in receivers:
+                _drop(c, {id(n)})
+            stats["s/r"] += len(receivers)
+            changed = True
+            continue
+        canvas = ent[0][0]
+        if all(c is canvas for c, _, _ in ent):
+            wires = canvas.connects()
+            ids = {id(n) for n in senders}
+            # i ricevitori di un nome scattano dal più recente al più vecchio
+            dests = [w for _, r in reversed(receivers) for w in wires if w[0] is r]
+            if any(id(d[2]) in ids for d in dests):
+                continue
+            ins = {id(w) for w in wires if id(w[2]) in ids}
+            if _splice(canvas, ins, dests, ids | {id(n) for _, n in receivers}):
+                stats["s/r"] += len(senders) + len(receivers)
+                changed = True
+            continue
+        if len(receivers) == 1:
+            c, r = receivers[0]
+            outs = [w for w in c.connects() if w[0] is r]
+            target = static_sr(outs[0][2]) if len(outs) == 1 else None
+            if target is not None and target[0] == "s" and target[1] != name:
+                for n in senders:
+                    n.rec = "#X obj {} {} s {}".format(*_xy(n.rec), target[1])
+                _drop(c, {id(r)})   # l'[s B] rimasto senza ingressi va via al giro dopo
+                stats["s/r"] += 1
+                changed = True
+    return changed
+
+def build(records, keep_comments=False):
+    """Record della variante -> (record della build, statistiche)."""
+    root = pdfile.parse(records)
+    if root is None:
+        raise ValueError("non è un patch Pd (manca #N canvas)")
+    stats = lower_patch(root, keep_comments)
+    local = local_names(root)
+    changed = True
+    while changed:
+        changed = collapse_names(root, local, stats)
+        for c in walk(root):
+            changed = collapse_triggers(c, stats) or changed
+    return pdfile.emit(root), dict(stats)
+
+def local_names(root):
+    """
+    Predicato: il nome ($0-...) si raggiunge solo da [s]/[r] statici di
+    questo file (dopo il passo 1: le GUI rimaste contano come uso esterno).
+    """
+    foreign = foreign_names(root)
+    return lambda name: "\\$0" in name and name not in foreign
+
+# ---------------------------------------------------------------- equivalenza
+
+class Behaviour:
+    """
+    Grafo dei messaggi di un patch: unità (oggetti che si comportano, in
+    ordine per canvas) e, per ogni outlet, le destinazioni (unità, inlet)
+    attraverso t a, s/r statici e send/receive delle GUI rimaste.
+    """
+
+    def __init__(self, root):
+        self.role = {}      # id(node) -> ruolo
+        self.uid = {}       # id(node) -> (canvas, posizione) per le unità
+        self.send = {}      # id(node) -> send di una GUI
+        self.name = {}      # id(node) -> nome di un s/r statico
+        self.wires = defaultdict(list)
+        self.recv = defaultdict(list)
+        self.canvases = []  # per canvas: (head, record non oggetto, testi delle unità)
+        self._nodes = []
+        for ci, c in enumerate(walk(root)):
+            for a, o, b, i in c.connects():
+                self.wires[(id(a), o)].append((b, i))
+            units = []
+            for n in c.nodes():
+                self._nodes.append(n)
+                role = self._classify(n)
+                self.role[id(n)] = role
+                if role == "unit":
+                    self.uid[id(n)] = (ci, len(units))
+                    units.append(n.rec)
+            self.canvases.append((c.head, [x for what, x in c.items if what == "rec"], units))
+
+    def _classify(self, n):
+        if pdfile.kind(n.rec) == "text" or cnv_receive(n) is not None:
+            return "deco"
+        g = gui_info(n)
+        if g is not None:
+            if g["rcv"]:
+                self.recv[g["rcv"]].append(n)
+            self.send[id(n)] = g["snd"]
+            return "unit"
+        if is_passthrough(n):
+            return "pass"
+        sr = static_sr(n)
+        if sr is not None:
+            self.name[id(n)] = sr[1]
+            if sr[0] == "r":
+                self.recv[sr[1]].append(n)
+            return sr[0]
+        return "unit"
+
+    def targets(self, node, inlet, path=()):
+        """Unità raggiunte da un messaggio che entra in node/inlet, in ordine."""
+        role = self.role.get(id(node))
+        if role == "unit":
+            return [(self.uid[id(node)], inlet)]
+        if id(node) in path:
+            return [("cycle",)]
+        if role == "pass":
+            return self.fanout(node, 0, path + (id(node),))
+        if role == "s":
+            return self.receivers(self.name[id(node)], path + (id(node),))
+        return []
+
+    def fanout(self, node, outlet, path=()):
+        out = []
+        for b, i in self.wires[(id(node), outlet)]:
+            out.extend(self.targets(b, i, path))
+        return out
+
+    def receivers(self, name, path=()):
+        """Chi riceve un messaggio mandato a name (dal receive più recente al più vecchio)."""
+        out = []
+        for n in reversed(self.recv.get(name, [])):
+            if self.role[id(n)] == "unit":
+                out.append((self.uid[id(n)], 0))
+            elif self.role[id(n)] == "r":
+                out.extend(self.fanout(n, 0, path))
+        return out
+
+    def edges(self):
+        """(unità, outlet) -> destinazioni; l'outlet 0 di una GUI continua nel suo send."""
+        out = {}
+        units = {id(n): n for n in self._nodes}
+        for (nid, o), _ in list(self.wires.items()):
+            if self.role.get(nid) == "unit":
+                out[(self.uid[nid], o)] = self.fanout(units[nid], o)
+        for nid, snd in self.send.items():
+            if snd and self.role.get(nid) == "unit":
+                key = (self.uid[nid], 0)
+                out[key] = out.get(key, []) + self.receivers(snd, (nid,))
+        return {k: v for k, v in out.items() if v}
+
+def equivalent(orig_records, build_records, limit=20):
+    """Differenze di comportamento tra due patch (lista vuota = equivalenti)."""
+    a_root, b_root = pdfile.parse(orig_records), pdfile.parse(build_records)
+    if a_root is None or b_root is None:
+        return ["non è un patch Pd (manca #N canvas)"]
+    lower_patch(a_root)
+    a, b = Behaviour(a_root), Behaviour(b_root)
+    diffs = []
+    if a_root.pre != b_root.pre:
+        diffs.append("record prima del canvas principale diversi")
+    if len(a.canvases) != len(b.canvases):
+        return diffs + [f"canvas: {len(a.canvases)} -> {len(b.canvases)}"]
+    for ci, (ca, cb) in enumerate(zip(a.canvases, b.canvases)):
+        if ca[0] != cb[0] or ca[1] != cb[1]:
+            diffs.append(f"canvas {ci}: intestazione o record non oggetto diversi ({ca[0]})")
+        if ca[2] != cb[2]:
+            k = next((k for k, (x, y) in enumerate(zip(ca[2], cb[2])) if x != y), min(len(ca[2]), len(cb[2])))
+            what = ca[2][k] if k < len(ca[2]) else "(fine)"
+            diffs.append(f"canvas {ci}: oggetti diversi dalla posizione {k} ({what})")
+    ea, eb = a.edges(), b.edges()
+    for key in sorted(set(ea) | set(eb), key=str):
+        if ea.get(key, []) != eb.get(key, []):
+            diffs.append(f"canvas {key[0][0]} oggetto {key[0][1]} outlet {key[1]}: "
+                         f"{ea.get(key, [])[:6]} -> {eb.get(key, [])[:6]}")
+    local = local_names(a_root)
+    for name in sorted(set(a.recv) | set(b.recv)):
+        if not local(name) and a.receivers(name) != b.receivers(name):
+            diffs.append(f"receive {name}: {a.receivers(name)[:6]} -> {b.receivers(name)[:6]}")
+    return diffs[:limit] + ([f"... altre {len(diffs) - limit}"] if len(diffs) > limit else [])
+
+# ---------------------------------------------------------------- main
+
+def census(records):
+    """Conteggio per il riepilogo: oggetti (subpatch compresi), fili, GUI."""
+    objs = conns = guis = 0
+    for rec in records:
+        k = pdfile.kind(rec)
+        if k in pdfile.OBJECT_KINDS:
+            objs += 1
+            a = pdfile.atoms(pdfile.obj_text(rec))
+            if k in ATOM_KINDS or (k == "obj" and a and a[0] in GUI_KINDS + ("cnv", "my_canvas", "vu", "knob")):
+                guis += 1
+        elif k == "connect":
+            conns += 1
+    return objs, conns, guis
+
+def out_path(src, suffix):
+    base, ext = os.path.splitext(src)
+    return base + suffix + (ext or ".pd")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Headless performance build of a Pd patch variant, with an equivalence check.")
+    ap.add_argument("patches", nargs="*", help="varianti da trasformare (default: le 3 di bench_patches)")
+    ap.add_argument("-o", "--out", default=None, help="file di uscita (una sola variante; default: <nome>_perf.pd)")
+    ap.add_argument("--suffix", default="_perf", help="suffisso del file generato (default: _perf)")
+    ap.add_argument("--keep-comments", action="store_true", help="lascia i commenti")
+    ap.add_argument("--check", nargs=2, metavar=("ORIG", "BUILD"), help="confronta solo due patch già esistenti")
+    ap.add_argument("--no-check", action="store_true", help="scrive la build senza verifica di equivalenza")
+    ap.add_argument("-v", "--verbose", action="store_true")
+    args = ap.parse_args(argv)
+
+    if args.check:
+        diffs = equivalent(pdfile.read_records(args.check[0]), pdfile.read_records(args.check[1]))
+        for d in diffs:
+            print(f"[perf_build] {d}", file=sys.stderr)
+        print(f"[perf_build] {'equivalenti' if not diffs else 'NON equivalenti'}", file=sys.stderr)
+        sys.exit(1 if diffs else 0)
+
+    paths = args.patches or [os.path.join(ROOT, p) for p in VARIANTS.values()]
+    if args.out and len(paths) != 1:
+        ap.error("-o vale con una sola variante")
+    bad = 0
+    for src in paths:
+        if not os.path.isfile(src):
+            print(f"[perf_build] non trovato: {src}", file=sys.stderr)
+            bad += 1
+            continue
+        records = pdfile.read_records(src)
+        try:
+            out, stats = build(records, args.keep_comments)
+        except ValueError as e:
+            print(f"[perf_build] {os.path.relpath(src)}: {e}", file=sys.stderr)
+            bad += 1
+            continue
+        diffs = [] if args.no_check else equivalent(records, out)
+        if diffs:
+            for d in diffs:
+                print(f"[perf_build] {os.path.relpath(src)}: {d}", file=sys.stderr)
+            print(f"[perf_build] {os.path.relpath(src)}: NON equivalente, niente scritto", file=sys.stderr)
+            bad += 1
+            continue
+        dst = args.out or out_path(src, args.suffix)
+        pdfile.write_records(dst, out)
+        (o0, c0, g0), (o1, c1, g1) = census(records), census(out)
+        print(f"[perf_build] {os.path.relpath(dst)}: oggetti {o0} -> {o1}, fili {c0} -> {c1}, "
+              f"GUI {g0} -> {g1}{'' if args.no_check else ', equivalente'}", file=sys.stderr)
+        if args.verbose:
+            print("[perf_build]   " + ", ".join(f"{k} {v}" for k, v in sorted(stats.items())), file=sys.stderr)
+    if bad:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
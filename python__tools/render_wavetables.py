@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+render_wavetables.py
+Wavetable di inviluppo precalcolate dalle tabelle di terne (data/*.txt).
+
+Ogni trigger del patch manda a vline~ tutte le terne di una riga: con tabelle
+dense (random_delayed_perc.txt) e molte voci, su iOS il traffico di messaggi
+pesa. Qui ogni riga viene resa una volta per tutte come curva campionata
+(stessa semantica di vline~, vedi terne.py) e l'intera tabella finisce in un
+solo file audio che Pd carica con soundfiler in un array:
+
+  data/wavetables/<tabella>.wav        float32 mono, righe concatenate
+  data/wavetables/<tabella>_index.txt  una riga per riga di tabella: "offset lunghezza;"
+                                       (campioni; stesso numero di riga della tabella,
+                                       quindi [text get] usa lo stesso indice)
+
+In playback basta leggere l'array da offset a offset+lunghezza (un solo
+segmento di vline~ che pilota tabread4~) invece di programmare N segmenti.
+
+Frequenza di campionamento: --sr. Il default 1000 Hz fa cadere su campioni
+esatti tutti i punti di rottura delle terne (tempi in ms interi) con stretch 1;
+con 44100/48000 la tabella è leggibile campione per campione, ma pesa 48 volte
+tanto (random_delayed_perc.txt ≈ 280 MB a 48 kHz).
+
+In Pd:  [soundfiler] <- "read -resize data/wavetables/perc.wav envtab"
+
+Uso:
+  python3 python__tools/render_wavetables.py                  # tutte le tabelle di data/
+  python3 python__tools/render_wavetables.py data/perc.txt --sr 48000
+  python3 python__tools/render_wavetables.py --stretch 0.5 --out-dir /tmp/wt
+"""
+
+import argparse
+import os
+import struct
+import sys
+import time
+
+import terne
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+DEFAULT_DATA = os.path.join(ROOT, "data")
+DEFAULT_OUT = os.path.join(ROOT, "data", "wavetables")
+
+def write_float_wav(path, samples, sr):
+    """float32 mono -> WAV IEEE float (formato 3), letto da soundfiler."""
+    raw = samples.astype("<f4").tobytes()
+    fmt = struct.pack("<HHIIHH", 3, 1, sr, sr * 4, 4, 32)
+    body = b"WAVE" + b"fmt " + struct.pack("<I", len(fmt)) + fmt \
+        + b"data" + struct.pack("<I", len(raw)) + raw
+    tmp = path + ".part"
+    with open(tmp, "wb") as f:
+        f.write(b"RIFF" + struct.pack("<I", len(body)) + body)
+    os.replace(tmp, path)
+
+def write_index(path, offsets, lengths):
+    with open(path, "w", encoding="utf-8") as f:
+        for off, n in zip(offsets, lengths):
+            f.write(f"{off} {n};\n")
+
+def render_table(src, out_dir, sr, stretch, tail_ms, max_mb):
+    rows = terne.read_table(src)
+    name = os.path.splitext(os.path.basename(src))[0]
+    t0 = time.perf_counter()
+    est = sum(terne.row_samples(terne.schedule(r, stretch), sr, tail_ms) for r in rows) * 4 / 1e6
+    if max_mb > 0 and est > max_mb:
+        print(f"[SKIP] {name}: {est:.0f} MB a {sr} Hz (> --max-mb {max_mb:g})", file=sys.stderr)
+        return False
+    samples, offsets, lengths = terne.render_rows(rows, sr, stretch, tail_ms)
+    wav = os.path.join(out_dir, f"{name}.wav")
+    idx = os.path.join(out_dir, f"{name}_index.txt")
+    write_float_wav(wav, samples, sr)
+    write_index(idx, offsets, lengths)
+    empty = sum(1 for n in lengths if n == 0)
+    print(f"[OK] {name}: {len(rows)} righe, {len(samples)} campioni ({len(samples) * 4 / 1e6:.1f} MB)"
+          f"{f', {empty} vuote' if empty else ''} in {time.perf_counter() - t0:.2f}s -> {wav}")
+    return True
+
+def main():
+    ap = argparse.ArgumentParser(description="Render Envion terne tables into envelope wavetables.")
+    ap.add_argument("tables", nargs="*", default=[DEFAULT_DATA], help="tabelle .txt o cartelle (default: data/)")
+    ap.add_argument("--sr", type=int, default=1000, help="sample rate della wavetable (default: 1000)")
+    ap.add_argument("--stretch", type=float, default=1.0, help="fattore sui tempi, come $0-factor (default: 1)")
+    ap.add_argument("--tail-ms", type=float, default=0.0, help="coda in ms dopo l'ultima rampa (default: 0)")
+    ap.add_argument("--out-dir", type=str, default=DEFAULT_OUT, help="cartella di output (default: data/wavetables)")
+    ap.add_argument("--max-mb", type=float, default=64.0, help="salta le tabelle più grandi (0 = nessun limite)")
+    args = ap.parse_args()
+
+    if terne.np is None:
+        print("[ERROR] serve numpy.", file=sys.stderr)
+        sys.exit(2)
+    if args.sr <= 0 or args.stretch <= 0:
+        print("[ERROR] --sr e --stretch devono essere > 0.", file=sys.stderr)
+        sys.exit(2)
+    tables = terne.find_tables(args.tables)
+    if not tables:
+        print("[WARN] Nessuna tabella trovata.", file=sys.stderr)
+        sys.exit(1)
+    os.makedirs(args.out_dir, exist_ok=True)
+    failed = 0
+    for src in tables:
+        if not render_table(src, args.out_dir, args.sr, args.stretch, args.tail_ms, args.max_mb):
+            failed += 1
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
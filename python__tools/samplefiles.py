@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+"""
+samplefiles.py
+Accesso ai sample per gli strumenti di analisi offline (overviews, onsets).
+
+- WavSource: chunk 'data' di un WAV mappato con numpy.memmap; read() converte
+  in float32 solo il tratto chiesto (header e formati da envion_audio)
+- ArraySource: tutto il resto, decodificato da ffmpeg (mono, FFMPEG_RATE)
+- find_samples: file audio sotto una lista di cartelle
+- freshness: decide se un risultato salvato vale ancora. Il manifest tiene
+  sha256, stat (dimensione, mtime_ns) e parametri: con stat e parametri
+  uguali il file non viene letto; con stat diverso si rifà l'hash e si
+  ricalcola solo se il contenuto è cambiato
+"""
+
+import hashlib
+import json
+import os
+import struct
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, os.path.join(ROOT, "python__queries"))   # envion_audio
+
+import envion_audio
+from envion_audio import np
+
+DEFAULT_ROOTS = [os.path.join(ROOT, "audio"), os.path.join(ROOT, "netsound", "atoms")]
+WAV_EXTS = (".wav", ".wave")
+FFMPEG_EXTS = (".mp3", ".ogg", ".oga", ".flac", ".aif", ".aiff", ".m4a")
+FFMPEG_RATE = 44100
+
+class WavSource:
+    """Chunk 'data' di un WAV mappato in memoria; read() converte solo il tratto chiesto."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            head = f.read(1 << 16)
+        self.fmt = envion_audio.parse_wav_header(head)
+        size = os.path.getsize(path)
+        avail = max(0, min(self.fmt.data_size, size - self.fmt.data_offset))
+        self.rate = self.fmt.rate
+        self.channels = self.fmt.channels
+        self.frames = avail // self.fmt.block_align
+        if self.frames:
+            self.raw = np.memmap(path, dtype=np.uint8, mode="r", offset=self.fmt.data_offset,
+                                 shape=(self.frames * self.fmt.block_align,))
+        else:
+            self.raw = np.zeros(0, dtype=np.uint8)
+
+    def read(self, start, n):
+        start = max(0, min(start, self.frames))
+        n = max(0, min(n, self.frames - start))
+        a = self.fmt.block_align
+        return envion_audio.pcm_to_float(self.raw[start * a:(start + n) * a], self.fmt)
+
+class ArraySource:
+    """Audio già decodificato (ffmpeg, mono)."""
+
+    def __init__(self, samples, rate):
+        self.x = samples.reshape(-1, 1)
+        self.rate = rate
+        self.channels = 1
+        self.frames = len(self.x)
+
+    def read(self, start, n):
+        return self.x[max(0, start):max(0, start + n)]
+
+def open_source(path):
+    if path.lower().endswith(WAV_EXTS):
+        return WavSource(path)
+    with open(path, "rb") as f:
+        data = f.read()
+    return ArraySource(envion_audio.decode_ffmpeg(data, 24 * 3600.0, FFMPEG_RATE), FFMPEG_RATE)
+
+def find_samples(roots, with_ffmpeg, skip_dirs=()):
+    """File audio sotto roots (file singoli passano così come sono); salta le cartelle *skip_dirs."""
+    exts = WAV_EXTS + (FFMPEG_EXTS if with_ffmpeg else ())
+    out = []
+    for root in roots:
+        if os.path.isfile(root):
+            out.append(root)
+            continue
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = sorted(d for d in dirnames if not (skip_dirs and d.endswith(tuple(skip_dirs))))
+            out.extend(os.path.join(dirpath, fn) for fn in sorted(filenames) if fn.lower().endswith(exts))
+    return out
+
+def write_float_wav(path, samples, sr):
+    """float32 (frame[, canali]) -> WAV IEEE float (formato 3), letto da soundfiler."""
+    x = np.asarray(samples, dtype="<f4")
+    ch = 1 if x.ndim == 1 else x.shape[1]
+    raw = x.tobytes()
+    fmt = struct.pack("<HHIIHH", 3, ch, sr, sr * 4 * ch, 4 * ch, 32)
+    body = b"WAVE" + b"fmt " + struct.pack("<I", len(fmt)) + fmt \
+        + b"data" + struct.pack("<I", len(raw)) + raw
+    tmp = path + ".part"
+    with open(tmp, "wb") as f:
+        f.write(b"RIFF" + struct.pack("<I", len(body)) + body)
+    os.replace(tmp, path)
+
+def sha256_file(path, bufsize=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            b = f.read(bufsize)
+            if not b:
+                break
+            h.update(b)
+    return h.hexdigest()
+
+def read_json(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_json(path, obj):
+    with open(path + ".part", "w", encoding="utf-8") as f:
+        json.dump(obj, f, indent=1, sort_keys=True)
+        f.write("\n")
+    os.replace(path + ".part", path)
+
+def freshness(path, man, params, force=False):
+    """
+    Confronta il sample col manifest salvato.
+    Ritorna (stato, sha256, stat): stato "fresh" (stat e parametri uguali, il
+    file non è stato letto), "same" (toccato ma contenuto identico: basta
+    aggiornare lo stat nel manifest) o "stale" (da ricalcolare).
+    """
+    st = os.stat(path)
+    stamp = [st.st_size, st.st_mtime_ns]
+    same_params = man is not None and man.get("params") == params
+    if not force and same_params and man.get("stat") == stamp:
+        return "fresh", man.get("sha256"), stamp
+    digest = sha256_file(path)
+    if not force and same_params and man.get("sha256") == digest:
+        return "same", digest, stamp
+    return "stale", digest, stamp
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+"""
+terne.py
+Lettura delle tabelle Dynatext (data/*.txt) e semantica di vline~.
+
+Formato: un messaggio Pd per riga di tabella, chiuso da ';'. Ogni messaggio
+è una sequenza di terne "target rampa_ms ritardo_ms", che il patch manda una
+alla volta a vline~ (list split 3).
+
+Regole di vline~ riprodotte qui:
+- ogni terna programma un segmento che parte a 'ritardo' ms dall'inizio
+  della riga e va linearmente dal valore corrente a 'target' in 'rampa' ms
+- un segmento nuovo cancella quelli già programmati che partono dopo di lui
+  (e quelli con la stessa partenza, se hanno una rampa)
+- un segmento che parte durante una rampa la interrompe: riparte dal valore
+  raggiunto in quell'istante
+- prima del primo segmento l'inviluppo vale 0
+Stretch (il $0-factor del patch) moltiplica rampe e ritardi.
+"""
+
+import math
+import os
+
+try:
+    import numpy as np
+except ImportError:  # numpy serve solo per il rendering
+    np = None
+
+def parse_row(msg):
+    """'1 15 0 0 560 15' -> [(1.0, 15.0, 0.0), (0.0, 560.0, 15.0)]. Valori non numerici: ValueError."""
+    vals = [float(v) for v in msg.replace(",", " ").split()]
+    return [tuple(vals[i:i + 3]) for i in range(0, len(vals) - len(vals) % 3, 3)]
+
+def read_table(path):
+    """File di terne -> lista di righe (liste di terne). Righe non valide -> []."""
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        text = f.read()
+    rows = []
+    for msg in text.split(";"):
+        if not msg.strip():
+            continue
+        try:
+            rows.append(parse_row(msg))
+        except ValueError:
+            rows.append([])
+    return rows
+
+def find_tables(paths):
+    """File o cartelle (data/) -> elenco ordinato di file .txt."""
+    out = []
+    for p in paths:
+        if os.path.isdir(p):
+            out.extend(sorted(os.path.join(p, n) for n in os.listdir(p) if n.endswith(".txt")))
+        else:
+            out.append(p)
+    return out
+
+def schedule(terne, stretch=1.0):
+    """Terne di una riga -> segmenti (partenza_ms, rampa_ms, target) dopo le cancellazioni di vline~."""
+    segs = []
+    for target, ramp, delay in terne:
+        start = max(0.0, delay * stretch)
+        ramp = max(0.0, ramp * stretch)
+        segs = [s for s in segs if s[0] < start or (s[0] == start and s[1] <= 0 and ramp > 0)]
+        segs.append((start, ramp, target))
+    segs.sort(key=lambda s: s[0])
+    return segs
+
+def envelope_ms(segs):
+    """Durata dell'inviluppo: fine dell'ultima rampa (o ultima partenza)."""
+    return max((s + r for s, r, _ in segs), default=0.0)
+
+def start_values(segs):
+    """Valore di partenza di ogni segmento (rampe interrotte incluse)."""
+    out, prev = [], None
+    for s, r, tg in segs:
+        if prev is None:
+            v0 = 0.0
+        else:
+            ps, pr, ptg, pv0 = prev
+            v0 = ptg if pr <= 0 or s >= ps + pr else pv0 + (ptg - pv0) * (s - ps) / pr
+        out.append(v0)
+        prev = (s, r, tg, v0)
+    return out
+
+def row_samples(segs, sr, tail_ms=0.0):
+    """Campioni necessari a una riga (estremo finale incluso)."""
+    if not segs:
+        return 0
+    return int(math.ceil((envelope_ms(segs) + tail_ms) * sr / 1000.0)) + 1
+
+def render_rows(rows, sr, stretch=1.0, tail_ms=0.0):
+    """
+    Tutte le righe in un solo array float32 (vettorizzato su tutta la tabella).
+    Ritorna (array, offsets, lengths) in campioni; righe vuote -> lunghezza 0.
+    """
+    if np is None:
+        raise RuntimeError("serve numpy per il rendering delle wavetable")
+    starts, ramps, targets, v0s, lengths = [], [], [], [], []
+    base = []
+    off = 0
+    offsets = []
+    for terne in rows:
+        segs = schedule(terne, stretch)
+        n = row_samples(segs, sr, tail_ms)
+        offsets.append(off)
+        lengths.append(n)
+        if n:
+            # segmento fittizio a 0 prima del primo: l'inviluppo parte da 0
+            segs = [(0.0, 0.0, 0.0)] + segs
+            vals = start_values(segs)
+            for (s, r, tg), v0 in zip(segs, vals):
+                starts.append(s)
+                ramps.append(r)
+                targets.append(tg)
+                v0s.append(v0)
+                base.append(off)
+        off += n
+    total = off
+    out = np.zeros(total, dtype=np.float32)
+    if not total:
+        return out, offsets, lengths
+
+    starts = np.asarray(starts)
+    ramps = np.asarray(ramps)
+    targets = np.asarray(targets)
+    v0s = np.asarray(v0s)
+    base = np.asarray(base)
+    gstart = base + starts * (sr / 1000.0)   # partenza globale in campioni (frazionaria)
+
+    chunk = 1 << 20
+    for a in range(0, total, chunk):
+        n = np.arange(a, min(total, a + chunk), dtype=np.float64)
+        k = np.searchsorted(gstart, n, side="right") - 1
+        t = (n - base[k]) * (1000.0 / sr)            # ms dall'inizio della riga
+        s, r, tg, v0 = starts[k], ramps[k], targets[k], v0s[k]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ramp_val = v0 + (tg - v0) * (t - s) / r
+        done = (r <= 0) | (t >= s + r)
+        out[a:a + len(n)] = np.where(done, tg, ramp_val)
+    return out, offsets, lengths